@@ -21,7 +21,7 @@ do
 	    echo "Running seed ${SEED}, ${N} nodes, ${FLOWS} flows, ${PATHS} paths, NDP, ECMP"
 	    TMFILE=perm-${N}-${FLOWS}.cm
 	    echo "$FLOWS Flows"
-	    CMD="$SIMPATH/htsim_ndp -tm $TMFILE -log switch -log sink -linkspeed ${LINKSPEED} -strat $STRAT -paths ${PATHS} -nodes $N -conns $FLOWS -q $QUEUESIZE -cwnd $CWND -mtu $MTU -end ${XMAX} -logtime 0.01 -o data/logout.dat > data/out_${N}.tmp"
+	    CMD="python $SIMPATH/launch.py --db data/htsim_runs.db --tag seed=${SEED} -- $SIMPATH/htsim_ndp -tm $TMFILE -log switch -log sink -linkspeed ${LINKSPEED} -strat $STRAT -paths ${PATHS} -nodes $N -conns $FLOWS -q $QUEUESIZE -cwnd $CWND -mtu $MTU -end ${XMAX} -logtime 0.01 -o data/logout.dat > data/out_${N}.tmp"
 	    echo ${CME}
 	    eval ${CMD}
 	    CMD="$SIMPATH/../parse_output data/logout.dat -ascii > data/logout_$FLOWS_$SEED_${PATHS}.txt"
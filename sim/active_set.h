@@ -0,0 +1,155 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef ACTIVE_SET_H
+#define ACTIVE_SET_H
+
+/*
+ * ActiveSet holds the members of a round robin - flows with pulls
+ * queued, sinks waiting to be pulled - each known by a small dense slot
+ * number handed out by the owner.  The members form a ring threaded
+ * through per-slot arrays, so joining, leaving, checking membership and
+ * passing the turn on are all O(1), however many slots are idle.
+ *
+ * Each slot has a weight, 1 unless set.  The member at the front may be
+ * served up to its weight (in whatever units the owner charges, one per
+ * service by default) before the turn passes to the next member: deficit
+ * round robin, where a member that overdraws carries the debt into its
+ * next turn.  With every weight 1 and unit charges it is plain round
+ * robin, in the order members joined.
+ *
+ * The set counts what each slot has been served, and fairness() gives
+ * Jain's index of those counts, divided by the weights, over the slots
+ * served so far: 1 when every slot got its share.
+ */
+
+#include <assert.h>
+#include <stdint.h>
+#include <vector>
+
+template<class T>
+class ActiveSet {
+public:
+    ActiveSet() : _head(NONE), _size(0) {}
+
+    bool empty() const {return _size == 0;}
+    uint32_t size() const {return _size;}
+    bool contains(uint32_t slot) const {
+        return slot < _slots.size() && _slots[slot].member;
+    }
+
+    // join at the back of the ring
+    void push_back(uint32_t slot, T item) {
+        Slot& s = get(slot);
+        assert(!s.member);
+        s.item = item;
+        s.member = true;
+        s.deficit = s.weight;
+        if (_size == 0) {
+            s.next = s.prev = slot;
+            _head = slot;
+        } else {
+            uint32_t tail = _slots[_head].prev;
+            s.prev = tail;
+            s.next = _head;
+            _slots[tail].next = slot;
+            _slots[_head].prev = slot;
+        }
+        _size++;
+    }
+
+    // leave, from wherever in the ring
+    void remove(uint32_t slot) {
+        assert(contains(slot));
+        Slot& s = _slots[slot];
+        if (_size == 1) {
+            _head = NONE;
+        } else {
+            _slots[s.prev].next = s.next;
+            _slots[s.next].prev = s.prev;
+            if (_head == slot)
+                _head = s.next;
+        }
+        s.member = false;
+        _size--;
+    }
+
+    T front() const {assert(_size); return _slots[_head].item;}
+    uint32_t front_slot() const {assert(_size); return _head;}
+    void pop_front() {remove(_head);}
+
+    // charge the front member for a service.  If it wants serving again
+    // it keeps the front until its turn is used up, then goes to the
+    // back; otherwise it leaves.
+    void served(bool again, uint32_t cost = 1) {
+        assert(_size);
+        Slot& s = _slots[_head];
+        s.served += cost;
+        s.deficit -= cost;
+        if (!again) {
+            remove(_head);
+        } else if (s.deficit <= 0) {
+            s.deficit += s.weight;
+            _head = s.next;
+        }
+    }
+
+    void set_weight(uint32_t slot, uint32_t weight) {
+        assert(weight > 0);
+        get(slot).weight = weight;
+    }
+    uint32_t weight(uint32_t slot) const {
+        return slot < _slots.size() ? _slots[slot].weight : 1;
+    }
+    uint64_t served_count(uint32_t slot) const {
+        return slot < _slots.size() ? _slots[slot].served : 0;
+    }
+    // forget a slot's weight and count, so it can be handed out again
+    void reset(uint32_t slot) {
+        assert(!contains(slot));
+        if (slot < _slots.size())
+            _slots[slot] = Slot();
+    }
+
+    // the number of slots served so far, and Jain's index over them
+    uint32_t served_slots() const {
+        uint32_t n = 0;
+        for (size_t i = 0; i < _slots.size(); i++)
+            if (_slots[i].served)
+                n++;
+        return n;
+    }
+    double fairness() const {
+        double sum = 0, sum_squares = 0;
+        uint32_t n = 0;
+        for (size_t i = 0; i < _slots.size(); i++) {
+            if (!_slots[i].served)
+                continue;
+            double share = (double)_slots[i].served / _slots[i].weight;
+            sum += share;
+            sum_squares += share * share;
+            n++;
+        }
+        return n ? sum * sum / (n * sum_squares) : 1.0;
+    }
+private:
+    static const uint32_t NONE = UINT32_MAX;
+    struct Slot {
+        Slot() : item(), next(NONE), prev(NONE), member(false), weight(1), deficit(0), served(0) {}
+        T item;
+        uint32_t next, prev;
+        bool member;
+        uint32_t weight;
+        int64_t deficit;
+        uint64_t served;
+    };
+    Slot& get(uint32_t slot) {
+        if (slot >= _slots.size())
+            _slots.resize(slot + 1);
+        return _slots[slot];
+    }
+
+    std::vector<Slot> _slots;
+    uint32_t _head;
+    uint32_t _size;
+};
+
+#endif
@@ -116,6 +116,7 @@ AeolusQueue::completeService(){
     }
     
     pkt->flow().logTraffic(*pkt,*this,TrafficLogger::PKT_DEPART);
+    _bytes_served += pkt->size();
     pkt->sendOn();
 
     //_virtual_time += drainTime(pkt);
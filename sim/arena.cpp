@@ -0,0 +1,70 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include "arena.h"
+#include <cxxabi.h>
+#include <stdlib.h>
+#include <algorithm>
+#include <iomanip>
+#include <iostream>
+#include <sstream>
+
+using namespace std;
+
+Arena::Arena(bool pooled, size_t chunk_size)
+    : _pooled(pooled), _chunk_size(chunk_size), _next(NULL), _left(0),
+      _bytes_made(0), _bytes_reserved(0)
+{
+}
+
+Arena::~Arena() {
+    for (size_t i = 0; i < _chunks.size(); i++)
+        free(_chunks[i]);
+}
+
+void*
+Arena::alloc(size_t size, size_t align) {
+    size_t pad = (align - (uintptr_t)_next % align) % align;
+    if (pad + size > _left) {
+        // objects bigger than a chunk get a chunk of their own
+        size_t chunk = max(_chunk_size, size + align);
+        _next = (char*)malloc(chunk);
+        if (!_next) {
+            cerr << "Arena out of memory after " << _bytes_reserved << " bytes" << endl;
+            abort();
+        }
+        _chunks.push_back(_next);
+        _left = chunk;
+        _bytes_reserved += chunk;
+        pad = (align - (uintptr_t)_next % align) % align;
+    }
+    void* p = _next + pad;
+    _next += pad + size;
+    _left -= pad + size;
+    return p;
+}
+
+void
+Arena::count(const type_info& type, size_t size) {
+    ClassCount& c = _classes[type_index(type)];
+    c.objects++;
+    c.size = size;
+    _bytes_made += size;
+}
+
+void
+Arena::print_classes(ostream& out, const string& indent) const {
+    vector<pair<uint64_t, string> > lines;
+    for (auto i = _classes.begin(); i != _classes.end(); i++) {
+        const ClassCount& c = i->second;
+        int status;
+        char* name = abi::__cxa_demangle(i->first.name(), NULL, NULL, &status);
+        stringstream line;
+        line << indent << left << setw(24) << (status == 0 ? name : i->first.name()) << right
+             << setw(10) << c.objects << " x " << setw(5) << c.size << "B = "
+             << fixed << setprecision(1) << c.objects * c.size / 1048576.0 << "MB";
+        free(name);
+        lines.push_back(make_pair(c.objects * c.size, line.str()));
+    }
+    sort(lines.rbegin(), lines.rend());
+    for (size_t i = 0; i < lines.size(); i++)
+        out << lines[i].second << endl;
+}
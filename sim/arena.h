@@ -0,0 +1,70 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef ARENA_H
+#define ARENA_H
+
+/*
+ * Arena hands out objects that live as long as the network they are part
+ * of: queues, pipes and switches.  With pooling on, objects are carved
+ * from large chunks one after another, so building a big topology costs
+ * a few large allocations rather than one per object, and the objects of
+ * a switch end up next to each other in memory.  With pooling off it
+ * just calls new.
+ *
+ * Either way it counts the objects made of each class, for a memory
+ * report.  Pooled objects are never freed or destroyed on their own; the
+ * memory goes when the arena does, without running destructors.
+ */
+
+#include <stdint.h>
+#include <new>
+#include <ostream>
+#include <string>
+#include <typeindex>
+#include <typeinfo>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+
+class Arena {
+public:
+    Arena(bool pooled, size_t chunk_size = DEFAULT_CHUNK_SIZE);
+    ~Arena();
+
+    template<class T, class... Args>
+    T* make(Args&&... args) {
+        count(typeid(T), sizeof(T));
+        if (!_pooled)
+            return new T(std::forward<Args>(args)...);
+        return new (alloc(sizeof(T), alignof(T))) T(std::forward<Args>(args)...);
+    }
+
+    bool pooled() const {return _pooled;}
+    uint64_t bytes_made() const {return _bytes_made;}
+    uint64_t bytes_reserved() const {return _bytes_reserved;}
+
+    // one line per class, largest first
+    void print_classes(std::ostream& out, const std::string& indent) const;
+
+    static const size_t DEFAULT_CHUNK_SIZE = 4 << 20;
+private:
+    struct ClassCount {
+        uint64_t objects;
+        size_t size;
+    };
+    Arena(const Arena&);
+    Arena& operator=(const Arena&);
+
+    void* alloc(size_t size, size_t align);
+    void count(const std::type_info& type, size_t size);
+
+    bool _pooled;
+    size_t _chunk_size;
+    std::vector<char*> _chunks;
+    char* _next;
+    size_t _left;
+    uint64_t _bytes_made;
+    uint64_t _bytes_reserved;
+    std::unordered_map<std::type_index, ClassCount> _classes;
+};
+
+#endif
@@ -0,0 +1,70 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include "checkpoint.h"
+#include <assert.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
+#include <sys/wait.h>
+#include <unistd.h>
+#include <chrono>
+#include <iomanip>
+#include <iostream>
+#include "eventlist.h"
+#include "logfile.h"
+
+using namespace std;
+
+Checkpoint::Checkpoint(Logfile& logfile)
+    : _logfile(logfile), _time(0), _in_branch(false) {
+}
+
+void
+Checkpoint::runUntil(simtime_picosec when) {
+    chrono::steady_clock::time_point started = chrono::steady_clock::now();
+    while (EventList::nextEventTime() < when && EventList::doNextEvent()) {
+    }
+    _time = when;
+    cout << "Checkpoint at " << timeAsUs(when) << "us after " << fixed << setprecision(3)
+         << chrono::duration<double>(chrono::steady_clock::now() - started).count() << "s" << endl;
+    cout.unsetf(ios_base::floatfield);
+}
+
+bool
+Checkpoint::branch(const string& name, const string& logname) {
+    assert(!_in_branch);
+    // a thread does not survive fork(), and anything left buffered would
+    // be written twice
+    bool threaded = _logfile.hasFlushThread();
+    _logfile.setFlushThread(false);
+    cout.flush();
+    fflush(stdout);
+
+    chrono::steady_clock::time_point started = chrono::steady_clock::now();
+    pid_t pid = fork();
+    if (pid < 0) {
+        cerr << "Failed to fork branch " << name << ": " << strerror(errno) << endl;
+        exit(1);
+    }
+    if (pid == 0) {
+        _in_branch = true;
+        _logfile.branch(logname);
+        _logfile.setFlushThread(threaded);
+        cout << "Branch " << name << " from " << timeAsUs(_time) << "us, logging to " << logname << endl;
+        return true;
+    }
+
+    int status;
+    while (waitpid(pid, &status, 0) < 0 && errno == EINTR) {
+    }
+    cout << "Branch " << name << " ";
+    if (WIFEXITED(status))
+        cout << "exited with status " << WEXITSTATUS(status);
+    else
+        cout << "killed by signal " << WTERMSIG(status);
+    cout << " after " << fixed << setprecision(3)
+         << chrono::duration<double>(chrono::steady_clock::now() - started).count() << "s" << endl;
+    cout.unsetf(ios_base::floatfield);
+    _logfile.setFlushThread(threaded);
+    return false;
+}
@@ -0,0 +1,51 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef CHECKPOINT_H
+#define CHECKPOINT_H
+
+/*
+ * Checkpoint runs a simulation up to a point in simulated time and then
+ * branches it, so that several what-if runs share one warm-up.  Each
+ * branch is a fork() of the simulator as it stands at the checkpoint:
+ * the event list, the queues and the packets in them, every protocol's
+ * state and the random number generators all carry over exactly, with
+ * nothing to save or load.  The branch makes its change (more flows, a
+ * failed link) and runs to the end, logging to its own copy of the
+ * logfile; meanwhile the parent waits, then branches again or carries
+ * on unchanged.
+ *
+ *   Checkpoint cp(logfile);
+ *   cp.runUntil(timeFromUs(500.0));
+ *   for (...) {
+ *       if (cp.branch(name, logname)) {
+ *           // in the branch: make the change, then fall through to run
+ *           break;
+ *       }
+ *   }
+ *   while (eventlist.doNextEvent()) {}
+ *
+ * Branches run one at a time, so their output on stdout does not mix.
+ */
+
+#include <string>
+#include "config.h"
+
+class Logfile;
+
+class Checkpoint {
+public:
+    Checkpoint(Logfile& logfile);
+    // run events up to (not including) time when
+    void runUntil(simtime_picosec when);
+    simtime_picosec time() const {return _time;}
+    // Fork a branch from the checkpoint.  Returns true in the branch,
+    // which logs to logname; in the parent returns false once the branch
+    // has finished.
+    bool branch(const std::string& name, const std::string& logname);
+    bool inBranch() const {return _in_branch;}
+private:
+    Logfile& _logfile;
+    simtime_picosec _time;
+    bool _in_branch;
+};
+
+#endif
@@ -86,8 +86,28 @@ public:
         return _queue.at(_next_pop);
     }
 
+    // the i'th item from the next to pop
+    T& at(int i) {
+        assert(i >= 0 && i < _count);
+        return _queue[(_next_pop + i) % _size];
+    }
+
     bool empty() {return _count == 0;}
     int size() {return _count;}
+    int capacity() {return _size;}
+
+    // give back the space above newsize, which must be more than the
+    // number of items
+    void shrink(int newsize) {
+        assert(newsize > _count);
+        std::vector<T> queue(newsize);
+        for (int i = 0; i < _count; i++)
+            queue[i] = at(i);
+        _queue.swap(queue);
+        _next_pop = 0;
+        _next_push = _count;
+        _size = newsize;
+    }
 private:
     void validate() {
         assert(_count < _size);
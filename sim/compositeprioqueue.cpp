@@ -80,6 +80,7 @@ CompositePrioQueue::completeService(){
     
     pkt->flow().logTraffic(*pkt,*this,TrafficLogger::PKT_DEPART);
     if (_logger) _logger->logQueue(*this, QueueLogger::PKT_SERVICE, *pkt);
+    _bytes_served += pkt->size();
     pkt->sendOn();
 
     _serv = QUEUE_INVALID;
@@ -305,9 +306,9 @@ CompositePrioQueue::trim_low_priority_packet(uint32_t prio) {
                 // there's no space in the header queue either
                 _dropped++;
                 booted_pkt->flow().logTraffic(*booted_pkt,*this,TrafficLogger::PKT_DROP);
-                booted_pkt->free();
                 if (_logger) 
                     _logger->logQueue(*this, QueueLogger::PKT_DROP, *booted_pkt);
+                booted_pkt->free();
             } else {
                 _stripped++;
                 booted_pkt->flow().logTraffic(*booted_pkt,*this,TrafficLogger::PKT_TRIM);
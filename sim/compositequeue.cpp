@@ -115,6 +115,7 @@ CompositeQueue::completeService(){
     }
     
     pkt->flow().logTraffic(*pkt,*this,TrafficLogger::PKT_DEPART);
+    _bytes_served += pkt->size();
     pkt->sendOn();
 
     //_virtual_time += drainTime(pkt);
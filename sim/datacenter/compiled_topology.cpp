@@ -0,0 +1,129 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include <errno.h>
+#include <fcntl.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <iostream>
+#include "compiled_topology.h"
+
+bool
+CompiledTopology::isCompiled(const char* filename) {
+    int fd = open(filename, O_RDONLY);
+    if (fd < 0)
+        return false;
+    uint64_t magic = 0;
+    bool compiled = read(fd, &magic, sizeof(magic)) == sizeof(magic) && magic == TOPO_MAGIC;
+    ::close(fd);
+    return compiled;
+}
+
+CompiledTopology::CompiledTopology(const char* filename)
+    : _filename(filename), _base(NULL), _size(0)
+{
+    int fd = open(filename, O_RDONLY);
+    struct stat st;
+    if (fd < 0 || fstat(fd, &st) != 0) {
+        cerr << "Failed to open compiled topology " << filename << ": " << strerror(errno) << endl;
+        exit(1);
+    }
+    _size = st.st_size;
+    if (_size < TOPO_HEADER_SIZE + TOPO_SPEC_SIZE) {
+        ::close(fd);
+        fail("file too short");
+    }
+    _base = (uint8_t*)mmap(NULL, _size, PROT_READ, MAP_PRIVATE, fd, 0);
+    ::close(fd);
+    if (_base == MAP_FAILED) {
+        cerr << "Failed to map compiled topology " << filename << ": " << strerror(errno) << endl;
+        exit(1);
+    }
+
+    const uint64_t* header = (const uint64_t*)_base;
+    if (header[0] != TOPO_MAGIC)
+        fail("bad magic");
+    if ((header[1] & 0xffffffff) != TOPO_VERSION)
+        fail("version " + to_string(header[1] & 0xffffffff) + ", expected " + to_string(TOPO_VERSION));
+    _kind = (topo_kind)(header[1] >> 32);
+    if (_kind != TOPO_GENERIC && _kind != TOPO_FAT_TREE)
+        fail("unknown kind " + to_string(_kind));
+    if (header[2] > header[3] || header[3] >= TOPO_NO_NAME || header[4] >= (1ULL << 48))
+        fail("bad node or link count");
+    _hosts = header[2];
+    _nodes = header[3];
+    _links = header[4];
+    _string_bytes = header[5];
+
+    size_t expected = TOPO_HEADER_SIZE + TOPO_SPEC_SIZE + 8 * (_nodes + 1) + 32 * _links
+        + 12 * (size_t)_nodes + 16 * _links + _string_bytes;
+    if (_size != expected)
+        fail("size " + to_string(_size) + ", expected " + to_string(expected));
+
+    uint8_t* p = _base + TOPO_HEADER_SIZE;
+    _spec = (const uint64_t*)p;
+    p += TOPO_SPEC_SIZE;
+    _node_offsets = (const uint64_t*)p;
+    p += 8 * (_nodes + 1);
+    _link_speed = (const uint64_t*)p;
+    p += 8 * _links;
+    _link_latency = (const uint64_t*)p;
+    p += 8 * _links;
+    _link_queue_size = (const uint64_t*)p;
+    p += 8 * _links;
+    _link_log_period = (const uint64_t*)p;
+    p += 8 * _links;
+    _node_name = (const uint32_t*)p;
+    p += 4 * _nodes;
+    _node_pos = (const int32_t*)p;
+    p += 8 * _nodes;
+    _link_dst = (const uint32_t*)p;
+    p += 4 * _links;
+    _link_queue_type = (const uint32_t*)p;
+    p += 4 * _links;
+    _link_queue_name = (const uint32_t*)p;
+    p += 4 * _links;
+    _link_pipe_name = (const uint32_t*)p;
+    p += 4 * _links;
+    _strings = (const char*)p;
+
+    check();
+}
+
+CompiledTopology::~CompiledTopology() {
+    munmap(_base, _size);
+}
+
+void
+CompiledTopology::fail(const string& why) const {
+    cerr << "Bad compiled topology " << _filename << ": " << why << endl;
+    exit(1);
+}
+
+// The compiler has validated the topology itself; this only makes sure the
+// file is intact, so a truncated or damaged file can't send us off the end
+// of an array.
+void
+CompiledTopology::check() const {
+    if (_string_bytes == 0 || _strings[_string_bytes - 1] != '\0')
+        fail("string table not terminated");
+    if (_node_offsets[0] != 0 || _node_offsets[_nodes] != _links)
+        fail("link offsets don't cover the links");
+    for (uint32_t n = 0; n < _nodes; n++) {
+        if (_node_offsets[n] > _node_offsets[n + 1])
+            fail("link offsets out of order at node " + to_string(n));
+        if (_node_name[n] >= _string_bytes)
+            fail("bad name for node " + to_string(n));
+    }
+    for (uint64_t l = 0; l < _links; l++) {
+        if (_link_dst[l] >= _nodes)
+            fail("bad destination for link " + to_string(l));
+        if (_link_queue_type[l] > TOPO_QUEUE_FAIR)
+            fail("bad queue type for link " + to_string(l));
+        if ((_link_queue_name[l] != TOPO_NO_NAME && _link_queue_name[l] >= _string_bytes)
+            || (_link_pipe_name[l] != TOPO_NO_NAME && _link_pipe_name[l] >= _string_bytes))
+            fail("bad name for link " + to_string(l));
+    }
+    if (_kind == TOPO_FAT_TREE && (specTiers() < 2 || specTiers() > 3 || specNodes() != _hosts))
+        fail("bad fat tree spec");
+}
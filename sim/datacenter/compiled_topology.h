@@ -0,0 +1,133 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef COMPILED_TOPOLOGY_H
+#define COMPILED_TOPOLOGY_H
+
+/*
+ * CompiledTopology: a topology compiled by datacenter/topology_compiler.py
+ * from a GenericTopology file or a fat tree .topo tier spec, already
+ * validated, and memory-mapped read-only here so that nothing is parsed
+ * at startup.  The links are held as CSR arrays: the links out of node n
+ * are linksBegin(n) .. linksEnd(n)-1.
+ *
+ * File layout, all fields little-endian:
+ *
+ *   header (TOPO_HEADER_SIZE bytes of uint64 unless noted)
+ *     0   magic "HTSIMTOP"
+ *     8   version (uint32), kind (uint32)
+ *     16  hosts
+ *     24  nodes, hosts first, then switches
+ *     32  links
+ *     40  string table bytes
+ *   fat tree spec (TOPO_SPEC_SIZE bytes of uint64, all zero for generic)
+ *     0   nodes, tiers, podsize
+ *     24  per tier, three tiers: see TierSpec
+ *   arrays
+ *     uint64 node_offsets[nodes + 1]
+ *     uint64 link_speed[links]       bps
+ *     uint64 link_latency[links]     ps, of the pipe
+ *     uint64 link_queue_size[links]  bytes, 0 for the simulator's default
+ *     uint64 link_log_period[links]  ps, 0 for no queue logger
+ *     uint32 node_name[nodes]        offsets into the string table
+ *     int32  node_pos[2 * nodes]
+ *     uint32 link_dst[links]
+ *     uint32 link_queue_type[links]  TOPO_QUEUE_*
+ *     uint32 link_queue_name[links]  TOPO_NO_NAME if unnamed
+ *     uint32 link_pipe_name[links]   TOPO_NO_NAME if the queue feeds dst directly
+ *     char   strings[]               NUL terminated
+ */
+
+#include <stdint.h>
+#include "config.h"
+
+#define TOPO_MAGIC 0x504f544d49535448ULL  // "HTSIMTOP"
+#define TOPO_VERSION 1
+#define TOPO_HEADER_SIZE 64
+#define TOPO_SPEC_SIZE 256
+#define TOPO_NO_NAME 0xffffffffU
+
+enum topo_kind {TOPO_GENERIC = 1, TOPO_FAT_TREE = 2};
+// TOPO_QUEUE_DEFAULT leaves the queue type to the simulator's command line
+enum topo_queue_type {TOPO_QUEUE_DEFAULT = 0, TOPO_QUEUE_FIFO = 1, TOPO_QUEUE_RANDOM = 2,
+                      TOPO_QUEUE_COMPOSITE = 3, TOPO_QUEUE_FAIR = 4};
+
+class CompiledTopology {
+public:
+    // one tier of a fat tree spec, as laid out in the file
+    struct TierSpec {
+        uint64_t downlink_speed; // bps
+        uint64_t link_latency; // ps
+        uint64_t switch_latency; // ps
+        uint64_t radix_up;
+        uint64_t radix_down;
+        uint64_t queue_up; // bytes, 0 for the simulator's default
+        uint64_t queue_down;
+        uint64_t bundle;
+        uint64_t oversub;
+    };
+
+    // true if the file starts with the compiled topology magic
+    static bool isCompiled(const char* filename);
+
+    // maps the file, exiting with a message if it is not a compiled topology
+    CompiledTopology(const char* filename);
+    ~CompiledTopology();
+
+    topo_kind kind() const {return _kind;}
+    uint32_t hosts() const {return _hosts;}
+    uint32_t nodes() const {return _nodes;}
+    uint64_t links() const {return _links;}
+
+    const char* nodeName(uint32_t node) const {return _strings + _node_name[node];}
+    int32_t nodeX(uint32_t node) const {return _node_pos[2 * node];}
+    int32_t nodeY(uint32_t node) const {return _node_pos[2 * node + 1];}
+    uint64_t linksBegin(uint32_t node) const {return _node_offsets[node];}
+    uint64_t linksEnd(uint32_t node) const {return _node_offsets[node + 1];}
+
+    uint32_t linkDst(uint64_t link) const {return _link_dst[link];}
+    linkspeed_bps linkSpeed(uint64_t link) const {return _link_speed[link];}
+    simtime_picosec linkLatency(uint64_t link) const {return _link_latency[link];}
+    mem_b linkQueueSize(uint64_t link) const {return _link_queue_size[link];}
+    simtime_picosec linkLogPeriod(uint64_t link) const {return _link_log_period[link];}
+    topo_queue_type linkQueueType(uint64_t link) const {return (topo_queue_type)_link_queue_type[link];}
+    // NULL when the compiler left the name to the simulator
+    const char* linkQueueName(uint64_t link) const {return name(_link_queue_name[link]);}
+    // NULL when the link has no pipe
+    const char* linkPipeName(uint64_t link) const {return name(_link_pipe_name[link]);}
+
+    // the fat tree spec, for TOPO_FAT_TREE files
+    uint32_t specNodes() const {return _spec[0];}
+    uint32_t specTiers() const {return _spec[1];}
+    uint32_t specPodsize() const {return _spec[2];}
+    const TierSpec& tier(uint32_t tier) const {return ((const TierSpec*)(_spec + 3))[tier];}
+
+private:
+    const char* name(uint32_t offset) const {return offset == TOPO_NO_NAME ? NULL : _strings + offset;}
+    void fail(const string& why) const;
+    void check() const;
+
+    string _filename;
+    uint8_t* _base;
+    size_t _size;
+
+    topo_kind _kind;
+    uint32_t _hosts;
+    uint32_t _nodes;
+    uint64_t _links;
+    uint64_t _string_bytes;
+
+    const uint64_t* _spec;
+    const uint64_t* _node_offsets;
+    const uint64_t* _link_speed;
+    const uint64_t* _link_latency;
+    const uint64_t* _link_queue_size;
+    const uint64_t* _link_log_period;
+    const uint32_t* _node_name;
+    const int32_t* _node_pos;
+    const uint32_t* _link_dst;
+    const uint32_t* _link_queue_type;
+    const uint32_t* _link_queue_name;
+    const uint32_t* _link_pipe_name;
+    const char* _strings;
+};
+
+#endif
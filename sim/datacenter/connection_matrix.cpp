@@ -791,6 +791,15 @@ bool ConnectionMatrix::load(istream& file){
                 } else if (tokens[i] == "prio") {
                     i++;
                     c->priority = stoi(tokens[i]);
+                } else if (tokens[i] == "weight") {
+                    i++;
+                    c->weight = stoi(tokens[i]);
+                    if (c->weight == 0) {
+                        cerr << "Error: weight must be positive at line " << linecount << endl;
+                        exit(1);
+                    }
+                } else if (tokens[i] == "fluid") {
+                    c->fluid = true;
                 } else {
                     cerr << "Error: unknown token: " << tokens[i] << " at line "
                          << linecount << endl;
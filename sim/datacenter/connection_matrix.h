@@ -21,6 +21,8 @@ struct connection{
     triggerid_t trigger;
     simtime_picosec start;
     int priority;
+    uint32_t weight = 1; // share of the receiver's pulls when backlogged (EQDS)
+    bool fluid = false; // background flow, simulated at the flow level (see FluidModel)
 };
 
 typedef enum {UNSPECIFIED, SINGLE_SHOT, MULTI_SHOT, BARRIER} trigger_type;
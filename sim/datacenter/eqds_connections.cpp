@@ -0,0 +1,108 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include <iostream>
+#include "eqds_connections.h"
+#include "fat_tree_switch.h"
+
+EqdsConnections::EqdsConnections(FatTreeTopology& top, EventList& eventlist, linkspeed_bps linkspeed,
+                                 uint32_t no_of_nodes, mem_b cwnd, uint32_t paths)
+    : _top(top), _eventlist(eventlist), _cwnd(cwnd), _paths(paths),
+      _use_fluid(true), _fluid_interval(timeFromUs(10.0)),
+      _traffic_logger(NULL), _flow_logger(NULL), _fluid(NULL), _last_flowid(0)
+{
+    for (size_t ix = 0; ix < no_of_nodes; ix++){
+        _pacers.push_back(new EqdsPullPacer(linkspeed, 0.99, EqdsSrc::_mtu, eventlist));
+        _nics.push_back(new EqdsNIC(eventlist, linkspeed));
+    }
+}
+
+bool
+EqdsConnections::add(ConnectionMatrix& matrix, simtime_picosec start_offset, flowid_t id_offset) {
+    vector<connection*>* all_conns = matrix.getAllConnections();
+    for (size_t c = 0; c < all_conns->size(); c++){
+        connection* crt = all_conns->at(c);
+        if (crt->fluid && _use_fluid
+            && (crt->trigger || crt->send_done_trigger || crt->recv_done_trigger || crt->size <= 0)) {
+            cerr << "Fluid flow " << crt->src << "->" << crt->dst << " needs a size and a start time, and no triggers" << endl;
+            return false;
+        }
+    }
+
+    for (size_t c = 0; c < all_conns->size(); c++){
+        connection* crt = all_conns->at(c);
+        int src = crt->src;
+        int dest = crt->dst;
+
+        if (crt->fluid && _use_fluid) {
+            if (!_fluid)
+                _fluid = new FluidModel(_top, _eventlist, _paths, _fluid_interval);
+            _fluid->addFlow("Eqds_" + ntoa(src) + "_" + ntoa(dest), crt->flowid ? crt->flowid + id_offset : 0,
+                            src, dest, crt->size, crt->start + start_offset);
+            continue;
+        }
+
+        EqdsSrc* eqds_src = new EqdsSrc(_traffic_logger, _eventlist, *_nics.at(src));
+        eqds_src->setCwnd(_cwnd);
+        _srcs.push_back(eqds_src);
+        eqds_src->setDst(dest);
+        if (_flow_logger)
+            eqds_src->logFlowEvents(*_flow_logger);
+
+        EqdsSink* eqds_snk = new EqdsSink(NULL, _pacers[dest], *_nics.at(dest));
+        eqds_src->setName("Eqds_" + ntoa(src) + "_" + ntoa(dest));
+        eqds_snk->setSrc(src);
+        eqds_snk->setName("Eqds_sink_" + ntoa(src) + "_" + ntoa(dest));
+
+        if (crt->flowid) {
+            eqds_src->setFlowId(crt->flowid + id_offset);
+            eqds_snk->setFlowId(crt->flowid + id_offset);
+            assert(_flowmap.find(eqds_src->flowId()) == _flowmap.end()); // don't have dups
+            _flowmap[eqds_src->flowId()] = eqds_src;
+        }
+        _last_flowid = max(_last_flowid, eqds_src->flowId());
+
+        if (crt->size > 0){
+            eqds_src->setFlowsize(crt->size);
+        }
+
+        if (crt->trigger) {
+            Trigger* trig = matrix.getTrigger(crt->trigger, _eventlist);
+            trig->add_target(*eqds_src);
+        }
+        if (crt->send_done_trigger) {
+            Trigger* trig = matrix.getTrigger(crt->send_done_trigger, _eventlist);
+            eqds_src->setEndTrigger(*trig);
+        }
+        if (crt->recv_done_trigger) {
+            Trigger* trig = matrix.getTrigger(crt->recv_done_trigger, _eventlist);
+            eqds_snk->setEndTrigger(*trig);
+        }
+
+        if (crt->weight > 1)
+            eqds_snk->setPullWeight(crt->weight);
+
+        // packets are sprayed by the switches, so the routes only reach
+        // the top of rack switch
+        Route* srctotor = new Route();
+        srctotor->push_back(_top.queues_ns_nlp[src][_top.HOST_POD_SWITCH(src)][0]);
+        srctotor->push_back(_top.pipes_ns_nlp[src][_top.HOST_POD_SWITCH(src)][0]);
+        srctotor->push_back(_top.queues_ns_nlp[src][_top.HOST_POD_SWITCH(src)][0]->getRemoteEndpoint());
+
+        Route* dsttotor = new Route();
+        dsttotor->push_back(_top.queues_ns_nlp[dest][_top.HOST_POD_SWITCH(dest)][0]);
+        dsttotor->push_back(_top.pipes_ns_nlp[dest][_top.HOST_POD_SWITCH(dest)][0]);
+        dsttotor->push_back(_top.queues_ns_nlp[dest][_top.HOST_POD_SWITCH(dest)][0]->getRemoteEndpoint());
+
+        eqds_src->connect(*srctotor, *dsttotor, *eqds_snk,
+                          crt->start == TRIGGER_START ? TRIGGER_START : crt->start + start_offset);
+
+        //register src and snk to receive packets from their respective TORs.
+        assert(_top.switches_lp[_top.HOST_POD_SWITCH(src)]);
+        assert(_top.switches_lp[_top.HOST_POD_SWITCH(dest)]);
+        _top.switches_lp[_top.HOST_POD_SWITCH(src)]->addHostPort(src, eqds_snk->flowId(), eqds_src);
+        _top.switches_lp[_top.HOST_POD_SWITCH(dest)]->addHostPort(dest, eqds_src->flowId(), eqds_snk);
+
+        if (_connected)
+            _connected(*crt, *eqds_src, *eqds_snk);
+    }
+    return true;
+}
@@ -0,0 +1,73 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef EQDS_CONNECTIONS_H
+#define EQDS_CONNECTIONS_H
+
+/*
+ * EqdsConnections sets up the EQDS flows of a connection matrix over a
+ * fat tree: a pull pacer and a NIC per host, then a source and sink per
+ * connection with its size, flow id, pull weight and triggers, hooked to
+ * the hosts' top of rack switches.  Connections tagged fluid go to a
+ * FluidModel instead, unless fluid flows are turned off.
+ *
+ * htsim_eqds and the in-process API (htsim_api.cpp) both build their
+ * flows with it, so a matrix means the same thing to each.  Loggers
+ * other than the traffic and flow event ones are left to the caller:
+ * setConnected() gives a function that is called with each source and
+ * sink once they are connected.
+ */
+
+#include <functional>
+#include <map>
+#include <vector>
+#include "eqds.h"
+#include "connection_matrix.h"
+#include "fat_tree_topology.h"
+#include "fluid_model.h"
+
+class EqdsConnections {
+public:
+    typedef std::function<void(connection& crt, EqdsSrc& src, EqdsSink& snk)> Connected;
+
+    EqdsConnections(FatTreeTopology& top, EventList& eventlist, linkspeed_bps linkspeed,
+                    uint32_t no_of_nodes, mem_b cwnd, uint32_t paths);
+
+    // simulate flows tagged fluid as packets as well when use_fluid is false
+    void setFluid(bool use_fluid, simtime_picosec interval) {
+        _use_fluid = use_fluid;
+        _fluid_interval = interval;
+    }
+    void setTrafficLogger(TrafficLogger* logger) {_traffic_logger = logger;}
+    void setFlowLogger(FlowEventLogger* logger) {_flow_logger = logger;}
+    void setConnected(Connected connected) {_connected = connected;}
+
+    // set up the connections in matrix, starting start_offset later than
+    // it says and with flow ids moved up by id_offset.  Returns false,
+    // having set up nothing, if a fluid flow has a trigger or no size and
+    // start time.
+    bool add(ConnectionMatrix& matrix, simtime_picosec start_offset = 0, flowid_t id_offset = 0);
+
+    const vector<EqdsSrc*>& srcs() const {return _srcs;}
+    const vector<EqdsPullPacer*>& pacers() const {return _pacers;}
+    FluidModel* fluid() const {return _fluid;}
+    flowid_t lastFlowId() const {return _last_flowid;}
+
+private:
+    FatTreeTopology& _top;
+    EventList& _eventlist;
+    mem_b _cwnd;
+    uint32_t _paths;
+    bool _use_fluid;
+    simtime_picosec _fluid_interval;
+    TrafficLogger* _traffic_logger;
+    FlowEventLogger* _flow_logger;
+    Connected _connected;
+
+    vector<EqdsPullPacer*> _pacers;
+    vector<EqdsNIC*> _nics;
+    vector<EqdsSrc*> _srcs;
+    FluidModel* _fluid;
+    map<flowid_t, EqdsSrc*> _flowmap;
+    flowid_t _last_flowid;
+};
+
+#endif
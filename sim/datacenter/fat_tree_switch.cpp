@@ -5,6 +5,7 @@
 #include "callback_pipe.h"
 #include "queue_lossless.h"
 #include "queue_lossless_output.h"
+#include "event_profiler.h"
 
 unordered_map<BaseQueue*,uint32_t> FatTreeSwitch::_port_flow_counts;
 
@@ -18,6 +19,75 @@ FatTreeSwitch::FatTreeSwitch(EventList& eventlist, string s, switch_type t, uint
     _hash_salt = random();
     _last_choice = eventlist.now();
     _fib = new RouteTable();
+    _nexthop_cache_shift = 32;
+}
+
+int FatTreeSwitch::addPort(BaseQueue* q){
+    int port = Switch::addPort(q);
+    _port_ids[q] = port;
+    _port_load.push_back(0);
+    _port_sampled.push_back(0);
+    _port_wins.push_back(0);
+    _port_multipath.push_back(false);
+    _port_entries.push_back(NULL);
+    return port;
+}
+
+void FatTreeSwitch::sample_port(int32_t port){
+    BaseQueue* q = _ports[port];
+    _port_sampled[port] = eventlist().now();
+    _port_load[port] = BaseQueue::queuesize_band(q->queuesize(), q->maxsize());
+}
+
+void FatTreeSwitch::add_route(uint32_t dst, BaseQueue* q, Pipe* pipe, packet_direction direction){
+    assert(q->getSwitch() == this);
+    auto port = _port_ids.find(q);
+    assert(port != _port_ids.end());
+
+    FibEntry*& e = _port_entries[port->second];
+    if (!e) {
+        Route * r = new Route();
+        r->push_back(q);
+        r->push_back(pipe);
+        r->push_back(q->getRemoteEndpoint());
+        e = new FibEntry(r,1,direction,port->second);
+    }
+    assert(e->getDirection() == direction);
+    _fib->addRoute(dst,e);
+}
+
+void FatTreeSwitch::note_choices(vector<FibEntry*>* ecmp_set){
+    if (ecmp_set->size() < 2)
+        return;
+    for (size_t i = 0; i < ecmp_set->size(); i++)
+        _port_multipath[(*ecmp_set)[i]->getPortID()] = true;
+}
+
+uint64_t FatTreeSwitch::choices_made() const {
+    uint64_t total = 0;
+    for (size_t i = 0; i < _port_wins.size(); i++)
+        total += _port_wins[i];
+    return total;
+}
+
+double FatTreeSwitch::port_fairness() const {
+    double sum = 0, sum_squares = 0;
+    uint32_t n = 0;
+    for (size_t i = 0; i < _port_wins.size(); i++) {
+        if (!_port_multipath[i])
+            continue;
+        sum += _port_wins[i];
+        sum_squares += (double)_port_wins[i] * _port_wins[i];
+        n++;
+    }
+    return sum_squares > 0 ? sum * sum / (n * sum_squares) : 1.0;
+}
+
+void FatTreeSwitch::print_lookup_stats(ostream& out) {
+    out << "FIB lookups: " << _lookups << " in " << _lookup_ns / 1e9 << "s";
+    if (_lookup_ns)
+        out << ", " << _lookups * 1e3 / _lookup_ns << "M/s";
+    out << endl;
 }
 
 void FatTreeSwitch::receivePacket(Packet& pkt){
@@ -41,7 +111,21 @@ void FatTreeSwitch::receivePacket(Packet& pkt){
 
         _packets[&pkt] = true;
 
-        const Route * nh = getNextHop(pkt,NULL);
+        const Route * nh;
+        if (_count_lookups) {
+            uint64_t started = EventProfiler::clock();
+            nh = getNextHop(pkt,NULL);
+            _lookup_ns += EventProfiler::clock() - started;
+            _lookups++;
+        } else {
+            nh = getNextHop(pkt,NULL);
+        }
+        if (!nh) {
+            //every link towards the destination has failed.
+            _packets.erase(&pkt);
+            pkt.free();
+            return;
+        }
         //set next hop which is peer switch.
         pkt.set_route(*nh);
 
@@ -65,6 +149,17 @@ void FatTreeSwitch::addHostPort(int addr, int flowid, PacketSink* transport){
     _fib->addHostRoute(addr,rt,flowid);
 }
 
+void FatTreeSwitch::flush_routes(){
+    _fib->clearRoutes();
+    _uproutes = NULL;
+    for (size_t i = 0; i < _nexthop_cache.size(); i++)
+        _nexthop_cache[i].entry = NULL;
+    //flowlets hold positions in the old route lists.
+    for (auto i = _flowlet_maps.begin(); i != _flowlet_maps.end(); i++)
+        delete i->second;
+    _flowlet_maps.clear();
+}
+
 uint32_t mhash(uint32_t x) {
     x = ((x >> 16) ^ x) * 0x45d9f3b;
     x = ((x >> 16) ^ x) * 0x45d9f3b;
@@ -72,29 +167,57 @@ uint32_t mhash(uint32_t x) {
     return x;
 }
 
-uint32_t FatTreeSwitch::adaptive_route_p2c(vector<FibEntry*>* ecmp_set, int8_t (*cmp)(FibEntry*,FibEntry*)){
-    uint32_t choice = 0, min = UINT32_MAX;
-    uint32_t start, i = 0;
-    static const uint16_t nr_choices = 2;
-    
-    do {
-        start = random()%ecmp_set->size();
-
-        Route * r= (*ecmp_set)[start]->getEgressPort();
-        assert(r && r->size()>1);
-        BaseQueue* q = (BaseQueue*)(r->at(0));
-        assert(q);
-        if (q->queuesize()<min){
-            choice = start;
-            min = q->queuesize();
-        }
-        i++;
-    } while (i<nr_choices);
+uint32_t FatTreeSwitch::adaptive_route_sampled(vector<FibEntry*>* ecmp_set, int8_t (*cmp)(FibEntry*,FibEntry*), uint16_t choices){
+    uint32_t choice = random()%ecmp_set->size();
+
+    for (uint16_t i = 1; i < choices; i++){
+        uint32_t other = random()%ecmp_set->size();
+        bool better;
+        if (cmp==compare_queuesize)
+            better = port_load((*ecmp_set)[other]->getPortID()) < port_load((*ecmp_set)[choice]->getPortID());
+        else
+            better = cmp((*ecmp_set)[choice],(*ecmp_set)[other]) < 0;
+        if (better)
+            choice = other;
+    }
+
+    if (cmp==compare_flow_count)
+        _port_flow_counts[(BaseQueue*)((*ecmp_set)[choice]->getEgressPort()->at(0))]++;
+
     return choice;
 }
 
+// adaptive_route() by queue size: the candidates' loads are read from
+// the port array, and the least loaded are gathered without branching on
+// ties.  The choice, and the random() calls made, are as the general loop
+// would make them.
+uint32_t FatTreeSwitch::least_loaded(vector<FibEntry*>* ecmp_set){
+    uint32_t best_choices[256];
+    uint32_t best_choices_count = 0;
+    uint8_t min = UINT8_MAX;
+    uint32_t n = ecmp_set->size();
+    assert(n <= 256);
+
+    for (uint32_t i = 0; i < n; i++){
+        uint8_t load = port_load((*ecmp_set)[i]->getPortID());
+        if (load < min){
+            min = load;
+            best_choices_count = 0;
+        }
+        best_choices[best_choices_count] = i;
+        best_choices_count += (load == min);
+    }
+
+    return best_choices[random()%best_choices_count];
+}
+
 uint32_t FatTreeSwitch::adaptive_route(vector<FibEntry*>* ecmp_set, int8_t (*cmp)(FibEntry*,FibEntry*)){
     //cout << "adaptive_route" << endl;
+    if (_ar_choices && _ar_choices < ecmp_set->size())
+        return adaptive_route_sampled(ecmp_set, cmp, _ar_choices);
+    if (cmp==compare_queuesize)
+        return least_loaded(ecmp_set);
+
     uint32_t choice = 0;
 
     uint32_t best_choices[256];
@@ -134,6 +257,19 @@ uint32_t FatTreeSwitch::adaptive_route(vector<FibEntry*>* ecmp_set, int8_t (*cmp
 }
 
 uint32_t FatTreeSwitch::replace_worst_choice(vector<FibEntry*>* ecmp_set, int8_t (*cmp)(FibEntry*,FibEntry*),uint32_t my_choice){
+    if (cmp==compare_queuesize){
+        //as below, but reading the port array.
+        uint8_t max = 0;
+        for (uint32_t i = 0; i < ecmp_set->size(); i++){
+            uint8_t load = port_load((*ecmp_set)[i]->getPortID());
+            if (load > max)
+                max = load;
+        }
+        if (port_load((*ecmp_set)[my_choice]->getPortID()) < max)
+            return my_choice;
+        return least_loaded(ecmp_set);
+    }
+
     uint32_t best_choice = 0;
     uint32_t worst_choice = 0;
 
@@ -217,16 +353,16 @@ int8_t FatTreeSwitch::compare_flow_count(FibEntry* left, FibEntry* right){
 }
 
 int8_t FatTreeSwitch::compare_queuesize(FibEntry* left, FibEntry* right){
+    //both are ports of the switch whose FIB holds them, which keeps their samples.
     Route * r1= left->getEgressPort();
     assert(r1 && r1->size()>1);
-    BaseQueue* q1 = dynamic_cast<BaseQueue*>(r1->at(0));
-    Route * r2= right->getEgressPort();
-    assert(r2 && r2->size()>1);
-    BaseQueue* q2 = dynamic_cast<BaseQueue*>(r2->at(0));
+    FatTreeSwitch* sw = (FatTreeSwitch*)((BaseQueue*)(r1->at(0)))->getSwitch();
+    uint8_t l1 = sw->port_load(left->getPortID());
+    uint8_t l2 = sw->port_load(right->getPortID());
 
-    if (q1->quantized_queuesize() < q2->quantized_queuesize())
+    if (l1 < l2)
         return 1;
-    else if (q1->quantized_queuesize() > q2->quantized_queuesize())
+    else if (l1 > l2)
         return -1;
     else 
         return 0;
@@ -312,6 +448,11 @@ void FatTreeSwitch::permute_paths(vector<FibEntry *>* uproutes) {
 
 FatTreeSwitch::routing_strategy FatTreeSwitch::_strategy = FatTreeSwitch::NIX;
 uint16_t FatTreeSwitch::_ar_fraction = 0;
+uint16_t FatTreeSwitch::_ar_choices = 0;
+uint32_t FatTreeSwitch::_nexthop_cache_size = 0;
+bool FatTreeSwitch::_count_lookups = false;
+uint64_t FatTreeSwitch::_lookups = 0;
+uint64_t FatTreeSwitch::_lookup_ns = 0;
 uint16_t FatTreeSwitch::_ar_sticky = FatTreeSwitch::PER_PACKET;
 simtime_picosec FatTreeSwitch::_sticky_delta = timeFromUs((uint32_t)10);
 double FatTreeSwitch::_ecn_threshold_fraction = 1.0;
@@ -319,6 +460,24 @@ double FatTreeSwitch::_speculative_threshold_fraction = 0.2;
 int8_t (*FatTreeSwitch::fn)(FibEntry*,FibEntry*)= &FatTreeSwitch::compare_queuesize;
 
 Route* FatTreeSwitch::getNextHop(Packet& pkt, BaseQueue* ingress_port){
+    if (_strategy == ECMP && _nexthop_cache_size) {
+        //an ECMP choice depends only on the flow, path id and destination.
+        if (_nexthop_cache.empty()) {
+            assert((_nexthop_cache_size & (_nexthop_cache_size - 1)) == 0);
+            _nexthop_cache.resize(_nexthop_cache_size);
+            _nexthop_cache_shift = 32;
+            for (uint32_t n = _nexthop_cache_size; n > 1; n >>= 1)
+                _nexthop_cache_shift--;
+        }
+        NextHop& c = cached_next_hop(pkt);
+        if (c.entry && c.flow_id == pkt.flow_id() && c.pathid == pkt.pathid() && c.dst == pkt.dst()) {
+            if (c.hops > 1)
+                _port_wins[c.entry->getPortID()]++;
+            pkt.set_direction(c.entry->getDirection());
+            return c.entry->getEgressPort();
+        }
+    }
+
     vector<FibEntry*> * available_hops = _fib->getRoutes(pkt.dst());
 
     if (available_hops){
@@ -394,125 +553,125 @@ Route* FatTreeSwitch::getNextHop(Packet& pkt, BaseQueue* ingress_port){
             }
         
         FibEntry* e = (*available_hops)[ecmp_choice];
+        if (available_hops->size()>1)
+            _port_wins[e->getPortID()]++;
+        if (_strategy == ECMP && _nexthop_cache_size) {
+            NextHop& c = cached_next_hop(pkt);
+            c.flow_id = pkt.flow_id();
+            c.pathid = pkt.pathid();
+            c.dst = pkt.dst();
+            c.hops = available_hops->size();
+            c.entry = e;
+        }
         pkt.set_direction(e->getDirection());
         
         return e->getEgressPort();
     }
 
+    if (_type == TOR && _ft->HOST_POD_SWITCH(pkt.dst()) == _id) { 
+        //this host is directly connected!
+        HostFibEntry* fe = _fib->getHostRoute(pkt.dst(),pkt.flow_id());
+        assert(fe);
+        pkt.set_direction(DOWN);
+        return fe->getEgressPort();
+    }
+
     //no route table entries for this destination. Add them to FIB or fail. 
-    if (_type == TOR){
-        if ( _ft->HOST_POD_SWITCH(pkt.dst()) == _id) { 
-            //this host is directly connected!
-            HostFibEntry* fe = _fib->getHostRoute(pkt.dst(),pkt.flow_id());
-            assert(fe);
-            pkt.set_direction(DOWN);
-            return fe->getEgressPort();
-        } else {
-            //route packet up!
-            if (_uproutes)
-                _fib->setRoutes(pkt.dst(),_uproutes);
-            else {
-                uint32_t podid,agg_min,agg_max;
+    if (!fill_routes(pkt.dst()))
+        return NULL; //no way down to the destination's pod.
 
-                if (_ft->get_tiers()==3) {
-                    podid = _id / _ft->tor_switches_per_pod();
-                    agg_min = _ft->MIN_POD_AGG_SWITCH(podid);
-                    agg_max = _ft->MAX_POD_AGG_SWITCH(podid);
-                }
-                else {
-                    agg_min = 0;
-                    agg_max = _ft->getNAGG()-1;
-                }
+    //FIB has been filled in; return choice. 
+    return getNextHop(pkt, ingress_port);
+};
 
-                for (uint32_t k=agg_min; k<=agg_max;k++){
-                    for (uint32_t b = 0; b < _ft->bundlesize(AGG_TIER); b++) {
-                        Route * r = new Route();
-                        r->push_back(_ft->queues_nlp_nup[_id][k][b]);
-                        assert(((BaseQueue*)r->at(0))->getSwitch() == this);
+bool FatTreeSwitch::fill_routes(uint32_t dst){
+    if (_type == TOR){
+        assert(_ft->HOST_POD_SWITCH(dst) != _id);
+        //route packet up!
+        if (_uproutes)
+            _fib->setRoutes(dst,_uproutes);
+        else {
+            uint32_t podid,agg_min,agg_max;
+
+            if (_ft->get_tiers()==3) {
+                podid = _id / _ft->tor_switches_per_pod();
+                agg_min = _ft->MIN_POD_AGG_SWITCH(podid);
+                agg_max = _ft->MAX_POD_AGG_SWITCH(podid);
+            }
+            else {
+                agg_min = 0;
+                agg_max = _ft->getNAGG()-1;
+            }
 
-                        r->push_back(_ft->pipes_nlp_nup[_id][k][b]);
-                        r->push_back(_ft->queues_nlp_nup[_id][k][b]->getRemoteEndpoint());
-                        _fib->addRoute(pkt.dst(),r,1,UP);
-                    }
+            for (uint32_t k=agg_min; k<=agg_max;k++){
+                for (uint32_t b = 0; b < _ft->bundlesize(AGG_TIER); b++)
+                    add_route(dst,_ft->queues_nlp_nup[_id][k][b],_ft->pipes_nlp_nup[_id][k][b],UP);
 
-                    /*
-                      FatTreeSwitch* next = (FatTreeSwitch*)_ft->queues_nlp_nup[_id][k]->getRemoteEndpoint();
-                      assert (next->getType()==AGG && next->getID() == k);
-                    */
-                }
-                _uproutes = _fib->getRoutes(pkt.dst());
-                permute_paths(_uproutes);
+                /*
+                  FatTreeSwitch* next = (FatTreeSwitch*)_ft->queues_nlp_nup[_id][k]->getRemoteEndpoint();
+                  assert (next->getType()==AGG && next->getID() == k);
+                */
             }
+            _uproutes = _fib->getRoutes(dst);
+            permute_paths(_uproutes);
         }
     } else if (_type == AGG) {
-        if ( _ft->get_tiers()==2 || _ft->HOST_POD(pkt.dst()) == _ft->AGG_SWITCH_POD_ID(_id)) {
+        if ( _ft->get_tiers()==2 || _ft->HOST_POD(dst) == _ft->AGG_SWITCH_POD_ID(_id)) {
             //must go down!
-            //target NLP id is 2 * pkt.dst()/K
-            uint32_t target_tor = _ft->HOST_POD_SWITCH(pkt.dst());
-            for (uint32_t b = 0; b < _ft->bundlesize(AGG_TIER); b++) {
-                Route * r = new Route();
-                r->push_back(_ft->queues_nup_nlp[_id][target_tor][b]);
-                assert(((BaseQueue*)r->at(0))->getSwitch() == this);
-
-                r->push_back(_ft->pipes_nup_nlp[_id][target_tor][b]);          
-                r->push_back(_ft->queues_nup_nlp[_id][target_tor][b]->getRemoteEndpoint());
-
-                _fib->addRoute(pkt.dst(),r,1, DOWN);
-            }
+            //target NLP id is 2 * dst/K
+            uint32_t target_tor = _ft->HOST_POD_SWITCH(dst);
+            for (uint32_t b = 0; b < _ft->bundlesize(AGG_TIER); b++)
+                add_route(dst,_ft->queues_nup_nlp[_id][target_tor][b],_ft->pipes_nup_nlp[_id][target_tor][b],DOWN);
         } else {
             //go up!
             if (_uproutes)
-                _fib->setRoutes(pkt.dst(),_uproutes);
+                _fib->setRoutes(dst,_uproutes);
             else {
                 uint32_t podpos = _id % _ft->agg_switches_per_pod();
                 uint32_t uplink_bundles = _ft->radix_up(AGG_TIER) / _ft->bundlesize(CORE_TIER);
                 for (uint32_t l = 0; l <  uplink_bundles ; l++) {
                     uint32_t core = l * _ft->agg_switches_per_pod() + podpos;
                     for (uint32_t b = 0; b < _ft->bundlesize(CORE_TIER); b++) {
-                        Route *r = new Route();
-                        r->push_back(_ft->queues_nup_nc[_id][core][b]);
-                        assert(((BaseQueue*)r->at(0))->getSwitch() == this);
-
-                        r->push_back(_ft->pipes_nup_nc[_id][core][b]);
-                        r->push_back(_ft->queues_nup_nc[_id][core][b]->getRemoteEndpoint());
+                        if (!_ft->queues_nup_nc[_id][core][b])
+                            continue; //failed link.
+                        add_route(dst,_ft->queues_nup_nc[_id][core][b],_ft->pipes_nup_nc[_id][core][b],UP);
 
-                        /*
-                          FatTreeSwitch* next = (FatTreeSwitch*)_ft->queues_nup_nc[_id][k]->getRemoteEndpoint();
-                          assert (next->getType()==CORE && next->getID() == k);
-                        */
-                    
-                        _fib->addRoute(pkt.dst(),r,1,UP);
-
-                        //cout << "AGG switch " << _id << " adding route to " << pkt.dst() << " via CORE " << k << " bundle_id " << b << endl;
+                        //cout << "AGG switch " << _id << " adding route to " << dst << " via CORE " << k << " bundle_id " << b << endl;
                     }
                 }
-                //_uproutes = _fib->getRoutes(pkt.dst());
-                permute_paths(_fib->getRoutes(pkt.dst()));
+                //_uproutes = _fib->getRoutes(dst);
+                permute_paths(_fib->getRoutes(dst));
             }
         }
     } else if (_type == CORE) {
-        uint32_t nup = _ft->MIN_POD_AGG_SWITCH(_ft->HOST_POD(pkt.dst())) + (_id % _ft->agg_switches_per_pod());
+        uint32_t nup = _ft->MIN_POD_AGG_SWITCH(_ft->HOST_POD(dst)) + (_id % _ft->agg_switches_per_pod());
         for (uint32_t b = 0; b < _ft->bundlesize(CORE_TIER); b++) {
-            Route *r = new Route();
-            //cout << "CORE switch " << _id << " adding route to " << pkt.dst() << " via AGG " << nup << endl;
-
-            assert (_ft->queues_nc_nup[_id][nup][b]);
-            r->push_back(_ft->queues_nc_nup[_id][nup][b]);
-            assert(((BaseQueue*)r->at(0))->getSwitch() == this);
-
+            if (!_ft->queues_nc_nup[_id][nup][b])
+                continue; //failed link.
+            //cout << "CORE switch " << _id << " adding route to " << dst << " via AGG " << nup << endl;
             assert (_ft->pipes_nc_nup[_id][nup][b]);
-            r->push_back(_ft->pipes_nc_nup[_id][nup][b]);
-
-            r->push_back(_ft->queues_nc_nup[_id][nup][b]->getRemoteEndpoint());
-            _fib->addRoute(pkt.dst(),r,1,DOWN);
+            add_route(dst,_ft->queues_nc_nup[_id][nup][b],_ft->pipes_nc_nup[_id][nup][b],DOWN);
         }
+        if (!_fib->getRoutes(dst))
+            return false;
     }
     else {
         cerr << "Route lookup on switch with no proper type: " << _type << endl;
         abort();
     }
-    assert(_fib->getRoutes(pkt.dst()));
+    assert(_fib->getRoutes(dst));
+    note_choices(_fib->getRoutes(dst));
+    return true;
+}
 
-    //FIB has been filled in; return choice. 
-    return getNextHop(pkt, ingress_port);
-};
+void FatTreeSwitch::build_fib(){
+    uint32_t hosts_per_tor = _ft->radix_down(TOR_TIER);
+    for (uint32_t first = 0; first < _ft->no_of_nodes(); first += hosts_per_tor) {
+        if (_type == TOR && _ft->HOST_POD_SWITCH(first) == _id)
+            continue; //host routes are added per flow.
+        if (!_fib->getRoutes(first) && !fill_routes(first))
+            continue;
+        for (uint32_t dst = first + 1; dst < first + hosts_per_tor && dst < _ft->no_of_nodes(); dst++)
+            _fib->setRoutes(dst,_fib->getRoutes(first));
+    }
+}
@@ -96,6 +96,8 @@ public:
     };
 
     FatTreeSwitch(EventList& eventlist, string s, switch_type t, uint32_t id,simtime_picosec switch_delay, FatTreeTopology* ft);
+
+    virtual int addPort(BaseQueue* q);
   
     virtual void receivePacket(Packet& pkt);
     virtual Route* getNextHop(Packet& pkt, BaseQueue* ingress_port);
@@ -103,7 +105,27 @@ public:
 
     uint32_t adaptive_route(vector<FibEntry*>* ecmp_set, int8_t (*cmp)(FibEntry*,FibEntry*));
     uint32_t replace_worst_choice(vector<FibEntry*>* ecmp_set, int8_t (*cmp)(FibEntry*,FibEntry*),uint32_t my_choice);
-    uint32_t adaptive_route_p2c(vector<FibEntry*>* ecmp_set, int8_t (*cmp)(FibEntry*,FibEntry*));
+    // the best of choices candidates picked at random
+    uint32_t adaptive_route_sampled(vector<FibEntry*>* ecmp_set, int8_t (*cmp)(FibEntry*,FibEntry*), uint16_t choices);
+
+    // the queue size band (see BaseQueue::queuesize_band) of a port,
+    // sampled at most once every BaseQueue::_update_period, as
+    // BaseQueue::quantized_queuesize() does.  The switch keeps the
+    // samples of all its ports together, so comparing candidates reads
+    // one small array rather than each FibEntry's route and queue.
+    uint8_t port_load(int32_t port) {
+        assert(port >= 0 && (uint32_t)port < _port_load.size());
+        if (eventlist().now() - _port_sampled[port] > BaseQueue::_update_period)
+            sample_port(port);
+        return _port_load[port];
+    }
+
+    // how often each port was chosen from more than one candidate, and
+    // Jain's index of those counts over the ports that are ever among
+    // several candidates: 1 when the choices were spread evenly.
+    uint64_t port_wins(uint32_t port) const {return port < _port_wins.size() ? _port_wins[port] : 0;}
+    uint64_t choices_made() const;
+    double port_fairness() const;
 
     static int8_t compare_flow_count(FibEntry* l, FibEntry* r);
     static int8_t compare_pause(FibEntry* l, FibEntry* r);
@@ -117,19 +139,57 @@ public:
     static int8_t (*fn)(FibEntry*,FibEntry*);
 
     virtual void addHostPort(int addr, int flowid, PacketSink* transport);
+    // work out routes again, after a link fails
+    void flush_routes();
+    // fill in the routes to every host up front rather than on the first
+    // packet to each.  Hosts behind the same ToR share one list of
+    // routes, so an agg switch permutes its uplinks once per ToR rather
+    // than once per host.
+    void build_fib();
 
     virtual void permute_paths(vector<FibEntry*>* uproutes);
 
     static void set_strategy(routing_strategy s) { assert (_strategy==NIX); _strategy = s; }
+    static void reset_strategy() { _strategy = NIX; _ar_choices = 0; _nexthop_cache_size = 0; _port_flow_counts.clear(); _count_lookups = false; _lookups = _lookup_ns = 0; }
     static void set_ar_fraction(uint16_t f) { assert(f>=1);_ar_fraction = f;} 
 
     static routing_strategy _strategy;
     static uint16_t _ar_fraction;
+    // adaptive routing compares this many random candidates rather than
+    // all of them; 0 for all
+    static uint16_t _ar_choices;
+    // entries, a power of two, in each switch's cache of ECMP next hops
+    // by flow, path id and destination; 0 turns the cache off
+    static uint32_t _nexthop_cache_size;
+    // -fib_stats: count the next hop lookups of every switch, and time them
+    static bool _count_lookups;
+    static uint64_t _lookups;
+    static uint64_t _lookup_ns;
+    static void print_lookup_stats(ostream& out);
     static uint16_t _ar_sticky;
     static simtime_picosec _sticky_delta;
     static double _ecn_threshold_fraction;
     static double _speculative_threshold_fraction;
 private:
+    uint32_t least_loaded(vector<FibEntry*>* ecmp_set);
+    void sample_port(int32_t port);
+    void add_route(uint32_t dst, BaseQueue* q, Pipe* pipe, packet_direction direction);
+    // add the routes to dst to the FIB; false if there are none
+    bool fill_routes(uint32_t dst);
+    void note_choices(vector<FibEntry*>* ecmp_set);
+
+    struct NextHop {
+        uint32_t flow_id;
+        uint32_t pathid;
+        uint32_t dst;
+        uint32_t hops; // how many there were to choose from
+        FibEntry* entry; // NULL when the slot is empty
+    };
+    NextHop& cached_next_hop(Packet& pkt) {
+        uint32_t key = (pkt.flow_id() << 8) + pkt.pathid();
+        return _nexthop_cache[(key * 2654435761U) >> _nexthop_cache_shift];
+    }
+
     switch_type _type;
     Pipe* _pipe;
     FatTreeTopology* _ft;
@@ -139,6 +199,18 @@ private:
 
     unordered_map<uint32_t,FlowletInfo*> _flowlet_maps;
 
+    // indexed by port number, as _ports
+    vector<uint8_t> _port_load;
+    vector<simtime_picosec> _port_sampled;
+    vector<uint64_t> _port_wins;
+    vector<bool> _port_multipath;
+    unordered_map<BaseQueue*,int32_t> _port_ids;
+    // one FIB entry per port, shared by every destination routed over it
+    vector<FibEntry*> _port_entries;
+
+    vector<NextHop> _nexthop_cache;
+    uint32_t _nexthop_cache_shift;
+
     static unordered_map<BaseQueue*,uint32_t> _port_flow_counts;
 
     uint32_t _crt_route;
@@ -5,6 +5,7 @@
 #include <sstream>
 
 #include <iostream>
+#include <iomanip>
 #include "main.h"
 #include "queue.h"
 #include "fat_tree_switch.h"
@@ -33,6 +34,7 @@ mem_b FatTreeTopology::_queue_down[] = {0,0,0};
 uint32_t FatTreeTopology::_bundlesize[] = {1,1,1};
 uint32_t FatTreeTopology::_oversub[] = {1,1,1};
 linkspeed_bps FatTreeTopology::_downlink_speeds[] = {0,0,0};
+bool FatTreeTopology::_use_arena = false;
 
 void
 FatTreeTopology::set_tier_parameters(int tier, int radix_up, int radix_down, mem_b queue_up, mem_b queue_down, int bundlesize, linkspeed_bps linkspeed, int oversub) {
@@ -52,6 +54,10 @@ FatTreeTopology::set_tier_parameters(int tier, int radix_up, int radix_down, mem
 
 // load a config file and use it to create a FatTreeTopology
 FatTreeTopology* FatTreeTopology::load(const char * filename, QueueLoggerFactory* logger_factory, EventList& eventlist, mem_b queuesize, queue_type q_type, queue_type sender_q_type){
+    if (CompiledTopology::isCompiled(filename)) {
+        CompiledTopology compiled(filename);
+        return load(compiled, logger_factory, eventlist, queuesize, q_type, sender_q_type);
+    }
     std::ifstream file(filename);
     if (file.is_open()) {
         FatTreeTopology* ft = load(file, logger_factory, eventlist, queuesize, q_type, sender_q_type);
@@ -243,6 +249,59 @@ FatTreeTopology* FatTreeTopology::load(istream& file, QueueLoggerFactory* logger
     return ft;
 }
 
+// the compiler has already checked the spec, so just copy it in
+FatTreeTopology* FatTreeTopology::load(const CompiledTopology& compiled, QueueLoggerFactory* logger_factory, EventList& eventlist, mem_b queuesize, queue_type q_type, queue_type sender_q_type){
+    if (compiled.kind() != TOPO_FAT_TREE) {
+        cerr << "Compiled topology is not a fat tree" << endl;
+        exit(1);
+    }
+    _tiers = compiled.specTiers();
+    _hosts_per_pod = compiled.specPodsize();
+    for (uint32_t tier = TOR_TIER; tier < _tiers; tier++) {
+        const CompiledTopology::TierSpec& spec = compiled.tier(tier);
+        _downlink_speeds[tier] = spec.downlink_speed;
+        _link_latencies[tier] = spec.link_latency;
+        _switch_latencies[tier] = spec.switch_latency;
+        _radix_down[tier] = spec.radix_down;
+        _queue_down[tier] = spec.queue_down ? spec.queue_down : queuesize;
+        _bundlesize[tier] = spec.bundle;
+        _oversub[tier] = spec.oversub;
+        if (tier < CORE_TIER) {
+            _radix_up[tier] = spec.radix_up;
+            _queue_up[tier] = spec.queue_up ? spec.queue_up : queuesize;
+        }
+    }
+
+    cout << "Compiled topology load done\n";
+    FatTreeTopology* ft = new FatTreeTopology(compiled.specNodes(), 0, 0, logger_factory, &eventlist, NULL, q_type, 0, 0, sender_q_type);
+    if (compiled.nodes() != ft->NSRV + ft->NTOR + ft->NAGG + ft->NCORE) {
+        cerr << "Compiled topology has " << compiled.nodes() << " nodes, but its spec builds "
+             << ft->NSRV + ft->NTOR + ft->NAGG + ft->NCORE << endl;
+        exit(1);
+    }
+    cout << "FatTree constructor done, " << ft->no_of_nodes() << " nodes created\n";
+    return ft;
+}
+
+void FatTreeTopology::reset_parameters() {
+    _tiers = 3;
+    _hosts_per_pod = 0;
+    _use_arena = false;
+    for (int tier = TOR_TIER; tier <= CORE_TIER; tier++) {
+        _link_latencies[tier] = 0;
+        _switch_latencies[tier] = 0;
+        _radix_down[tier] = 0;
+        _queue_down[tier] = 0;
+        _bundlesize[tier] = 1;
+        _oversub[tier] = 1;
+        _downlink_speeds[tier] = 0;
+        if (tier < CORE_TIER) {
+            _radix_up[tier] = 0;
+            _queue_up[tier] = 0;
+        }
+    }
+}
+
 FatTreeTopology::FatTreeTopology(uint32_t no_of_nodes, linkspeed_bps linkspeed, mem_b queuesize,
                                  QueueLoggerFactory* logger_factory,
                                  EventList* ev,FirstFit * fit,queue_type q, simtime_picosec latency, simtime_picosec switch_latency, queue_type snd){
@@ -610,8 +669,14 @@ void FatTreeTopology::alloc_vectors() {
     pipes_nup_nlp.resize(NAGG, vector< vector<Pipe*> >(NTOR, vector<Pipe*>(_bundlesize[AGG_TIER])));
     queues_nup_nlp.resize(NAGG, vector< vector<BaseQueue*> >(NTOR, vector<BaseQueue*>(_bundlesize[AGG_TIER])));
 
-    pipes_nlp_ns.resize(NTOR, vector< vector<Pipe*> >(NSRV, vector<Pipe*>(_bundlesize[TOR_TIER])));
-    queues_nlp_ns.resize(NTOR, vector< vector<BaseQueue*> >(NSRV, vector<BaseQueue*>(_bundlesize[TOR_TIER])));
+    // each ToR links to a run of hosts, and each host to one ToR
+    uint32_t link_bundles = _radix_down[TOR_TIER]/_bundlesize[TOR_TIER];
+    pipes_nlp_ns.resize(NTOR);
+    queues_nlp_ns.resize(NTOR);
+    for (uint32_t tor = 0; tor < NTOR; tor++) {
+        pipes_nlp_ns.set_columns(tor, tor * link_bundles, link_bundles, _bundlesize[TOR_TIER]);
+        queues_nlp_ns.set_columns(tor, tor * link_bundles, link_bundles, _bundlesize[TOR_TIER]);
+    }
 
 
     if (_tiers == 3) {
@@ -620,21 +685,25 @@ void FatTreeTopology::alloc_vectors() {
     }
     
     pipes_nlp_nup.resize(NTOR, vector< vector<Pipe*> >(NAGG, vector<Pipe*>(_bundlesize[AGG_TIER])));
-    pipes_ns_nlp.resize(NSRV, vector< vector<Pipe*> >(NTOR, vector<Pipe*>(_bundlesize[TOR_TIER])));
     queues_nlp_nup.resize(NTOR, vector< vector<BaseQueue*> >(NAGG, vector<BaseQueue*>(_bundlesize[AGG_TIER])));
-    queues_ns_nlp.resize(NSRV, vector< vector<BaseQueue*> >(NTOR, vector<BaseQueue*>(_bundlesize[TOR_TIER])));
+    pipes_ns_nlp.resize(NSRV);
+    queues_ns_nlp.resize(NSRV);
+    for (uint32_t srv = 0; srv < NSRV; srv++) {
+        pipes_ns_nlp.set_columns(srv, srv / link_bundles, 1, _bundlesize[TOR_TIER]);
+        queues_ns_nlp.set_columns(srv, srv / link_bundles, 1, _bundlesize[TOR_TIER]);
+    }
 }
 
 BaseQueue* FatTreeTopology::alloc_src_queue(QueueLogger* queueLogger){
     linkspeed_bps linkspeed = _downlink_speeds[TOR_TIER]; // linkspeeds are symmetric
     switch (_sender_qt) {
     case SWIFT_SCHEDULER:
-        return new FairScheduler(linkspeed, *_eventlist, queueLogger);
+        return make<FairScheduler>(linkspeed, *_eventlist, queueLogger);
     case PRIORITY:
-        return new PriorityQueue(linkspeed,
+        return make<PriorityQueue>(linkspeed,
                                  memFromPkt(FEEDER_BUFFER), *_eventlist, queueLogger);
     case FAIR_PRIO:
-        return new FairPriorityQueue(linkspeed,
+        return make<FairPriorityQueue>(linkspeed,
                                      memFromPkt(FEEDER_BUFFER), *_eventlist, queueLogger);
     default:
         abort();
@@ -654,16 +723,16 @@ FatTreeTopology::alloc_queue(QueueLogger* queueLogger, linkspeed_bps speed, mem_
                              link_direction dir, int switch_tier, bool tor){
     switch (_qt) {
     case RANDOM:
-        return new RandomQueue(speed, queuesize, *_eventlist, queueLogger, memFromPkt(RANDOM_BUFFER));
+        return make<RandomQueue>(speed, queuesize, *_eventlist, queueLogger, memFromPkt(RANDOM_BUFFER));
     case COMPOSITE:
-        return new CompositeQueue(speed, queuesize, *_eventlist, queueLogger);
+        return make<CompositeQueue>(speed, queuesize, *_eventlist, queueLogger);
     case CTRL_PRIO:
-        return new CtrlPrioQueue(speed, queuesize, *_eventlist, queueLogger);
+        return make<CtrlPrioQueue>(speed, queuesize, *_eventlist, queueLogger);
     case AEOLUS:
-        return new AeolusQueue(speed, queuesize, FatTreeSwitch::_speculative_threshold_fraction * queuesize,  *_eventlist, queueLogger);
+        return make<AeolusQueue>(speed, queuesize, FatTreeSwitch::_speculative_threshold_fraction * queuesize,  *_eventlist, queueLogger);
     case AEOLUS_ECN:
         {
-            AeolusQueue* q = new AeolusQueue(speed, queuesize, FatTreeSwitch::_speculative_threshold_fraction * queuesize ,  *_eventlist, queueLogger);
+            AeolusQueue* q = make<AeolusQueue>(speed, queuesize, FatTreeSwitch::_speculative_threshold_fraction * queuesize ,  *_eventlist, queueLogger);
             if (!tor || dir == UPLINK) {
                 // don't use ECN on ToR downlinks
                 q->set_ecn_threshold(FatTreeSwitch::_ecn_threshold_fraction * queuesize);
@@ -671,26 +740,26 @@ FatTreeTopology::alloc_queue(QueueLogger* queueLogger, linkspeed_bps speed, mem_
             return q;
         }
     case ECN:
-        return new ECNQueue(speed, queuesize, *_eventlist, queueLogger, memFromPkt(15));
+        return make<ECNQueue>(speed, queuesize, *_eventlist, queueLogger, memFromPkt(15));
     case ECN_PRIO:
-        return new ECNPrioQueue(speed, queuesize, queuesize,
+        return make<ECNPrioQueue>(speed, queuesize, queuesize,
                                 FatTreeSwitch::_ecn_threshold_fraction * queuesize,
                                 FatTreeSwitch::_ecn_threshold_fraction * queuesize,
                                 *_eventlist, queueLogger);
     case LOSSLESS:
-        return new LosslessQueue(speed, queuesize, *_eventlist, queueLogger, NULL);
+        return make<LosslessQueue>(speed, queuesize, *_eventlist, queueLogger, (Switch*)NULL);
     case LOSSLESS_INPUT:
-        return new LosslessOutputQueue(speed, queuesize, *_eventlist, queueLogger);
+        return make<LosslessOutputQueue>(speed, queuesize, *_eventlist, queueLogger);
     case LOSSLESS_INPUT_ECN: 
-        return new LosslessOutputQueue(speed, memFromPkt(10000), *_eventlist, queueLogger,1,memFromPkt(16));
+        return make<LosslessOutputQueue>(speed, memFromPkt(10000), *_eventlist, queueLogger,1,memFromPkt(16));
     case COMPOSITE_ECN:
         if (tor && dir == DOWNLINK) 
-            return new CompositeQueue(speed, queuesize, *_eventlist, queueLogger);
+            return make<CompositeQueue>(speed, queuesize, *_eventlist, queueLogger);
         else
-            return new ECNQueue(speed, memFromPkt(2*SWITCH_BUFFER), *_eventlist, queueLogger, memFromPkt(15));
+            return make<ECNQueue>(speed, memFromPkt(2*SWITCH_BUFFER), *_eventlist, queueLogger, memFromPkt(15));
     case COMPOSITE_ECN_LB:
         {
-            CompositeQueue* q = new CompositeQueue(speed, queuesize, *_eventlist, queueLogger);
+            CompositeQueue* q = make<CompositeQueue>(speed, queuesize, *_eventlist, queueLogger);
             if (!tor || dir == UPLINK) {
                 // don't use ECN on ToR downlinks
                 q->set_ecn_threshold(FatTreeSwitch::_ecn_threshold_fraction * queuesize);
@@ -704,6 +773,7 @@ FatTreeTopology::alloc_queue(QueueLogger* queueLogger, linkspeed_bps speed, mem_
 
 void FatTreeTopology::init_network(){
     QueueLogger* queueLogger;
+    _arena = new Arena(_use_arena);
     if (_tiers == 3) {
         for (uint32_t j=0;j<NCORE;j++) {
             for (uint32_t k=0;k<NAGG;k++) {
@@ -727,32 +797,22 @@ void FatTreeTopology::init_network(){
             }
         }
     }
-    
-    for (uint32_t j=0;j<NTOR;j++) {
-        for (uint32_t k=0;k<NSRV;k++) {
-            for (uint32_t b = 0; b < _bundlesize[TOR_TIER]; b++) { 
-                queues_nlp_ns[j][k][b] = NULL;
-                pipes_nlp_ns[j][k][b] = NULL;
-                queues_ns_nlp[k][j][b] = NULL;
-                pipes_ns_nlp[k][j][b] = NULL;
-            }
-        }
-    }
+
 
     //create switches if we have lossless operation
     //if (_qt==LOSSLESS)
     // changed to always create switches
     for (uint32_t j=0;j<NTOR;j++){
         simtime_picosec switch_latency = (_switch_latencies[TOR_TIER] > 0) ? _switch_latencies[TOR_TIER] : _switch_latency;
-        switches_lp[j] = new FatTreeSwitch(*_eventlist, "Switch_LowerPod_"+ntoa(j),FatTreeSwitch::TOR,j,switch_latency,this);
+        switches_lp[j] = make<FatTreeSwitch>(*_eventlist, "Switch_LowerPod_"+ntoa(j),FatTreeSwitch::TOR,j,switch_latency,this);
     }
     for (uint32_t j=0;j<NAGG;j++){
         simtime_picosec switch_latency = (_switch_latencies[AGG_TIER] > 0) ? _switch_latencies[AGG_TIER] : _switch_latency;
-        switches_up[j] = new FatTreeSwitch(*_eventlist, "Switch_UpperPod_"+ntoa(j), FatTreeSwitch::AGG,j,switch_latency,this);
+        switches_up[j] = make<FatTreeSwitch>(*_eventlist, "Switch_UpperPod_"+ntoa(j), FatTreeSwitch::AGG,j,switch_latency,this);
     }
     for (uint32_t j=0;j<NCORE;j++){
         simtime_picosec switch_latency = (_switch_latencies[CORE_TIER] > 0) ? _switch_latencies[CORE_TIER] : _switch_latency;
-        switches_c[j] = new FatTreeSwitch(*_eventlist, "Switch_Core_"+ntoa(j), FatTreeSwitch::CORE,j,switch_latency,this);
+        switches_c[j] = make<FatTreeSwitch>(*_eventlist, "Switch_Core_"+ntoa(j), FatTreeSwitch::CORE,j,switch_latency,this);
     }
       
     // links from lower layer pod switch to server
@@ -772,7 +832,7 @@ void FatTreeTopology::init_network(){
                 queues_nlp_ns[tor][srv][b]->setName("LS" + ntoa(tor) + "->DST" +ntoa(srv) + "(" + ntoa(b) + ")");
                 //if (logfile) logfile->writeName(*(queues_nlp_ns[tor][srv]));
                 simtime_picosec hop_latency = (_hop_latency == 0) ? _link_latencies[TOR_TIER] : _hop_latency;
-                pipes_nlp_ns[tor][srv][b] = new Pipe(hop_latency, *_eventlist);
+                pipes_nlp_ns[tor][srv][b] = make<Pipe>(hop_latency, *_eventlist);
                 pipes_nlp_ns[tor][srv][b]->setName("Pipe-LS" + ntoa(tor)  + "->DST" + ntoa(srv) + "(" + ntoa(b) + ")");
                 //if (logfile) logfile->writeName(*(pipes_nlp_ns[tor][srv]));
             
@@ -793,10 +853,10 @@ void FatTreeTopology::init_network(){
 
                 if (_qt==LOSSLESS_INPUT || _qt == LOSSLESS_INPUT_ECN){
                     //no virtual queue needed at server
-                    new LosslessInputQueue(*_eventlist, queues_ns_nlp[srv][tor][b], switches_lp[tor], _hop_latency);
+                    make<LosslessInputQueue>(*_eventlist, queues_ns_nlp[srv][tor][b], switches_lp[tor], _hop_latency);
                 }
         
-                pipes_ns_nlp[srv][tor][b] = new Pipe(hop_latency, *_eventlist);
+                pipes_ns_nlp[srv][tor][b] = make<Pipe>(hop_latency, *_eventlist);
                 pipes_ns_nlp[srv][tor][b]->setName("Pipe-SRC" + ntoa(srv) + "->LS" + ntoa(tor) + "(" + ntoa(b) + ")");
                 //if (logfile) logfile->writeName(*(pipes_ns_nlp[srv][tor]));
             
@@ -835,7 +895,7 @@ void FatTreeTopology::init_network(){
                 //if (logfile) logfile->writeName(*(queues_nup_nlp[agg][tor]));
             
                 simtime_picosec hop_latency = (_hop_latency == 0) ? _link_latencies[AGG_TIER] : _hop_latency;
-                pipes_nup_nlp[agg][tor][b] = new Pipe(hop_latency, *_eventlist);
+                pipes_nup_nlp[agg][tor][b] = make<Pipe>(hop_latency, *_eventlist);
                 pipes_nup_nlp[agg][tor][b]->setName("Pipe-US" + ntoa(agg) + "->LS" + ntoa(tor) + "(" + ntoa(b) + ")");
                 //if (logfile) logfile->writeName(*(pipes_nup_nlp[agg][tor]));
             
@@ -860,11 +920,11 @@ void FatTreeTopology::init_network(){
                   ((LosslessQueue*)queues_nup_nlp[agg][tor])->setRemoteEndpoint(queues_nlp_nup[tor][agg]);
                   }else */
                 if (_qt==LOSSLESS_INPUT || _qt == LOSSLESS_INPUT_ECN){            
-                    new LosslessInputQueue(*_eventlist, queues_nlp_nup[tor][agg][b],switches_up[agg],_hop_latency);
-                    new LosslessInputQueue(*_eventlist, queues_nup_nlp[agg][tor][b],switches_lp[tor],_hop_latency);
+                    make<LosslessInputQueue>(*_eventlist, queues_nlp_nup[tor][agg][b],switches_up[agg],_hop_latency);
+                    make<LosslessInputQueue>(*_eventlist, queues_nup_nlp[agg][tor][b],switches_lp[tor],_hop_latency);
                 }
         
-                pipes_nlp_nup[tor][agg][b] = new Pipe(hop_latency, *_eventlist);
+                pipes_nlp_nup[tor][agg][b] = make<Pipe>(hop_latency, *_eventlist);
                 pipes_nlp_nup[tor][agg][b]->setName("Pipe-LS" + ntoa(tor) + "->US" + ntoa(agg) + "(" + ntoa(b) + ")");
                 //if (logfile) logfile->writeName(*(pipes_nlp_nup[tor][agg]));
         
@@ -905,7 +965,7 @@ void FatTreeTopology::init_network(){
                     //if (logfile) logfile->writeName(*(queues_nup_nc[agg][core]));
         
                     simtime_picosec hop_latency = (_hop_latency == 0) ? _link_latencies[CORE_TIER] : _hop_latency;
-                    pipes_nup_nc[agg][core][b] = new Pipe(hop_latency, *_eventlist);
+                    pipes_nup_nc[agg][core][b] = make<Pipe>(hop_latency, *_eventlist);
                     pipes_nup_nc[agg][core][b]->setName("Pipe-US" + ntoa(agg) + "->CS" + ntoa(core) + "(" + ntoa(b) + ")");
                     //if (logfile) logfile->writeName(*(pipes_nup_nc[agg][core]));
         
@@ -937,12 +997,12 @@ void FatTreeTopology::init_network(){
                       }
                       else*/
                     if (_qt == LOSSLESS_INPUT || _qt == LOSSLESS_INPUT_ECN){
-                        new LosslessInputQueue(*_eventlist, queues_nup_nc[agg][core][b], switches_c[core], _hop_latency);
-                        new LosslessInputQueue(*_eventlist, queues_nc_nup[core][agg][b], switches_up[agg], _hop_latency);
+                        make<LosslessInputQueue>(*_eventlist, queues_nup_nc[agg][core][b], switches_c[core], _hop_latency);
+                        make<LosslessInputQueue>(*_eventlist, queues_nc_nup[core][agg][b], switches_up[agg], _hop_latency);
                     }
                     //if (logfile) logfile->writeName(*(queues_nc_nup[core][agg]));
             
-                    pipes_nc_nup[core][agg][b] = new Pipe(hop_latency, *_eventlist);
+                    pipes_nc_nup[core][agg][b] = make<Pipe>(hop_latency, *_eventlist);
                     pipes_nc_nup[core][agg][b]->setName("Pipe-CS" + ntoa(core) + "->US" + ntoa(agg) + "(" + ntoa(b) + ")");
                     //if (logfile) logfile->writeName(*(pipes_nc_nup[core][agg]));
             
@@ -993,6 +1053,14 @@ void FatTreeTopology::add_failed_link(uint32_t type, uint32_t switch_id, uint32_
     assert(pipes_nup_nc[switch_id][k][0]!=NULL && pipes_nc_nup[k][switch_id][0]);
     pipes_nup_nc[switch_id][k][0] = NULL;
     pipes_nc_nup[k][switch_id][0] = NULL;
+
+    // a link can fail mid-run, after switches have routed over it
+    for (uint32_t i = 0; i < NTOR; i++)
+        ((FatTreeSwitch*)switches_lp[i])->flush_routes();
+    for (uint32_t i = 0; i < NAGG; i++)
+        ((FatTreeSwitch*)switches_up[i])->flush_routes();
+    for (uint32_t i = 0; i < NCORE; i++)
+        ((FatTreeSwitch*)switches_c[i])->flush_routes();
 }
 
 
@@ -1252,7 +1320,7 @@ void FatTreeTopology::count_queue(Queue* queue){
 int64_t FatTreeTopology::find_lp_switch(Queue* queue){
     //first check ns_nlp
     for (uint32_t srv=0;srv<NSRV;srv++)
-        for (uint32_t tor = 0; tor < NTOR; tor++)
+        for (uint32_t tor = queues_ns_nlp[srv].first(); tor < queues_ns_nlp[srv].end(); tor++)
             if (queues_ns_nlp[srv][tor][0] == queue)
                 return tor;
 
@@ -1306,7 +1374,7 @@ int64_t FatTreeTopology::find_core_switch(Queue* queue){
 int64_t FatTreeTopology::find_destination(Queue* queue){
     //first check nlp_ns
     for (uint32_t tor=0; tor<NTOR; tor++)
-        for (uint32_t srv = 0; srv<NSRV; srv++)
+        for (uint32_t srv = queues_nlp_ns[tor].first(); srv < queues_nlp_ns[tor].end(); srv++)
             if (queues_nlp_ns[tor][srv][0]==queue)
                 return srv;
 
@@ -1338,6 +1406,40 @@ void FatTreeTopology::print_path(std::ofstream &paths,uint32_t src,const Route*
     paths << endl;
 }
 
+void FatTreeTopology::add_metrics(MetricsExporter& metrics) {
+    LinkTable<BaseQueue*>* host_tiers[] = {&queues_ns_nlp, &queues_nlp_ns};
+    MetricsExporter::queue_tier host_tier_of[] = {MetricsExporter::TIER_HOST, MetricsExporter::TIER_TOR};
+    for (int t = 0; t < 2; t++) {
+        for (size_t i = 0; i < host_tiers[t]->size(); i++) {
+            LinkTable<BaseQueue*>::Row& row = (*host_tiers[t])[i];
+            for (size_t j = row.first(); j < row.end(); j++) {
+                for (size_t b = 0; b < row[j].size(); b++) {
+                    if (row[j][b]) {
+                        metrics.monitorQueue(row[j][b], host_tier_of[t]);
+                    }
+                }
+            }
+        }
+    }
+
+    // the switch to switch vectors are sparse; unused entries are NULL
+    vector< vector< vector<BaseQueue*> > >* tiers[] = {
+        &queues_nlp_nup, &queues_nup_nlp, &queues_nup_nc, &queues_nc_nup};
+    MetricsExporter::queue_tier tier_of[] = {
+        MetricsExporter::TIER_TOR, MetricsExporter::TIER_AGG, MetricsExporter::TIER_AGG, MetricsExporter::TIER_CORE};
+    for (int t = 0; t < 4; t++) {
+        for (size_t i = 0; i < tiers[t]->size(); i++) {
+            for (size_t j = 0; j < (*tiers[t])[i].size(); j++) {
+                for (size_t b = 0; b < (*tiers[t])[i][j].size(); b++) {
+                    if ((*tiers[t])[i][j][b]) {
+                        metrics.monitorQueue((*tiers[t])[i][j][b], tier_of[t]);
+                    }
+                }
+            }
+        }
+    }
+}
+
 void FatTreeTopology::add_switch_loggers(Logfile& log, simtime_picosec sample_period) {
     for (uint32_t i = 0; i < NTOR; i++) {
         switches_lp[i]->add_logger(log, sample_period);
@@ -1350,3 +1452,111 @@ void FatTreeTopology::add_switch_loggers(Logfile& log, simtime_picosec sample_pe
         switches_c[i]->add_logger(log, sample_period);
     }
 }
+
+template<class T>
+static uint64_t table_bytes(const vector< vector< vector<T> > >& table) {
+    uint64_t bytes = table.capacity() * sizeof(vector< vector<T> >);
+    for (size_t i = 0; i < table.size(); i++) {
+        bytes += table[i].capacity() * sizeof(vector<T>);
+        for (size_t j = 0; j < table[i].size(); j++)
+            bytes += table[i][j].capacity() * sizeof(T);
+    }
+    return bytes;
+}
+
+void FatTreeTopology::print_memory(ostream& out) const {
+    uint64_t tables = pipes_nlp_ns.bytes() + queues_nlp_ns.bytes()
+        + pipes_ns_nlp.bytes() + queues_ns_nlp.bytes()
+        + table_bytes(pipes_nc_nup) + table_bytes(queues_nc_nup)
+        + table_bytes(pipes_nup_nlp) + table_bytes(queues_nup_nlp)
+        + table_bytes(pipes_nup_nc) + table_bytes(queues_nup_nc)
+        + table_bytes(pipes_nlp_nup) + table_bytes(queues_nlp_nup);
+    out << "Topology memory (object sizes exclude what they allocate themselves):" << endl;
+    out << "  " << left << setw(24) << "link tables" << right << fixed << setprecision(1)
+        << tables / 1048576.0 << "MB" << endl;
+    _arena->print_classes(out, "  ");
+    out << "  " << left << setw(24) << "total objects" << right
+        << _arena->bytes_made() / 1048576.0 << "MB";
+    if (_arena->pooled())
+        out << " in " << _arena->bytes_reserved() / 1048576.0 << "MB of arena";
+    out << endl;
+    out.unsetf(ios_base::floatfield);
+    out << setprecision(6);
+}
+
+void FatTreeTopology::build_fibs() {
+    for (uint32_t i = 0; i < NTOR; i++)
+        ((FatTreeSwitch*)switches_lp[i])->build_fib();
+    for (uint32_t i = 0; i < NAGG; i++)
+        ((FatTreeSwitch*)switches_up[i])->build_fib();
+    for (uint32_t i = 0; i < NCORE; i++)
+        ((FatTreeSwitch*)switches_c[i])->build_fib();
+}
+
+void FatTreeTopology::get_queue_path(uint32_t src, uint32_t dest, uint32_t entropy, vector<BaseQueue*>& path) {
+    uint32_t tor = HOST_POD_SWITCH(src), dest_tor = HOST_POD_SWITCH(dest);
+    path.clear();
+    path.push_back(queues_ns_nlp[src][tor][0]);
+    if (tor == dest_tor) {
+        path.push_back(queues_nlp_ns[tor][dest][0]);
+        return;
+    }
+
+    uint32_t agg_min = 0, aggs = NAGG;
+    if (_tiers == 3) {
+        agg_min = MIN_POD_AGG_SWITCH(HOST_POD(src));
+        aggs = _agg_switches_per_pod;
+    }
+    uint32_t agg = agg_min + entropy % aggs;
+    entropy /= aggs;
+    path.push_back(queues_nlp_nup[tor][agg][entropy % _bundlesize[AGG_TIER]]);
+
+    if (_tiers == 2 || HOST_POD(dest) == HOST_POD(src)) {
+        path.push_back(queues_nup_nlp[agg][dest_tor][0]);
+        path.push_back(queues_nlp_ns[dest_tor][dest][0]);
+        return;
+    }
+
+    // up to a core switch with both its links to the two pods working
+    uint32_t podpos = agg % _agg_switches_per_pod;
+    uint32_t dest_agg = MIN_POD_AGG_SWITCH(HOST_POD(dest)) + podpos;
+    uint32_t uplink_bundles = _radix_up[AGG_TIER] / _bundlesize[CORE_TIER];
+    for (uint32_t i = 0; i < uplink_bundles * _bundlesize[CORE_TIER]; i++) {
+        uint32_t choice = entropy + i;
+        uint32_t core = (choice % uplink_bundles) * _agg_switches_per_pod + podpos;
+        uint32_t b = (choice / uplink_bundles) % _bundlesize[CORE_TIER];
+        if (!queues_nup_nc[agg][core][b] || !queues_nc_nup[core][dest_agg][b])
+            continue; //failed link.
+        path.push_back(queues_nup_nc[agg][core][b]);
+        path.push_back(queues_nc_nup[core][dest_agg][b]);
+        path.push_back(queues_nup_nlp[dest_agg][dest_tor][0]);
+        path.push_back(queues_nlp_ns[dest_tor][dest][0]);
+        return;
+    }
+    cerr << "No working path from " << src << " to " << dest << " through agg switch " << agg << endl;
+    abort();
+}
+
+void FatTreeTopology::print_port_choices(ostream& out) const {
+    const vector<Switch*>* tiers[] = {&switches_lp, &switches_up, &switches_c};
+    const char* names[] = {"ToR", "aggregation", "core"};
+    for (int t = 0; t < 3; t++) {
+        uint64_t choices = 0;
+        double total_fairness = 0, worst_fairness = 1.0;
+        uint32_t switches = 0;
+        for (size_t i = 0; i < tiers[t]->size(); i++) {
+            FatTreeSwitch* sw = (FatTreeSwitch*)(*tiers[t])[i];
+            if (!sw || !sw->choices_made())
+                continue;
+            double fairness = sw->port_fairness();
+            choices += sw->choices_made();
+            total_fairness += fairness;
+            worst_fairness = min(worst_fairness, fairness);
+            switches++;
+        }
+        if (switches) {
+            out << "Port choices at " << names[t] << " switches: " << choices << " over " << switches
+                << " switches, fairness mean " << total_fairness / switches << " worst " << worst_fairness << endl;
+        }
+    }
+}
@@ -13,6 +13,9 @@
 #include "eventlist.h"
 #include "switch.h"
 #include <ostream>
+#include "metrics_exporter.h"
+#include "arena.h"
+#include "compiled_topology.h"
 
 //#define N K*K*K/4
 
@@ -29,6 +32,54 @@ typedef enum {UPLINK, DOWNLINK} link_direction;
 #define AGG_TIER 1
 #define CORE_TIER 2
 
+// A [row][column][bundle] table of links where each row only links to a
+// run of consecutive columns, as between a ToR and its hosts.  Only that
+// run is stored, so a 16k host fabric doesn't need a ToR x host matrix.
+// Indexing outside the run is a bug.
+template<class T>
+class LinkTable {
+public:
+    class Row {
+    public:
+        Row() : _first(0) {}
+        vector<T>& operator[](size_t col) {
+            assert(col >= _first && col < end());
+            return _cols[col - _first];
+        }
+        const vector<T>& operator[](size_t col) const {
+            assert(col >= _first && col < end());
+            return _cols[col - _first];
+        }
+        size_t first() const {return _first;}
+        size_t end() const {return _first + _cols.size();}
+    private:
+        friend class LinkTable;
+        size_t _first;
+        vector< vector<T> > _cols;
+    };
+
+    void resize(size_t rows) {_rows.resize(rows);}
+    void set_columns(size_t row, size_t first, size_t count, size_t bundlesize) {
+        _rows.at(row)._first = first;
+        _rows.at(row)._cols.assign(count, vector<T>(bundlesize));
+    }
+    size_t size() const {return _rows.size();}
+    Row& operator[](size_t row) {return _rows[row];}
+    const Row& operator[](size_t row) const {return _rows[row];}
+
+    uint64_t bytes() const {
+        uint64_t bytes = _rows.capacity() * sizeof(Row);
+        for (size_t r = 0; r < _rows.size(); r++) {
+            bytes += _rows[r]._cols.capacity() * sizeof(vector<T>);
+            for (size_t c = 0; c < _rows[r]._cols.size(); c++)
+                bytes += _rows[r]._cols[c].capacity() * sizeof(T);
+        }
+        return bytes;
+    }
+private:
+    vector<Row> _rows;
+};
+
 class FatTreeTopology: public Topology{
 public:
     vector <Switch*> switches_lp;
@@ -38,17 +89,17 @@ public:
     // 3rd index is link number in bundle
     vector< vector< vector<Pipe*> > > pipes_nc_nup;
     vector< vector< vector<Pipe*> > > pipes_nup_nlp;
-    vector< vector< vector<Pipe*> > > pipes_nlp_ns;
+    LinkTable<Pipe*> pipes_nlp_ns;
     vector< vector< vector<BaseQueue*> > > queues_nc_nup;
     vector< vector< vector<BaseQueue*> > > queues_nup_nlp;
-    vector< vector< vector<BaseQueue*> > > queues_nlp_ns;
+    LinkTable<BaseQueue*> queues_nlp_ns;
 
     vector< vector< vector<Pipe*> > > pipes_nup_nc;
     vector< vector< vector<Pipe*> > > pipes_nlp_nup;
-    vector< vector< vector<Pipe*> > > pipes_ns_nlp;
+    LinkTable<Pipe*> pipes_ns_nlp;
     vector< vector< vector<BaseQueue*> > > queues_nup_nc;
     vector< vector< vector<BaseQueue*> > > queues_nlp_nup;
-    vector< vector< vector<BaseQueue*> > > queues_ns_nlp;
+    LinkTable<BaseQueue*> queues_ns_nlp;
   
     FirstFit* ff;
     QueueLoggerFactory* _logger_factory;
@@ -57,7 +108,8 @@ public:
     queue_type _qt;
     queue_type _sender_qt;
 
-    // For regular topologies, just use the constructor.  For custom topologies, load from a config file.
+    // For regular topologies, just use the constructor.  For custom topologies, load from a config file,
+    // either a .topo tier spec or one compiled by topology_compiler.py.
     static FatTreeTopology* load(const char * filename, QueueLoggerFactory* logger_factory, EventList& eventlist,
                                  mem_b queuesize, queue_type q_type, queue_type sender_q_type);
 
@@ -93,6 +145,10 @@ public:
     static void set_podsize(int hosts_per_pod) {
         _hosts_per_pod = hosts_per_pod;
     }
+    // build queues, pipes and switches from large preallocated chunks
+    // rather than one allocation each
+    static void set_arena(bool use_arena) {_use_arena = use_arena;}
+    static void reset_parameters(); // back to defaults, before building another topology in the same process
 
     void count_queue(Queue*);
     void print_path(std::ofstream& paths,uint32_t src,const Route* route);
@@ -113,6 +169,19 @@ public:
 
     // add loggers to record total queue size at switches
     virtual void add_switch_loggers(Logfile& log, simtime_picosec sample_period); 
+    // stream queue depths, drops and trims per tier to a live metrics reader
+    void add_metrics(MetricsExporter& metrics);
+    // memory held by the link tables and the objects of each class
+    void print_memory(ostream& out) const;
+    // for each tier, how evenly its switches spread their choices over
+    // the ports they had a choice of
+    void print_port_choices(ostream& out) const;
+    // fill in every switch's routes to every host before the run
+    // (see FatTreeSwitch::build_fib)
+    void build_fibs();
+    // the queues on one path from src to dest, entropy picking among the
+    // equal cost paths as a flow hash would; failed links are avoided
+    void get_queue_path(uint32_t src, uint32_t dest, uint32_t entropy, vector<BaseQueue*>& path);
 
     uint32_t HOST_POD_SWITCH(uint32_t src){
         return src/_radix_down[TOR_TIER];
@@ -171,6 +240,8 @@ private:
     map<Queue*,int> _link_usage;
     static FatTreeTopology* load(istream& file, QueueLoggerFactory* logger_factory, EventList& eventlist,
                                  mem_b queuesize, queue_type q_type, queue_type sender_q_type);
+    static FatTreeTopology* load(const CompiledTopology& compiled, QueueLoggerFactory* logger_factory, EventList& eventlist,
+                                 mem_b queuesize, queue_type q_type, queue_type sender_q_type);
     void set_linkspeeds(linkspeed_bps linkspeed);
     void set_queue_sizes(mem_b queuesize);
     int64_t find_lp_switch(Queue* queue);
@@ -180,6 +251,14 @@ private:
     void set_params(uint32_t no_of_nodes);
     void set_custom_params(uint32_t no_of_nodes);
     void alloc_vectors();
+
+    template<class T, class... Args>
+    T* make(Args&&... args) {
+        return _arena->make<T>(std::forward<Args>(args)...);
+    }
+    Arena* _arena;
+    static bool _use_arena;
+
     uint32_t NCORE, NAGG, NTOR, NSRV, NPOD;
     uint32_t _tor_switches_per_pod, _agg_switches_per_pod;
     static uint32_t _tiers;
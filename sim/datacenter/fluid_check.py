@@ -0,0 +1,295 @@
+#! /usr/bin/env python3
+
+"""
+Check the fluid background model against a full packet-level run.
+
+Flows tagged "fluid" in a connection matrix are simulated at the flow level
+by htsim_eqds unless -no_fluid is given. This script runs the same matrix
+both ways and reports how far the flow completion times (FCTs) of the fluid
+run are from the packet run, separately for the foreground (packet) flows
+and the background (fluid) flows, together with how many events each run
+scheduled and how long it took.
+
+Example:
+
+    python fluid_check.py -tm mixed.cm -- -nodes 128 -strat ecmp -paths 16 -end 50000
+"""
+
+import argparse
+import os
+import shlex
+import sys
+import tempfile
+from collections import namedtuple
+
+from launch import launch
+
+# Default argument values.
+DEFAULT_BINARY = "./htsim_eqds"
+
+
+class FctError(namedtuple("FctError", ["flows", "mean", "p99", "worst"])):
+    """
+    The relative FCT error of the fluid run over a set of flows: the number
+    of flows present in both runs, and the mean, 99th percentile and largest
+    of |fct_fluid - fct_packet| / fct_packet.
+    """
+
+
+class CheckResult(
+    namedtuple(
+        "CheckResult",
+        [
+            "foreground",
+            "background",
+            "foreground_mean_fct",
+            "foreground_p99_fct",
+            "events_ratio",
+            "wall_ratio",
+        ],
+    )
+):
+    """
+    The outcome of a check: FctError for the foreground and background
+    flows, the foreground mean and 99th percentile FCT in us as
+    (packet, fluid) pairs, and the events scheduled and wall time of the
+    fluid run as a fraction of the packet run.
+    """
+
+
+def read_matrix(tm_path: str) -> dict[int, tuple[float, bool]]:
+    """
+    Read the flows of a connection matrix.
+
+    Args:
+        tm_path (str): The connection matrix file.
+
+    Returns:
+        dict[int, tuple[float, bool]]: A map from flow id to its start time
+        in microseconds and whether it is tagged fluid. Flows without an id
+        are left out, as their completions cannot be matched up.
+    """
+    flows = {}
+    with open(tm_path, "r", encoding="utf-8") as tm_file:
+        for line in tm_file:
+            tokens = line.split()
+            if not tokens or "->" not in tokens[0] or "id" not in tokens:
+                continue
+            flow_id = int(tokens[tokens.index("id") + 1])
+            start_us = 0.0
+            if "start" in tokens:
+                # start times in a connection matrix are in picoseconds
+                start_us = float(tokens[tokens.index("start") + 1]) / 1e6
+            flows[flow_id] = (start_us, "fluid" in tokens)
+    return flows
+
+
+def parse_output(output: str) -> tuple[dict[int, float], int]:
+    """
+    Extract the flow finish times and the number of events scheduled from
+    the stdout of an htsim_eqds run.
+
+    Returns:
+        tuple[dict[int, float], int]: A map from flow id to finish time in
+        microseconds, and the events scheduled (None if not reported).
+    """
+    finish_times = {}
+    events = None
+    for line in output.splitlines():
+        items = line.split()
+        if line.startswith("Events scheduled:"):
+            events = int(items[-1])
+            continue
+        if not line.startswith("Flow ") or "flowId" not in items or "at" not in items:
+            continue
+        at_idx = items.index("at")
+        if items[at_idx - 1] != "finished" or at_idx + 1 >= len(items):
+            continue
+        try:
+            flow_id = int(items[items.index("flowId") + 1])
+            finish_times[flow_id] = float(items[at_idx + 1])
+        except ValueError:
+            continue
+    return finish_times, events
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Return the value at the given fraction of the sorted values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def fct_error(packet_fcts: dict[int, float], fluid_fcts: dict[int, float]) -> FctError:
+    """Compare the FCTs of the flows present in both runs."""
+    errors = [
+        abs(fluid_fcts[flow_id] - fct) / fct
+        for flow_id, fct in packet_fcts.items()
+        if flow_id in fluid_fcts and fct > 0
+    ]
+    if not errors:
+        return FctError(0, None, None, None)
+    return FctError(
+        len(errors), sum(errors) / len(errors), percentile(errors, 0.99), max(errors)
+    )
+
+
+def compare(
+    flows: dict[int, tuple[float, bool]],
+    packet_output: str,
+    fluid_output: str,
+    packet_wall_s: float,
+    fluid_wall_s: float,
+) -> CheckResult:
+    """
+    Compare a fluid run with a packet run of the same matrix.
+
+    Args:
+        flows (dict): The flows of the matrix, as returned by read_matrix().
+        packet_output (str): The stdout of the run with -no_fluid.
+        fluid_output (str): The stdout of the run with the fluid model.
+        packet_wall_s (float): The wall time of the packet run.
+        fluid_wall_s (float): The wall time of the fluid run.
+
+    Returns:
+        CheckResult: The FCT errors and cost ratios.
+    """
+    runs = []
+    for output in (packet_output, fluid_output):
+        finish_times, events = parse_output(output)
+        fcts = {
+            flow_id: finish - flows[flow_id][0]
+            for flow_id, finish in finish_times.items()
+            if flow_id in flows
+        }
+        runs.append((fcts, events))
+    (packet_fcts, packet_events), (fluid_fcts, fluid_events) = runs
+
+    def subset(fcts, fluid):
+        return {k: v for k, v in fcts.items() if flows[k][1] == fluid}
+
+    foreground = [subset(packet_fcts, False), subset(fluid_fcts, False)]
+    summary = [
+        tuple(
+            (sum(fcts.values()) / len(fcts)) if fcts else None for fcts in foreground
+        ),
+        tuple(
+            percentile(list(fcts.values()), 0.99) if fcts else None
+            for fcts in foreground
+        ),
+    ]
+    return CheckResult(
+        fct_error(*foreground),
+        fct_error(subset(packet_fcts, True), subset(fluid_fcts, True)),
+        summary[0],
+        summary[1],
+        fluid_events / packet_events if packet_events and fluid_events else None,
+        fluid_wall_s / packet_wall_s if packet_wall_s > 0 else None,
+    )
+
+
+def run(cmdline: list[str]):
+    """
+    Run the simulator with its log in a temporary file.
+
+    Returns:
+        LaunchResult: The result of the run.
+
+    Raises:
+        RuntimeError: If the simulator exits with a non-zero status.
+    """
+    print("Running", shlex.join(cmdline))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if "-o" not in cmdline:
+            cmdline = cmdline + ["-o", os.path.join(tmpdir, "logout.dat")]
+        result = launch(cmdline)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"{shlex.join(cmdline)} exited with status {result.returncode}:"
+            f" {result.stderr}"
+        )
+    return result
+
+
+def add_commandline_options():
+    """
+    Create an argument parser and add command line options to the parser.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser object with added command line options.
+    """
+    arg_parser = argparse.ArgumentParser(
+        description="Compare fluid background flows with a packet-level run."
+    )
+    arg_parser.add_argument(
+        "-tm",
+        "--tm_path",
+        required=True,
+        help="(Required) A connection matrix with some flows tagged fluid.",
+    )
+    arg_parser.add_argument(
+        "-b",
+        "--binary",
+        default=DEFAULT_BINARY,
+        help=f"The simulator executable, by default {DEFAULT_BINARY}.",
+    )
+    arg_parser.add_argument(
+        "sim_args",
+        nargs=argparse.REMAINDER,
+        help="Arguments passed to both runs.",
+    )
+    return arg_parser
+
+
+def format_error(error: FctError) -> str:
+    """Format an FctError as percentages."""
+    if not error.flows:
+        return "no flows"
+    return (
+        f"mean {error.mean:.1%} p99 {error.p99:.1%} worst {error.worst:.1%}"
+        f" over {error.flows} flows"
+    )
+
+
+def main():
+    """The main function of the fluid check."""
+    args = add_commandline_options().parse_args()
+    sim_args = args.sim_args
+    if sim_args and sim_args[0] == "--":
+        sim_args = sim_args[1:]
+    flows = read_matrix(args.tm_path)
+    if not any(fluid for _, fluid in flows.values()):
+        sys.exit(f"Error: no flows in {args.tm_path} are tagged fluid")
+
+    cmdline = [args.binary, "-tm", args.tm_path] + sim_args
+    try:
+        packet = run(cmdline + ["-no_fluid"])
+        fluid = run(cmdline)
+    except RuntimeError as e:
+        sys.exit(f"Error: {e}")
+
+    result = compare(
+        flows,
+        packet.stdout,
+        fluid.stdout,
+        packet.usage.wall_s,
+        fluid.usage.wall_s,
+    )
+    print("Foreground FCT error:", format_error(result.foreground))
+    print("Background FCT error:", format_error(result.background))
+    if result.foreground.flows:
+        print(
+            "Foreground mean FCT: %.1f us packet, %.1f us fluid"
+            % result.foreground_mean_fct
+        )
+        print(
+            "Foreground p99 FCT: %.1f us packet, %.1f us fluid"
+            % result.foreground_p99_fct
+        )
+    if result.events_ratio is not None:
+        print(f"Events scheduled: {result.events_ratio:.1%} of the packet run")
+    if result.wall_ratio is not None:
+        print(f"Wall time: {result.wall_ratio:.1%} of the packet run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include "fluid_model.h"
+#include "fat_tree_switch.h"
+#include <algorithm>
+#include <math.h>
+
+// the packet traffic on a link is backlogged in an interval if it sent at
+// this much of the rate the background flows left it, or more
+static const double BUSY_FRACTION = 0.9;
+
+FluidModel::FluidModel(FatTreeTopology& topology, EventList& eventlist, uint32_t paths,
+                       simtime_picosec interval, double min_share)
+    : EventSource(eventlist, "FluidModel"), _topology(topology), _paths(paths),
+      _interval(interval), _min_share(min_share), _sorted(true),
+      _last_advance(0), _last_sample(0), _next_event(UINT64_MAX),
+      _finished(0), _updates(0)
+{
+    assert(paths > 0);
+    assert(interval > 0);
+    assert(min_share > 0 && min_share < 1);
+}
+
+uint32_t
+FluidModel::linkIndex(BaseQueue* queue) {
+    auto i = _link_ids.find(queue);
+    if (i != _link_ids.end())
+        return i->second;
+
+    Link l;
+    l.queue = queue;
+    l.capacity = queue->bitrate();
+    l.active = 0;
+    l.idle = IDLE_INTERVALS;
+    l.served = queue->bytes_served();
+    l.demand = 0;
+    l.background = 0;
+    _links.push_back(l);
+    _link_ids[queue] = _links.size() - 1;
+    return _links.size() - 1;
+}
+
+void
+FluidModel::addFlow(const string& name, flowid_t flowid, uint32_t src, uint32_t dest,
+                    uint64_t size, simtime_picosec start) {
+    Flow f;
+    f.name = name;
+    f.flowid = flowid;
+    f.start = max(start, eventlist().now());
+    f.size = size;
+    f.remaining = size;
+    f.rate = 0;
+
+    // consecutive entropies walk round the aggregation and core switches,
+    // so the paths cover the links between them evenly
+    vector<BaseQueue*> path;
+    unordered_map<uint32_t,uint32_t> pos;
+    uint32_t entropy = freeBSDHash(flowid, src, dest);
+    for (uint32_t p = 0; p < _paths; p++) {
+        _topology.get_queue_path(src, dest, entropy + p, path);
+        for (size_t i = 0; i < path.size(); i++) {
+            uint32_t link = linkIndex(path[i]);
+            auto j = pos.find(link);
+            if (j == pos.end()) {
+                pos[link] = f.links.size();
+                f.links.push_back(link);
+                f.weights.push_back(1.0 / _paths);
+            } else {
+                f.weights[j->second] += 1.0 / _paths;
+            }
+        }
+    }
+
+    _flows.push_back(f);
+    _pending.push_back(_flows.size() - 1);
+    _sorted = false;
+
+    if (f.start < _next_event) {
+        _next_event = f.start;
+        eventlist().reschedulePendingSource(*this, _next_event);
+    }
+}
+
+void
+FluidModel::advance(simtime_picosec now) {
+    double elapsed = timeAsSec(now - _last_advance);
+    _last_advance = now;
+
+    for (size_t i = 0; i < _running.size();) {
+        Flow& f = _flows[_running[i]];
+        f.remaining -= f.rate * elapsed / 8;
+        if (f.remaining >= 1.0) {
+            i++;
+            continue;
+        }
+
+        cout << "Flow " << f.name << " flowId " << f.flowid << " fluid finished at " << timeAsUs(now)
+             << " total bytes " << f.size << endl;
+        for (size_t j = 0; j < f.links.size(); j++)
+            _links[f.links[j]].active--;
+        f.rate = 0;
+        _finished++;
+        _running[i] = _running.back();
+        _running.pop_back();
+    }
+}
+
+void
+FluidModel::sampleLinks() {
+    simtime_picosec now = eventlist().now();
+    if (now - _last_sample < _interval)
+        return;
+    double elapsed = timeAsSec(now - _last_sample);
+    _last_sample = now;
+
+    for (size_t i = 0; i < _links.size(); i++) {
+        Link& l = _links[i];
+        uint64_t served = l.queue->bytes_served();
+        l.demand = (served - l.served) * 8 / elapsed;
+        l.served = served;
+        if (l.demand >= BUSY_FRACTION * (l.capacity - l.queue->background_rate()))
+            l.idle = 0;
+        else if (l.idle < IDLE_INTERVALS)
+            l.idle++;
+    }
+}
+
+// Progressive filling: raise the rates of all unfixed flows together
+// until a link is full, fix the flows through it at that rate, and carry
+// on with the rest.  A flow loads each link with its rate times the share
+// of its paths through that link.  The packet traffic on a link joins in
+// as a flow of its own, asking for no more than it sent last interval
+// (or min_share of the link, if more) while not backlogged.
+void
+FluidModel::assignRates() {
+    const double epsilon = 1e-9;
+    vector<uint32_t> used;
+    for (size_t i = 0; i < _links.size(); i++) {
+        Link& l = _links[i];
+        if (!l.active)
+            continue;
+        l.left = l.capacity;
+        l.unfixed = l.active + 1;
+        l.unfixed_weight = 1;
+        l.packets_fixed = false;
+        used.push_back(i);
+    }
+    vector<uint32_t> unfixed(_running);
+    for (size_t i = 0; i < unfixed.size(); i++) {
+        Flow& f = _flows[unfixed[i]];
+        for (size_t j = 0; j < f.links.size(); j++)
+            _links[f.links[j]].unfixed_weight += f.weights[j];
+    }
+
+    while (!unfixed.empty()) {
+        double level = HUGE_VAL;
+        for (size_t i = 0; i < used.size(); i++) {
+            Link& l = _links[used[i]];
+            if (l.unfixed)
+                level = min(level, l.left / l.unfixed_weight);
+        }
+
+        // packet traffic that wants less than the level gets what it wants
+        bool fixed_packets = false;
+        for (size_t i = 0; i < used.size(); i++) {
+            Link& l = _links[used[i]];
+            if (l.packets_fixed || l.idle < IDLE_INTERVALS)
+                continue;
+            double demand = max(l.demand, _min_share * l.capacity);
+            if (demand <= level) {
+                l.left -= demand;
+                l.unfixed--;
+                l.unfixed_weight -= 1;
+                l.packets_fixed = true;
+                fixed_packets = true;
+            }
+        }
+        if (fixed_packets)
+            continue;
+
+        for (size_t i = 0; i < unfixed.size();) {
+            Flow& f = _flows[unfixed[i]];
+            bool bottlenecked = false;
+            for (size_t j = 0; j < f.links.size() && !bottlenecked; j++) {
+                Link& l = _links[f.links[j]];
+                bottlenecked = l.left / l.unfixed_weight <= level * (1 + epsilon);
+            }
+            if (!bottlenecked) {
+                i++;
+                continue;
+            }
+            f.rate = level;
+            for (size_t j = 0; j < f.links.size(); j++) {
+                Link& l = _links[f.links[j]];
+                l.left -= level * f.weights[j];
+                l.unfixed--;
+                l.unfixed_weight -= f.weights[j];
+            }
+            unfixed[i] = unfixed.back();
+            unfixed.pop_back();
+        }
+
+        // the packet traffic through the full links is held at the level too
+        for (size_t i = 0; i < used.size(); i++) {
+            Link& l = _links[used[i]];
+            if (!l.packets_fixed && l.unfixed == 1 && l.left <= level * (1 + epsilon)) {
+                l.left -= level;
+                l.unfixed--;
+                l.unfixed_weight = 0;
+                l.packets_fixed = true;
+            }
+        }
+    }
+
+    for (size_t i = 0; i < _links.size(); i++)
+        _links[i].background = 0;
+    for (size_t i = 0; i < _running.size(); i++) {
+        Flow& f = _flows[_running[i]];
+        for (size_t j = 0; j < f.links.size(); j++)
+            _links[f.links[j]].background += f.rate * f.weights[j];
+    }
+    for (size_t i = 0; i < _links.size(); i++) {
+        Link& l = _links[i];
+        linkspeed_bps background = (linkspeed_bps)l.background;
+        if (background != l.queue->background_rate())
+            l.queue->set_background_rate(background);
+    }
+    _updates++;
+}
+
+void
+FluidModel::schedule() {
+    simtime_picosec now = eventlist().now();
+    _next_event = UINT64_MAX;
+    if (!_pending.empty())
+        _next_event = _flows[_pending.back()].start;
+    if (!_running.empty())
+        _next_event = min(_next_event, now + _interval);
+    for (size_t i = 0; i < _running.size(); i++) {
+        Flow& f = _flows[_running[i]];
+        if (f.rate <= 0)
+            continue;
+        simtime_picosec done = now + (simtime_picosec)ceil(f.remaining * 8 / f.rate * 1e12);
+        _next_event = min(_next_event, done);
+    }
+    if (_next_event != UINT64_MAX)
+        eventlist().sourceIsPending(*this, _next_event);
+}
+
+void
+FluidModel::doNextEvent() {
+    simtime_picosec now = eventlist().now();
+    if (!_sorted) {
+        // latest first, so flows start from the back
+        sort(_pending.begin(), _pending.end(), [this](uint32_t a, uint32_t b) {
+                return _flows[a].start > _flows[b].start;
+            });
+        _sorted = true;
+    }
+
+    advance(now);
+    while (!_pending.empty() && _flows[_pending.back()].start <= now) {
+        Flow& f = _flows[_pending.back()];
+        _pending.pop_back();
+        for (size_t j = 0; j < f.links.size(); j++)
+            _links[f.links[j]].active++;
+        _running.push_back(&f - &_flows[0]);
+    }
+    sampleLinks();
+    assignRates();
+    schedule();
+}
+
+void
+FluidModel::printStats(ostream& out) const {
+    out << "Fluid flows: " << _finished << " finished of " << _flows.size()
+        << ", " << _updates << " rate updates over " << _links.size() << " links" << endl;
+}
@@ -0,0 +1,98 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef FLUID_MODEL_H
+#define FLUID_MODEL_H
+
+/*
+ * FluidModel simulates background flows at the flow level rather than
+ * packet by packet.  Each flow is spread evenly over as many paths through
+ * the fat tree as an EQDS source would spray its packets over, and sends
+ * at its max-min fair share of the links on those paths.  Rates are worked out again
+ * whenever a flow starts or finishes, and at least once every interval,
+ * so the model costs a few events per flow however large the flow is.
+ *
+ * Background flows take their rates out of the links they cross: each
+ * queue on the path serves packets at the link rate less the background
+ * rate through it (see BaseQueue::set_background_rate).  The packet
+ * traffic on a link takes part in the max-min share as one more flow.
+ * Once an interval, the bytes the queue sent on give the rate the packet
+ * traffic had.  If it used almost all the rate left to it, it is counted
+ * as backlogged and takes a full share; once it has not for a few
+ * intervals running, it is given what it used, and never less than a
+ * small reserve (min_share of the link), so packets arriving later are
+ * never stalled outright.  A link starts out not backlogged.
+ */
+
+#include <vector>
+#include <unordered_map>
+#include "eventlist.h"
+#include "fat_tree_topology.h"
+
+class FluidModel : public EventSource {
+public:
+    FluidModel(FatTreeTopology& topology, EventList& eventlist, uint32_t paths,
+               simtime_picosec interval = timeFromUs(10.0), double min_share = 0.05);
+
+    void addFlow(const string& name, flowid_t flowid, uint32_t src, uint32_t dest,
+                 uint64_t size, simtime_picosec start);
+    void doNextEvent();
+
+    uint32_t flows() const {return _flows.size();}
+    uint32_t finished() const {return _finished;}
+    uint64_t updates() const {return _updates;}
+    void printStats(ostream& out) const;
+
+    // the packet traffic on a link counts as backlogged until it has not
+    // used the rate left to it this many intervals running
+    static const uint32_t IDLE_INTERVALS = 4;
+private:
+    struct Flow {
+        string name;
+        flowid_t flowid;
+        simtime_picosec start;
+        uint64_t size;
+        double remaining; // bytes
+        double rate; // bits per second
+        vector<uint32_t> links;
+        vector<double> weights; // share of the flow's rate crossing each link
+    };
+    struct Link {
+        BaseQueue* queue;
+        double capacity; // bits per second
+        uint32_t active; // background flows crossing it
+        uint32_t idle; // intervals the packet traffic has not been backlogged
+        uint64_t served; // the queue's bytes_served() at the last sample
+        double demand; // bits per second the packet traffic sent last interval
+        // scratch space for the max-min computation
+        double left;
+        uint32_t unfixed;
+        double unfixed_weight;
+        bool packets_fixed;
+        double background;
+    };
+
+    uint32_t linkIndex(BaseQueue* queue);
+    void advance(simtime_picosec now);
+    void sampleLinks();
+    void assignRates();
+    void schedule();
+
+    FatTreeTopology& _topology;
+    uint32_t _paths;
+    simtime_picosec _interval;
+    double _min_share;
+
+    vector<Flow> _flows;
+    vector<uint32_t> _pending; // flows not yet started, latest first
+    bool _sorted;
+    vector<uint32_t> _running;
+    vector<Link> _links;
+    unordered_map<BaseQueue*,uint32_t> _link_ids;
+
+    simtime_picosec _last_advance;
+    simtime_picosec _last_sample;
+    simtime_picosec _next_event;
+    uint32_t _finished;
+    uint64_t _updates;
+};
+
+#endif
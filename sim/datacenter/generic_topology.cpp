@@ -16,6 +16,10 @@ GenericTopology::GenericTopology(Logfile* lg, EventList* ev){
 
 
 bool GenericTopology::load(const char* filename){
+    if (CompiledTopology::isCompiled(filename)) {
+        CompiledTopology compiled(filename);
+        return load(compiled);
+    }
     FILE* f = fopen(filename,"r");
     if (!f)
         return false;
@@ -454,6 +458,93 @@ bool GenericTopology::load(FILE* f, int pass){
     return true;
 }
 
+// The compiler has resolved every queue and pipe into a link from one host
+// or switch to the next, so everything can be built in a single pass.
+bool GenericTopology::load(const CompiledTopology& compiled){
+    if (compiled.kind() != TOPO_GENERIC) {
+        cerr << "Compiled topology is not a generic topology" << endl;
+        return false;
+    }
+    _no_of_hosts = compiled.hosts();
+    _no_of_switches = compiled.nodes() - compiled.hosts();
+    _no_of_links = compiled.links();
+
+    std::fstream gv;
+    gv.open ("topo.gv", std::fstream::out);
+    gv << "digraph {" << endl;
+
+    vector<PacketSink*> nodes;
+    for (uint32_t n = 0; n < compiled.nodes(); n++) {
+        if (n < compiled.hosts()) {
+            Host* host = new Host(compiled.nodeName(n));
+            host->setPos(compiled.nodeX(n), compiled.nodeY(n));
+            _hosts.push_back(host);
+            nodes.push_back(host);
+        } else {
+            Switch* sw = new Switch(*_eventlist, compiled.nodeName(n));
+            sw->setPos(compiled.nodeX(n), compiled.nodeY(n));
+            _switches.push_back(sw);
+            nodes.push_back(sw);
+        }
+    }
+
+    for (uint32_t n = 0; n < compiled.nodes(); n++) {
+        for (uint64_t l = compiled.linksBegin(n); l < compiled.linksEnd(n); l++) {
+            QueueLogger* queuelogger = 0;
+            if (compiled.linkLogPeriod(l)) {
+                queuelogger = new QueueLoggerSampling(compiled.linkLogPeriod(l), *_eventlist);
+                _logfile->addLogger(*queuelogger);
+            }
+            linkspeed_bps linkspeed = compiled.linkSpeed(l);
+            mem_b queuesize = compiled.linkQueueSize(l);
+            BaseQueue* q = 0;
+            switch (compiled.linkQueueType(l)) {
+            case TOPO_QUEUE_FIFO:
+                q = new Queue(linkspeed, queuesize, *_eventlist, queuelogger);
+                break;
+            case TOPO_QUEUE_RANDOM:
+                q = new RandomQueue(linkspeed, queuesize, *_eventlist, queuelogger, memFromPkt(RANDOM_BUFFER));
+                break;
+            case TOPO_QUEUE_COMPOSITE:
+                q = new CompositeQueue(linkspeed, queuesize, *_eventlist, queuelogger);
+                break;
+            case TOPO_QUEUE_FAIR:
+                q = new FairScheduler(linkspeed, *_eventlist, queuelogger);
+                break;
+            default:
+                cerr << "No valid type specified for Queue " << compiled.linkQueueName(l) << endl;
+                return false;
+            }
+            q->forceName(compiled.linkQueueName(l));
+            _queues.push_back(q);
+            if (n < compiled.hosts()) {
+                ((Host*)nodes[n])->setQueue(q);
+            } else {
+                ((Switch*)nodes[n])->addPort(q);
+            }
+            gv << compiled.nodeName(n) << " -> " << q->nodename() << endl;
+
+            PacketSink* dst = nodes[compiled.linkDst(l)];
+            if (compiled.linkPipeName(l)) {
+                Pipe* pipe = new Pipe(compiled.linkLatency(l), *_eventlist);
+                pipe->forceName(compiled.linkPipeName(l));
+                _pipes.push_back(pipe);
+                q->setNext(pipe);
+                pipe->setNext(dst);
+                gv << q->nodename() << " -> " << pipe->nodename() << endl;
+                gv << pipe->nodename() << " -> " << compiled.nodeName(compiled.linkDst(l)) << endl;
+            } else {
+                q->setNext(dst);
+                gv << q->nodename() << " -> " << compiled.nodeName(compiled.linkDst(l)) << endl;
+            }
+        }
+    }
+
+    gv << "}\n";
+    gv.close();
+    return true;
+}
+
 vector<const Route*>* GenericTopology::get_bidir_paths(uint32_t src, uint32_t dest, bool reverse) {
     vector<const Route*>* paths = new vector<const Route*>();
     // TBD
@@ -12,6 +12,7 @@
 #include "logfile.h"
 #include "eventlist.h"
 #include "switch.h"
+#include "compiled_topology.h"
 #include <ostream>
 #include <fstream>
 
@@ -33,7 +34,9 @@ private:
 class GenericTopology: public Topology {
 public:
     GenericTopology(Logfile* lg, EventList* ev);
+    // a text topology file, or one compiled by topology_compiler.py
     bool load(const char *filename);
+    bool load(const CompiledTopology& compiled);
     void draw();
     virtual vector<const Route*>* get_bidir_paths(uint32_t src, uint32_t dest, bool reverse);
 
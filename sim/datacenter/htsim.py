@@ -0,0 +1,262 @@
+"""
+In-process bindings for running EQDS over a fat tree.
+
+Sweeps over thousands of small configurations spend most of their time
+starting processes and parsing text; this runs the simulator inside the
+Python process through libhtsim_api.so (make libhtsim_api.so) and returns
+the results as NumPy arrays.
+
+Example:
+
+    import htsim
+
+    htsim.reset(seed=13)
+    htsim.load_matrix("connection_matrices/perm_16n_16c_2MB.cm")
+    htsim.fat_tree(paths=128)
+    htsim.run(end_us=1000)
+    flows = htsim.flows()
+    print(flows.finish_us.max(), flows.rtx_pkts.sum())
+
+Only EQDS over a fat tree is covered, built as htsim_eqds builds it with
+its default options (ECMP routing, composite queues, fair priority host
+queues); the other mains (NDP, RoCE, HPCC, Swift, TCP) have no bindings.
+The connections are set up by the same code as htsim_eqds's, so sizes,
+flow ids, weights, triggers and link failures in a matrix mean the same
+thing here. Flows tagged fluid are not simulated: load_matrix() refuses
+a matrix with any.
+
+The library keeps one simulation at a time; reset() starts the next one.
+The library is looked for next to this file unless HTSIM_API_LIB is set.
+"""
+
+import ctypes
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# Default argument values, the same as htsim_eqds.
+DEFAULT_SEED = 13
+DEFAULT_TIERS = 3
+DEFAULT_LINKSPEED_MBPS = 100000
+DEFAULT_QUEUE_PKTS = 35
+DEFAULT_MTU = 4150
+DEFAULT_CWND_PKTS = 50
+DEFAULT_PATHS = 64
+DEFAULT_HOP_LATENCY_US = 1.0
+DEFAULT_SWITCH_LATENCY_US = 0.0
+DEFAULT_END_US = 1000.0
+
+LIB_FILE_NAME = "libhtsim_api.so"
+
+_u32_p = np.ctypeslib.ndpointer(np.uint32, flags="C_CONTIGUOUS")
+_u64_p = np.ctypeslib.ndpointer(np.uint64, flags="C_CONTIGUOUS")
+_f64_p = np.ctypeslib.ndpointer(np.float64, flags="C_CONTIGUOUS")
+
+_lib = None
+
+
+class Flows(
+    namedtuple(
+        "Flows",
+        "flow_id src dst size start_us finish_us new_pkts rtx_pkts rts_pkts bounces",
+    )
+):
+    """
+    Per-flow results, one array entry per connection in matrix order.
+
+    finish_us is NaN for flows that did not finish, start_us is NaN for
+    flows that only start on a trigger.
+    """
+
+    def finished(self) -> np.ndarray:
+        """Return a boolean mask of the flows that finished."""
+        return ~np.isnan(self.finish_us)
+
+    def fct_us(self) -> np.ndarray:
+        """Return the flow completion times, NaN for unfinished flows."""
+        return self.finish_us - self.start_us
+
+
+def _load_library():
+    """
+    Load the shared library and declare its functions.
+
+    Raises:
+        OSError: If the library has not been built.
+    """
+    global _lib
+    if _lib is not None:
+        return _lib
+    path = os.environ.get(
+        "HTSIM_API_LIB",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), LIB_FILE_NAME),
+    )
+    lib = ctypes.CDLL(path)
+    lib.htsim_reset.argtypes = [ctypes.c_uint32]
+    lib.htsim_reset.restype = ctypes.c_int
+    lib.htsim_set_quiet.argtypes = [ctypes.c_int]
+    lib.htsim_set_quiet.restype = None
+    lib.htsim_load_matrix.argtypes = [ctypes.c_char_p]
+    lib.htsim_load_matrix.restype = ctypes.c_int
+    lib.htsim_set_matrix.argtypes = [
+        ctypes.c_uint32, ctypes.c_uint32, _u32_p, _u32_p, _u64_p, _f64_p,
+    ]
+    lib.htsim_set_matrix.restype = ctypes.c_int
+    lib.htsim_eqds_fat_tree.argtypes = [
+        ctypes.c_uint32, ctypes.c_double, ctypes.c_uint32, ctypes.c_uint32,
+        ctypes.c_uint32, ctypes.c_uint32, ctypes.c_double, ctypes.c_double,
+    ]
+    lib.htsim_eqds_fat_tree.restype = ctypes.c_int
+    lib.htsim_run.argtypes = [ctypes.c_double]
+    lib.htsim_run.restype = ctypes.c_uint64
+    lib.htsim_now_us.argtypes = []
+    lib.htsim_now_us.restype = ctypes.c_double
+    lib.htsim_flow_count.argtypes = []
+    lib.htsim_flow_count.restype = ctypes.c_uint32
+    lib.htsim_finished_count.argtypes = []
+    lib.htsim_finished_count.restype = ctypes.c_uint32
+    lib.htsim_flows.argtypes = [
+        _u32_p, _u32_p, _u32_p, _u64_p, _f64_p, _f64_p, _u32_p, _u32_p, _u32_p, _u32_p,
+    ]
+    lib.htsim_flows.restype = None
+    _lib = lib
+    return lib
+
+
+def _check(ret: int, what: str) -> int:
+    """Raise RuntimeError if a library call failed."""
+    if ret < 0:
+        raise RuntimeError(f"{what} failed, see stderr")
+    return ret
+
+
+def reset(seed: int = DEFAULT_SEED, quiet: bool = True):
+    """
+    Start a new simulation.
+
+    Args:
+        seed (int): The random seed.
+        quiet (bool): Discard the simulator's standard output.
+    """
+    lib = _load_library()
+    lib.htsim_set_quiet(int(quiet))
+    _check(lib.htsim_reset(seed), "reset")
+
+
+def load_matrix(file_path: str) -> int:
+    """
+    Load the connection matrix from a file.
+
+    Returns:
+        int: The number of connections.
+
+    Raises:
+        RuntimeError: If the file cannot be loaded or tags a flow fluid.
+    """
+    return _check(
+        _load_library().htsim_load_matrix(os.fsencode(file_path)), "load_matrix"
+    )
+
+
+def set_matrix(nodes: int, src, dst, size, start_us=None) -> int:
+    """
+    Set the connection matrix from arrays.
+
+    Args:
+        nodes (int): The number of hosts.
+        src: The source host of each connection.
+        dst: The destination host of each connection.
+        size: The size of each flow in bytes.
+        start_us: The start time of each flow in us, by default all 0.
+
+    Returns:
+        int: The number of connections.
+
+    Raises:
+        ValueError: If the arrays differ in length.
+        RuntimeError: If a host is out of range.
+    """
+    src = np.ascontiguousarray(src, dtype=np.uint32)
+    dst = np.ascontiguousarray(dst, dtype=np.uint32)
+    size = np.ascontiguousarray(size, dtype=np.uint64)
+    if start_us is None:
+        start_us = np.zeros(len(src))
+    start_us = np.ascontiguousarray(start_us, dtype=np.float64)
+    if not len(src) == len(dst) == len(size) == len(start_us):
+        raise ValueError("src, dst, size and start_us must have the same length")
+    return _check(
+        _load_library().htsim_set_matrix(nodes, len(src), src, dst, size, start_us),
+        "set_matrix",
+    )
+
+
+def fat_tree(
+    tiers: int = DEFAULT_TIERS,
+    linkspeed_mbps: float = DEFAULT_LINKSPEED_MBPS,
+    queue_pkts: int = DEFAULT_QUEUE_PKTS,
+    mtu: int = DEFAULT_MTU,
+    cwnd_pkts: int = DEFAULT_CWND_PKTS,
+    paths: int = DEFAULT_PATHS,
+    hop_latency_us: float = DEFAULT_HOP_LATENCY_US,
+    switch_latency_us: float = DEFAULT_SWITCH_LATENCY_US,
+) -> int:
+    """
+    Build a fat tree sized to the connection matrix and connect an EQDS
+    flow for every connection.
+
+    Returns:
+        int: The number of flows.
+
+    Raises:
+        RuntimeError: If there is no matrix or the tree cannot be built.
+    """
+    return _check(
+        _load_library().htsim_eqds_fat_tree(
+            tiers, linkspeed_mbps, queue_pkts, mtu, cwnd_pkts, paths,
+            hop_latency_us, switch_latency_us,
+        ),
+        "fat_tree",
+    )
+
+
+def run(end_us: float = DEFAULT_END_US) -> int:
+    """
+    Run the simulation until end_us or until no events are left.
+
+    Returns:
+        int: The number of events dispatched.
+    """
+    return _load_library().htsim_run(end_us)
+
+
+def now_us() -> float:
+    """Return the current simulation time in us."""
+    return _load_library().htsim_now_us()
+
+
+def finished_count() -> int:
+    """Return the number of flows that have finished."""
+    return _load_library().htsim_finished_count()
+
+
+def flows() -> Flows:
+    """Return the per-flow results of the current simulation."""
+    lib = _load_library()
+    count = lib.htsim_flow_count()
+    result = Flows(
+        np.empty(count, np.uint32),
+        np.empty(count, np.uint32),
+        np.empty(count, np.uint32),
+        np.empty(count, np.uint64),
+        np.empty(count, np.float64),
+        np.empty(count, np.float64),
+        np.empty(count, np.uint32),
+        np.empty(count, np.uint32),
+        np.empty(count, np.uint32),
+        np.empty(count, np.uint32),
+    )
+    lib.htsim_flows(*result)
+    result.start_us[result.start_us < 0] = np.nan
+    result.finish_us[result.finish_us < 0] = np.nan
+    return result
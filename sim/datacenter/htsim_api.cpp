@@ -0,0 +1,261 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include <fstream>
+#include <iostream>
+#include <map>
+#include <vector>
+#include <stdlib.h>
+#include "network.h"
+#include "eventlist.h"
+#include "clock.h"
+#include "eqds.h"
+#include "eqds_connections.h"
+#include "connection_matrix.h"
+#include "fat_tree_topology.h"
+#include "fat_tree_switch.h"
+#include "htsim_api.h"
+
+// The topology below is main_eqds.cpp's with its default options (ECMP_FIB
+// host routing, composite queues, fair priority host queues), and the
+// flows are set up by the same EqdsConnections.
+
+static const simtime_picosec NOT_FINISHED = UINT64_MAX;
+
+// Records when each flow finishes, indexed by its position in the
+// connection matrix.
+class ApiFlowLogger : public FlowEventLogger {
+public:
+    virtual void logEvent(PacketFlow& flow, Logged& location, FlowEvent ev, mem_b bytes, uint64_t pkts) {
+        if (ev != FINISH)
+            return;
+        map<const Logged*, size_t>::iterator i = _index.find(&location);
+        if (i != _index.end() && _finish[i->second] == NOT_FINISHED) {
+            _finish[i->second] = EventList::now();
+            _finished++;
+        }
+    }
+    void clear() {_index.clear(); _finish.clear(); _finished = 0;}
+
+    map<const Logged*, size_t> _index;
+    vector<simtime_picosec> _finish;
+    uint32_t _finished;
+};
+
+// Values of the simulator's static parameters before any simulation
+// changed them; htsim_reset() puts them back.
+struct ApiDefaults {
+    uint16_t eqds_mss;
+    uint16_t eqds_mtu;
+    simtime_picosec eqds_min_rto;
+    uint32_t eqds_path_entropy_size;
+    uint16_t ar_sticky;
+    simtime_picosec sticky_delta;
+    double ecn_threshold_fraction;
+};
+
+static ApiDefaults* api_defaults = NULL;
+static ConnectionMatrix* api_matrix = NULL;
+static vector<EqdsSrc*> api_srcs;
+static ApiFlowLogger api_logger;
+static bool api_built = false;
+static bool api_ran = false;
+
+static ofstream api_devnull;
+static streambuf* api_cout_buf = NULL;
+
+static int api_error(const string& msg) {
+    cerr << "htsim_api: " << msg << endl;
+    return -1;
+}
+
+int htsim_reset(uint32_t seed) {
+    if (!api_defaults) {
+        api_defaults = new ApiDefaults;
+        api_defaults->eqds_mss = EqdsSrc::_mss;
+        api_defaults->eqds_mtu = EqdsSrc::_mtu;
+        api_defaults->eqds_min_rto = EqdsSrc::_min_rto;
+        api_defaults->eqds_path_entropy_size = EqdsSrc::_path_entropy_size;
+        api_defaults->ar_sticky = FatTreeSwitch::_ar_sticky;
+        api_defaults->sticky_delta = FatTreeSwitch::_sticky_delta;
+        api_defaults->ecn_threshold_fraction = FatTreeSwitch::_ecn_threshold_fraction;
+    }
+
+    // the previous simulation's objects are leaked: most of them do
+    // not have destructors that would unhook them from each other.
+    EventList::reset();
+    PacketFlow::reset_flow_ids();
+    Packet::reset_packet_size();
+    FatTreeTopology::reset_parameters();
+    FatTreeSwitch::reset_strategy();
+    FatTreeSwitch::_ar_sticky = api_defaults->ar_sticky;
+    FatTreeSwitch::_sticky_delta = api_defaults->sticky_delta;
+    FatTreeSwitch::_ecn_threshold_fraction = api_defaults->ecn_threshold_fraction;
+    EqdsSrc::_mss = api_defaults->eqds_mss;
+    EqdsSrc::_mtu = api_defaults->eqds_mtu;
+    EqdsSrc::_min_rto = api_defaults->eqds_min_rto;
+    EqdsSrc::_path_entropy_size = api_defaults->eqds_path_entropy_size;
+    EqdsSrc::_global_node_count = 0;
+
+    api_matrix = NULL;
+    api_srcs.clear();
+    api_logger.clear();
+    api_built = false;
+    api_ran = false;
+
+    srand(seed);
+    srandom(seed);
+    return 0;
+}
+
+void htsim_set_quiet(int quiet) {
+    if (quiet && !api_cout_buf) {
+        if (!api_devnull.is_open())
+            api_devnull.open("/dev/null");
+        api_cout_buf = cout.rdbuf(api_devnull.rdbuf());
+    } else if (!quiet && api_cout_buf) {
+        cout.rdbuf(api_cout_buf);
+        api_cout_buf = NULL;
+    }
+}
+
+int htsim_load_matrix(const char* filename) {
+    if (api_built)
+        return api_error("connection matrix must be set before the topology is built");
+    ConnectionMatrix* matrix = new ConnectionMatrix(0);
+    if (!matrix->load(filename))
+        return api_error(string("failed to load connection matrix ") + filename);
+    // flows are reported per connection, which a fluid flow is not
+    vector<connection*>* all_conns = matrix->getAllConnections();
+    for (size_t c = 0; c < all_conns->size(); c++) {
+        connection* crt = all_conns->at(c);
+        if (crt->fluid)
+            return api_error("connection " + ntoa(crt->src) + "->" + ntoa(crt->dst) + " in " + filename
+                             + " is tagged fluid, which the API does not simulate; use htsim_eqds");
+    }
+    api_matrix = matrix;
+    return matrix->getAllConnections()->size();
+}
+
+int htsim_set_matrix(uint32_t nodes, uint32_t count, const uint32_t* src, const uint32_t* dst,
+                     const uint64_t* size, const double* start_us) {
+    if (api_built)
+        return api_error("connection matrix must be set before the topology is built");
+    ConnectionMatrix* matrix = new ConnectionMatrix(nodes);
+    matrix->conns = new vector<connection*>();
+    for (uint32_t i = 0; i < count; i++) {
+        if (src[i] >= nodes || dst[i] >= nodes)
+            return api_error("connection " + ntoa(i) + " has an endpoint outside 0.." + ntoa(nodes - 1));
+        connection* c = new connection();
+        c->src = src[i];
+        c->dst = dst[i];
+        c->size = size[i];
+        c->start = timeFromUs(start_us[i]);
+        c->flowid = 0;
+        c->send_done_trigger = 0;
+        c->recv_done_trigger = 0;
+        c->trigger = 0;
+        c->priority = 2000000;
+        matrix->conns->push_back(c);
+    }
+    api_matrix = matrix;
+    return count;
+}
+
+int htsim_eqds_fat_tree(uint32_t tiers, double linkspeed_mbps, uint32_t queue_pkts, uint32_t mtu,
+                        uint32_t cwnd_pkts, uint32_t paths, double hop_latency_us,
+                        double switch_latency_us) {
+    if (!api_matrix)
+        return api_error("no connection matrix");
+    if (api_built)
+        return api_error("topology already built; call htsim_reset() first");
+    if (tiers != 2 && tiers != 3)
+        return api_error("tiers must be 2 or 3");
+
+    EventList& eventlist = EventList::getTheEventList();
+    // main_eqds has a progress clock; its events interleave with the
+    // flows' so it is kept to give identical results.
+    new Clock(timeFromSec(5 / 100.), eventlist);
+    linkspeed_bps linkspeed = speedFromMbps(linkspeed_mbps);
+    uint32_t no_of_nodes = api_matrix->N;
+
+    Packet::set_packet_size(mtu);
+    FatTreeSwitch::set_strategy(FatTreeSwitch::ECMP);
+    mem_b queuesize = memFromPkt(queue_pkts);
+    EqdsSrc::_min_rto = timeFromUs(150 + queuesize * 6.0 * 8 * 1000000 / linkspeed);
+    EqdsSrc::_path_entropy_size = paths;
+
+    FatTreeTopology::set_tiers(tiers);
+    FatTreeTopology* top = new FatTreeTopology(no_of_nodes, linkspeed, queuesize, NULL,
+                                               &eventlist, NULL, COMPOSITE,
+                                               timeFromUs(hop_latency_us),
+                                               timeFromUs(switch_latency_us),
+                                               FAIR_PRIO);
+    if (top->no_of_nodes() != no_of_nodes)
+        return api_error("connection matrix has " + ntoa(no_of_nodes) + " nodes, the fat tree "
+                         + ntoa(top->no_of_nodes()));
+
+    for (size_t c = 0; c < api_matrix->failures.size(); c++) {
+        failure* crt = api_matrix->failures.at(c);
+        top->add_failed_link(crt->switch_type, crt->switch_id, crt->link_id);
+    }
+
+    EqdsConnections* connections = new EqdsConnections(*top, eventlist, linkspeed, no_of_nodes,
+                                                       cwnd_pkts * Packet::data_packet_size(), paths);
+    connections->setFlowLogger(&api_logger);
+    if (!connections->add(*api_matrix))
+        return api_error("failed to set up the connections");
+    api_srcs = connections->srcs();
+    api_logger._finish.assign(api_srcs.size(), NOT_FINISHED);
+    for (size_t c = 0; c < api_srcs.size(); c++)
+        api_logger._index[api_srcs[c]] = c;
+    api_built = true;
+    return api_srcs.size();
+}
+
+uint64_t htsim_run(double end_us) {
+    // events beyond the end time are dropped when scheduled, so a
+    // simulation can only be run once.
+    if (!api_built || api_ran) {
+        api_error("nothing to run; build a topology after htsim_reset() first");
+        return 0;
+    }
+    api_ran = true;
+    simtime_picosec endtime = timeFromUs(end_us);
+    EventList::setEndtime(endtime);
+    uint64_t events = 0;
+    while (EventList::nextEventTime() < endtime && EventList::doNextEvent()) {
+        events++;
+    }
+    return events;
+}
+
+double htsim_now_us() {
+    return timeAsUs(EventList::now());
+}
+
+uint32_t htsim_flow_count() {
+    return api_srcs.size();
+}
+
+uint32_t htsim_finished_count() {
+    return api_logger._finished;
+}
+
+void htsim_flows(uint32_t* flow_id, uint32_t* src, uint32_t* dst, uint64_t* size,
+                 double* start_us, double* finish_us,
+                 uint32_t* new_pkts, uint32_t* rtx_pkts, uint32_t* rts_pkts, uint32_t* bounces) {
+    vector<connection*>* all_conns = api_matrix->getAllConnections();
+    for (size_t i = 0; i < api_srcs.size(); i++) {
+        connection* crt = all_conns->at(i);
+        EqdsSrc* eqds_src = api_srcs[i];
+        flow_id[i] = eqds_src->flowId();
+        src[i] = crt->src;
+        dst[i] = crt->dst;
+        size[i] = crt->size;
+        start_us[i] = crt->start == NO_START ? -1.0 : timeAsUs(crt->start);
+        finish_us[i] = api_logger._finish[i] == NOT_FINISHED ? -1.0 : timeAsUs(api_logger._finish[i]);
+        new_pkts[i] = eqds_src->_new_packets_sent;
+        rtx_pkts[i] = eqds_src->_rtx_packets_sent;
+        rts_pkts[i] = eqds_src->_rts_packets_sent;
+        bounces[i] = eqds_src->_bounces_received;
+    }
+}
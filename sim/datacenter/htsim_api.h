@@ -0,0 +1,47 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef HTSIM_API_H
+#define HTSIM_API_H
+
+/*
+ * C interface to run EQDS over a fat tree inside another process,
+ * built as libhtsim_api.so and used from Python through htsim.py.
+ *
+ * A simulation is: htsim_reset(), one of htsim_load_matrix() or
+ * htsim_set_matrix(), htsim_eqds_fat_tree(), then htsim_run().  Results
+ * are copied out with htsim_flows().  htsim_reset() starts the next
+ * simulation; objects from the previous one are not freed.
+ *
+ * Functions returning int return a negative value on error.
+ */
+
+#include <stdint.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+int htsim_reset(uint32_t seed);
+void htsim_set_quiet(int quiet);
+
+int htsim_load_matrix(const char* filename);
+int htsim_set_matrix(uint32_t nodes, uint32_t count, const uint32_t* src, const uint32_t* dst,
+                     const uint64_t* size, const double* start_us);
+
+int htsim_eqds_fat_tree(uint32_t tiers, double linkspeed_mbps, uint32_t queue_pkts, uint32_t mtu,
+                        uint32_t cwnd_pkts, uint32_t paths, double hop_latency_us,
+                        double switch_latency_us);
+
+uint64_t htsim_run(double end_us);
+double htsim_now_us();
+
+uint32_t htsim_flow_count();
+uint32_t htsim_finished_count();
+void htsim_flows(uint32_t* flow_id, uint32_t* src, uint32_t* dst, uint64_t* size,
+                 double* start_us, double* finish_us,
+                 uint32_t* new_pkts, uint32_t* rtx_pkts, uint32_t* rts_pkts, uint32_t* bounces);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
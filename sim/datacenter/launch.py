@@ -0,0 +1,427 @@
+#! /usr/bin/env python3
+
+"""
+Resource accounting for htsim launches.
+
+Every simulator run started from the Python tooling goes through launch(),
+which records wall time, user/sys CPU, peak RSS, page faults and context
+switches (from the rusage of the child) plus periodic RSS samples. Each run
+is tagged with its parameters and written to an SQLite database, by default
+htsim_runs.db in the current directory or the file named by $HTSIM_RUN_DB.
+
+Shell scripts can wrap a launch the same way:
+
+    python launch.py --tag seed=13 -- ./htsim_ndp -nodes 1024 ... > out.txt
+
+and the recorded runs can be used to fit a scaling curve before sizing a
+job:
+
+    python launch.py --fit max_rss_kb --binary htsim_ndp
+"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+
+# Default argument values.
+DEFAULT_DB_PATH = "htsim_runs.db"
+DEFAULT_SAMPLE_INTERVAL_S = 0.5
+
+# Resource columns that a scaling curve can be fitted to.
+FIT_COLUMNS = ("wall_s", "user_s", "sys_s", "max_rss_kb")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL,
+    binary TEXT,
+    cmdline TEXT,
+    params TEXT,
+    nodes INTEGER,
+    conns INTEGER,
+    returncode INTEGER,
+    wall_s REAL,
+    user_s REAL,
+    sys_s REAL,
+    max_rss_kb INTEGER,
+    major_faults INTEGER,
+    minor_faults INTEGER,
+    voluntary_ctx_switches INTEGER,
+    involuntary_ctx_switches INTEGER
+);
+CREATE TABLE IF NOT EXISTS rss_samples (
+    run_id INTEGER REFERENCES runs(id),
+    t_s REAL,
+    rss_kb INTEGER
+);
+"""
+
+
+class ResourceUsage(
+    namedtuple(
+        "ResourceUsage",
+        [
+            "wall_s",
+            "user_s",
+            "sys_s",
+            "max_rss_kb",
+            "major_faults",
+            "minor_faults",
+            "voluntary_ctx_switches",
+            "involuntary_ctx_switches",
+        ],
+    )
+):
+    """
+    The resources used by one simulator process.
+    """
+
+
+class LaunchResult(
+    namedtuple("LaunchResult", ["returncode", "stdout", "stderr", "usage", "rss_samples"])
+):
+    """
+    The outcome of a launch: exit status, captured output (None if not
+    captured), the ResourceUsage and a list of (seconds, rss_kb) samples.
+    """
+
+
+def default_db_path() -> str:
+    """Return the database that runs are recorded to."""
+    return os.environ.get("HTSIM_RUN_DB", DEFAULT_DB_PATH)
+
+
+def parse_params(cmdline: list[str]) -> dict:
+    """
+    Collect the "-name value" parameters of an htsim command line.
+
+    Flags without a value are recorded as True; repeated options such as
+    "-log" keep every value in a list.
+
+    Args:
+        cmdline (list[str]): The command line, starting with the executable.
+
+    Returns:
+        dict: A map from parameter name (without the dash) to its value.
+    """
+    params = {}
+    i = 1
+    while i < len(cmdline):
+        arg = cmdline[i]
+        i += 1
+        if not arg.startswith("-") or len(arg) == 1:
+            continue
+        name = arg[1:]
+        value = True
+        if i < len(cmdline) and not cmdline[i].startswith("-"):
+            value = cmdline[i]
+            i += 1
+        if name in params:
+            if not isinstance(params[name], list):
+                params[name] = [params[name]]
+            params[name].append(value)
+        else:
+            params[name] = value
+    return params
+
+
+def matrix_size(params: dict):
+    """
+    Return (nodes, conns) for a run, from -nodes/-conns or the header of the
+    -tm connection matrix. Either may be None if unknown.
+    """
+    nodes = params.get("nodes")
+    conns = params.get("conns")
+    tm_file = params.get("tm")
+    if isinstance(tm_file, str) and os.path.isfile(tm_file):
+        with open(tm_file, "r", encoding="utf-8") as cm_file:
+            for line in [cm_file.readline(), cm_file.readline()]:
+                items = line.split()
+                if len(items) == 2 and items[0] == "Nodes" and nodes is None:
+                    nodes = items[1]
+                elif len(items) == 2 and items[0] == "Connections" and conns is None:
+                    conns = items[1]
+    try:
+        nodes = int(nodes) if nodes is not None else None
+        conns = int(conns) if conns is not None else None
+    except ValueError:
+        return None, None
+    return nodes, conns
+
+
+def read_rss_kb(pid: int):
+    """Return the current resident set size of pid in KB, or None if unknown."""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def record_run(
+    db_path: str,
+    cmdline: list[str],
+    tags: dict,
+    started: float,
+    returncode: int,
+    usage: ResourceUsage,
+    rss_samples: list,
+) -> int:
+    """
+    Write one run to the database.
+
+    Returns:
+        int: The id of the new row in the runs table.
+    """
+    params = parse_params(cmdline)
+    params.update(tags or {})
+    nodes, conns = matrix_size(params)
+    with sqlite3.connect(db_path, timeout=60) as db:
+        db.executescript(SCHEMA)
+        cursor = db.execute(
+            "INSERT INTO runs (started, binary, cmdline, params, nodes, conns,"
+            " returncode, wall_s, user_s, sys_s, max_rss_kb, major_faults,"
+            " minor_faults, voluntary_ctx_switches, involuntary_ctx_switches)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                started,
+                os.path.basename(cmdline[0]),
+                " ".join(cmdline),
+                json.dumps(params),
+                nodes,
+                conns,
+                returncode,
+            )
+            + tuple(usage),
+        )
+        run_id = cursor.lastrowid
+        db.executemany(
+            "INSERT INTO rss_samples (run_id, t_s, rss_kb) VALUES (?, ?, ?)",
+            [(run_id, t_s, rss_kb) for t_s, rss_kb in rss_samples],
+        )
+    return run_id
+
+
+def launch(
+    cmdline: list[str],
+    stdout=subprocess.PIPE,
+    stderr=subprocess.PIPE,
+    tags: dict = None,
+    db_path: str = None,
+    sample_interval_s: float = DEFAULT_SAMPLE_INTERVAL_S,
+) -> LaunchResult:
+    """
+    Run a simulator, recording the resources it used.
+
+    Args:
+        cmdline (list[str]): The command line, starting with the executable.
+        stdout: As for subprocess.Popen; output sent to PIPE is captured and
+            returned as text.
+        stderr: As for subprocess.Popen.
+        tags (dict): Extra parameters to record with the run, e.g. a seed
+            that is not on the command line.
+        db_path (str): The database to record to, by default default_db_path().
+        sample_interval_s (float): How often to sample the RSS.
+
+    Returns:
+        LaunchResult: The exit status, output and resource usage of the run.
+    """
+    started = time.time()
+    start = time.monotonic()
+    process = subprocess.Popen(cmdline, stdout=stdout, stderr=stderr, text=True)
+
+    output = {}
+
+    def drain(name, pipe):
+        output[name] = pipe.read()
+        pipe.close()
+
+    threads = [
+        threading.Thread(target=drain, args=(name, pipe))
+        for name, pipe in (("stdout", process.stdout), ("stderr", process.stderr))
+        if pipe is not None
+    ]
+
+    rss_samples = []
+    finished = threading.Event()
+
+    def sample():
+        while not finished.wait(sample_interval_s):
+            rss_kb = read_rss_kb(process.pid)
+            if rss_kb is None:
+                break
+            rss_samples.append((time.monotonic() - start, rss_kb))
+
+    threads.append(threading.Thread(target=sample))
+    for thread in threads:
+        thread.start()
+
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_s = time.monotonic() - start
+    finished.set()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    for thread in threads:
+        thread.join()
+
+    # ru_maxrss is in KB on Linux but in bytes on macOS.
+    max_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+    usage = ResourceUsage(
+        wall_s,
+        rusage.ru_utime,
+        rusage.ru_stime,
+        max_rss_kb,
+        rusage.ru_majflt,
+        rusage.ru_minflt,
+        rusage.ru_nvcsw,
+        rusage.ru_nivcsw,
+    )
+    record_run(
+        db_path or default_db_path(),
+        cmdline,
+        tags,
+        started,
+        process.returncode,
+        usage,
+        rss_samples,
+    )
+    return LaunchResult(
+        process.returncode,
+        output.get("stdout"),
+        output.get("stderr"),
+        usage,
+        rss_samples,
+    )
+
+
+def fit_scaling(db_path: str, column: str, binary: str = None):
+    """
+    Fit column = a * (nodes * conns) ** b over the successful recorded runs,
+    by least squares in log-log space.
+
+    Args:
+        db_path (str): The run database.
+        column (str): One of FIT_COLUMNS.
+        binary (str): Only use runs of this executable, e.g. "htsim_ndp".
+
+    Returns:
+        tuple: (a, b, number of runs used), or None with fewer than two
+        distinct problem sizes.
+
+    Raises:
+        ValueError: If the column cannot be fitted.
+    """
+    if column not in FIT_COLUMNS:
+        raise ValueError(f"Cannot fit {column}. Must be one of {FIT_COLUMNS}.")
+    query = (
+        f"SELECT nodes * conns, {column} FROM runs WHERE returncode = 0"
+        f" AND nodes > 0 AND conns > 0 AND {column} > 0"
+    )
+    args = ()
+    if binary:
+        query += " AND binary = ?"
+        args = (binary,)
+    with sqlite3.connect(db_path) as db:
+        db.executescript(SCHEMA)
+        points = [(math.log(x), math.log(y)) for x, y in db.execute(query, args)]
+    if len({x for x, _ in points}) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    b = sum((x - mean_x) * (y - mean_y) for x, y in points) / sum(
+        (x - mean_x) ** 2 for x, _ in points
+    )
+    a = math.exp(mean_y - b * mean_x)
+    return a, b, n
+
+
+def add_commandline_options():
+    """
+    Create an argument parser and add command line options to the parser.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser object with added command line options.
+    """
+    arg_parser = argparse.ArgumentParser(
+        description="Run an htsim command and record the resources it uses."
+    )
+    arg_parser.add_argument(
+        "--db",
+        default=None,
+        help=f"The run database, by default $HTSIM_RUN_DB or {DEFAULT_DB_PATH}.",
+    )
+    arg_parser.add_argument(
+        "--tag",
+        dest="tags",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="An extra parameter to record with the run. Repeatable.",
+    )
+    arg_parser.add_argument(
+        "--sample_interval_s",
+        default=DEFAULT_SAMPLE_INTERVAL_S,
+        type=float,
+        help=f"How often to sample RSS, by default {DEFAULT_SAMPLE_INTERVAL_S}s.",
+    )
+    arg_parser.add_argument(
+        "--fit",
+        choices=FIT_COLUMNS,
+        default=None,
+        help="Instead of running, fit this column against nodes * conns.",
+    )
+    arg_parser.add_argument(
+        "--binary",
+        default=None,
+        help="With --fit, only use runs of this executable.",
+    )
+    arg_parser.add_argument(
+        "cmdline",
+        nargs=argparse.REMAINDER,
+        help="The simulator command line.",
+    )
+    return arg_parser
+
+
+def main():
+    """The main function of the launch wrapper."""
+    args = add_commandline_options().parse_args()
+    db_path = args.db or default_db_path()
+
+    if args.fit:
+        fit = fit_scaling(db_path, args.fit, args.binary)
+        if fit is None:
+            sys.exit("Not enough runs of different sizes to fit")
+        a, b, n = fit
+        print(f"{args.fit} = {a:.6g} * (nodes * conns) ^ {b:.4f} from {n} runs")
+        return
+
+    cmdline = args.cmdline
+    if cmdline and cmdline[0] == "--":
+        cmdline = cmdline[1:]
+    if not cmdline:
+        sys.exit("No command to run")
+    tags = dict(tag.split("=", 1) for tag in args.tags)
+    result = launch(
+        cmdline,
+        stdout=None,
+        stderr=None,
+        tags=tags,
+        db_path=db_path,
+        sample_interval_s=args.sample_interval_s,
+    )
+    sys.exit(result.returncode if result.returncode >= 0 else 128 - result.returncode)
+
+
+if __name__ == "__main__":
+    main()
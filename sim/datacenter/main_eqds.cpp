@@ -8,7 +8,12 @@
 #include "network.h"
 #include "pipe.h"
 #include "eventlist.h"
+#include "event_profiler.h"
 #include "logfile.h"
+#include "logsampler.h"
+#include "sink_stats.h"
+#include "phase_timer.h"
+#include "checkpoint.h"
 #include "eqds_logger.h"
 #include "clock.h"
 #include "eqds.h"
@@ -18,6 +23,8 @@
 
 #include "fat_tree_topology.h"
 #include "fat_tree_switch.h"
+#include "metrics_exporter.h"
+#include "eqds_connections.h"
 
 #include <list>
 
@@ -34,7 +41,7 @@ int DEFAULT_NODES = 128;
 EventList eventlist;
 
 void exit_error(char* progr) {
-    cout << "Usage " << progr << " [-nodes N]\n\t[-conns C]\n\t[-cwnd cwnd_size]\n\t[-q queue_size]\n\t[-oversubscribed_cc] Use receiver-driven AIMD to reduce total window when trims are not last hop\n\t[-queue_type composite|random|lossless|lossless_input|]\n\t[-tm traffic_matrix_file]\n\t[-strat route_strategy (single,rand,perm,pull,ecmp,\n\tecmp_host path_count,ecmp_ar,ecmp_rr,\n\tecmp_host_ar ar_thresh)]\n\t[-log log_level]\n\t[-seed random_seed]\n\t[-end end_time_in_usec]\n\t[-mtu MTU]\n\t[-hop_latency x] per hop wire latency in us,default 1\n\t[-switch_latency x] switching latency in us, default 0\n\t[-host_queue_type  swift|prio|fair_prio]\n\t[-logtime dt] sample time for sinklogger, etc" << endl;
+    cout << "Usage " << progr << " [-nodes N]\n\t[-conns C]\n\t[-cwnd cwnd_size]\n\t[-q queue_size]\n\t[-oversubscribed_cc] Use receiver-driven AIMD to reduce total window when trims are not last hop\n\t[-queue_type composite|random|lossless|lossless_input|]\n\t[-tm traffic_matrix_file]\n\t[-strat route_strategy (single,rand,perm,pull,ecmp,\n\tecmp_host path_count,ecmp_ar,ecmp_rr,\n\tecmp_host_ar ar_thresh)]\n\t[-log log_level]\n\t[-seed random_seed]\n\t[-end end_time_in_usec]\n\t[-mtu MTU]\n\t[-hop_latency x] per hop wire latency in us,default 1\n\t[-switch_latency x] switching latency in us, default 0\n\t[-host_queue_type  swift|prio|fair_prio]\n\t[-logtime dt] sample time for sinklogger, etc\n\t[-sink_stats f] with -log sink, write rate percentiles and fairness each sample instead of a record per flow, keeping per-flow records for fraction f of flows\n\t[-log_thread] write the logfile from a background thread\n\t[-fast_build] build the topology from arenas, and queue loggers on first use\n\t[-prebuild_fib] fill in the switch routes before the run\n\t[-fib_cache n] entries in each switch's cache of ECMP next hops, a power of two, default 0 (none)\n\t[-fib_stats] count and time the switches' next hop lookups\n\t[-checkpoint us] run to this time, then branch once per -whatif\n\t[-whatif traffic_matrix_file] connections and failures for a branch, started from the checkpoint\n\t[-no_fluid] simulate flows tagged fluid as packets too\n\t[-fluid_interval us] longest time between fluid rate updates, default 10\n" << LogSampler::usage() << "\n" << PacketDBBase::usage() << "\n" << EventProfiler::usage() << "\n\t[-metrics shm_name] stream live counters to shared memory\n\t[-metrics_interval us] simulated time between samples, default 100" << endl;
     exit(1);
 }
 
@@ -48,11 +55,20 @@ int main(int argc, char **argv) {
     uint32_t tiers = 3; // we support 2 and 3 tier fattrees
     simtime_picosec logtime = timeFromMs(0.25); // ms;
     stringstream filename(ios_base::out);
+    bool log_thread = false;
+    LogSampler log_sampler;
+    bool fast_build = false;
+    bool prebuild_fib = false;
+    double checkpoint_at = 0; // us
+    vector<char*> whatif_files;
+    bool use_fluid = true;
+    double fluid_interval = 10; // us
     simtime_picosec hop_latency = timeFromUs((uint32_t)1);
     simtime_picosec switch_latency = timeFromUs((uint32_t)0);
     queue_type qt = COMPOSITE;
 
     bool log_sink = false;
+    double sink_detail = -1; // per-flow fraction with -sink_stats, -1 if off
     bool log_flow_events = true;
 
     bool log_tor_downqueue = false;
@@ -81,6 +97,8 @@ int main(int argc, char **argv) {
 
     char* tm_file = NULL;
     char* topo_file = NULL;
+    char* metrics_shm = NULL;
+    double metrics_interval = 100; // us
 
     while (i<argc) {
         if (!strcmp(argv[i],"-o")) {
@@ -192,11 +210,42 @@ int main(int argc, char **argv) {
             // fraction of queuesize, between 0 and 1
             ecn_thresh = atof(argv[i+1]); 
             i++;
+        } else if (!strcmp(argv[i],"-log_thread")){
+            log_thread = true;
+        } else if (!strcmp(argv[i],"-fast_build")){
+            fast_build = true;
+        } else if (!strcmp(argv[i],"-checkpoint")){
+            checkpoint_at = atof(argv[i+1]);
+            cout << "checkpoint at " << checkpoint_at << "us" << endl;
+            i++;
+        } else if (!strcmp(argv[i],"-no_fluid")){
+            use_fluid = false;
+        } else if (!strcmp(argv[i],"-fluid_interval")){
+            fluid_interval = atof(argv[i+1]);
+            i++;
+        } else if (!strcmp(argv[i],"-whatif")){
+            whatif_files.push_back(argv[i+1]);
+            i++;
+        } else if (log_sampler.parseArg(argc, argv, i)) {
+            // -log_rate, -log_flows, -log_reservoir or -log_sample_seed
+        } else if (PacketDBBase::parseArg(argc, argv, i)) {
+            // -pkt_prewarm or -pkt_pool_max
+        } else if (EventProfiler::parseArg(argc, argv, i)) {
+            // -profile or -profile_instances
+        } else if (!strcmp(argv[i],"-sink_stats")){
+            sink_detail = atof(argv[i+1]);
+            i++;
         } else if (!strcmp(argv[i],"-logtime")){
             double log_ms = atof(argv[i+1]);            
             logtime = timeFromMs(log_ms);
             cout << "logtime "<< logtime << " ms" << endl;
             i++;
+        } else if (!strcmp(argv[i],"-metrics")){
+            metrics_shm = argv[i+1];
+            i++;
+        } else if (!strcmp(argv[i],"-metrics_interval")){
+            metrics_interval = atof(argv[i+1]);
+            i++;
         } else if (!strcmp(argv[i],"-linkspeed")){
             // linkspeed specified is in Mbps
             linkspeed = speedFromMbps(atof(argv[i+1]));
@@ -238,6 +287,17 @@ int main(int argc, char **argv) {
                 exit(1);
             }   
             i++;
+        } else if (!strcmp(argv[i],"-prebuild_fib")){
+            prebuild_fib = true;
+        } else if (!strcmp(argv[i],"-fib_cache")){
+            FatTreeSwitch::_nexthop_cache_size = atoi(argv[i+1]);
+            i++;
+        } else if (!strcmp(argv[i],"-fib_stats")){
+            FatTreeSwitch::_count_lookups = true;
+        } else if (!strcmp(argv[i],"-ar_choices")){
+            FatTreeSwitch::_ar_choices = atoi(argv[i+1]);
+            cout << "Adaptive routing compares " << FatTreeSwitch::_ar_choices << " random choices" << endl;
+            i++;
         } else if (!strcmp(argv[i],"-ar_method")){
             if (!strcmp(argv[i+1],"pause")){
                 cout << "Adaptive routing based on pause state " << endl;
@@ -318,6 +378,15 @@ int main(int argc, char **argv) {
         i++;
     }
 
+    if (!whatif_files.empty() && checkpoint_at <= 0) {
+        cout << "-whatif needs -checkpoint" << endl;
+        exit_error(argv[0]);
+    }
+    if (checkpoint_at > 0 && metrics_shm) {
+        cout << "-checkpoint can't be used with -metrics: branches would share the metrics" << endl;
+        exit(1);
+    }
+
     srand(seed);
     srandom(seed);
     cout << "Parsed args\n";
@@ -378,12 +447,19 @@ int main(int argc, char **argv) {
     cout << "Logging to " << filename.str() << endl;
     //Logfile 
     Logfile logfile(filename.str(), eventlist);
+    logfile.setFlushThread(log_thread);
+    logfile.setSampler(&log_sampler);
 
     cout << "Linkspeed set to " << linkspeed/1000000000 << "Gbps" << endl;
     logfile.setStartTime(timeFromSec(0));
 
     EqdsSinkLoggerSampling* sink_logger = NULL;
-    if (log_sink) {
+    SinkStatsAggregator* sink_stats = NULL;
+    if (log_sink && sink_detail >= 0) {
+        sink_stats = new SinkStatsAggregator(logtime, eventlist, Logger::EQDS_SINK, EqdsLogger::RATE, sink_detail);
+        logfile.addLogger(*sink_stats);
+        logfile.writeName(*sink_stats);
+    } else if (log_sink) {
         sink_logger = new EqdsSinkLoggerSampling(logtime, eventlist);
         logfile.addLogger(*sink_logger);
     }
@@ -401,14 +477,12 @@ int main(int argc, char **argv) {
     //EqdsSrc::setMinRTO(50000); //increase RTO to avoid spurious retransmits
     EqdsSrc::_path_entropy_size = path_entropy_size;
     
-    EqdsSrc* eqds_src;
-    EqdsSink* eqds_snk;
-
     //Route* routeout, *routein;
 
     // scanner interval must be less than min RTO
     //EqdsRtxTimerScanner EqdsRtxScanner(timeFromUs((uint32_t)9), eventlist);
    
+    PhaseTimer startup;
     QueueLoggerFactory *qlf = 0;
     if (log_tor_downqueue || log_tor_upqueue) {
         qlf = new QueueLoggerFactory(&logfile, QueueLoggerFactory::LOGGER_SAMPLING, eventlist);
@@ -417,6 +491,12 @@ int main(int argc, char **argv) {
         qlf = new QueueLoggerFactory(&logfile, QueueLoggerFactory::LOGGER_EMPTY, eventlist);
         qlf->set_sample_period(timeFromUs(10.0));
     }
+    if (qlf) {
+        qlf->set_deferred(fast_build);
+    }
+    FatTreeTopology::set_arena(fast_build);
+
+    startup.start("connection matrix");
 
     ConnectionMatrix* conns = new ConnectionMatrix(no_of_nodes);
 
@@ -441,6 +521,7 @@ int main(int argc, char **argv) {
     no_of_nodes = conns->N;
 
 
+    startup.start("topology");
     FatTreeTopology* top;
     if (topo_file) {
         top = FatTreeTopology::load(topo_file, qlf, eventlist, queuesize, qt, snd_type);
@@ -469,113 +550,47 @@ int main(int argc, char **argv) {
         top->add_failed_link(crt->switch_type,crt->switch_id,crt->link_id);
     }
 
-    vector<EqdsPullPacer*> pacers;
-    vector<EqdsNIC*> nics;
-
-    for (size_t ix = 0; ix < no_of_nodes; ix++){
-        pacers.push_back(new EqdsPullPacer(linkspeed, 0.99, EqdsSrc::_mtu, eventlist));   
-        nics.push_back(new EqdsNIC(eventlist,linkspeed));
+    MetricsExporter* metrics = NULL;
+    if (metrics_shm) {
+        metrics = new MetricsExporter(metrics_shm, timeFromUs(metrics_interval), eventlist);
+        metrics->setNextFlowLogger(event_logger);
+        top->add_metrics(*metrics);
+        cout << "Streaming metrics to " << metrics_shm << " every " << metrics_interval << "us" << endl;
     }
 
-    // used just to print out stats data at the end
-    list <const Route*> routes;
-
-    vector<connection*>* all_conns = conns->getAllConnections();
-    vector <EqdsSrc*> eqds_srcs;
-
-    map <flowid_t, TriggerTarget*> flowmap;
-
-    for (size_t c = 0; c < all_conns->size(); c++){
-        connection* crt = all_conns->at(c);
-        int src = crt->src;
-        int dest = crt->dst;
-        //cout << "Connection " << crt->src << "->" <<crt->dst << " starting at " << crt->start << " size " << crt->size << endl;
-
-        eqds_src = new EqdsSrc(traffic_logger, eventlist, *nics.at(src));
-        eqds_src->setCwnd(cwnd*Packet::data_packet_size());
-        eqds_srcs.push_back(eqds_src);
-        eqds_src->setDst(dest);
-
-        if (log_flow_events) {
-            eqds_src->logFlowEvents(*event_logger);
-        }
-        
-        eqds_snk = new EqdsSink(NULL,pacers[dest],*nics.at(dest));
-        eqds_src->setName("Eqds_" + ntoa(src) + "_" + ntoa(dest));
-        logfile.writeName(*eqds_src);
-        eqds_snk->setSrc(src);
-                        
-        eqds_snk->setName("Eqds_sink_" + ntoa(src) + "_" + ntoa(dest));
-        logfile.writeName(*eqds_snk);
-
-        if (crt->flowid) {
-            eqds_src->setFlowId(crt->flowid);
-            eqds_snk->setFlowId(crt->flowid);
-            assert(flowmap.find(crt->flowid) == flowmap.end()); // don't have dups
-            flowmap[crt->flowid] = eqds_src;
-        }
-                        
-        if (crt->size>0){
-            eqds_src->setFlowsize(crt->size);
-        }
-
-        if (crt->trigger) {
-            Trigger* trig = conns->getTrigger(crt->trigger, eventlist);
-            trig->add_target(*eqds_src);
-        }
-        if (crt->send_done_trigger) {
-            Trigger* trig = conns->getTrigger(crt->send_done_trigger, eventlist);
-            eqds_src->setEndTrigger(*trig);
-        }
-
+    if (prebuild_fib) {
+        startup.start("fib");
+        top->build_fibs();
+    }
 
-        if (crt->recv_done_trigger) {
-            Trigger* trig = conns->getTrigger(crt->recv_done_trigger, eventlist);
-            eqds_snk->setEndTrigger(*trig);
+    startup.start("flow setup");
+    EqdsConnections connections(*top, eventlist, linkspeed, no_of_nodes,
+                                cwnd*Packet::data_packet_size(), path_entropy_size);
+    connections.setFluid(use_fluid, timeFromUs(fluid_interval));
+    connections.setTrafficLogger(traffic_logger);
+    if (metrics) {
+        connections.setFlowLogger(metrics);
+    } else if (log_flow_events) {
+        connections.setFlowLogger(event_logger);
+    }
+    connections.setConnected([&](connection& crt, EqdsSrc& eqds_src, EqdsSink& eqds_snk) {
+        logfile.writeName(eqds_src);
+        logfile.writeName(eqds_snk);
+        if (sink_stats) {
+            eqds_snk.monitorWith(*sink_stats);
+        } else if (log_sink) {
+            sink_logger->monitorSink(&eqds_snk);
         }
-
-        //eqds_snk->set_priority(crt->priority);
-                        
-        //EqdsRtxScanner.registerEqds(*EqdsSrc);
-
-        switch (route_strategy) {
-        case ECMP_FIB:
-        case ECMP_FIB_ECN:
-        case REACTIVE_ECN:
-            {
-                Route* srctotor = new Route();
-                srctotor->push_back(top->queues_ns_nlp[src][top->HOST_POD_SWITCH(src)][0]);
-                srctotor->push_back(top->pipes_ns_nlp[src][top->HOST_POD_SWITCH(src)][0]);
-                srctotor->push_back(top->queues_ns_nlp[src][top->HOST_POD_SWITCH(src)][0]->getRemoteEndpoint());
-
-                Route* dsttotor = new Route();
-                dsttotor->push_back(top->queues_ns_nlp[dest][top->HOST_POD_SWITCH(dest)][0]);
-                dsttotor->push_back(top->pipes_ns_nlp[dest][top->HOST_POD_SWITCH(dest)][0]);
-                dsttotor->push_back(top->queues_ns_nlp[dest][top->HOST_POD_SWITCH(dest)][0]->getRemoteEndpoint());
-
-
-                eqds_src->connect(*srctotor, *dsttotor, *eqds_snk, crt->start);
-                //eqds_src->setPaths(path_entropy_size);
-                //eqds_snk->setPaths(path_entropy_size);
-
-                //register src and snk to receive packets from their respective TORs. 
-                assert(top->switches_lp[top->HOST_POD_SWITCH(src)]);
-                assert(top->switches_lp[top->HOST_POD_SWITCH(src)]);
-                top->switches_lp[top->HOST_POD_SWITCH(src)]->addHostPort(src,eqds_snk->flowId(),eqds_src);
-                top->switches_lp[top->HOST_POD_SWITCH(dest)]->addHostPort(dest,eqds_src->flowId(),eqds_snk);
-                break;
-            }
-        default:
-            abort();
+        if (metrics) {
+            metrics->monitorSink(&eqds_snk);
         }
+    });
+    if (!connections.add(*conns))
+        exit(1);
 
-        // set up the triggers
-        // xxx
-
-        if (log_sink) {
-            sink_logger->monitorSink(eqds_snk);
-        }
-    }
+    startup.stop();
+    startup.print(cout);
+    top->print_memory(cout);
 
     Logged::dump_idmap();
     // Record the setup
@@ -587,11 +602,56 @@ int main(int argc, char **argv) {
     
     // GO!
     cout << "Starting simulation" << endl;
+    if (checkpoint_at > 0) {
+        // warm up once, then branch to try each what-if from here; the
+        // run carries on unchanged once the branches are done
+        Checkpoint checkpoint(logfile);
+        checkpoint.runUntil(timeFromUs(checkpoint_at));
+        for (size_t w = 0; w < whatif_files.size(); w++) {
+            if (!checkpoint.branch(whatif_files[w], filename.str() + ".whatif" + ntoa(w + 1)))
+                continue;
+
+            ConnectionMatrix* whatif = new ConnectionMatrix(no_of_nodes);
+            if (!whatif->load(whatif_files[w])) {
+                cout << "Failed to load connection matrix " << whatif_files[w] << endl;
+                exit(-1);
+            }
+            if (whatif->N != no_of_nodes) {
+                cout << "Connection matrix number of nodes is " << whatif->N << " while I am using " << no_of_nodes << endl;
+                exit(-1);
+            }
+            for (size_t c = 0; c < whatif->failures.size(); c++) {
+                failure* crt = whatif->failures.at(c);
+                cout << "Failing link switch type " << crt->switch_type << " Switch ID " << crt->switch_id << " link ID " << crt->link_id << endl;
+                top->add_failed_link(crt->switch_type, crt->switch_id, crt->link_id);
+            }
+            if (!connections.add(*whatif, checkpoint.time(), connections.lastFlowId()))
+                exit(1);
+            break;
+        }
+    }
     while (eventlist.doNextEvent()) {
     }
 
     cout << "Done" << endl;
+    cout << "Events scheduled: " << EventList::eventsScheduled() << endl;
+    if (connections.fluid()) {
+        connections.fluid()->printStats(cout);
+    }
+    if (FatTreeSwitch::_strategy == FatTreeSwitch::ADAPTIVE_ROUTING || FatTreeSwitch::_strategy == FatTreeSwitch::ECMP_ADAPTIVE)
+        top->print_port_choices(cout);
+    if (FatTreeSwitch::_count_lookups)
+        FatTreeSwitch::print_lookup_stats(cout);
+    if (qlf) {
+        cout << "Queue loggers: " << qlf->loggers_built() << " built for " << qlf->loggers_requested() << " queues" << endl;
+    }
+    PacketDBBase::printStats(cout);
+    EventProfiler::write();
+    if (metrics) {
+        metrics->close();
+    }
     int new_pkts = 0, rtx_pkts = 0, bounce_pkts = 0, rts_pkts = 0;
+    const vector<EqdsSrc*>& eqds_srcs = connections.srcs();
     for (size_t ix = 0; ix < eqds_srcs.size(); ix++) {
         new_pkts += eqds_srcs[ix]->_new_packets_sent;
         rtx_pkts += eqds_srcs[ix]->_rtx_packets_sent;
@@ -599,6 +659,22 @@ int main(int argc, char **argv) {
         bounce_pkts += eqds_srcs[ix]->_bounces_received;
     }
     cout << "New: " << new_pkts << " Rtx: " << rtx_pkts << " RTS: " << rts_pkts << " Bounced: " << bounce_pkts << endl;
+    // how evenly receivers pulled the senders backlogged at them (only
+    // meaningful when those senders had the same to send)
+    double worst_fairness = 1, total_fairness = 0;
+    int shared_pacers = 0;
+    const vector<EqdsPullPacer*>& pacers = connections.pacers();
+    for (size_t ix = 0; ix < pacers.size(); ix++) {
+        if (pacers[ix]->sinksPulled() < 2)
+            continue;
+        worst_fairness = min(worst_fairness, pacers[ix]->fairness());
+        total_fairness += pacers[ix]->fairness();
+        shared_pacers++;
+    }
+    if (shared_pacers) {
+        cout << "Pull fairness: mean " << total_fairness / shared_pacers << " worst " << worst_fairness
+             << " over " << shared_pacers << " receivers pulling more than one sender" << endl;
+    }
     /*
     list <const Route*>::iterator rt_i;
     int counts[10]; int hop;
@@ -12,7 +12,11 @@
 #include "shortflows.h"
 #include "pipe.h"
 #include "eventlist.h"
+#include "event_profiler.h"
 #include "logfile.h"
+#include "logsampler.h"
+#include "phase_timer.h"
+#include "path_cache.h"
 #include "loggers.h"
 #include "clock.h"
 #include "hpcc.h"
@@ -43,7 +47,7 @@ int DEFAULT_NODES = 432;
 EventList eventlist;
 
 void exit_error(char* progr) {
-    cout << "Usage " << progr << " [-nodes N]\n\t[-conns C]\n\t[-q queue_size]\n\t[-queue_type composite|random|lossless|lossless_input|]\n\t[-tm traffic_matrix_file]\n\t[-strat route_strategy (single,\n\tecmp_host,ecmp_ar,\n\tecmp_host_ar ar_thresh)]\n\t[-log log_level]\n\t[-seed random_seed]\n\t[-end end_time_in_usec]\n\t[-mtu MTU]\n\t[-hop_latency x] per hop wire latency in us,default 1\n\t[-switch_latency x] switching latency in us, default 0\n\t[-start_delta] time in us to randomly delay the start of connections\n\t[-pfc_thresholds low high]" << endl;
+    cout << "Usage " << progr << " [-nodes N]\n\t[-conns C]\n\t[-q queue_size]\n\t[-queue_type composite|random|lossless|lossless_input|]\n\t[-tm traffic_matrix_file]\n\t[-strat route_strategy (single,\n\tecmp_host,ecmp_ar,\n\tecmp_host_ar ar_thresh)]\n\t[-log log_level]\n\t[-log_thread] write the logfile from a background thread\n\t[-fast_build] build the topology from arenas, and queue loggers on first use\n\t[-prebuild_fib] fill in the switch routes before the run\n\t[-fib_cache n] entries in each switch's cache of ECMP next hops, a power of two, default 0 (none)\n\t[-fib_stats] count and time the switches' next hop lookups\n" << LogSampler::usage() << "\n" << PacketDBBase::usage() << "\n" << EventProfiler::usage() << "\n\t[-seed random_seed]\n\t[-end end_time_in_usec]\n\t[-mtu MTU]\n\t[-hop_latency x] per hop wire latency in us,default 1\n\t[-switch_latency x] switching latency in us, default 0\n\t[-start_delta] time in us to randomly delay the start of connections\n\t[-pfc_thresholds low high]\n\t[-path_cache_mb n] memory for paths shared between connections, default 256" << endl;
     exit(1);
 }
 
@@ -56,6 +60,11 @@ int main(int argc, char **argv) {
     uint32_t no_of_conns = 0, no_of_nodes = DEFAULT_NODES;
     double logtime = 0.25; // ms;
     stringstream filename(ios_base::out);
+    bool log_thread = false;
+    LogSampler log_sampler;
+    bool fast_build = false;
+    bool prebuild_fib = false;
+    uint64_t path_cache_mb = PathCache::DEFAULT_MAX_BYTES >> 20;
     simtime_picosec hop_latency = timeFromUs((uint32_t)1);
     simtime_picosec switch_latency = timeFromUs((uint32_t)0);
     simtime_picosec start_delta = 0;
@@ -164,6 +173,19 @@ int main(int argc, char **argv) {
         } else if (!strcmp(argv[i],"-q")){
             queuesize = atoi(argv[i+1]);
             i++;
+        } else if (!strcmp(argv[i],"-log_thread")){
+            log_thread = true;
+        } else if (!strcmp(argv[i],"-path_cache_mb")){
+            path_cache_mb = atoll(argv[i+1]);
+            i++;
+        } else if (!strcmp(argv[i],"-fast_build")){
+            fast_build = true;
+        } else if (log_sampler.parseArg(argc, argv, i)) {
+            // -log_rate, -log_flows, -log_reservoir or -log_sample_seed
+        } else if (PacketDBBase::parseArg(argc, argv, i)) {
+            // -pkt_prewarm or -pkt_pool_max
+        } else if (EventProfiler::parseArg(argc, argv, i)) {
+            // -profile or -profile_instances
         } else if (!strcmp(argv[i],"-logtime")){
             logtime = atof(argv[i+1]);            
             cout << "logtime "<< logtime << " ms" << endl;
@@ -205,6 +227,17 @@ int main(int argc, char **argv) {
             high_pfc = atoi(argv[i+2]);
             cout << "PFC thresholds high " << high_pfc << " low " << low_pfc << endl;
             i+=2;
+        } else if (!strcmp(argv[i],"-prebuild_fib")){
+            prebuild_fib = true;
+        } else if (!strcmp(argv[i],"-fib_cache")){
+            FatTreeSwitch::_nexthop_cache_size = atoi(argv[i+1]);
+            i++;
+        } else if (!strcmp(argv[i],"-fib_stats")){
+            FatTreeSwitch::_count_lookups = true;
+        } else if (!strcmp(argv[i],"-ar_choices")){
+            FatTreeSwitch::_ar_choices = atoi(argv[i+1]);
+            cout << "Adaptive routing compares " << FatTreeSwitch::_ar_choices << " random choices" << endl;
+            i++;
         } else if (!strcmp(argv[i],"-ar_method")){
             if (!strcmp(argv[i+1],"pause")){
                 cout << "Adaptive routing based on pause state " << endl;
@@ -317,6 +350,8 @@ int main(int argc, char **argv) {
     cout << "Logging to " << filename.str() << endl;
     //Logfile 
     Logfile logfile(filename.str(), eventlist);
+    logfile.setFlushThread(log_thread);
+    logfile.setSampler(&log_sampler);
 
     logfile.setStartTime(timeFromSec(0));
 
@@ -334,6 +369,7 @@ int main(int argc, char **argv) {
 
     Route* routeout, *routein;
 
+    PhaseTimer startup;
     QueueLoggerFactory *qlf = 0;
     if (log_tor_downqueue || log_tor_upqueue) {
         qlf = new QueueLoggerFactory(&logfile, QueueLoggerFactory::LOGGER_SAMPLING, eventlist);
@@ -342,7 +378,13 @@ int main(int argc, char **argv) {
         qlf = new QueueLoggerFactory(&logfile, QueueLoggerFactory::LOGGER_EMPTY, eventlist);
         qlf->set_sample_period(timeFromUs(10.0));
     }
+    if (qlf) {
+        qlf->set_deferred(fast_build);
+    }
+
+    startup.start("topology");
 #ifdef FAT_TREE
+    FatTreeTopology::set_arena(fast_build);
     FatTreeTopology* top = new FatTreeTopology(no_of_nodes, linkspeed, queuesize, qlf, 
                                                &eventlist,NULL,qt,hop_latency,switch_latency,snd_type);
 #endif
@@ -372,24 +414,17 @@ int main(int argc, char **argv) {
         top->add_switch_loggers(logfile, timeFromUs(20.0));
     }
 
-    vector<const Route*>*** net_paths;
-    net_paths = new vector<const Route*>**[no_of_nodes];
-
-    int **path_refcounts;
-    path_refcounts = new int*[no_of_nodes];
+    // paths are built when a connection first needs them, and shared
+    // by all the connections between the same pair of hosts
+    PathCache path_cache(*top, false, path_cache_mb << 20);
 
     int* is_dest = new int[no_of_nodes];
     
     for (size_t s = 0; s < no_of_nodes; s++) {
         is_dest[s] = 0;
-        net_paths[s] = new vector<const Route*>*[no_of_nodes];
-        path_refcounts[s] = new int[no_of_nodes];
-        for (size_t d = 0; d < no_of_nodes; d++) {
-            net_paths[s][d] = NULL;
-            path_refcounts[s][d] = 0;
-        }
     }
     
+    startup.start("connection matrix");
     ConnectionMatrix* conns = new ConnectionMatrix(no_of_nodes);
 
     if (tm_file){
@@ -416,34 +451,25 @@ int main(int argc, char **argv) {
     all_conns = conns->getAllConnections();
     vector <HPCCSrc*> hpcc_srcs;
 
-    for (size_t c = 0; c < all_conns->size(); c++){
-        connection* crt = all_conns->at(c);
-        int src = crt->src;
-        int dest = crt->dst;
-        path_refcounts[src][dest]++;
-        path_refcounts[dest][src]++;
-                        
-        if (!net_paths[src][dest]&&route_strategy!=ECMP_FIB) {
-            vector<const Route*>* paths = top->get_bidir_paths(src,dest,false);
-            net_paths[src][dest] = paths;
-            /*
-              for (unsigned int i = 0; i < paths->size(); i++) {
-              routes.push_back((*paths)[i]);
-              }
-            */
-        }
-        if (!net_paths[dest][src]&&route_strategy!=ECMP_FIB) {
-            vector<const Route*>* paths = top->get_bidir_paths(dest,src,false);
-            net_paths[dest][src] = paths;
-        }
+    if (prebuild_fib) {
+        startup.start("fib");
+        top->build_fibs();
     }
 
+    startup.start("flow setup");
     map <flowid_t, TriggerTarget*> flowmap;
 
     for (size_t c = 0; c < all_conns->size(); c++){
         connection* crt = all_conns->at(c);
         int src = crt->src;
         int dest = crt->dst;
+        PathCache::paths_t paths_out, paths_back;
+        if (route_strategy!=ECMP_FIB) {
+            startup.start("routes");
+            paths_out = path_cache.get(src, dest);
+            paths_back = path_cache.get(dest, src);
+            startup.start("flow setup");
+        }
         //cout << "Connection " << crt->src << "->" <<crt->dst << " starting at " << crt->start << " size " << crt->size << endl;
 
         hpccSrc = new HPCCSrc(NULL, NULL, eventlist,linkspeed);
@@ -509,46 +535,25 @@ int main(int argc, char **argv) {
             top->switches_lp[top->HOST_POD_SWITCH(src)]->addHostPort(src,hpccSrc->flow_id(),hpccSrc);
             top->switches_lp[top->HOST_POD_SWITCH(dest)]->addHostPort(dest,hpccSrc->flow_id(),hpccSnk);
         } else {
-            int choice = rand()%net_paths[src][dest]->size();
-            routeout = new Route(*(net_paths[src][dest]->at(choice)));
+            int choice = rand()%paths_out->size();
+            routeout = new Route(*(paths_out->at(choice)));
             routeout->add_endpoints(hpccSrc, hpccSnk);
                                 
-            routein = new Route(*top->get_bidir_paths(dest,src,false)->at(choice));
+            routein = new Route(*paths_back->at(choice));
             routein->add_endpoints(hpccSnk, hpccSrc);
             hpccSrc->connect(routeout, routein, *hpccSnk, timeFromUs((uint32_t)rand()%20));
         }
 
-        path_refcounts[src][dest]--;
-        path_refcounts[dest][src]--;
-
-        // free up the routes if no other connection needs them 
-        if (path_refcounts[src][dest] == 0 && net_paths[src][dest]) {
-            vector<const Route*>::iterator i;
-            for (i = net_paths[src][dest]->begin(); i != net_paths[src][dest]->end(); i++) {
-                if ((*i)->reverse())
-                    delete (*i)->reverse();
-                delete *i;
-            }
-            delete net_paths[src][dest];
-        }
-        if (path_refcounts[dest][src] == 0 && net_paths[dest][src]) {
-            vector<const Route*>::iterator i;
-            for (i = net_paths[dest][src]->begin(); i != net_paths[dest][src]->end(); i++) {
-                if ((*i)->reverse())
-                    delete (*i)->reverse();
-                delete *i;
-            }
-            delete net_paths[dest][src];
-        }
-
         if (log_sink) {
             sinkLogger.monitorSink(hpccSnk);
         }
     }
 
-    for (size_t ix = 0; ix < no_of_nodes; ix++) {
-        delete path_refcounts[ix];
-    }
+    startup.stop();
+    startup.print(cout);
+#ifdef FAT_TREE
+    top->print_memory(cout);
+#endif
 
     Logged::dump_idmap();
     // Record the setup
@@ -566,12 +571,22 @@ int main(int argc, char **argv) {
     }
 
     cout << "Done" << endl;
+    if (FatTreeSwitch::_strategy == FatTreeSwitch::ADAPTIVE_ROUTING || FatTreeSwitch::_strategy == FatTreeSwitch::ECMP_ADAPTIVE)
+        top->print_port_choices(cout);
+    if (FatTreeSwitch::_count_lookups)
+        FatTreeSwitch::print_lookup_stats(cout);
     int new_pkts = 0, rtx_pkts = 0;
     for (size_t ix = 0; ix < hpcc_srcs.size(); ix++) {
         new_pkts += hpcc_srcs[ix]->_new_packets_sent;
         rtx_pkts += hpcc_srcs[ix]->_rtx_packets_sent;
     }
     cout << "New: " << new_pkts << " Rtx: " << rtx_pkts << endl;
+    path_cache.printStats(cout);
+    PacketDBBase::printStats(cout);
+    EventProfiler::write();
+    if (qlf) {
+        cout << "Queue loggers: " << qlf->loggers_built() << " built for " << qlf->loggers_requested() << " queues" << endl;
+    }
 
     /*list <const Route*>::iterator rt_i;
       int counts[10]; int hop;
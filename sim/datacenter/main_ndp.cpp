@@ -11,7 +11,12 @@
 #include "shortflows.h"
 #include "pipe.h"
 #include "eventlist.h"
+#include "event_profiler.h"
 #include "logfile.h"
+#include "logsampler.h"
+#include "sink_stats.h"
+#include "phase_timer.h"
+#include "path_cache.h"
 #include "loggers.h"
 #include "clock.h"
 #include "ndp.h"
@@ -44,7 +49,7 @@ int DEFAULT_NODES = 432;
 EventList eventlist;
 
 void exit_error(char* progr) {
-    cout << "Usage " << progr << " [-nodes N]\n\t[-conns C]\n\t[-cwnd cwnd_size]\n\t[-q queue_size]\n\t[-oversubscribed_cc] Use receiver-driven AIMD to reduce total window when trims are not last hop\n\t[-queue_type composite|random|lossless|lossless_input|]\n\t[-tm traffic_matrix_file]\n\t[-strat route_strategy (single,rand,perm,pull,ecmp,\n\tecmp_host path_count,ecmp_ar,ecmp_rr,\n\tecmp_host_ar ar_thresh)]\n\t[-log log_level]\n\t[-seed random_seed]\n\t[-end end_time_in_usec]\n\t[-mtu MTU]\n\t[-hop_latency x] per hop wire latency in us,default 1\n\t[-switch_latency x] switching latency in us, default 0\n\t[-host_queue_type  swift|prio|fair_prio]" << endl;
+    cout << "Usage " << progr << " [-nodes N]\n\t[-conns C]\n\t[-cwnd cwnd_size]\n\t[-q queue_size]\n\t[-oversubscribed_cc] Use receiver-driven AIMD to reduce total window when trims are not last hop\n\t[-queue_type composite|random|lossless|lossless_input|]\n\t[-tm traffic_matrix_file]\n\t[-strat route_strategy (single,rand,perm,pull,ecmp,\n\tecmp_host path_count,ecmp_ar,ecmp_rr,\n\tecmp_host_ar ar_thresh)]\n\t[-log log_level]\n\t[-logtime dt] sample time for sinklogger, etc\n\t[-sink_stats f] with -log sink, write rate percentiles and fairness each sample instead of a record per flow, keeping per-flow records for fraction f of flows\n\t[-log_thread] write the logfile from a background thread\n\t[-fast_build] build the topology from arenas, and queue loggers on first use\n\t[-prebuild_fib] fill in the switch routes before the run\n\t[-fib_cache n] entries in each switch's cache of ECMP next hops, a power of two, default 0 (none)\n\t[-fib_stats] count and time the switches' next hop lookups\n" << LogSampler::usage() << "\n" << PacketDBBase::usage() << "\n" << EventProfiler::usage() << "\n\t[-seed random_seed]\n\t[-end end_time_in_usec]\n\t[-mtu MTU]\n\t[-hop_latency x] per hop wire latency in us,default 1\n\t[-switch_latency x] switching latency in us, default 0\n\t[-host_queue_type  swift|prio|fair_prio]\n\t[-path_cache_mb n] memory for paths shared between connections, default 256" << endl;
     exit(1);
 }
 
@@ -82,11 +87,17 @@ int main(int argc, char **argv) {
     uint32_t tiers = 3; // we support 2 and 3 tier fattrees
     double logtime = 0.25; // ms;
     stringstream filename(ios_base::out);
+    bool log_thread = false;
+    LogSampler log_sampler;
+    bool fast_build = false;
+    bool prebuild_fib = false;
+    uint64_t path_cache_mb = PathCache::DEFAULT_MAX_BYTES >> 20;
     simtime_picosec hop_latency = timeFromUs((uint32_t)1);
     simtime_picosec switch_latency = timeFromUs((uint32_t)0);
     queue_type qt = COMPOSITE;
 
     bool log_sink = false;
+    double sink_detail = -1; // per-flow fraction with -sink_stats, -1 if off
     bool rts = false;
     bool log_tor_downqueue = false;
     bool log_tor_upqueue = false;
@@ -219,6 +230,22 @@ int main(int argc, char **argv) {
             // fraction of queuesize, between 0 and 1
             ecn_thresh = atof(argv[i+1]); 
             i++;
+        } else if (!strcmp(argv[i],"-log_thread")){
+            log_thread = true;
+        } else if (!strcmp(argv[i],"-path_cache_mb")){
+            path_cache_mb = atoll(argv[i+1]);
+            i++;
+        } else if (!strcmp(argv[i],"-fast_build")){
+            fast_build = true;
+        } else if (log_sampler.parseArg(argc, argv, i)) {
+            // -log_rate, -log_flows, -log_reservoir or -log_sample_seed
+        } else if (PacketDBBase::parseArg(argc, argv, i)) {
+            // -pkt_prewarm or -pkt_pool_max
+        } else if (EventProfiler::parseArg(argc, argv, i)) {
+            // -profile or -profile_instances
+        } else if (!strcmp(argv[i],"-sink_stats")){
+            sink_detail = atof(argv[i+1]);
+            i++;
         } else if (!strcmp(argv[i],"-logtime")){
             logtime = atof(argv[i+1]);            
             cout << "logtime "<< logtime << " ms" << endl;
@@ -269,6 +296,17 @@ int main(int argc, char **argv) {
                 exit(1);
             }   
             i++;
+        } else if (!strcmp(argv[i],"-prebuild_fib")){
+            prebuild_fib = true;
+        } else if (!strcmp(argv[i],"-fib_cache")){
+            FatTreeSwitch::_nexthop_cache_size = atoi(argv[i+1]);
+            i++;
+        } else if (!strcmp(argv[i],"-fib_stats")){
+            FatTreeSwitch::_count_lookups = true;
+        } else if (!strcmp(argv[i],"-ar_choices")){
+            FatTreeSwitch::_ar_choices = atoi(argv[i+1]);
+            cout << "Adaptive routing compares " << FatTreeSwitch::_ar_choices << " random choices" << endl;
+            i++;
         } else if (!strcmp(argv[i],"-ar_method")){
             if (!strcmp(argv[i+1],"pause")){
                 cout << "Adaptive routing based on pause state " << endl;
@@ -418,12 +456,19 @@ int main(int argc, char **argv) {
     cout << "Logging to " << filename.str() << endl;
     //Logfile 
     Logfile logfile(filename.str(), eventlist);
+    logfile.setFlushThread(log_thread);
+    logfile.setSampler(&log_sampler);
 
     cout << "Linkspeed set to " << linkspeed/1000000000 << "Gbps" << endl;
     logfile.setStartTime(timeFromSec(0));
 
     NdpSinkLoggerSampling sinkLogger = NdpSinkLoggerSampling(timeFromMs(logtime), eventlist);
-    if (log_sink) {
+    SinkStatsAggregator* sink_stats = NULL;
+    if (log_sink && sink_detail >= 0) {
+        sink_stats = new SinkStatsAggregator(timeFromMs(logtime), eventlist, Logger::NDP_SINK, NdpLogger::RATE, sink_detail);
+        logfile.addLogger(*sink_stats);
+        logfile.writeName(*sink_stats);
+    } else if (log_sink) {
         logfile.addLogger(sinkLogger);
     }
     NdpTrafficLogger traffic_logger = NdpTrafficLogger();
@@ -454,6 +499,7 @@ int main(int argc, char **argv) {
     // scanner interval must be less than min RTO
     NdpRtxTimerScanner ndpRtxScanner(timeFromUs((uint32_t)9), eventlist);
    
+    PhaseTimer startup;
     QueueLoggerFactory *qlf = 0;
     if (log_tor_downqueue || log_tor_upqueue) {
         qlf = new QueueLoggerFactory(&logfile, QueueLoggerFactory::LOGGER_SAMPLING, eventlist);
@@ -462,7 +508,13 @@ int main(int argc, char **argv) {
         qlf = new QueueLoggerFactory(&logfile, QueueLoggerFactory::LOGGER_EMPTY, eventlist);
         qlf->set_sample_period(timeFromUs(10.0));
     }
+    if (qlf) {
+        qlf->set_deferred(fast_build);
+    }
+
+    startup.start("topology");
 #ifdef FAT_TREE
+    FatTreeTopology::set_arena(fast_build);
     FatTreeTopology* top;
     if (topo_file) {
         top = FatTreeTopology::load(topo_file, qlf, eventlist, queuesize, qt, snd_type);
@@ -501,24 +553,17 @@ int main(int argc, char **argv) {
         top->add_switch_loggers(logfile, timeFromUs(20.0));
     }
 
-    vector<const Route*>*** net_paths;
-    net_paths = new vector<const Route*>**[no_of_nodes];
-
-    int **path_refcounts;
-    path_refcounts = new int*[no_of_nodes];
+    // paths are built when a connection first needs them, and shared
+    // by all the connections between the same pair of hosts
+    PathCache path_cache(*top, false, path_cache_mb << 20);
 
     int* is_dest = new int[no_of_nodes];
     
     for (size_t s = 0; s < no_of_nodes; s++) {
         is_dest[s] = 0;
-        net_paths[s] = new vector<const Route*>*[no_of_nodes];
-        path_refcounts[s] = new int[no_of_nodes];
-        for (size_t d = 0; d < no_of_nodes; d++) {
-            net_paths[s][d] = NULL;
-            path_refcounts[s][d] = 0;
-        }
     }
     
+    startup.start("connection matrix");
     ConnectionMatrix* conns = new ConnectionMatrix(no_of_nodes);
 
     if (tm_file){
@@ -558,45 +603,27 @@ int main(int argc, char **argv) {
     vector<connection*>* all_conns = conns->getAllConnections();
     vector <NdpSrc*> ndp_srcs;
 
-    for (size_t c = 0; c < all_conns->size(); c++){
-        connection* crt = all_conns->at(c);
-        int src = crt->src;
-        int dest = crt->dst;
-        path_refcounts[src][dest]++;
-        path_refcounts[dest][src]++;
-                        
-        if (!net_paths[src][dest]
-            && route_strategy!=ECMP_FIB
-            && route_strategy!=ECMP_FIB_ECN
-            && route_strategy!=REACTIVE_ECN ) {
-            vector<const Route*>* paths = top->get_bidir_paths(src,dest,false);
-            net_paths[src][dest] = paths;
-            /*
-            for (unsigned int i = 0; i < paths->size(); i++) {
-              routes.push_back((*paths)[i]);
-            }
-            */
-        }
-        if (!net_paths[dest][src]
-            && route_strategy!=ECMP_FIB
-            && route_strategy!=ECMP_FIB_ECN
-            && route_strategy!=REACTIVE_ECN ) {
-            vector<const Route*>* paths = top->get_bidir_paths(dest,src,false);
-            net_paths[dest][src] = paths;
-            /*
-            for (unsigned int i = 0; i < paths->size(); i++) {
-              routes.push_back((*paths)[i]);
-            }
-            */
-        }
+    if (prebuild_fib) {
+        startup.start("fib");
+        top->build_fibs();
     }
 
+    startup.start("flow setup");
     map <flowid_t, TriggerTarget*> flowmap;
 
     for (size_t c = 0; c < all_conns->size(); c++){
         connection* crt = all_conns->at(c);
         int src = crt->src;
         int dest = crt->dst;
+        PathCache::paths_t paths_out, paths_back;
+        if (route_strategy!=ECMP_FIB
+            && route_strategy!=ECMP_FIB_ECN
+            && route_strategy!=REACTIVE_ECN ) {
+            startup.start("routes");
+            paths_out = path_cache.get(src, dest);
+            paths_back = path_cache.get(dest, src);
+            startup.start("flow setup");
+        }
         //cout << "Connection " << crt->src << "->" <<crt->dst << " starting at " << crt->start << " size " << crt->size << endl;
 
         ndpSrc = new NdpSrc(NULL, NULL, eventlist,rts);
@@ -649,8 +676,8 @@ int main(int argc, char **argv) {
         case SCATTER_ECMP:
         case PULL_BASED:
             ndpSrc->connect(NULL, NULL, *ndpSnk, crt->start);
-            ndpSrc->set_paths(net_paths[src][dest]);
-            ndpSnk->set_paths(net_paths[dest][src]);
+            ndpSrc->set_paths(paths_out.get());
+            ndpSnk->set_paths(paths_back.get());
             break;
         case ECMP_FIB:
         case ECMP_FIB_ECN:
@@ -681,11 +708,11 @@ int main(int argc, char **argv) {
         case SINGLE_PATH:
             {
                 assert(route_strategy==SINGLE_PATH);
-                int choice = rand()%net_paths[src][dest]->size();
-                routeout = new Route(*(net_paths[src][dest]->at(choice)));
+                int choice = rand()%paths_out->size();
+                routeout = new Route(*(paths_out->at(choice)));
                 routeout->add_endpoints(ndpSrc, ndpSnk);
                                 
-                routein = new Route(*top->get_bidir_paths(dest,src,false)->at(choice));
+                routein = new Route(*paths_back->at(choice));
                 routein->add_endpoints(ndpSnk, ndpSrc);
                 ndpSrc->connect(routeout, routein, *ndpSnk, crt->start);
                 break;
@@ -694,41 +721,21 @@ int main(int argc, char **argv) {
             abort();
         }
 
-        path_refcounts[src][dest]--;
-        path_refcounts[dest][src]--;
-
-
         // set up the triggers
         // xxx
 
-        // free up the routes if no other connection needs them 
-        if (path_refcounts[src][dest] == 0 && net_paths[src][dest]) {
-            vector<const Route*>::iterator i;
-            for (i = net_paths[src][dest]->begin(); i != net_paths[src][dest]->end(); i++) {
-                if ((*i)->reverse())
-                    delete (*i)->reverse();
-                delete *i;
-            }
-            delete net_paths[src][dest];
-        }
-        if (path_refcounts[dest][src] == 0 && net_paths[dest][src]) {
-            vector<const Route*>::iterator i;
-            for (i = net_paths[dest][src]->begin(); i != net_paths[dest][src]->end(); i++) {
-                if ((*i)->reverse())
-                    delete (*i)->reverse();
-                delete *i;
-            }
-            delete net_paths[dest][src];
-        }
-
-        if (log_sink) {
+        if (sink_stats) {
+            ndpSnk->monitorWith(*sink_stats);
+        } else if (log_sink) {
             sinkLogger.monitorSink(ndpSnk);
         }
     }
 
-    for (size_t ix = 0; ix < no_of_nodes; ix++) {
-        delete path_refcounts[ix];
-    }
+    startup.stop();
+    startup.print(cout);
+#ifdef FAT_TREE
+    top->print_memory(cout);
+#endif
 
     Logged::dump_idmap();
     // Record the setup
@@ -746,6 +753,10 @@ int main(int argc, char **argv) {
     }
 
     cout << "Done" << endl;
+    if (FatTreeSwitch::_strategy == FatTreeSwitch::ADAPTIVE_ROUTING || FatTreeSwitch::_strategy == FatTreeSwitch::ECMP_ADAPTIVE)
+        top->print_port_choices(cout);
+    if (FatTreeSwitch::_count_lookups)
+        FatTreeSwitch::print_lookup_stats(cout);
     int new_pkts = 0, rtx_pkts = 0, bounce_pkts = 0;
     for (size_t ix = 0; ix < ndp_srcs.size(); ix++) {
         new_pkts += ndp_srcs[ix]->_new_packets_sent;
@@ -753,6 +764,12 @@ int main(int argc, char **argv) {
         bounce_pkts += ndp_srcs[ix]->_bounces_received;
     }
     cout << "New: " << new_pkts << " Rtx: " << rtx_pkts << " Bounced: " << bounce_pkts << endl;
+    path_cache.printStats(cout);
+    PacketDBBase::printStats(cout);
+    EventProfiler::write();
+    if (qlf) {
+        cout << "Queue loggers: " << qlf->loggers_built() << " built for " << qlf->loggers_requested() << " queues" << endl;
+    }
     /*
     list <const Route*>::iterator rt_i;
     int counts[10]; int hop;
@@ -11,7 +11,11 @@
 #include "shortflows.h"
 #include "pipe.h"
 #include "eventlist.h"
+#include "event_profiler.h"
 #include "logfile.h"
+#include "logsampler.h"
+#include "sink_stats.h"
+#include "path_cache.h"
 #include "loggers.h"
 #include "clock.h"
 #include "swift.h"
@@ -62,10 +66,14 @@ int main(int argc, char **argv) {
     mem_b queuesize = DEFAULT_QUEUE_SIZE;
     linkspeed_bps linkspeed = speedFromMbps((double)HOST_NIC);
     stringstream filename(ios_base::out);
+    bool log_thread = false;
+    LogSampler log_sampler;
+    uint64_t path_cache_mb = PathCache::DEFAULT_MAX_BYTES >> 20;
     uint32_t packet_size = 4000;
     bool plb = false;
     uint32_t no_of_subflows = 1;
     simtime_picosec tput_sample_time = timeFromUs((uint32_t)12);
+    double sink_detail = -1; // per-flow fraction with -sink_stats, -1 if off
     simtime_picosec endtime = timeFromMs(1.2);
     char* tm_file = NULL;
     char* topo_file = NULL;
@@ -78,6 +86,17 @@ int main(int argc, char **argv) {
             filename.str(std::string());
             filename << argv[i+1];
             i++;
+        } else if (!strcmp(argv[i],"-log_thread")){
+            log_thread = true;
+        } else if (!strcmp(argv[i],"-path_cache_mb")){
+            path_cache_mb = atoll(argv[i+1]);
+            i++;
+        } else if (log_sampler.parseArg(argc, argv, i)) {
+            // -log_rate, -log_flows, -log_reservoir or -log_sample_seed
+        } else if (PacketDBBase::parseArg(argc, argv, i)) {
+            // -pkt_prewarm or -pkt_pool_max
+        } else if (EventProfiler::parseArg(argc, argv, i)) {
+            // -profile or -profile_instances
         } else if (!strcmp(argv[i],"-conns")){
             no_of_conns = atoi(argv[i+1]);
             i++;
@@ -117,6 +136,9 @@ int main(int argc, char **argv) {
         } else if (!strcmp(argv[i],"-tsample")){
             tput_sample_time = timeFromUs((uint32_t)atoi(argv[i+1]));
             i++;            
+        } else if (!strcmp(argv[i],"-sink_stats")){
+            sink_detail = atof(argv[i+1]);
+            i++;
         } else if (!strcmp(argv[i],"-plb")){
             if (strcmp(argv[i+1], "off") == 0) {
                 plb = false;
@@ -151,6 +173,8 @@ int main(int argc, char **argv) {
     cout << "Logging to " << filename.str() << endl;
     //Logfile 
     Logfile logfile(filename.str(), eventlist);
+    logfile.setFlushThread(log_thread);
+    logfile.setSampler(&log_sampler);
 
 #if PRINT_PATHS
     filename << ".paths";
@@ -167,7 +191,14 @@ int main(int argc, char **argv) {
 
     logfile.setStartTime(timeFromSec(0));
     SwiftSinkLoggerSampling sinkLogger = SwiftSinkLoggerSampling(tput_sample_time, eventlist);
-    logfile.addLogger(sinkLogger);
+    SinkStatsAggregator* sink_stats = NULL;
+    if (sink_detail >= 0) {
+        sink_stats = new SinkStatsAggregator(tput_sample_time, eventlist, Logger::SWIFT_SINK, SwiftLogger::RATE, sink_detail);
+        logfile.addLogger(*sink_stats);
+        logfile.writeName(*sink_stats);
+    } else {
+        logfile.addLogger(sinkLogger);
+    }
     SwiftTrafficLogger traffic_logger = SwiftTrafficLogger();
     logfile.addLogger(traffic_logger);
     SwiftSrc* swiftSrc;
@@ -217,16 +248,14 @@ int main(int argc, char **argv) {
     no_of_nodes = top->no_of_nodes();
     cout << "actual nodes " << no_of_nodes << endl;
 
-    vector<const Route*>*** net_paths;
-    net_paths = new vector<const Route*>**[no_of_nodes];
+    // paths are built when a connection first needs them, and shared
+    // by all the connections between the same pair of hosts
+    PathCache path_cache(*top, true, path_cache_mb << 20);
 
     int* is_dest = new int[no_of_nodes];
     
     for (uint32_t i=0; i<no_of_nodes; i++){
 is_dest[i] = 0;
-        net_paths[i] = new vector<const Route*>*[no_of_nodes];
-        for (uint32_t j = 0; j<no_of_nodes; j++)
-            net_paths[i][j] = NULL;
     }
 
     // Permutation connections
@@ -265,17 +294,14 @@ is_dest[i] = 0;
         uint32_t dest = crt->dst;
         
         connID++;
-        if (!net_paths[src][dest]) {
-            vector<const Route*>* paths = top->get_paths(src,dest);
-            net_paths[src][dest] = paths;
-            for (uint32_t p = 0; p < paths->size(); p++) {
-                routes.push_back((*paths)[p]);
+        uint64_t built = path_cache.misses();
+        PathCache::paths_t paths_out = path_cache.get(src, dest);
+        if (path_cache.misses() != built) {
+            for (uint32_t p = 0; p < paths_out->size(); p++) {
+                routes.push_back((*paths_out)[p]);
             }
         }
-        if (!net_paths[dest][src]) {
-            vector<const Route*>* paths = top->get_paths(dest,src);
-            net_paths[dest][src] = paths;
-        }
+        PathCache::paths_t paths_back = path_cache.get(dest, src);
 
         swiftSrc = new SwiftSrc(swiftRtxScanner, NULL, NULL, eventlist);
         swiftSrc->set_cwnd(cwnd*Packet::data_packet_size());
@@ -292,7 +318,8 @@ is_dest[i] = 0;
         //ReorderBufferLoggerSampling* buf_logger = new ReorderBufferLoggerSampling(timeFromMs(0.01), eventlist);
         //logfile.addLogger(*buf_logger);
         //swiftSnk->add_buffer_logger(buf_logger);
-        sinkLogger.monitorSink(swiftSnk);
+        if (!sink_stats)
+            sinkLogger.monitorSink(swiftSnk);
 
         swiftSrc->setName("swift_" + ntoa(src) + "_" + ntoa(dest));
         logfile.writeName(*swiftSrc);
@@ -308,24 +335,24 @@ is_dest[i] = 0;
         uint32_t choice = 0;
           
 #ifdef FAT_TREE
-        choice = rand()%net_paths[src][dest]->size();
+        choice = rand()%paths_out->size();
 #endif
           
 #ifdef OV_FAT_TREE
-        choice = rand()%net_paths[src][dest]->size();
+        choice = rand()%paths_out->size();
 #endif
           
 #ifdef MH_FAT_TREE
-        int use_all = it_sub==net_paths[src][dest]->size();
+        int use_all = it_sub==paths_out->size();
 
         if (use_all)
             choice = inter;
         else
-            choice = rand()%net_paths[src][dest]->size();
+            choice = rand()%paths_out->size();
 #endif
           
 #ifdef VL2
-        choice = rand()%net_paths[src][dest]->size();
+        choice = rand()%paths_out->size();
 #endif
           
 #ifdef STAR
@@ -338,50 +365,53 @@ is_dest[i] = 0;
         int min = -1, max = -1,minDist = 1000,maxDist = 0;
         if (subflow_count==1){
             //find shortest and longest path 
-            for (uint32_t dd=0;dd<net_paths[src][dest]->size();dd++){
-                if (net_paths[src][dest]->at(dd)->size()<minDist){
-                    minDist = net_paths[src][dest]->at(dd)->size();
+            for (uint32_t dd=0;dd<paths_out->size();dd++){
+                if (paths_out->at(dd)->size()<minDist){
+                    minDist = paths_out->at(dd)->size();
                     min = dd;
                 }
-                if (net_paths[src][dest]->at(dd)->size()>maxDist){
-                    maxDist = net_paths[src][dest]->at(dd)->size();
+                if (paths_out->at(dd)->size()>maxDist){
+                    maxDist = paths_out->at(dd)->size();
                     max = dd;
                 }
             }
             choice = min;
         } 
         else
-            choice = rand()%net_paths[src][dest]->size();
+            choice = rand()%paths_out->size();
 #endif
-        if (choice>=net_paths[src][dest]->size()){
-            printf("Weird path choice %d out of %lu\n",choice,net_paths[src][dest]->size());
+        if (choice>=paths_out->size()){
+            printf("Weird path choice %d out of %lu\n",choice,paths_out->size());
             exit(1);
         }
           
 #if PRINT_PATHS
-        for (uint32_t ll=0;ll<net_paths[src][dest]->size();ll++){
+        for (uint32_t ll=0;ll<paths_out->size();ll++){
             paths << "Route from "<< ntoa(src) << " to " << ntoa(dest) << "  (" << ll << ") -> " ;
-            print_path(paths,net_paths[src][dest]->at(ll));
+            print_path(paths,paths_out->at(ll));
         }
 #endif
           
-        routeout = new Route(*(net_paths[src][dest]->at(choice)));
+        routeout = new Route(*(paths_out->at(choice)));
         //routeout->push_back(swiftSnk);
           
-        routein = new Route(*top->get_paths(dest,src)->at(choice));
+        routein = new Route(*paths_back->at(choice));
         //routein->push_back(swiftSrc);
 
         if (no_of_subflows == 1) {
             swiftSrc->connect(*routeout, *routein, *swiftSnk, timeFromUs((uint32_t)crt->start));
         }
-        swiftSrc->set_paths(net_paths[src][dest]);
+        swiftSrc->set_paths(paths_out.get());
         if (no_of_subflows > 1) {
             // could probably use this for single-path case too, but historic reasons
             cout << "will start subflow " << c << " at " << crt->start << endl;
             swiftSrc->multipath_connect(*swiftSnk, timeFromUs((uint32_t)crt->start), no_of_subflows);
         }
           
-        sinkLogger.monitorSink(swiftSnk);
+        if (sink_stats)
+            swiftSnk->monitorWith(*sink_stats);
+        else
+            sinkLogger.monitorSink(swiftSnk);
     }
     //    ShortFlows* sf = new ShortFlows(2560, eventlist, net_paths,conns,lg, &swiftRtxScanner);
 
@@ -405,6 +435,9 @@ is_dest[i] = 0;
     }
 
     cout << "Done" << endl;
+    path_cache.printStats(cout);
+    PacketDBBase::printStats(cout);
+    EventProfiler::write();
 
 #if PRINT_PATHS
     list <const Route*>::iterator rt_i;
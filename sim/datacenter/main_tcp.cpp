@@ -11,7 +11,9 @@
 #include "shortflows.h"
 #include "pipe.h"
 #include "eventlist.h"
+#include "event_profiler.h"
 #include "logfile.h"
+#include "logsampler.h"
 #include "loggers.h"
 #include "clock.h"
 #include "mtcp.h"
@@ -74,6 +76,8 @@ int main(int argc, char **argv) {
     double epsilon = 1;
     uint32_t no_of_conns = 0, no_of_nodes = DEFAULT_NODES;
     stringstream filename(ios_base::out);
+    bool log_thread = false;
+    LogSampler log_sampler;
 
     int i = 1;
     filename << "logout.dat";
@@ -83,6 +87,14 @@ int main(int argc, char **argv) {
             filename.str(std::string());
             filename << argv[i+1];
             i++;
+        } else if (!strcmp(argv[i],"-log_thread")){
+            log_thread = true;
+        } else if (log_sampler.parseArg(argc, argv, i)) {
+            // -log_rate, -log_flows, -log_reservoir or -log_sample_seed
+        } else if (PacketDBBase::parseArg(argc, argv, i)) {
+            // -pkt_prewarm or -pkt_pool_max
+        } else if (EventProfiler::parseArg(argc, argv, i)) {
+            // -profile or -profile_instances
         }
         else if (!strcmp(argv[i],"-sub")){
             subflow_count = atoi(argv[i+1]);
@@ -130,6 +142,8 @@ int main(int argc, char **argv) {
     cout << "Logging to " << filename.str() << endl;
     //Logfile 
     Logfile logfile(filename.str(), eventlist);
+    logfile.setFlushThread(log_thread);
+    logfile.setSampler(&log_sampler);
 
 #if PRINT_PATHS
     filename << ".paths";
@@ -457,4 +471,6 @@ int main(int argc, char **argv) {
     // GO!
     while (eventlist.doNextEvent()) {
     }
+    PacketDBBase::printStats(cout);
+    EventProfiler::write();
 }
@@ -0,0 +1,303 @@
+#! /usr/bin/env python3
+
+"""
+Live reader for the shared-memory metrics stream of a running simulation.
+
+Start the simulator with -metrics NAME (and optionally -metrics_interval
+us), then attach:
+
+    ./htsim_eqds -tm big.cm -metrics htsim_run1 -end 100000 &
+    python metrics_reader.py htsim_run1
+
+Every poll prints the newest sample: simulated time, simulation speed,
+flows finished, delivery rate, queued bytes per tier and drops/trims.
+With --save the full trace is written as CSV; with --reference a saved
+trace from an earlier run is compared against, and the reader warns as
+soon as completions or delivered bytes diverge by more than --tolerance.
+"""
+
+import argparse
+import csv
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+MAGIC = 0x54454D4D49535448  # "HTSIMMET"
+VERSION = 1
+HEADER_SIZE = 4096
+NAME_LEN = 32
+NAMES_OFFSET = 64
+
+# Header fields, as uint64 indices.
+PUBLISHED = 4
+FINISHED = 5
+
+TIERS = ("host", "tor", "agg", "core")
+DIVERGENCE_COUNTERS = ("flows_finished", "bytes_delivered")
+
+# Default argument values.
+DEFAULT_POLL_INTERVAL_S = 1.0
+DEFAULT_TOLERANCE = 0.1
+DEFAULT_ATTACH_TIMEOUT_S = 30.0
+
+
+class MetricsReader:
+    """
+    Attaches to a metrics segment and returns the samples published since
+    the previous poll.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): The shared memory name given to -metrics.
+
+        Raises:
+            FileNotFoundError: If the segment does not exist.
+            ValueError: If the segment is not a metrics stream.
+        """
+        self.name = name.lstrip("/")
+        self._shm = shared_memory.SharedMemory(name=self.name)
+        # The simulator owns the segment; stop Python removing it at exit.
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._buf = self._shm.buf
+        magic, version_count, self.slots, self.period_ps = struct.unpack_from(
+            "<QQQQ", self._buf, 0
+        )
+        if magic != MAGIC or version_count & 0xFFFFFFFF != VERSION:
+            self.close()
+            raise ValueError(f"{name} is not an htsim metrics stream (version {VERSION})")
+        count = version_count >> 32
+        self.counters = [
+            bytes(self._buf[NAMES_OFFSET + i * NAME_LEN:NAMES_OFFSET + (i + 1) * NAME_LEN])
+            .rstrip(b"\0")
+            .decode()
+            for i in range(count)
+        ]
+        self._slot_format = f"<{count + 1}Q"
+        self._slot_size = struct.calcsize(self._slot_format)
+        self.next_sample = 0
+        self.lost = 0
+
+    def published(self) -> int:
+        """Return the number of samples written so far."""
+        return struct.unpack_from("<Q", self._buf, PUBLISHED * 8)[0]
+
+    def finished(self) -> bool:
+        """Return True once the simulation has written its last sample."""
+        return struct.unpack_from("<Q", self._buf, FINISHED * 8)[0] != 0
+
+    def poll(self) -> list:
+        """
+        Return the samples published since the last poll, oldest first, as
+        dicts keyed by counter name.
+
+        Samples overwritten before they could be read are counted in lost.
+        """
+        published = self.published()
+        if published - self.next_sample > self.slots:
+            self.lost += published - self.slots - self.next_sample
+            self.next_sample = published - self.slots
+        samples = []
+        for k in range(self.next_sample, published):
+            offset = HEADER_SIZE + (k % self.slots) * self._slot_size
+            values = struct.unpack_from(self._slot_format, self._buf, offset)
+            seq_after = struct.unpack_from("<Q", self._buf, offset)[0]
+            if values[0] != 2 * k + 2 or seq_after != values[0]:
+                self.lost += 1
+                continue
+            samples.append(dict(zip(self.counters, values[1:])))
+        self.next_sample = published
+        return samples
+
+    def close(self, unlink: bool = False):
+        """Detach from the segment, removing it if unlink is set."""
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            shared_memory.SharedMemory(name=self.name).unlink()
+
+
+def load_trace(file_path: str) -> list:
+    """Load a trace saved with --save as a list of samples."""
+    with open(file_path, newline="", encoding="utf-8") as trace_file:
+        return [{k: int(v) for k, v in row.items()} for row in csv.DictReader(trace_file)]
+
+
+def interpolate(trace: list, time_ps: int, counter: str) -> float:
+    """
+    Return the value of a counter at time_ps, linearly interpolated
+    between the samples of a trace, or None if time_ps is past its end.
+    """
+    for prev, cur in zip(trace, trace[1:]):
+        if prev["time_ps"] <= time_ps <= cur["time_ps"]:
+            span = cur["time_ps"] - prev["time_ps"]
+            if span == 0:
+                return cur[counter]
+            frac = (time_ps - prev["time_ps"]) / span
+            return prev[counter] + frac * (cur[counter] - prev[counter])
+    if trace and trace[0]["time_ps"] == time_ps:
+        return trace[0][counter]
+    return None
+
+
+def divergence(sample: dict, reference: list, tolerance: float) -> list:
+    """
+    Compare a sample against a reference trace.
+
+    Returns:
+        list: (counter, value, expected) for each counter that differs by
+        more than tolerance, relative to the expected value.
+    """
+    diverged = []
+    for counter in DIVERGENCE_COUNTERS:
+        expected = interpolate(reference, sample["time_ps"], counter)
+        if expected is None:
+            continue
+        if abs(sample[counter] - expected) > tolerance * max(expected, 1):
+            diverged.append((counter, sample[counter], expected))
+    return diverged
+
+
+def format_sample(sample: dict, prev: dict) -> str:
+    """Format one sample, with rates against the previous one if given."""
+    line = f"t={sample['time_ps'] / 1e6:.1f}us"
+    if prev is not None and sample["wall_ns"] > prev["wall_ns"]:
+        wall_s = (sample["wall_ns"] - prev["wall_ns"]) / 1e9
+        sim_us = (sample["time_ps"] - prev["time_ps"]) / 1e6
+        line += f" speed={sim_us / wall_s:.1f}us/s"
+    if prev is not None and sample["time_ps"] > prev["time_ps"]:
+        delivered = sample["bytes_delivered"] - prev["bytes_delivered"]
+        gbps = delivered * 8 / ((sample["time_ps"] - prev["time_ps"]) / 1e12) / 1e9
+        line += f" rate={gbps:.1f}Gbps"
+    line += f" flows={sample['flows_finished']}/{sample['flows_started']}"
+    line += " queued=" + "/".join(str(sample[f"qdepth_{t}"]) for t in TIERS)
+    line += f" drops={sum(sample[f'drops_{t}'] for t in TIERS)}"
+    line += f" trims={sum(sample[f'trims_{t}'] for t in TIERS)}"
+    return line
+
+
+def attach(name: str, timeout_s: float) -> MetricsReader:
+    """
+    Attach to a segment, waiting up to timeout_s for the simulator to
+    create it.
+
+    Raises:
+        FileNotFoundError: If the segment does not appear in time.
+    """
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            return MetricsReader(name)
+        except (FileNotFoundError, ValueError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def add_commandline_options():
+    """
+    Create an argument parser and add command line options to the parser.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser object with added command line options.
+    """
+    arg_parser = argparse.ArgumentParser(
+        description="Watch the live metrics of a running htsim simulation."
+    )
+    arg_parser.add_argument("name", help="The shared memory name given to -metrics.")
+    arg_parser.add_argument(
+        "-i",
+        "--poll_interval_s",
+        default=DEFAULT_POLL_INTERVAL_S,
+        type=float,
+        help=f"Seconds between polls, by default {DEFAULT_POLL_INTERVAL_S}.",
+    )
+    arg_parser.add_argument(
+        "-s", "--save", default=None, help="Write every sample to this CSV file."
+    )
+    arg_parser.add_argument(
+        "-r",
+        "--reference",
+        default=None,
+        help="A CSV trace saved from an earlier run to compare against.",
+    )
+    arg_parser.add_argument(
+        "-t",
+        "--tolerance",
+        default=DEFAULT_TOLERANCE,
+        type=float,
+        help=(
+            "Relative difference from the reference that counts as divergence,"
+            f" by default {DEFAULT_TOLERANCE}."
+        ),
+    )
+    arg_parser.add_argument(
+        "--exit_on_divergence",
+        action="store_true",
+        help="Exit with status 2 at the first divergence.",
+    )
+    arg_parser.add_argument(
+        "--timeout_s",
+        default=DEFAULT_ATTACH_TIMEOUT_S,
+        type=float,
+        help=f"Seconds to wait for the segment to appear, by default {DEFAULT_ATTACH_TIMEOUT_S}.",
+    )
+    arg_parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="Do not remove the segment when the simulation has finished.",
+    )
+    return arg_parser
+
+
+def main():
+    """The main function of the metrics reader."""
+    args = add_commandline_options().parse_args()
+    try:
+        reader = attach(args.name, args.timeout_s)
+    except (FileNotFoundError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+    reference = load_trace(args.reference) if args.reference else None
+    trace = []
+    prev = None
+    status = 0
+    try:
+        while True:
+            finished = reader.finished()
+            samples = reader.poll()
+            trace.extend(samples)
+            if samples:
+                print(format_sample(samples[-1], prev), flush=True)
+                prev = samples[-1]
+            if reference is not None:
+                for sample in samples:
+                    for counter, value, expected in divergence(sample, reference, args.tolerance):
+                        print(
+                            f"DIVERGED at t={sample['time_ps'] / 1e6:.1f}us: {counter}"
+                            f" {value} vs {expected:.0f} in the reference",
+                            flush=True,
+                        )
+                        status = 2
+                if status and args.exit_on_divergence:
+                    break
+            if finished:
+                break
+            time.sleep(args.poll_interval_s)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if reader.lost:
+            print(f"{reader.lost} samples were overwritten before they were read")
+        if args.save:
+            with open(args.save, "w", newline="", encoding="utf-8") as trace_file:
+                writer = csv.DictWriter(trace_file, fieldnames=reader.counters)
+                writer.writeheader()
+                writer.writerows(trace)
+        reader.close(unlink=reader.finished() and not args.keep)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include "path_cache.h"
+#include <iomanip>
+
+// the topology hands over ownership of the vector, its routes and their
+// reverses; they go when the last holder lets go
+static void delete_paths(vector<const Route*>* paths) {
+    for (size_t i = 0; i < paths->size(); i++) {
+        const Route* rt = paths->at(i);
+        if (rt->reverse())
+            delete rt->reverse();
+        delete rt;
+    }
+    delete paths;
+}
+
+PathCache::PathCache(Topology& topology, bool reverse, uint64_t max_bytes)
+    : _topology(topology), _reverse(reverse), _max_bytes(max_bytes),
+      _hits(0), _misses(0), _evictions(0), _bytes(0), _peak_bytes(0)
+{
+}
+
+PathCache::~PathCache() {
+    clear();
+}
+
+uint64_t
+PathCache::pathsBytes(const vector<const Route*>& paths) {
+    uint64_t bytes = sizeof(vector<const Route*>) + paths.size() * sizeof(const Route*);
+    for (size_t i = 0; i < paths.size(); i++) {
+        const Route* rt = paths[i];
+        bytes += sizeof(Route) + rt->size() * sizeof(PacketSink*);
+        if (rt->reverse())
+            bytes += sizeof(Route) + rt->reverse()->size() * sizeof(PacketSink*);
+    }
+    return bytes;
+}
+
+PathCache::paths_t
+PathCache::get(uint32_t src, uint32_t dest) {
+    uint64_t key = ((uint64_t)src << 32) | dest;
+    auto found = _index.find(key);
+    if (found != _index.end()) {
+        _hits++;
+        _lru.splice(_lru.begin(), _lru, found->second);
+        return found->second->paths;
+    }
+
+    _misses++;
+    vector<const Route*>* built = _reverse ? _topology.get_paths(src, dest)
+        : _topology.get_bidir_paths(src, dest, false);
+    Entry entry;
+    entry.key = key;
+    entry.paths = paths_t(built, delete_paths);
+    entry.bytes = pathsBytes(*built);
+    _lru.push_front(entry);
+    _index[key] = _lru.begin();
+    _bytes += entry.bytes;
+    if (_bytes > _peak_bytes)
+        _peak_bytes = _bytes;
+    evict();
+    return entry.paths;
+}
+
+void
+PathCache::evict() {
+    // copies of a route share its reverse, and add_endpoints() extends
+    // that reverse in place, so sets built with reverses must stay put
+    if (_reverse)
+        return;
+    // always keep the set just built, however large
+    while (_bytes > _max_bytes && _lru.size() > 1) {
+        Entry& victim = _lru.back();
+        _bytes -= victim.bytes;
+        _index.erase(victim.key);
+        _lru.pop_back();
+        _evictions++;
+    }
+}
+
+void
+PathCache::setMaxBytes(uint64_t max_bytes) {
+    _max_bytes = max_bytes;
+    evict();
+}
+
+void
+PathCache::clear() {
+    _lru.clear();
+    _index.clear();
+    _bytes = 0;
+}
+
+void
+PathCache::printStats(ostream& out) const {
+    uint64_t lookups = _hits + _misses;
+    out << "Path cache: " << lookups << " lookups, " << _hits << " hits ("
+        << fixed << setprecision(1) << (lookups ? 100.0 * _hits / lookups : 0.0) << "%), "
+        << _misses << " built, " << _evictions << " evicted, "
+        << setprecision(2) << _peak_bytes / 1048576.0 << "MB peak, "
+        << _bytes / 1048576.0 << "MB held" << endl;
+    out.unsetf(ios_base::floatfield);
+    out << setprecision(6);
+}
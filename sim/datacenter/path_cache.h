@@ -0,0 +1,69 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef PATH_CACHE_H
+#define PATH_CACHE_H
+
+/*
+ * PathCache builds the paths between a pair of hosts the first time a
+ * connection asks for them, and hands the same Route objects to every
+ * later connection between that pair.  Sources and sinks copy the routes
+ * they use (adding their own endpoints), so the cached routes are never
+ * modified and can be shared freely.
+ *
+ * Memory is capped: once the cached routes exceed the limit, the path
+ * sets used least recently are dropped.  A caller still holding one keeps
+ * it alive until it lets go, so dropping a set never invalidates a route
+ * being copied.  Reverse routes are the exception: a copy of a route
+ * shares its reverse, and adding endpoints to the copy extends that
+ * reverse, so a cache built with reverses never drops anything.
+ */
+
+#include <list>
+#include <memory>
+#include <unordered_map>
+#include "topology.h"
+
+class PathCache {
+public:
+    typedef std::shared_ptr<vector<const Route*>> paths_t;
+
+    // reverse: also build the reverse of every path, as get_paths() does
+    PathCache(Topology& topology, bool reverse, uint64_t max_bytes = DEFAULT_MAX_BYTES);
+    ~PathCache();
+
+    paths_t get(uint32_t src, uint32_t dest);
+    void setMaxBytes(uint64_t max_bytes);
+    void clear();
+    void printStats(ostream& out) const;
+
+    uint64_t hits() const {return _hits;}
+    uint64_t misses() const {return _misses;}
+    uint64_t evictions() const {return _evictions;}
+    uint64_t bytes() const {return _bytes;}
+    uint64_t peakBytes() const {return _peak_bytes;}
+
+    static const uint64_t DEFAULT_MAX_BYTES = 256ULL << 20;
+private:
+    struct Entry {
+        uint64_t key;
+        paths_t paths;
+        uint64_t bytes;
+    };
+    typedef std::list<Entry> lru_t;
+
+    static uint64_t pathsBytes(const vector<const Route*>& paths);
+    void evict();
+
+    Topology& _topology;
+    bool _reverse;
+    uint64_t _max_bytes;
+    lru_t _lru; // most recently used first
+    std::unordered_map<uint64_t, lru_t::iterator> _index;
+
+    uint64_t _hits;
+    uint64_t _misses;
+    uint64_t _evictions;
+    uint64_t _bytes;
+    uint64_t _peak_bytes;
+};
+
+#endif
@@ -0,0 +1,132 @@
+#! /usr/bin/env python3
+
+"""
+Report where a simulation's time goes, from the event profile written by
+-profile.
+
+The profile counts the events EventList dispatched and the wall time they
+took for each EventSource class (Queue, Pipe, EqdsSrc, loggers, ...) and,
+with -profile_instances, for each source. The simulator must be built with
+"make PROFILE=1" for -profile to work:
+
+    ./htsim_eqds -tm perm.cm -end 1000 -profile prof.json -profile_instances
+    python profile_report.py prof.json -n 10
+
+With a second profile, each class's share of the events and time is shown
+beside the first's, to see what a change moved.
+"""
+
+import argparse
+import json
+import sys
+
+# Default argument values.
+DEFAULT_TOP = 20
+
+
+def load_profile(file_path: str) -> dict:
+    """Load a profile written by -profile."""
+    with open(file_path, encoding="utf-8") as profile_file:
+        return json.load(profile_file)
+
+
+def class_rows(profile: dict) -> list:
+    """
+    Summarise the classes of a profile, busiest first.
+
+    Returns:
+        list: dicts with class, events, seconds, ns_per_event and the
+        fractions of all events (event_share) and of event time
+        (time_share).
+    """
+    events = profile["events"] or 1
+    seconds = profile["event_seconds"] or 1
+    rows = []
+    for entry in profile["classes"]:
+        rows.append(
+            {
+                "class": entry["class"],
+                "events": entry["events"],
+                "seconds": entry["seconds"],
+                "ns_per_event": entry["seconds"] * 1e9 / max(entry["events"], 1),
+                "event_share": entry["events"] / events,
+                "time_share": entry["seconds"] / seconds,
+            }
+        )
+    rows.sort(key=lambda row: row["seconds"], reverse=True)
+    return rows
+
+
+def top_instances(profile: dict, count: int) -> list:
+    """Return the count busiest sources, if the profile has them."""
+    instances = sorted(profile.get("instances", []), key=lambda i: i["seconds"], reverse=True)
+    return instances[:count]
+
+
+def format_report(profile: dict, top: int, baseline: dict = None) -> str:
+    """Format a profile as text, compared to a baseline profile if given."""
+    lines = [
+        f"{profile['events']} events, {profile['event_seconds']:.3f}s in events"
+        f" of {profile['run_seconds']:.3f}s run"
+    ]
+    before = {row["class"]: row for row in class_rows(baseline)} if baseline else {}
+    lines.append(f"{'class':<32} {'events':>12} {'ev%':>6} {'seconds':>9} {'time%':>6} {'ns/ev':>8}")
+    for row in class_rows(profile)[:top]:
+        line = (
+            f"{row['class'][:32]:<32} {row['events']:>12} {100 * row['event_share']:>6.1f}"
+            f" {row['seconds']:>9.3f} {100 * row['time_share']:>6.1f} {row['ns_per_event']:>8.0f}"
+        )
+        if baseline:
+            old = before.get(row["class"])
+            if old:
+                line += f"  (was {100 * old['time_share']:.1f}% of time, {old['ns_per_event']:.0f}ns/ev)"
+            else:
+                line += "  (new)"
+        lines.append(line)
+    instances = top_instances(profile, top)
+    if instances:
+        lines.append("")
+        lines.append(f"{'busiest sources':<48} {'events':>12} {'seconds':>9}")
+        for inst in instances:
+            name = f"{inst['name']} ({inst['class']})"
+            lines.append(f"{name[:48]:<48} {inst['events']:>12} {inst['seconds']:>9.3f}")
+    return "\n".join(lines)
+
+
+def add_commandline_options():
+    """
+    Create an argument parser and add command line options to the parser.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser object with added command line options.
+    """
+    arg_parser = argparse.ArgumentParser(
+        description="Summarise an htsim event profile written by -profile."
+    )
+    arg_parser.add_argument("profile", help="The JSON file given to -profile.")
+    arg_parser.add_argument(
+        "-n",
+        "--top",
+        default=DEFAULT_TOP,
+        type=int,
+        help=f"Classes and sources to list, by default {DEFAULT_TOP}.",
+    )
+    arg_parser.add_argument(
+        "-b", "--baseline", default=None, help="An earlier profile to compare against."
+    )
+    return arg_parser
+
+
+def main():
+    """The main function of the profile report."""
+    args = add_commandline_options().parse_args()
+    try:
+        profile = load_profile(args.profile)
+        baseline = load_profile(args.baseline) if args.baseline else None
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Error: {e}")
+    print(format_report(profile, args.top, baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#! /usr/bin/env python3
+
+"""
+Seed replication with confidence-interval early stopping.
+
+Rather than running a fixed set of seeds (e.g. 13..17) for every
+configuration, seeds are launched in parallel and the running mean and
+confidence interval of the target metric are tracked per configuration.
+A configuration stops receiving seeds once the half-width of its interval,
+relative to the mean, is below a threshold; free workers always go to the
+configuration whose interval is currently the widest.
+
+Example:
+
+    python seed_control.py -b ./htsim_ndp -m mean_fct -w 0.02 -j 8 \\
+        --config "-paths 1" --config "-paths 8" -- \\
+        -tm perm-{seed}.cm -strat ecmp_host -end 1500
+
+The seed is passed as "-seed N", or substituted wherever {seed} appears.
+"""
+
+import argparse
+import math
+import shlex
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from sweep import (
+    DEFAULT_BINARY,
+    DEFAULT_CACHE_FILE_PATH,
+    METRICS,
+    RunCache,
+    build_cmdline,
+    compute_metric,
+    run_simulation,
+)
+
+# Default argument values.
+DEFAULT_METRIC = "mean_fct"
+DEFAULT_CI_WIDTH = 0.02
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_FIRST_SEED = 13
+DEFAULT_MIN_SEEDS = 3
+DEFAULT_MAX_SEEDS = 20
+DEFAULT_JOBS = 4
+
+# Two-sided Student t critical values for 1..30 degrees of freedom; beyond
+# that the normal quantile is close enough.
+T_TABLE = {
+    0.90: [6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+           1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+           1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697],
+    0.95: [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+           2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+           2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042],
+    0.99: [63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250, 3.169,
+           3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861, 2.845,
+           2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756, 2.750],
+}
+Z_VALUES = {0.90: 1.645, 0.95: 1.960, 0.99: 2.576}
+
+
+def t_critical(confidence: float, dof: int) -> float:
+    """
+    Return the two-sided Student t critical value.
+
+    Args:
+        confidence (float): The confidence level, one of 0.90, 0.95 or 0.99.
+        dof (int): The degrees of freedom, at least 1.
+
+    Raises:
+        ValueError: If the confidence level is not supported.
+    """
+    if confidence not in T_TABLE:
+        raise ValueError(
+            f"Unsupported confidence level: {confidence}. Must be one of"
+            f" {sorted(T_TABLE)}."
+        )
+    if dof <= len(T_TABLE[confidence]):
+        return T_TABLE[confidence][dof - 1]
+    return Z_VALUES[confidence]
+
+
+class RunningStats:
+    """
+    The running mean and variance of a metric over seeds (Welford's method).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        """Add one sample."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def variance(self) -> float:
+        """Return the sample variance, or infinity with fewer than two samples."""
+        if self.count < 2:
+            return math.inf
+        return self._m2 / (self.count - 1)
+
+    def half_width(self, confidence: float = DEFAULT_CONFIDENCE) -> float:
+        """Return the half-width of the confidence interval of the mean."""
+        if self.count < 2:
+            return math.inf
+        return t_critical(confidence, self.count - 1) * math.sqrt(
+            self.variance() / self.count
+        )
+
+    def relative_half_width(self, confidence: float = DEFAULT_CONFIDENCE) -> float:
+        """Return the half-width relative to the magnitude of the mean."""
+        half_width = self.half_width(confidence)
+        if half_width == 0:
+            return 0.0
+        if self.mean == 0 or math.isinf(self.mean) or math.isnan(self.mean):
+            return math.inf
+        return half_width / abs(self.mean)
+
+
+class SeedController:
+    """
+    Schedules seeds across configurations until every interval is narrow
+    enough, the per-configuration seed limit is hit, or the run budget is
+    spent.
+
+    evaluate(config, seed) must return the metric of one run; it is called
+    from up to jobs worker threads at once.
+    """
+
+    def __init__(
+        self,
+        configs: list,
+        evaluate,
+        ci_width: float = DEFAULT_CI_WIDTH,
+        confidence: float = DEFAULT_CONFIDENCE,
+        first_seed: int = DEFAULT_FIRST_SEED,
+        min_seeds: int = DEFAULT_MIN_SEEDS,
+        max_seeds: int = DEFAULT_MAX_SEEDS,
+        budget: int = None,
+        jobs: int = DEFAULT_JOBS,
+    ):
+        t_critical(confidence, 1)
+        self.configs = configs
+        self.evaluate = evaluate
+        self.ci_width = ci_width
+        self.confidence = confidence
+        self.first_seed = first_seed
+        self.min_seeds = max(min_seeds, 2)
+        self.max_seeds = max(max_seeds, self.min_seeds)
+        self.budget = budget if budget is not None else self.max_seeds * len(configs)
+        self.jobs = jobs
+        self.stats = [RunningStats() for _ in configs]
+        self.scheduled = [0] * len(configs)
+
+    def converged(self, idx: int) -> bool:
+        """Return True if the interval of configuration idx is narrow enough."""
+        stats = self.stats[idx]
+        return (
+            stats.count >= self.min_seeds
+            and stats.relative_half_width(self.confidence) <= self.ci_width
+        )
+
+    def next_config(self):
+        """
+        Pick the configuration to run the next seed for, or None.
+
+        Configurations short of min_seeds come first, then the one with the
+        widest relative interval. Seeds already in flight count towards
+        min_seeds so a single noisy configuration cannot claim every worker
+        before any results are back.
+        """
+        best = None
+        best_key = None
+        for idx in range(len(self.configs)):
+            if self.scheduled[idx] >= self.max_seeds or self.converged(idx):
+                continue
+            in_flight = self.scheduled[idx] - self.stats[idx].count
+            if self.scheduled[idx] < self.min_seeds:
+                key = (1, -self.scheduled[idx], math.inf)
+            elif in_flight > 0 and self.stats[idx].count < self.min_seeds:
+                continue
+            else:
+                key = (0, -in_flight, self.stats[idx].relative_half_width(self.confidence))
+            if best_key is None or key > best_key:
+                best, best_key = idx, key
+        return best
+
+    def run(self) -> list[RunningStats]:
+        """Run seeds until done and return the statistics per configuration."""
+        runs = 0
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            pending = {}
+            while True:
+                while len(pending) < self.jobs and runs < self.budget:
+                    idx = self.next_config()
+                    if idx is None:
+                        break
+                    seed = self.first_seed + self.scheduled[idx]
+                    self.scheduled[idx] += 1
+                    runs += 1
+                    future = executor.submit(self.evaluate, self.configs[idx], seed)
+                    pending[future] = idx
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.stats[pending.pop(future)].add(future.result())
+        return self.stats
+
+
+def add_commandline_options():
+    """
+    Create an argument parser and add command line options to the parser.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser object with added command line options.
+    """
+    arg_parser = argparse.ArgumentParser(
+        description="Replicate htsim runs over seeds until the metric converges."
+    )
+    arg_parser.add_argument(
+        "--config",
+        dest="configs",
+        action="append",
+        default=[],
+        help="Extra simulator arguments of one configuration. Repeatable.",
+    )
+    arg_parser.add_argument(
+        "-b",
+        "--binary",
+        default=DEFAULT_BINARY,
+        help=f"The simulator executable, by default {DEFAULT_BINARY}.",
+    )
+    arg_parser.add_argument(
+        "-m",
+        "--metric",
+        default=DEFAULT_METRIC,
+        choices=METRICS,
+        help=f"The metric to track, by default {DEFAULT_METRIC}.",
+    )
+    arg_parser.add_argument(
+        "-w",
+        "--ci_width",
+        default=DEFAULT_CI_WIDTH,
+        type=float,
+        help=(
+            "Stop once the confidence interval half-width relative to the mean"
+            f" is below this, by default {DEFAULT_CI_WIDTH}."
+        ),
+    )
+    arg_parser.add_argument(
+        "--confidence",
+        default=DEFAULT_CONFIDENCE,
+        type=float,
+        choices=sorted(T_TABLE),
+        help=f"The confidence level, by default {DEFAULT_CONFIDENCE}.",
+    )
+    arg_parser.add_argument(
+        "-s",
+        "--first_seed",
+        default=DEFAULT_FIRST_SEED,
+        type=int,
+        help=f"The first seed, by default {DEFAULT_FIRST_SEED}.",
+    )
+    arg_parser.add_argument(
+        "--min_seeds",
+        default=DEFAULT_MIN_SEEDS,
+        type=int,
+        help=f"Seeds to run before testing convergence, by default {DEFAULT_MIN_SEEDS}.",
+    )
+    arg_parser.add_argument(
+        "--max_seeds",
+        default=DEFAULT_MAX_SEEDS,
+        type=int,
+        help=f"Seeds per configuration at most, by default {DEFAULT_MAX_SEEDS}.",
+    )
+    arg_parser.add_argument(
+        "--budget",
+        default=None,
+        type=int,
+        help="Total runs across all configurations, by default unlimited.",
+    )
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        default=DEFAULT_JOBS,
+        type=int,
+        help=f"Simulations to run in parallel, by default {DEFAULT_JOBS}.",
+    )
+    arg_parser.add_argument(
+        "-c",
+        "--cache_file_path",
+        default=DEFAULT_CACHE_FILE_PATH,
+        help=f"The results cache, by default {DEFAULT_CACHE_FILE_PATH}.",
+    )
+    arg_parser.add_argument(
+        "sim_args",
+        nargs=argparse.REMAINDER,
+        help="Arguments passed to every run; {seed} is replaced by the seed.",
+    )
+    return arg_parser
+
+
+def main():
+    """The main function of the seed replication controller."""
+    args = add_commandline_options().parse_args()
+    sim_args = args.sim_args
+    if sim_args and sim_args[0] == "--":
+        sim_args = sim_args[1:]
+    configs = args.configs or [""]
+    cache = RunCache(args.cache_file_path)
+
+    def evaluate(config, seed):
+        cmdline = build_cmdline(
+            args.binary, sim_args + shlex.split(config), {"seed": seed}
+        )
+        finish_times = cache.get(cmdline)
+        if finish_times is None:
+            finish_times = run_simulation(cmdline)
+            cache.put(cmdline, finish_times)
+        return compute_metric(finish_times, args.metric)
+
+    controller = SeedController(
+        configs,
+        evaluate,
+        args.ci_width,
+        args.confidence,
+        args.first_seed,
+        args.min_seeds,
+        args.max_seeds,
+        args.budget,
+        args.jobs,
+    )
+    try:
+        all_stats = controller.run()
+    except RuntimeError as e:
+        sys.exit(f"Error: {e}")
+
+    for idx, config in enumerate(configs):
+        stats = all_stats[idx]
+        state = "converged" if controller.converged(idx) else "NOT converged"
+        print(
+            f"[{config}] {args.metric} {stats.mean:.3f} +/-"
+            f" {stats.half_width(args.confidence):.3f} over {stats.count} seeds"
+            f" ({state})"
+        )
+
+
+if __name__ == "__main__":
+    main()
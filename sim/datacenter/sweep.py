@@ -0,0 +1,442 @@
+#! /usr/bin/env python3
+
+"""
+Adaptive parameter sweeps over htsim runs.
+
+Instead of running every point of a grid (e.g. -paths 1..256 for every node
+count), the sweep bisects the sorted list of candidate values of one numeric
+parameter to locate either
+
+  * the knee: the smallest value whose metric is within a relative tolerance
+    of the metric at the largest value (i.e. where the metric stops
+    improving), or
+  * the first value that meets a target (e.g. a tailFCT from validate.txt).
+
+The metric is assumed to be monotone in the searched parameter. Results are
+cached on disk, keyed by the full command line, so repeated or overlapping
+sweeps never re-run a simulation.
+
+Example:
+
+    python sweep.py -b ./htsim_ndp -p paths -v 1,8,16,32,64,128,256 \\
+        -m tail_fct -k 0.05 --for nodes=432,1024 -- \\
+        -tm perm-{nodes}.cm -strat ecmp_host -end 1500
+"""
+
+import argparse
+import json
+import os
+import re
+import shlex
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+
+from launch import launch
+
+# Default argument values.
+DEFAULT_BINARY = "./htsim_eqds"
+DEFAULT_METRIC = "tail_fct"
+DEFAULT_KNEE_TOLERANCE = 0.05
+DEFAULT_CACHE_FILE_PATH = "sweep_cache.json"
+
+# Metrics that can be computed from the flow completion lines of a run.
+METRICS = ("mean_fct", "tail_fct", "completed")
+
+
+class KneeResult(
+    namedtuple("KneeResult", ["value", "score", "reference", "evaluated"])
+):
+    """
+    The outcome of a knee search: the located parameter value (None if no
+    candidate qualifies), its metric score, the score it was compared against
+    and a dict of every candidate value evaluated to its score.
+    """
+
+
+def parse_finish_times(output: str) -> dict[str, float]:
+    """
+    Extract the flow finish times from the stdout of an htsim run.
+
+    Every protocol prints a line of the form
+    "Flow <name> ... finished at <time> ..." when a flow completes.
+
+    Args:
+        output (str): The stdout of the simulator.
+
+    Returns:
+        dict[str, float]: A map from flow name to its finish time.
+    """
+    finish_times = {}
+    for line in output.splitlines():
+        if "finished at" not in line:
+            continue
+        items = line.split()
+        at_idx = items.index("at")
+        if items[at_idx - 1] != "finished" or at_idx + 1 >= len(items):
+            continue
+        try:
+            finish_times[items[1]] = float(items[at_idx + 1])
+        except ValueError:
+            continue
+    return finish_times
+
+
+def compute_metric(finish_times: list[float], metric: str) -> float:
+    """
+    Reduce the finish times of one run to a single metric value.
+
+    Args:
+        finish_times (list[float]): The finish times of all completed flows.
+        metric (str): One of METRICS.
+
+    Returns:
+        float: The metric value. Mean and tail FCT are infinite if no flow
+        completed.
+
+    Raises:
+        ValueError: If the metric is unknown.
+    """
+    if metric == "completed":
+        return float(len(finish_times))
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}. Must be one of {METRICS}.")
+    if not finish_times:
+        return float("inf")
+    if metric == "mean_fct":
+        return sum(finish_times) / len(finish_times)
+    return max(finish_times)
+
+
+def lower_is_better(metric: str) -> bool:
+    """Return True if smaller values of the metric are better."""
+    return metric != "completed"
+
+
+def meets(score: float, threshold: float, metric: str) -> bool:
+    """Return True if score is at least as good as threshold for the metric."""
+    if lower_is_better(metric):
+        return score <= threshold
+    return score >= threshold
+
+
+class RunCache:
+    """
+    A persistent map from a simulator command line to the finish times it
+    produced, stored as JSON. Safe to share between worker threads.
+    """
+
+    def __init__(self, file_path: str = None):
+        self.file_path = file_path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if file_path and os.path.isfile(file_path):
+            with open(file_path, "r", encoding="utf-8") as cache_file:
+                self.entries = json.load(cache_file)
+
+    @staticmethod
+    def key(cmdline: list[str]) -> str:
+        """Return the cache key for a command line."""
+        return shlex.join(cmdline)
+
+    def get(self, cmdline: list[str]):
+        """Return the cached finish times for cmdline, or None."""
+        return self.entries.get(self.key(cmdline))
+
+    def put(self, cmdline: list[str], finish_times: list[float]):
+        """Record the finish times for cmdline and write the cache out."""
+        with self._lock:
+            self.entries[self.key(cmdline)] = finish_times
+            if self.file_path:
+                with open(self.file_path, "w", encoding="utf-8") as cache_file:
+                    json.dump(self.entries, cache_file, indent=1)
+
+
+def run_simulation(cmdline: list[str]) -> list[float]:
+    """
+    Run the simulator and return the finish times of the completed flows.
+
+    Unless the command line names a logfile with -o, the log goes to a
+    temporary file so that runs in the same directory can run in parallel.
+
+    Raises:
+        RuntimeError: If the simulator exits with a non-zero status.
+    """
+    print("Running", shlex.join(cmdline))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if "-o" not in cmdline:
+            cmdline = cmdline + ["-o", os.path.join(tmpdir, "logout.dat")]
+        result = launch(cmdline)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"{shlex.join(cmdline)} exited with status {result.returncode}:"
+            f" {result.stderr}"
+        )
+    return list(parse_finish_times(result.stdout).values())
+
+
+def build_cmdline(binary: str, base_args: list[str], params: dict) -> list[str]:
+    """
+    Build a simulator command line.
+
+    Parameters referenced as {name} in base_args are substituted in place,
+    all others are appended as "-name value". Braces that do not name a
+    swept parameter, such as a JSON fragment or a shell glob, are kept.
+
+    Args:
+        binary (str): The simulator executable.
+        base_args (list[str]): The arguments shared by every run.
+        params (dict): The swept parameter values of this run.
+
+    Returns:
+        list[str]: The command line.
+    """
+    cmdline = [binary]
+    used = set()
+
+    def substitute(match):
+        name = match.group(1)
+        if name not in params:
+            return match.group(0)
+        used.add(name)
+        return str(params[name])
+
+    for arg in base_args:
+        cmdline.append(re.sub(r"\{(\w+)\}", substitute, arg))
+    for name, value in params.items():
+        if name not in used:
+            cmdline += ["-" + name, str(value)]
+    return cmdline
+
+
+def find_knee(
+    values: list,
+    evaluate,
+    metric: str,
+    tolerance: float = DEFAULT_KNEE_TOLERANCE,
+    target: float = None,
+    resolution: float = 0,
+) -> KneeResult:
+    """
+    Bisect the sorted candidate values for the first one that is good enough.
+
+    Without a target, a value is good enough if its score is within the
+    relative tolerance of the score at the largest candidate. With a target,
+    it must meet the target itself.
+
+    Args:
+        values (list): The candidate parameter values, sorted ascending.
+        evaluate: A callable mapping a parameter value to its metric score.
+        metric (str): The metric being scored, one of METRICS.
+        tolerance (float): The relative distance from the reference that still
+            counts as the knee.
+        target (float): An absolute target for the metric, or None.
+        resolution (float): Stop once the bracketing values are at most this
+            far apart; the upper bracket is then reported.
+
+    Returns:
+        KneeResult: The located value and the scores evaluated on the way.
+    """
+    if not values:
+        raise ValueError("No candidate values to search")
+    evaluated = {}
+
+    def score(idx):
+        if values[idx] not in evaluated:
+            evaluated[values[idx]] = evaluate(values[idx])
+        return evaluated[values[idx]]
+
+    hi = len(values) - 1
+    if target is None:
+        reference = score(hi)
+        if lower_is_better(metric):
+            threshold = reference * (1 + tolerance)
+        else:
+            threshold = reference * (1 - tolerance)
+    else:
+        reference = threshold = target
+        if not meets(score(hi), threshold, metric):
+            return KneeResult(None, score(hi), reference, evaluated)
+
+    if meets(score(0), threshold, metric):
+        return KneeResult(values[0], score(0), reference, evaluated)
+
+    # Invariant: values[lo] is not good enough, values[hi] is.
+    lo = 0
+    while hi - lo > 1 and values[hi] - values[lo] > resolution:
+        mid = (lo + hi) // 2
+        if meets(score(mid), threshold, metric):
+            hi = mid
+        else:
+            lo = mid
+    return KneeResult(values[hi], score(hi), reference, evaluated)
+
+
+def parse_values(values_string: str) -> list:
+    """
+    Parse a candidate list, either "v1,v2,..." or an integer range "lo:hi[:step]".
+
+    Returns:
+        list: The sorted, de-duplicated candidate values.
+    """
+    if ":" in values_string:
+        bounds = [int(v) for v in values_string.split(":")]
+        step = bounds[2] if len(bounds) > 2 else 1
+        values = list(range(bounds[0], bounds[1] + 1, step))
+    else:
+        values = [
+            float(v) if "." in v else int(v) for v in values_string.split(",")
+        ]
+    return sorted(set(values))
+
+
+def add_commandline_options():
+    """
+    Create an argument parser and add command line options to the parser.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser object with added command line options.
+    """
+    arg_parser = argparse.ArgumentParser(
+        description="Locate the knee of a metric over one htsim parameter."
+    )
+    arg_parser.add_argument(
+        "-p",
+        "--param",
+        required=True,
+        help="(Required) The htsim parameter to search, without the leading dash.",
+    )
+    arg_parser.add_argument(
+        "-v",
+        "--values",
+        required=True,
+        help="(Required) Candidate values, 'v1,v2,...' or 'lo:hi[:step]'.",
+    )
+    arg_parser.add_argument(
+        "-b",
+        "--binary",
+        default=DEFAULT_BINARY,
+        help=f"The simulator executable, by default {DEFAULT_BINARY}.",
+    )
+    arg_parser.add_argument(
+        "-m",
+        "--metric",
+        default=DEFAULT_METRIC,
+        choices=METRICS,
+        help=f"The metric to optimise, by default {DEFAULT_METRIC}.",
+    )
+    arg_parser.add_argument(
+        "-k",
+        "--knee_tolerance",
+        default=DEFAULT_KNEE_TOLERANCE,
+        type=float,
+        help=(
+            "Relative distance from the best score that counts as the knee, by"
+            f" default {DEFAULT_KNEE_TOLERANCE}."
+        ),
+    )
+    arg_parser.add_argument(
+        "-t",
+        "--target",
+        default=None,
+        type=float,
+        help="Find the first value meeting this absolute target instead of the knee.",
+    )
+    arg_parser.add_argument(
+        "-r",
+        "--resolution",
+        default=0,
+        type=float,
+        help="Stop once the knee is bracketed to within this many parameter units.",
+    )
+    arg_parser.add_argument(
+        "--for",
+        dest="grid",
+        action="append",
+        default=[],
+        metavar="NAME=V1,V2",
+        help="An outer parameter; the knee is searched for every value. Repeatable.",
+    )
+    arg_parser.add_argument(
+        "-c",
+        "--cache_file_path",
+        default=DEFAULT_CACHE_FILE_PATH,
+        help=f"The results cache, by default {DEFAULT_CACHE_FILE_PATH}.",
+    )
+    arg_parser.add_argument(
+        "sim_args",
+        nargs=argparse.REMAINDER,
+        help="Arguments passed to every run; {name} is replaced by parameter values.",
+    )
+    return arg_parser
+
+
+def grid_points(grid: list[str]) -> list[dict]:
+    """Expand repeated NAME=V1,V2 options into a list of parameter dicts."""
+    points = [{}]
+    for option in grid:
+        name, values_string = option.split("=", 1)
+        points = [
+            dict(point, **{name: value})
+            for point in points
+            for value in parse_values(values_string)
+        ]
+    return points
+
+
+def main():
+    """The main function of the adaptive sweep."""
+    args = add_commandline_options().parse_args()
+    sim_args = args.sim_args
+    if sim_args and sim_args[0] == "--":
+        sim_args = sim_args[1:]
+    values = parse_values(args.values)
+    cache = RunCache(args.cache_file_path)
+    runs = 0
+
+    for point in grid_points(args.grid):
+
+        def evaluate(value, point=point):
+            nonlocal runs
+            cmdline = build_cmdline(
+                args.binary, sim_args, dict(point, **{args.param: value})
+            )
+            finish_times = cache.get(cmdline)
+            if finish_times is None:
+                finish_times = run_simulation(cmdline)
+                cache.put(cmdline, finish_times)
+                runs += 1
+            return compute_metric(finish_times, args.metric)
+
+        try:
+            result = find_knee(
+                values,
+                evaluate,
+                args.metric,
+                args.knee_tolerance,
+                args.target,
+                args.resolution,
+            )
+        except RuntimeError as e:
+            sys.exit(f"Error: {e}")
+
+        where = " ".join(f"{name}={value}" for name, value in point.items())
+        prefix = f"[{where}] " if where else ""
+        if result.value is None:
+            print(
+                f"{prefix}no value of {args.param} meets {args.metric}"
+                f" {result.reference}; best {result.score}"
+            )
+        else:
+            print(
+                f"{prefix}{args.param}={result.value}: {args.metric}"
+                f" {result.score} (reference {result.reference}),"
+                f" {len(result.evaluated)} of {len(values)} points evaluated"
+            )
+
+    print(f"{runs} simulations run, {len(cache.entries)} results cached")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+""" Unit tests for fluid_check.py """
+
+import os
+import tempfile
+import unittest
+
+from fluid_check import compare, fct_error, parse_output, read_matrix, run
+
+BINARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "htsim_eqds")
+
+PACKET_OUTPUT = """Parsed args
+Flow Eqds_0_1 flowId 1 eqdsSrc 0 finished at 110 total packets 490 RTS 0 total bytes 2002140
+Flow Eqds_1_0 flowId 2 eqdsSrc 1 finished at 200 total packets 490 RTS 0 total bytes 2002140
+Flow Eqds_2_3 flowId 3 eqdsSrc 2 finished at 400 total packets 1224 RTS 0 total bytes 5005350
+Done
+Events scheduled: 1000
+"""
+
+FLUID_OUTPUT = """Parsed args
+Flow Eqds_0_1 flowId 1 eqdsSrc 0 finished at 120 total packets 490 RTS 0 total bytes 2002140
+Flow Eqds_1_0 flowId 2 eqdsSrc 1 finished at 200 total packets 490 RTS 0 total bytes 2002140
+Flow Eqds_2_3 flowId 3 fluid finished at 300 total bytes 5000000
+Done
+Events scheduled: 250
+Fluid flows: 1 finished of 1, 12 rate updates over 6 links
+"""
+
+
+class TestFluidCheck(unittest.TestCase):
+    """
+    Tests for comparing fluid and packet runs.
+    """
+
+    def test_read_matrix(self):
+        """
+        Test that start times are converted to us and fluid tags are read.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tm_file = os.path.join(tmpdir, "mixed.cm")
+            with open(tm_file, "w", encoding="utf-8") as cm_file:
+                cm_file.write(
+                    "Nodes 4\nConnections 4\n"
+                    "0->1 id 1 start 10000000 size 2000000\n"
+                    "1->0 id 2 size 2000000\n"
+                    "2->3 id 3 start 0 size 5000000 fluid\n"
+                    "3->2 start 0 size 5000000\n"
+                )
+            self.assertEqual(
+                read_matrix(tm_file),
+                {1: (10.0, False), 2: (0.0, False), 3: (0.0, True)},
+            )
+
+    def test_parse_output(self):
+        """
+        Test that packet and fluid completions are both keyed by flow id.
+        """
+        finish_times, events = parse_output(FLUID_OUTPUT)
+        self.assertEqual(finish_times, {1: 120.0, 2: 200.0, 3: 300.0})
+        self.assertEqual(events, 250)
+        self.assertEqual(parse_output("Done\n"), ({}, None))
+
+    def test_fct_error(self):
+        """
+        Test that flows missing from either run are left out.
+        """
+        error = fct_error({1: 100.0, 2: 200.0, 4: 50.0}, {1: 110.0, 2: 200.0})
+        self.assertEqual(error.flows, 2)
+        self.assertAlmostEqual(error.mean, 0.05)
+        self.assertAlmostEqual(error.worst, 0.1)
+        self.assertEqual(fct_error({}, {1: 1.0}).flows, 0)
+
+    def test_compare(self):
+        """
+        Test that FCTs are measured from the start in the matrix and split
+        into foreground and background.
+        """
+        flows = {1: (10.0, False), 2: (0.0, False), 3: (0.0, True)}
+        result = compare(flows, PACKET_OUTPUT, FLUID_OUTPUT, 4.0, 1.0)
+        self.assertEqual(result.foreground.flows, 2)
+        self.assertAlmostEqual(result.foreground.mean, 0.05)
+        self.assertAlmostEqual(result.background.mean, 0.25)
+        self.assertEqual(result.foreground_mean_fct, (150.0, 155.0))
+        self.assertEqual(result.foreground_p99_fct, (200.0, 200.0))
+        self.assertAlmostEqual(result.events_ratio, 0.25)
+        self.assertAlmostEqual(result.wall_ratio, 0.25)
+
+
+@unittest.skipUnless(os.path.exists(BINARY_PATH), "htsim_eqds not built")
+class TestFluidAccuracy(unittest.TestCase):
+    """
+    Runs a mixed matrix both ways and checks the fluid FCTs.
+    """
+
+    def test_mixed_permutation(self):
+        """
+        Test a 16 node permutation, i -> (i + 5) % 16, with every other
+        flow tagged fluid. The packet flows send ACKs and pulls through
+        the fluid flows' links, which must not be given a full share.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tm_file = os.path.join(tmpdir, "mixed.cm")
+            with open(tm_file, "w", encoding="utf-8") as cm_file:
+                cm_file.write("Nodes 16\nConnections 16\n")
+                for src in range(16):
+                    fluid = " fluid" if src % 2 else ""
+                    cm_file.write(
+                        f"{src}->{(src + 5) % 16} id {src + 1}"
+                        f" start 0 size 2000000{fluid}\n"
+                    )
+            flows = read_matrix(tm_file)
+            cmdline = [BINARY_PATH, "-tm", tm_file, "-nodes", "16"]
+            cmdline += ["-strat", "ecmp", "-paths", "16", "-end", "5000"]
+            cmdline += ["-o", os.path.join(tmpdir, "logout.dat")]
+            packet = run(cmdline + ["-no_fluid"])
+            fluid = run(cmdline)
+        result = compare(
+            flows, packet.stdout, fluid.stdout, packet.usage.wall_s, fluid.usage.wall_s
+        )
+        self.assertEqual(result.foreground.flows, 8)
+        self.assertEqual(result.background.flows, 8)
+        self.assertLess(result.foreground.worst, 0.15)
+        self.assertLess(result.background.mean, 0.2)
+        self.assertLess(result.events_ratio, 0.75)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+""" Unit tests for htsim.py """
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import htsim
+
+MATRIX_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "connection_matrices",
+    "perm_16n_16c_2MB.cm",
+)
+
+
+def library_built():
+    """Return True if libhtsim_api.so can be loaded."""
+    try:
+        htsim._load_library()
+    except OSError:
+        return False
+    return True
+
+
+@unittest.skipUnless(library_built(), "libhtsim_api.so not built")
+class TestHtsim(unittest.TestCase):
+    """
+    Tests for running simulations in process.
+    """
+
+    def simulate(self, seed=13):
+        """Run the 16 node permutation and return its flows."""
+        htsim.reset(seed)
+        self.assertEqual(htsim.load_matrix(MATRIX_FILE_PATH), 16)
+        self.assertEqual(htsim.fat_tree(paths=128), 16)
+        self.assertGreater(htsim.run(1000), 0)
+        return htsim.flows()
+
+    def test_repeatable(self):
+        """
+        Test that simulations after a reset give identical results.
+        """
+        first = self.simulate()
+        second = self.simulate()
+        self.assertEqual(htsim.finished_count(), 16)
+        self.assertTrue(first.finished().all())
+        for name in htsim.Flows._fields:
+            np.testing.assert_array_equal(getattr(first, name), getattr(second, name))
+        self.assertEqual(first.new_pkts.sum(), 16 * 490)
+
+    def test_set_matrix(self):
+        """
+        Test flows given as arrays, including one that cannot finish in time.
+        """
+        htsim.reset()
+        htsim.set_matrix(16, [0, 1], [5, 6], [2000000, 2000000000], [0.0, 10.0])
+        htsim.fat_tree(paths=128)
+        htsim.run(500)
+        flows = htsim.flows()
+        self.assertEqual(list(flows.src), [0, 1])
+        self.assertEqual(list(flows.start_us), [0.0, 10.0])
+        self.assertTrue(np.isnan(flows.finish_us[1]))
+        self.assertGreater(flows.fct_us()[0], 0)
+        self.assertEqual(htsim.finished_count(), 1)
+        self.assertLess(htsim.now_us(), 500)
+
+    def load_matrix_text(self, text):
+        """Load a connection matrix given as text."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file_path = os.path.join(tmpdir, "matrix.cm")
+            with open(file_path, "w") as f:
+                f.write(text)
+            return htsim.load_matrix(file_path)
+
+    def test_weight(self):
+        """
+        Test that a flow's pull weight is used, as it is by htsim_eqds.
+        """
+        htsim.reset()
+        self.load_matrix_text(
+            "Nodes 16\nConnections 2\n"
+            "0->5 id 1 start 0 size 2000000 weight 3\n"
+            "1->5 id 2 start 0 size 2000000\n"
+        )
+        htsim.fat_tree(paths=128)
+        htsim.run(1000)
+        flows = htsim.flows()
+        self.assertTrue(flows.finished().all())
+        self.assertLess(flows.finish_us[0] + 50, flows.finish_us[1])
+
+    def test_fluid_rejected(self):
+        """
+        Test that a matrix with a fluid flow is refused.
+        """
+        htsim.reset()
+        with self.assertRaises(RuntimeError):
+            self.load_matrix_text(
+                "Nodes 16\nConnections 1\n0->5 id 1 start 0 size 2000000 fluid\n"
+            )
+        with self.assertRaises(RuntimeError):
+            htsim.fat_tree()
+
+    def test_errors(self):
+        """
+        Test that setup errors raise.
+        """
+        htsim.reset()
+        with self.assertRaises(RuntimeError):
+            htsim.fat_tree()
+        with self.assertRaises(RuntimeError):
+            htsim.set_matrix(4, [0], [7], [1000])
+        with self.assertRaises(ValueError):
+            htsim.set_matrix(4, [0, 1], [2], [1000])
+
+
+if __name__ == "__main__":
+    unittest.main()
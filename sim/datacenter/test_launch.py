@@ -0,0 +1,105 @@
+""" Unit tests for launch.py """
+
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+from launch import fit_scaling, launch, matrix_size, parse_params
+
+
+class TestParams(unittest.TestCase):
+    """
+    Tests for tagging runs with their parameters.
+    """
+
+    def test_parse_params(self):
+        """
+        Test value options, flags and repeated options.
+        """
+        params = parse_params(
+            ["./htsim_ndp", "-nodes", "1024", "-debug", "-log", "sink", "-log", "switch"]
+        )
+        self.assertEqual(
+            params, {"nodes": "1024", "debug": True, "log": ["sink", "switch"]}
+        )
+
+    def test_matrix_size_from_tm_file(self):
+        """
+        Test that nodes and conns are read from a connection matrix header
+        unless given on the command line.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tm_file = os.path.join(tmpdir, "perm.cm")
+            with open(tm_file, "w", encoding="utf-8") as cm_file:
+                cm_file.write("Nodes 16\nConnections 32\n0->1 start 0 size 1000\n")
+            self.assertEqual(matrix_size({"tm": tm_file}), (16, 32))
+            self.assertEqual(matrix_size({"tm": tm_file, "conns": "8"}), (16, 8))
+        self.assertEqual(matrix_size({}), (None, None))
+
+
+class TestLaunch(unittest.TestCase):
+    """
+    Tests for running a process and recording its resources.
+    """
+
+    def setUp(self):
+        """
+        Set up a temporary run database.
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "runs.db")
+
+    def tearDown(self):
+        """
+        Remove the temporary run database.
+        """
+        self.tmpdir.cleanup()
+
+    def test_launch_records_run(self):
+        """
+        Test that output is captured and the run and its samples are recorded.
+        """
+        cmdline = [
+            sys.executable, "-c",
+            "import sys, time; x = bytearray(20000000); time.sleep(0.3);"
+            " print('hello'); sys.exit(3)",
+        ]
+        result = launch(cmdline, tags={"seed": 13}, db_path=self.db_path, sample_interval_s=0.05)
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stdout, "hello\n")
+        self.assertGreater(result.usage.wall_s, 0.25)
+        self.assertGreater(result.usage.max_rss_kb, 19000)
+        with sqlite3.connect(self.db_path) as db:
+            rows = list(db.execute("SELECT returncode, params FROM runs"))
+            samples = db.execute("SELECT COUNT(*) FROM rss_samples").fetchone()[0]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][0], 3)
+        self.assertIn('"seed": 13', rows[0][1])
+        if sys.platform.startswith("linux"):
+            self.assertGreater(samples, 0)
+
+    def test_fit_scaling(self):
+        """
+        Test fitting a power law to recorded runs.
+        """
+        self.assertIsNone(fit_scaling(self.db_path, "max_rss_kb"))
+        launch([sys.executable, "-c", "pass"], db_path=self.db_path)
+        with sqlite3.connect(self.db_path) as db:
+            for nodes, conns in [(16, 16), (128, 128), (1024, 1024)]:
+                db.execute(
+                    "INSERT INTO runs (binary, nodes, conns, returncode, max_rss_kb)"
+                    " VALUES ('htsim_ndp', ?, ?, 0, ?)",
+                    (nodes, conns, 3 * (nodes * conns) ** 0.5),
+                )
+        a, b, n = fit_scaling(self.db_path, "max_rss_kb", "htsim_ndp")
+        self.assertAlmostEqual(a, 3.0, places=3)
+        self.assertAlmostEqual(b, 0.5, places=3)
+        self.assertEqual(n, 3)
+        with self.assertRaises(ValueError):
+            fit_scaling(self.db_path, "cmdline")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+""" Unit tests for metrics_reader.py """
+
+import os
+import struct
+import unittest
+from multiprocessing import resource_tracker, shared_memory
+
+from metrics_reader import (
+    FINISHED,
+    HEADER_SIZE,
+    MAGIC,
+    NAME_LEN,
+    NAMES_OFFSET,
+    PUBLISHED,
+    VERSION,
+    MetricsReader,
+    divergence,
+    interpolate,
+)
+
+COUNTERS = ["time_ps", "wall_ns", "flows_finished", "bytes_delivered"]
+
+
+class FakeExporter:
+    """
+    Writes a segment the way the simulator's MetricsExporter does.
+    """
+
+    def __init__(self, name, slots):
+        self.slots = slots
+        self.slot_size = 8 * (1 + len(COUNTERS))
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=True, size=HEADER_SIZE + slots * self.slot_size
+        )
+        struct.pack_into(
+            "<QQQQQQ", self.shm.buf, 0, MAGIC, (len(COUNTERS) << 32) | VERSION, slots,
+            10000000, 0, 0,
+        )
+        for i, counter in enumerate(COUNTERS):
+            offset = NAMES_OFFSET + i * NAME_LEN
+            self.shm.buf[offset:offset + len(counter)] = counter.encode()
+        self.published = 0
+
+    def publish(self, *values, torn=False):
+        """Write one sample; a torn one is left half written."""
+        offset = HEADER_SIZE + (self.published % self.slots) * self.slot_size
+        seq = 2 * self.published + (1 if torn else 2)
+        struct.pack_into(f"<{len(values) + 1}Q", self.shm.buf, offset, seq, *values)
+        self.published += 1
+        struct.pack_into("<Q", self.shm.buf, PUBLISHED * 8, self.published)
+
+    def finish(self):
+        """Mark the run as finished."""
+        struct.pack_into("<Q", self.shm.buf, FINISHED * 8, 1)
+
+    def close(self):
+        """Remove the segment."""
+        self.shm.close()
+        self.shm.unlink()
+
+
+class TestMetricsReader(unittest.TestCase):
+    """
+    Tests for reading samples from the ring buffer.
+    """
+
+    def setUp(self):
+        """
+        Set up a fake exporter with a four slot ring.
+        """
+        self.exporter = FakeExporter(f"htsim_test_{os.getpid()}", 4)
+        self.reader = MetricsReader(self.exporter.shm.name)
+        # both ends are in this process; the reader untracked the segment
+        resource_tracker.register(self.exporter.shm._name, "shared_memory")
+
+    def tearDown(self):
+        """
+        Remove the segment.
+        """
+        self.reader.close()
+        self.exporter.close()
+
+    def test_poll(self):
+        """
+        Test that each poll returns only the new samples.
+        """
+        self.assertEqual(self.reader.counters, COUNTERS)
+        self.assertEqual(self.reader.poll(), [])
+        self.exporter.publish(10, 1, 0, 100)
+        self.exporter.publish(20, 2, 1, 200)
+        samples = self.reader.poll()
+        self.assertEqual([s["bytes_delivered"] for s in samples], [100, 200])
+        self.exporter.publish(30, 3, 2, 300)
+        self.assertEqual([s["time_ps"] for s in self.reader.poll()], [30])
+        self.assertFalse(self.reader.finished())
+        self.exporter.finish()
+        self.assertTrue(self.reader.finished())
+
+    def test_overwritten_and_torn(self):
+        """
+        Test that overwritten and half-written samples are skipped and counted.
+        """
+        for k in range(6):
+            self.exporter.publish(k, 0, 0, 0)
+        self.exporter.publish(6, 0, 0, 0, torn=True)
+        samples = self.reader.poll()
+        self.assertEqual([s["time_ps"] for s in samples], [3, 4, 5])
+        self.assertEqual(self.reader.lost, 4)
+
+
+class TestDivergence(unittest.TestCase):
+    """
+    Tests for comparing a run against a reference trace.
+    """
+
+    def setUp(self):
+        """
+        Set up a reference trace.
+        """
+        self.reference = [
+            {"time_ps": 0, "flows_finished": 0, "bytes_delivered": 0},
+            {"time_ps": 100, "flows_finished": 10, "bytes_delivered": 1000},
+        ]
+
+    def test_interpolate(self):
+        """
+        Test interpolation within and beyond the trace.
+        """
+        self.assertEqual(interpolate(self.reference, 50, "bytes_delivered"), 500)
+        self.assertEqual(interpolate(self.reference, 0, "flows_finished"), 0)
+        self.assertIsNone(interpolate(self.reference, 200, "flows_finished"))
+
+    def test_divergence(self):
+        """
+        Test that only differences beyond the tolerance are reported.
+        """
+        close = {"time_ps": 50, "flows_finished": 5, "bytes_delivered": 520}
+        self.assertEqual(divergence(close, self.reference, 0.1), [])
+        far = {"time_ps": 50, "flows_finished": 5, "bytes_delivered": 300}
+        self.assertEqual(
+            divergence(far, self.reference, 0.1), [("bytes_delivered", 300, 500)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+""" Unit tests for profile_report.py """
+
+import json
+import os
+import tempfile
+import unittest
+
+from profile_report import class_rows, format_report, load_profile, top_instances
+
+PROFILE = {
+    "run_seconds": 2.0,
+    "event_seconds": 1.5,
+    "events": 1000,
+    "classes": [
+        {"class": "Pipe", "events": 600, "seconds": 0.3},
+        {"class": "CompositeQueue", "events": 300, "seconds": 0.9},
+        {"class": "EqdsSrc", "events": 100, "seconds": 0.3},
+    ],
+    "instances": [
+        {"class": "Pipe", "name": "Pipe-0", "events": 600, "seconds": 0.3},
+        {"class": "CompositeQueue", "name": "q0", "events": 300, "seconds": 0.9},
+    ],
+}
+
+
+class TestProfileReport(unittest.TestCase):
+    """
+    Tests for summarising event profiles.
+    """
+
+    def test_class_rows(self):
+        """
+        Classes come busiest first, with their shares and cost per event.
+        """
+        rows = class_rows(PROFILE)
+        self.assertEqual([row["class"] for row in rows][0], "CompositeQueue")
+        queue = rows[0]
+        self.assertAlmostEqual(queue["event_share"], 0.3)
+        self.assertAlmostEqual(queue["time_share"], 0.6)
+        self.assertAlmostEqual(queue["ns_per_event"], 3e6)
+
+    def test_top_instances(self):
+        """
+        Sources are ranked by time, and a profile without them gives none.
+        """
+        self.assertEqual([i["name"] for i in top_instances(PROFILE, 1)], ["q0"])
+        self.assertEqual(top_instances({"classes": []}, 5), [])
+
+    def test_format_with_baseline(self):
+        """
+        Compared to a baseline, classes it lacked are marked new.
+        """
+        baseline = dict(PROFILE, classes=PROFILE["classes"][:2])
+        report = format_report(PROFILE, 10, baseline)
+        self.assertIn("1000 events", report)
+        eqds = [line for line in report.splitlines() if line.startswith("EqdsSrc")]
+        self.assertIn("(new)", eqds[0])
+        self.assertIn("busiest sources", report)
+
+    def test_load_profile(self):
+        """
+        A profile round-trips through its JSON file.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "prof.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(PROFILE, f)
+            self.assertEqual(load_profile(path), PROFILE)
+
+
+if __name__ == "__main__":
+    unittest.main()
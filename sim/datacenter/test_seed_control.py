@@ -0,0 +1,104 @@
+""" Unit tests for seed_control.py """
+
+import math
+import unittest
+
+from seed_control import RunningStats, SeedController, t_critical
+
+
+class TestRunningStats(unittest.TestCase):
+    """
+    Tests for the running mean and confidence interval.
+    """
+
+    def test_mean_and_variance(self):
+        """
+        Test the running estimates against a known sample.
+        """
+        stats = RunningStats()
+        for value in [2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0]:
+            stats.add(value)
+        self.assertAlmostEqual(stats.mean, 5.0)
+        self.assertAlmostEqual(stats.variance(), 32.0 / 7)
+        self.assertAlmostEqual(
+            stats.half_width(0.95), 2.365 * math.sqrt(32.0 / 7 / 8), places=6
+        )
+
+    def test_too_few_samples(self):
+        """
+        Test that a single sample gives an unbounded interval.
+        """
+        stats = RunningStats()
+        stats.add(3.0)
+        self.assertEqual(stats.half_width(), math.inf)
+        self.assertEqual(stats.relative_half_width(), math.inf)
+
+    def test_t_critical(self):
+        """
+        Test the t table lookup and the normal fallback.
+        """
+        self.assertEqual(t_critical(0.95, 4), 2.776)
+        self.assertEqual(t_critical(0.95, 100), 1.960)
+        with self.assertRaises(ValueError):
+            t_critical(0.8, 4)
+
+
+class TestSeedController(unittest.TestCase):
+    """
+    Tests for scheduling seeds across configurations.
+    """
+
+    def setUp(self):
+        """
+        Set up one quiet and one noisy configuration.
+        """
+        self.samples = {
+            "quiet": lambda seed: 100.0 + (seed % 2) * 0.1,
+            "noisy": lambda seed: 100.0 + (seed % 2) * 40.0,
+        }
+        self.calls = []
+
+    def evaluate(self, config, seed):
+        """Return the metric of one seed, recording the call."""
+        self.calls.append((config, seed))
+        return self.samples[config](seed)
+
+    def test_stops_converged_configs(self):
+        """
+        Test that converged configurations stop early and the remaining
+        budget goes to the noisy one.
+        """
+        controller = SeedController(
+            ["quiet", "noisy"], self.evaluate, ci_width=0.02, min_seeds=3,
+            max_seeds=10, jobs=1,
+        )
+        stats = controller.run()
+        self.assertTrue(controller.converged(0))
+        self.assertEqual(stats[0].count, 3)
+        self.assertFalse(controller.converged(1))
+        self.assertEqual(stats[1].count, 10)
+
+    def test_seeds_are_consecutive(self):
+        """
+        Test that each configuration gets consecutive seeds from first_seed.
+        """
+        controller = SeedController(
+            ["quiet"], self.evaluate, min_seeds=3, first_seed=13, jobs=2
+        )
+        controller.run()
+        self.assertEqual(sorted(seed for _, seed in self.calls), [13, 14, 15])
+
+    def test_budget(self):
+        """
+        Test that the total number of runs never exceeds the budget.
+        """
+        controller = SeedController(
+            ["quiet", "noisy"], self.evaluate, min_seeds=2, max_seeds=10,
+            budget=7, jobs=3,
+        )
+        controller.run()
+        self.assertEqual(len(self.calls), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
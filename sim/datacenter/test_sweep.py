@@ -0,0 +1,149 @@
+""" Unit tests for sweep.py """
+
+import os
+import tempfile
+import unittest
+
+from sweep import (
+    RunCache,
+    build_cmdline,
+    compute_metric,
+    find_knee,
+    parse_finish_times,
+    parse_values,
+)
+
+EQDS_OUTPUT = """Parsed args
+Flow Eqds_9_12 flowId 8 eqdsSrc 7 finished at 194.444 total packets 490 RTS 0 total bytes 2002140
+Flow Eqds_0_13 flowId 3 eqdsSrc 2 finished at 201.148 total packets 490 RTS 0 total bytes 2002140
+Flow NDP_1_2 flow_id 4 finished at 150 total bytes 2000000
+Done
+"""
+
+
+class TestParsing(unittest.TestCase):
+    """
+    Tests for parsing simulator output and sweep options.
+    """
+
+    def test_parse_finish_times(self):
+        """
+        Test that finish lines of different protocols are all recognised.
+        """
+        self.assertEqual(
+            parse_finish_times(EQDS_OUTPUT),
+            {"Eqds_9_12": 194.444, "Eqds_0_13": 201.148, "NDP_1_2": 150.0},
+        )
+
+    def test_compute_metric(self):
+        """
+        Test the metric reductions, including a run where nothing completed.
+        """
+        self.assertEqual(compute_metric([1.0, 2.0, 6.0], "mean_fct"), 3.0)
+        self.assertEqual(compute_metric([1.0, 2.0, 6.0], "tail_fct"), 6.0)
+        self.assertEqual(compute_metric([1.0, 2.0, 6.0], "completed"), 3.0)
+        self.assertEqual(compute_metric([], "tail_fct"), float("inf"))
+        with self.assertRaises(ValueError):
+            compute_metric([1.0], "median")
+
+    def test_parse_values(self):
+        """
+        Test candidate lists and ranges.
+        """
+        self.assertEqual(parse_values("256,1,8"), [1, 8, 256])
+        self.assertEqual(parse_values("1:9:4"), [1, 5, 9])
+
+    def test_build_cmdline(self):
+        """
+        Test that placeholders are substituted and other parameters appended.
+        """
+        self.assertEqual(
+            build_cmdline("./htsim_ndp", ["-tm", "perm-{nodes}.cm"], {"nodes": 16, "paths": 8}),
+            ["./htsim_ndp", "-tm", "perm-16.cm", "-paths", "8"],
+        )
+
+    def test_build_cmdline_literal_braces(self):
+        """
+        Test that braces which do not name a parameter are passed through.
+        """
+        self.assertEqual(
+            build_cmdline(
+                "./htsim_ndp",
+                ["-tm", "perm-{nodes}.cm", "-metrics", '{"a": 1}', "-o", "{a,b}.dat", "{}"],
+                {"nodes": 16},
+            ),
+            ["./htsim_ndp", "-tm", "perm-16.cm", "-metrics", '{"a": 1}', "-o", "{a,b}.dat", "{}"],
+        )
+
+
+class TestFindKnee(unittest.TestCase):
+    """
+    Tests for the bisection knee search.
+    """
+
+    def setUp(self):
+        """
+        Set up a tail FCT curve that stops improving at 32 paths.
+        """
+        self.curve = {1: 1300, 8: 400, 16: 260, 32: 215, 64: 212, 128: 210, 256: 210}
+        self.calls = []
+
+    def evaluate(self, value):
+        """Score a value from the curve, recording the call."""
+        self.calls.append(value)
+        return self.curve[value]
+
+    def test_knee(self):
+        """
+        Test that the knee is found without evaluating the full grid.
+        """
+        result = find_knee(sorted(self.curve), self.evaluate, "tail_fct", 0.05)
+        self.assertEqual(result.value, 32)
+        self.assertLess(len(self.calls), len(self.curve))
+        self.assertEqual(len(self.calls), len(set(self.calls)))
+
+    def test_target(self):
+        """
+        Test searching for the first value meeting an absolute target.
+        """
+        result = find_knee(sorted(self.curve), self.evaluate, "tail_fct", target=300)
+        self.assertEqual(result.value, 16)
+        result = find_knee(sorted(self.curve), self.evaluate, "tail_fct", target=100)
+        self.assertIsNone(result.value)
+
+    def test_higher_is_better(self):
+        """
+        Test a metric where larger scores are better.
+        """
+        completed = {1: 2, 2: 5, 3: 9, 4: 10, 5: 10}
+        result = find_knee(sorted(completed), completed.get, "completed", 0.05)
+        self.assertEqual(result.value, 4)
+
+    def test_resolution(self):
+        """
+        Test that the search stops once the knee is bracketed closely enough.
+        """
+        result = find_knee(list(range(1, 101)), lambda v: 1000 / v, "tail_fct", 1.0, resolution=20)
+        self.assertGreaterEqual(result.value, 50)
+        self.assertLessEqual(result.value, 70)
+
+
+class TestRunCache(unittest.TestCase):
+    """
+    Tests for the persistent results cache.
+    """
+
+    def test_round_trip(self):
+        """
+        Test that cached results survive reloading the cache file.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.json")
+            cmdline = ["./htsim_eqds", "-paths", "8"]
+            RunCache(path).put(cmdline, [1.5, 2.5])
+            self.assertEqual(RunCache(path).get(cmdline), [1.5, 2.5])
+            self.assertIsNone(RunCache(path).get(["./htsim_eqds"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+""" Unit tests for topology_compiler.py """
+
+import os
+import tempfile
+import unittest
+
+from topology_compiler import (
+    KIND_FAT_TREE,
+    NO_NAME,
+    QUEUE_TYPES,
+    FatTreeShape,
+    FatTreeSpec,
+    Topology,
+    compile_topology,
+    fat_tree_shape,
+    fat_tree_topology,
+    read_fat_tree_spec,
+    read_generic_topology,
+    tier,
+)
+
+TOPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topologies")
+
+GENERIC = """Hosts 2
+Switches 1
+Links 2
+
+# two hosts on one switch
+Host h0, queue h0q, pos 1 2
+Host h1, queue h1q
+Switch s0, queue s0q0, queue s0q1
+Queue h0q, type composite, speed 100 Gbps, size 50000, dst p0
+Queue h1q, type queue, speed 400 Mbps, size 50000, log sampling 10, dst p1
+Queue s0q0, type fairscheduler, speed 100 Gbps, size 50000, dst p0r
+Queue s0q1, type random, speed 100 Gbps, size 50000, dst h1
+Pipe p0, latency 1 us, reverse p0r, src h0, dst s0
+Pipe p1, latency 500 ns, src h1, dst s0
+"""
+
+
+class TestFatTree(unittest.TestCase):
+    """
+    Tests for fat tree specs.
+    """
+
+    def test_read_spec(self):
+        """
+        Test that a .topo file parses to the switch counts htsim builds.
+        """
+        with open(os.path.join(TOPO_DIR, "fat_tree_1024.topo"), encoding="utf-8") as f:
+            spec = read_fat_tree_spec(f)
+        self.assertEqual((spec.nodes, spec.podsize, len(spec.tiers)), (1024, 64, 3))
+        self.assertEqual(spec.tiers[0].downlink_speed_bps, 100000000000)
+        self.assertEqual(spec.tiers[0].link_latency_ps, 1000000)
+        self.assertEqual(fat_tree_shape(spec), FatTreeShape(16, 8, 8, 64))
+
+    def test_invalid_spec(self):
+        """
+        Test that inconsistent or incomplete specs are rejected.
+        """
+        spec = FatTreeSpec(32, 32, (tier(100, 8, 2, oversub=4), tier(100, 4, bundle=3)))
+        with self.assertRaises(ValueError):
+            fat_tree_shape(spec)
+        with self.assertRaises(ValueError):
+            read_fat_tree_spec(["Nodes 32", "Tiers 2", "Podsize 32", "Tier 0", "Radix_Down 8"])
+        with self.assertRaises(ValueError):
+            read_fat_tree_spec(["Nodes 32", "Tiers 2", "Tier 0", "Radix_Down 8", "Radix_Down 8"])
+
+    def test_links(self):
+        """
+        Test the wiring: hosts hang off their ToR, every link has a link
+        back, and bundles show up as parallel links.
+        """
+        spec = FatTreeSpec(
+            8,
+            4,
+            (tier(200, 2, 2), tier(200, 2, 4), tier(100, 4, bundle=2)),
+        )
+        topo = fat_tree_topology(spec)
+        self.assertEqual((topo.hosts, topo.nodes), (8, 20))
+        self.assertEqual(topo.kind, KIND_FAT_TREE)
+        self.assertEqual([topo.link_dst[l] for l in topo.links_from(3)], [9])
+        pairs = [(n, topo.link_dst[l]) for n in range(topo.nodes) for l in topo.links_from(n)]
+        self.assertEqual(sorted(pairs), sorted((dst, src) for src, dst in pairs))
+        agg = 12
+        cores = [topo.link_dst[l] for l in topo.links_from(agg) if topo.link_dst[l] >= 16]
+        self.assertEqual(cores, [16, 16, 18, 18])
+        self.assertEqual(
+            {topo.link_speed[l] for l in topo.links_from(agg) if topo.link_dst[l] >= 16},
+            {100000000000},
+        )
+
+
+class TestGeneric(unittest.TestCase):
+    """
+    Tests for generic topology files.
+    """
+
+    def test_links(self):
+        """
+        Test that queues and pipes, including reverse pipes, are resolved
+        into links between hosts and switches.
+        """
+        topo = read_generic_topology(GENERIC.splitlines(True))
+        self.assertEqual((topo.hosts, topo.nodes, topo.links), (2, 3, 4))
+        self.assertEqual(topo.node_names, ["h0", "h1", "s0"])
+        self.assertEqual(list(topo.node_pos[:2]), [1, 2])
+        s0 = list(topo.links_from(2))
+        self.assertEqual([topo.link_dst[l] for l in s0], [0, 1])
+        self.assertEqual(topo.name(topo.link_pipe_name[s0[0]]), "p0r")
+        self.assertEqual(topo.link_latency[s0[0]], 1000000)
+        self.assertEqual(topo.link_pipe_name[s0[1]], NO_NAME)
+        self.assertEqual(topo.link_queue_type[s0[0]], QUEUE_TYPES["fairscheduler"])
+        h1 = topo.links_from(1)[0]
+        self.assertEqual(topo.link_speed[h1], 400000000)
+        self.assertEqual(topo.link_log_period[h1], 10000000)
+        self.assertEqual(topo.link_latency[h1], 500000)
+
+    def test_unsupported(self):
+        """
+        Test that queues off the host/switch ports or chained queues are
+        rejected rather than silently dropped.
+        """
+        unowned = GENERIC.replace("Switch s0, queue s0q0, queue s0q1", "Switch s0, queue s0q0")
+        with self.assertRaises(ValueError):
+            read_generic_topology(unowned.splitlines(True))
+        chained = GENERIC.replace("size 50000, dst h1", "size 50000, dst h1q")
+        with self.assertRaises(ValueError):
+            read_generic_topology(chained.splitlines(True))
+        with self.assertRaises(ValueError):
+            read_generic_topology(GENERIC.replace("type queue", "type fifo").splitlines(True))
+
+
+class TestFile(unittest.TestCase):
+    """
+    Tests for writing and reading compiled files.
+    """
+
+    def test_round_trip(self):
+        """
+        Test that both kinds of topology read back as written.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            generic_path = os.path.join(tmpdir, "generic.txt")
+            with open(generic_path, "w", encoding="utf-8") as f:
+                f.write(GENERIC)
+            for source in (generic_path, os.path.join(TOPO_DIR, "leaf_spine_tiny.topo")):
+                topo = compile_topology(source)
+                path = os.path.join(tmpdir, "out.htop")
+                topo.write(path)
+                back = Topology.read(path)
+                self.assertEqual(back.spec, topo.spec)
+                self.assertEqual(back.node_names, topo.node_names)
+                self.assertEqual(list(back.node_offsets), list(topo.node_offsets) + [topo.links])
+                for name in ("link_dst", "link_speed", "link_latency", "link_queue_size"):
+                    self.assertEqual(getattr(back, name), getattr(topo, name))
+                self.assertEqual(
+                    [back.name(o) for o in back.link_queue_name],
+                    [topo.name(o) for o in topo.link_queue_name],
+                )
+                self.assertEqual(back.summary(), topo.summary())
+
+    def test_not_compiled(self):
+        """
+        Test that other files are refused.
+        """
+        with self.assertRaises(ValueError):
+            Topology.read(os.path.join(TOPO_DIR, "test.topo"))
+
+
+if __name__ == "__main__":
+    unittest.main()
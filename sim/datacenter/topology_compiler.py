@@ -0,0 +1,820 @@
+#! /usr/bin/env python3
+
+"""
+Compile topologies into the binary form htsim memory-maps at startup.
+
+Two kinds of input are understood: GenericTopology files (Hosts/Switches/
+Links header, then host, switch, queue and pipe lines) and the fat tree
+tier specs in topologies/*.topo. Either is validated here, once, with the
+same checks htsim makes, and written out as CSR arrays of links with their
+speed, latency and queue (see compiled_topology.h for the layout). Any
+htsim binary given the compiled file with -topo, or GenericTopology::load,
+maps it instead of parsing text.
+
+Fat trees can be generated without a text file at all:
+
+    import topology_compiler as tc
+
+    spec = tc.FatTreeSpec(65536, 1024, (
+        tc.tier(400, radix_down=32, radix_up=32),
+        tc.tier(400, radix_down=32, radix_up=32),
+        tc.tier(400, radix_down=64),
+    ))
+    tc.fat_tree_topology(spec).write("ft_64k.htop")
+
+and compiled files inspected:
+
+    python topology_compiler.py compile topologies/fat_tree_1024.topo -o ft.htop
+    python topology_compiler.py inspect ft.htop
+"""
+
+import argparse
+import struct
+import sys
+from array import array
+from collections import Counter, namedtuple
+
+MAGIC = 0x504F544D49535448  # "HTSIMTOP"
+VERSION = 1
+HEADER_SIZE = 64
+SPEC_SIZE = 256
+NO_NAME = 0xFFFFFFFF
+
+KIND_GENERIC = 1
+KIND_FAT_TREE = 2
+KIND_NAMES = {KIND_GENERIC: "generic", KIND_FAT_TREE: "fat tree"}
+
+# Queue types; QUEUE_DEFAULT leaves the choice to the simulator's -queue_type.
+QUEUE_DEFAULT = 0
+QUEUE_TYPES = {"queue": 1, "random": 2, "composite": 3, "fairscheduler": 4}
+
+TOR_TIER, AGG_TIER, CORE_TIER = 0, 1, 2
+
+# Default argument values.
+DEFAULT_LATENCY_NS = 1000
+
+# The per-link arrays, in file order, with their array typecodes.
+LINK_ARRAYS = (
+    ("link_speed", "Q"),
+    ("link_latency", "Q"),
+    ("link_queue_size", "Q"),
+    ("link_log_period", "Q"),
+)
+LINK_NAME_ARRAYS = (
+    ("link_dst", "I"),
+    ("link_queue_type", "I"),
+    ("link_queue_name", "I"),
+    ("link_pipe_name", "I"),
+)
+
+
+class TierSpec(
+    namedtuple(
+        "TierSpec",
+        [
+            "downlink_speed_bps",
+            "link_latency_ps",
+            "switch_latency_ps",
+            "radix_up",
+            "radix_down",
+            "queue_up",
+            "queue_down",
+            "bundle",
+            "oversub",
+        ],
+    )
+):
+    """
+    One tier of a fat tree: the speed and latency of the links down from
+    it, its switching latency, radices, queue sizes in bytes (0 for the
+    simulator's -q), bundle size and oversubscription ratio.
+    """
+
+
+class FatTreeSpec(namedtuple("FatTreeSpec", ["nodes", "podsize", "tiers"])):
+    """
+    A fat tree: the number of hosts, hosts per pod and a TierSpec for each
+    of its two or three tiers, ToRs first.
+    """
+
+
+class FatTreeShape(namedtuple("FatTreeShape", ["pods", "tors_per_pod", "aggs_per_pod", "cores"])):
+    """The switch counts that a valid FatTreeSpec works out to."""
+
+
+def tier(
+    downlink_gbps: int,
+    radix_down: int,
+    radix_up: int = 0,
+    latency_ns: int = DEFAULT_LATENCY_NS,
+    switch_latency_ns: int = 0,
+    bundle: int = 1,
+    oversub: int = 1,
+    queue_up: int = 0,
+    queue_down: int = 0,
+) -> TierSpec:
+    """Build a TierSpec in the units of a .topo file."""
+    return TierSpec(
+        downlink_gbps * 1000000000,
+        latency_ns * 1000,
+        switch_latency_ns * 1000,
+        radix_up,
+        radix_down,
+        queue_up,
+        queue_down,
+        bundle,
+        oversub,
+    )
+
+
+def float32(value: float) -> float:
+    """Round to single precision, as the C++ parser's stof() does."""
+    return struct.unpack("<f", struct.pack("<f", value))[0]
+
+
+def read_fat_tree_spec(lines, source: str = "<spec>") -> FatTreeSpec:
+    """
+    Parse a fat tree tier spec, as FatTreeTopology::load does.
+
+    Args:
+        lines: The lines of the spec.
+        source (str): The file name, for error messages.
+
+    Raises:
+        ValueError: If the spec is malformed or inconsistent.
+    """
+    header = {}
+    params = [{} for _ in range(3)]
+    current_tier = None
+    names = {
+        "downlink_speed_gbps": "downlink_speed_bps",
+        "radix_up": "radix_up",
+        "radix_down": "radix_down",
+        "queue_up": "queue_up",
+        "queue_down": "queue_down",
+        "oversubscribed": "oversub",
+        "bundle": "bundle",
+        "switch_latency_ns": "switch_latency_ps",
+        "downlink_latency_ns": "link_latency_ps",
+    }
+    for linecount, line in enumerate(lines, 1):
+        tokens = line.split()
+        if not tokens or tokens[0].startswith("#"):
+            continue
+        key = tokens[0].lower()
+        try:
+            value = int(tokens[1]) if len(tokens) > 1 else None
+        except ValueError as e:
+            raise ValueError(f"{source}:{linecount}: bad value {tokens[1]}") from e
+        if current_tier is None and key in ("nodes", "tiers", "podsize"):
+            header[key] = value
+        elif key == "tier":
+            if value is None or value < 0 or value > 2:
+                raise ValueError(f"{source}:{linecount}: invalid tier {value}")
+            current_tier = value
+            params[value]["present"] = True
+        elif key in names:
+            if current_tier is None:
+                raise ValueError(f"{source}:{linecount}: {tokens[0]} before any tier")
+            field = names[key]
+            if field in params[current_tier]:
+                raise ValueError(
+                    f"{source}:{linecount}: duplicate {key} setting for tier {current_tier}"
+                )
+            if current_tier == CORE_TIER and field in ("radix_up", "queue_up"):
+                raise ValueError(
+                    f"{source}:{linecount}: can't specify {key} for tier 2 (no uplinks from top tier!)"
+                )
+            if field == "downlink_speed_bps":
+                value *= 1000000000
+            elif field.endswith("_ps"):
+                value *= 1000
+            params[current_tier][field] = value
+
+    for key in ("nodes", "tiers", "podsize"):
+        if not header.get(key):
+            raise ValueError(f"{source}: missing {key} in header")
+    tiers = header["tiers"]
+    if tiers < 2 or tiers > 3:
+        raise ValueError(f"{source}: invalid number of tiers: {tiers}")
+
+    specs = []
+    for t in range(tiers):
+        p = params[t]
+        if not p.get("present"):
+            raise ValueError(f"{source}: no configuration found for tier {t}")
+        for field, key in (
+            ("downlink_speed_bps", "downlink_speed_gbps"),
+            ("link_latency_ps", "downlink_latency_ns"),
+            ("radix_down", "radix_down"),
+        ):
+            if not p.get(field):
+                raise ValueError(f"{source}: missing {key} for tier {t}")
+        if t < tiers - 1 and not p.get("radix_up"):
+            raise ValueError(f"{source}: missing radix_up for tier {t}")
+        specs.append(
+            TierSpec(
+                p["downlink_speed_bps"],
+                p["link_latency_ps"],
+                p.get("switch_latency_ps", 0),
+                p.get("radix_up", 0),
+                p["radix_down"],
+                p.get("queue_up", 0),
+                p.get("queue_down", 0),
+                p.get("bundle", 1),
+                p.get("oversub", 1),
+            )
+        )
+    spec = FatTreeSpec(header["nodes"], header["podsize"], tuple(specs))
+    fat_tree_shape(spec)
+    return spec
+
+
+def fat_tree_shape(spec: FatTreeSpec) -> FatTreeShape:
+    """
+    Work out the switch counts of a fat tree, with the checks that
+    FatTreeTopology::set_custom_params makes.
+
+    Raises:
+        ValueError: If the tiers don't fit together.
+    """
+    tiers = spec.tiers
+    ntiers = len(tiers)
+    if ntiers < 2 or ntiers > 3:
+        raise ValueError(f"invalid number of tiers: {ntiers}")
+    for t, ts in enumerate(tiers):
+        if ts.radix_down <= 0 or ts.radix_down % ts.bundle != 0:
+            raise ValueError(
+                f"tier {t} down radix of {ts.radix_down} must be a multiple of bundlesize {ts.bundle}"
+            )
+        if t < ntiers - 1 and (ts.radix_up <= 0 or ts.radix_up % tiers[t + 1].bundle != 0):
+            raise ValueError(
+                f"tier {t} up radix of {ts.radix_up} must be a multiple of tier {t + 1}"
+                f" down bundlesize {tiers[t + 1].bundle}"
+            )
+    tor, agg = tiers[TOR_TIER], tiers[AGG_TIER]
+    if spec.podsize <= 0 or spec.nodes % spec.podsize != 0:
+        raise ValueError("nodes is not a multiple of podsize")
+    if tor.bundle != 1:
+        raise ValueError("host to ToR links can't be bundled")
+    pods = spec.nodes // spec.podsize
+    if spec.podsize % tor.radix_down != 0:
+        raise ValueError(f"mismatch between ToR radix {tor.radix_down} and podsize {spec.podsize}")
+    tors_per_pod = spec.podsize // tor.radix_down
+
+    tor_up_bw = spec.nodes * tor.downlink_speed_bps
+    if tor_up_bw % (agg.downlink_speed_bps * tor.oversub) != 0:
+        raise ValueError("ToR uplink bandwidth is not a whole number of links")
+    tor_uplinks = tor_up_bw // (agg.downlink_speed_bps * tor.oversub)
+    if tor.radix_down // tor.radix_up != tor.oversub:
+        raise ValueError(
+            f"mismatch between ToR radix ({tor.radix_down} down, {tor.radix_up} up)"
+            f" and oversubscription ratio of {tor.oversub}"
+        )
+    if tor_uplinks % (pods * agg.radix_down) != 0:
+        raise ValueError("ToR uplinks don't divide evenly between aggregation switches")
+    aggs_per_pod = tor_uplinks // (pods * agg.radix_down)
+    if aggs_per_pod * agg.bundle != tor.radix_up:
+        raise ValueError(
+            f"mismatch between ToR up radix {tor.radix_up} and {aggs_per_pod} aggregation"
+            f" switches per pod with a bundle size of {agg.bundle}"
+        )
+
+    cores = 0
+    if ntiers == 3:
+        core = tiers[CORE_TIER]
+        agg_up_bw = tor_uplinks * agg.downlink_speed_bps
+        if agg_up_bw % (core.downlink_speed_bps * agg.oversub) != 0:
+            raise ValueError("aggregation uplink bandwidth is not a whole number of links")
+        agg_uplinks = agg_up_bw // (core.downlink_speed_bps * agg.oversub)
+        if agg_uplinks % core.radix_down != 0:
+            raise ValueError("aggregation uplinks don't divide evenly between core switches")
+        cores = agg_uplinks // core.radix_down
+        if cores % aggs_per_pod != 0:
+            raise ValueError(
+                f"{cores} core switches isn't a multiple of {aggs_per_pod} aggregation switches per pod"
+            )
+        if cores * core.bundle // aggs_per_pod != agg.radix_up:
+            raise ValueError(
+                f"mismatch between the aggregation up radix of {agg.radix_up} and {aggs_per_pod}"
+                f" aggregation switches per pod with {cores} core switches"
+            )
+    return FatTreeShape(pods, tors_per_pod, aggs_per_pod, cores)
+
+
+class Topology:
+    """
+    A compiled topology: named nodes, hosts first, and the links out of
+    each node as CSR arrays (links out of node n are node_offsets[n] up to
+    node_offsets[n + 1]).
+    """
+
+    def __init__(self, kind: int, hosts: int, spec: FatTreeSpec = None):
+        self.kind = kind
+        self.hosts = hosts
+        self.spec = spec
+        self.node_names = []
+        self.node_pos = array("i")
+        self.node_offsets = array("Q", [0])
+        for name, typecode in LINK_ARRAYS + LINK_NAME_ARRAYS:
+            setattr(self, name, array(typecode))
+        self._strings = bytearray()
+        self._string_offsets = {}
+
+    @property
+    def nodes(self) -> int:
+        """The number of hosts and switches."""
+        return len(self.node_names)
+
+    @property
+    def links(self) -> int:
+        """The number of links."""
+        return len(self.link_dst)
+
+    def _string(self, name: str) -> int:
+        if name is None:
+            return NO_NAME
+        offset = self._string_offsets.get(name)
+        if offset is None:
+            offset = len(self._strings)
+            self._strings += name.encode() + b"\0"
+            self._string_offsets[name] = offset
+        return offset
+
+    def add_node(self, name: str, pos=(0, 0)):
+        """Add a node; its links must all be added before the next node."""
+        if self.node_names:
+            self.node_offsets.append(self.links)
+        self.node_names.append(name)
+        self.node_pos.extend(pos)
+
+    def add_link(
+        self,
+        dst: int,
+        speed_bps: int,
+        latency_ps: int,
+        queue_size: int = 0,
+        queue_type: int = QUEUE_DEFAULT,
+        queue_name: str = None,
+        pipe_name: str = None,
+        log_period_ps: int = 0,
+    ):
+        """Add a link out of the most recently added node."""
+        self.link_dst.append(dst)
+        self.link_speed.append(speed_bps)
+        self.link_latency.append(latency_ps)
+        self.link_queue_size.append(queue_size)
+        self.link_queue_type.append(queue_type)
+        self.link_queue_name.append(self._string(queue_name))
+        self.link_pipe_name.append(self._string(pipe_name))
+        self.link_log_period.append(log_period_ps)
+
+    def links_from(self, node: int) -> range:
+        """The indices of the links out of a node."""
+        end = self.node_offsets[node + 1] if node + 1 < len(self.node_offsets) else self.links
+        return range(self.node_offsets[node], end)
+
+    def name(self, offset: int) -> str:
+        """Look up a queue or pipe name; None if there is none."""
+        if offset == NO_NAME:
+            return None
+        return self._strings[offset:self._strings.index(b"\0", offset)].decode()
+
+    def write(self, path: str):
+        """Write the compiled topology to a file."""
+        node_name = array("I", (self._string(name) for name in self.node_names))
+        offsets = array("Q", self.node_offsets)
+        if len(offsets) == self.nodes:
+            offsets.append(self.links)
+        strings = bytes(self._strings) or b"\0"
+        header = struct.pack(
+            "<QIIQQQQ",
+            MAGIC,
+            VERSION,
+            self.kind,
+            self.hosts,
+            self.nodes,
+            self.links,
+            len(strings),
+        ).ljust(HEADER_SIZE, b"\0")
+        spec = array("Q", [0] * (SPEC_SIZE // 8))
+        if self.spec:
+            spec[0:3] = array("Q", [self.spec.nodes, len(self.spec.tiers), self.spec.podsize])
+            for t, ts in enumerate(self.spec.tiers):
+                spec[3 + 9 * t:12 + 9 * t] = array("Q", ts)
+        sections = [offsets]
+        sections += [getattr(self, name) for name, _ in LINK_ARRAYS]
+        sections += [node_name, self.node_pos]
+        sections += [getattr(self, name) for name, _ in LINK_NAME_ARRAYS]
+        with open(path, "wb") as out:
+            out.write(header)
+            for section in [spec] + sections:
+                if sys.byteorder != "little":
+                    section = array(section.typecode, section)
+                    section.byteswap()
+                section.tofile(out)
+            out.write(strings)
+
+    @classmethod
+    def read(cls, path: str) -> "Topology":
+        """
+        Read a compiled topology.
+
+        Raises:
+            ValueError: If the file is not a compiled topology.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < HEADER_SIZE + SPEC_SIZE:
+            raise ValueError(f"{path} is too short to be a compiled topology")
+        magic, version, kind, hosts, nodes, links, string_bytes = struct.unpack_from(
+            "<QIIQQQQ", data, 0
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a compiled htsim topology (version {VERSION})")
+        pos = HEADER_SIZE
+
+        def take(typecode, count):
+            nonlocal pos
+            section = array(typecode)
+            section.frombytes(data[pos:pos + count * section.itemsize])
+            if sys.byteorder != "little":
+                section.byteswap()
+            pos += count * section.itemsize
+            return section
+
+        spec_words = take("Q", SPEC_SIZE // 8)
+        spec = None
+        if kind == KIND_FAT_TREE:
+            ntiers = spec_words[1]
+            spec = FatTreeSpec(
+                spec_words[0],
+                spec_words[2],
+                tuple(TierSpec(*spec_words[3 + 9 * t:12 + 9 * t]) for t in range(ntiers)),
+            )
+        topo = cls(kind, hosts, spec)
+        topo.node_offsets = take("Q", nodes + 1)
+        for name, typecode in LINK_ARRAYS:
+            setattr(topo, name, take(typecode, links))
+        node_name = take("I", nodes)
+        topo.node_pos = take("i", 2 * nodes)
+        for name, typecode in LINK_NAME_ARRAYS:
+            setattr(topo, name, take(typecode, links))
+        topo._strings = bytearray(data[pos:pos + string_bytes])
+        if pos + string_bytes != len(data):
+            raise ValueError(f"{path} has the wrong size for its header")
+        topo.node_names = [topo.name(offset) for offset in node_name]
+        return topo
+
+    def summary(self) -> str:
+        """A human readable description of the topology."""
+        lines = [
+            f"{KIND_NAMES.get(self.kind, self.kind)} topology: {self.hosts} hosts,"
+            f" {self.nodes - self.hosts} switches, {self.links} links"
+        ]
+        if self.spec:
+            shape = fat_tree_shape(self.spec)
+            lines.append(
+                f"  {shape.pods} pods of {self.spec.podsize} hosts,"
+                f" {shape.tors_per_pod} ToRs and {shape.aggs_per_pod} aggregation switches"
+                f" per pod, {shape.cores} core switches"
+            )
+        degrees = Counter(
+            (n < self.hosts, len(self.links_from(n))) for n in range(self.nodes)
+        )
+        for (is_host, degree), count in sorted(degrees.items()):
+            lines.append(f"  {count} {'hosts' if is_host else 'switches'} with {degree} links")
+        speeds = Counter(zip(self.link_speed, self.link_latency))
+        for (speed, latency), count in sorted(speeds.items()):
+            lines.append(
+                f"  {count} links at {speed / 1e9:g}Gbps, {latency / 1e6:g}us"
+            )
+        return "\n".join(lines)
+
+
+def fat_tree_topology(spec: FatTreeSpec) -> Topology:
+    """
+    Build the links of a fat tree, wired as FatTreeTopology wires them.
+
+    Raises:
+        ValueError: If the spec doesn't describe a valid fat tree.
+    """
+    shape = fat_tree_shape(spec)
+    tiers = spec.tiers
+    ntiers = len(tiers)
+    tor_spec, agg_spec = tiers[TOR_TIER], tiers[AGG_TIER]
+    ntor = shape.tors_per_pod * shape.pods
+    nagg = shape.aggs_per_pod * shape.pods
+    first_tor = spec.nodes
+    first_agg = first_tor + ntor
+    first_core = first_agg + nagg
+    topo = Topology(KIND_FAT_TREE, spec.nodes, spec)
+
+    def aggs_of(tor):
+        if ntiers == 2:
+            return range(nagg)
+        pod = tor // shape.tors_per_pod
+        return range(pod * shape.aggs_per_pod, (pod + 1) * shape.aggs_per_pod)
+
+    tor_link = (tor_spec.downlink_speed_bps, tor_spec.link_latency_ps)
+    agg_link = (agg_spec.downlink_speed_bps, agg_spec.link_latency_ps)
+    for host in range(spec.nodes):
+        topo.add_node(f"host{host}")
+        topo.add_link(first_tor + host // tor_spec.radix_down, *tor_link)
+    for tor in range(ntor):
+        topo.add_node(f"tor{tor}")
+        for host in range(tor * tor_spec.radix_down, (tor + 1) * tor_spec.radix_down):
+            topo.add_link(host, *tor_link, tor_spec.queue_down)
+        for agg in aggs_of(tor):
+            for _ in range(agg_spec.bundle):
+                topo.add_link(first_agg + agg, *agg_link, tor_spec.queue_up)
+    for agg in range(nagg):
+        topo.add_node(f"agg{agg}")
+        if ntiers == 2:
+            tors = range(ntor)
+        else:
+            pod = agg // shape.aggs_per_pod
+            tors = range(pod * shape.tors_per_pod, (pod + 1) * shape.tors_per_pod)
+        for tor in tors:
+            for _ in range(agg_spec.bundle):
+                topo.add_link(first_tor + tor, *agg_link, agg_spec.queue_down)
+        if ntiers == 3:
+            core_spec = tiers[CORE_TIER]
+            podpos = agg % shape.aggs_per_pod
+            for l in range(agg_spec.radix_up // core_spec.bundle):
+                for _ in range(core_spec.bundle):
+                    topo.add_link(
+                        first_core + podpos + shape.aggs_per_pod * l,
+                        core_spec.downlink_speed_bps,
+                        core_spec.link_latency_ps,
+                        agg_spec.queue_up,
+                    )
+    for core in range(shape.cores):
+        core_spec = tiers[CORE_TIER]
+        topo.add_node(f"core{core}")
+        for pod in range(shape.pods):
+            for _ in range(core_spec.bundle):
+                topo.add_link(
+                    first_agg + pod * shape.aggs_per_pod + core % shape.aggs_per_pod,
+                    core_spec.downlink_speed_bps,
+                    core_spec.link_latency_ps,
+                    core_spec.queue_down,
+                )
+    return topo
+
+
+def tokenize_generic(line: str) -> list[str]:
+    """Split a generic topology line, with trailing commas as tokens."""
+    tokens = []
+    for token in line.split():
+        if token.endswith(","):
+            tokens += [token[:-1], ","]
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def attributes(tokens: list[str]) -> list[list[str]]:
+    """The comma separated attributes after "<kind> <id> ,"."""
+    groups = [[]]
+    for token in tokens[3:]:
+        if token == ",":
+            groups.append([])
+        else:
+            groups[-1].append(token)
+    return [group for group in groups if group]
+
+
+SPEED_UNITS = {"gbps": 1e9, "mbps": 1e6}
+LATENCY_UNITS = {"s": 1e12, "ms": 1e9, "us": 1e6, "ns": 1e3, "ps": 1}
+
+
+def read_generic_topology(lines, source: str = "<topology>") -> Topology:
+    """
+    Parse and validate a GenericTopology file, and resolve every port
+    queue into a link to the next host or switch.
+
+    Only what GenericTopology builds from the file is kept: each host or
+    switch port queue must feed a pipe that feeds a host or switch, or feed
+    one directly. Pipes that no queue feeds carry nothing and are dropped.
+
+    Raises:
+        ValueError: If the file is malformed or uses chains of queues or
+            pipes that a compiled topology can't describe.
+    """
+    lines = list(lines)
+    header = {}
+    body = 0
+    for key in ("Hosts", "Switches", "Links"):
+        while body < len(lines) and not lines[body].strip():
+            body += 1
+        tokens = lines[body].split() if body < len(lines) else []
+        if len(tokens) != 2 or tokens[0] != key:
+            raise ValueError(f"{source}: failed to find number of {key.lower()}")
+        header[key] = int(tokens[1])
+        body += 1
+
+    hosts, switches, queues, pipes = {}, {}, {}, {}
+    for linecount, line in enumerate(lines[body:], body + 1):
+        line = line.lstrip(" \t")
+        if not line or line.startswith("#") or line.startswith("\n"):
+            continue
+        tokens = tokenize_generic(line)
+        cmd = tokens[0].lower()
+        if cmd not in ("host", "switch", "queue", "pipe"):
+            continue
+        if len(tokens) < 3 or tokens[2] != ",":
+            raise ValueError(f"{source}:{linecount}: expected '{tokens[0]} <id>,'")
+        ident = tokens[1]
+        table = {"host": hosts, "switch": switches, "queue": queues, "pipe": pipes}[cmd]
+        if ident in table:
+            raise ValueError(f"{source}:{linecount}: duplicate {cmd} id {ident}")
+        item = {"line": linecount, "queues": [], "pos": (0, 0)}
+        for attribute in attributes(tokens):
+            name = attribute[0]
+            if name == "queue" and cmd in ("host", "switch"):
+                item["queues"].append(attribute[1])
+            elif name == "pos" and cmd in ("host", "switch"):
+                item["pos"] = (int(attribute[1]), int(attribute[2]))
+            elif name == "type" and cmd == "queue":
+                item["type"] = attribute[1].lower()
+            elif name == "speed" and cmd == "queue":
+                scale = SPEED_UNITS.get(attribute[2].lower(), 0)
+                item["speed"] = int(float32(float(attribute[1])) * scale)
+            elif name == "size" and cmd == "queue":
+                item["size"] = int(attribute[1])
+            elif name == "log" and cmd == "queue" and attribute[1].lower() == "sampling":
+                if len(attribute) != 3:
+                    raise ValueError(f"{source}:{linecount}: missing log sample rate for id {ident}")
+                item["log"] = int(float32(float(attribute[2])) * 1e6)
+            elif name == "latency" and cmd == "pipe":
+                scale = LATENCY_UNITS.get(attribute[2].lower())
+                if scale is None:
+                    raise ValueError(f"{source}:{linecount}: invalid latency units for id {ident}")
+                item["latency"] = int(float32(float(attribute[1])) * scale)
+            elif name in ("dst", "src", "reverse") and cmd in ("queue", "pipe"):
+                if len(attribute) != 2:
+                    raise ValueError(f"{source}:{linecount}: bad {name} for id {ident}")
+                item[name] = attribute[1]
+        if cmd == "queue":
+            if not item.get("speed"):
+                raise ValueError(f"{source}:{linecount}: no valid linkspeed specified for queue {ident}")
+            if not item.get("size"):
+                raise ValueError(f"{source}:{linecount}: no valid size specified for queue {ident}")
+            if item.get("type") not in QUEUE_TYPES:
+                raise ValueError(f"{source}:{linecount}: no valid type specified for queue {ident}")
+        if cmd == "pipe":
+            if not item.get("latency"):
+                raise ValueError(f"{source}:{linecount}: no valid latency specified for pipe {ident}")
+            if "reverse" in item:
+                if "src" not in item:
+                    raise ValueError(
+                        f"{source}:{linecount}: src not specified for reverse pipe {item['reverse']}"
+                    )
+                if item["reverse"] in pipes:
+                    raise ValueError(f"{source}:{linecount}: duplicate pipe id {item['reverse']}")
+                pipes[item["reverse"]] = {
+                    "line": linecount,
+                    "latency": item["latency"],
+                    "dst": item["src"],
+                }
+        table[ident] = item
+
+    nodes = list(hosts) + list(switches)
+    node_ids = {name: i for i, name in enumerate(nodes)}
+    topo = Topology(KIND_GENERIC, len(hosts))
+    owner = {}
+    pipe_feeders = Counter(queue["dst"] for queue in queues.values() if "dst" in queue)
+    for name in nodes:
+        item = hosts.get(name) or switches[name]
+        topo.add_node(name, item["pos"])
+        for queue_name in item["queues"]:
+            queue = queues.get(queue_name)
+            where = f"{source}:{item['line']}"
+            if queue is None:
+                raise ValueError(f"{where}: queue {queue_name} of {name} not found")
+            if queue_name in owner:
+                raise ValueError(f"{where}: queue {queue_name} is a port of both {owner[queue_name]} and {name}")
+            owner[queue_name] = name
+            next_name = queue.get("dst")
+            if next_name is None:
+                raise ValueError(f"{where}: queue {queue_name} has no dst")
+            pipe_name, latency = None, 0
+            if next_name in pipes:
+                if pipe_feeders[next_name] > 1:
+                    raise ValueError(f"{where}: pipe {next_name} is fed by more than one queue")
+                pipe_name = next_name
+                latency = pipes[pipe_name]["latency"]
+                next_name = pipes[pipe_name].get("dst")
+                if next_name is None:
+                    raise ValueError(f"{where}: pipe {pipe_name} has no dst")
+            if next_name not in node_ids:
+                raise ValueError(
+                    f"{where}: queue {queue_name} must lead to a host or switch through at most"
+                    f" one pipe, not to {next_name}"
+                )
+            topo.add_link(
+                node_ids[next_name],
+                queue["speed"],
+                latency,
+                queue["size"],
+                QUEUE_TYPES[queue["type"]],
+                queue_name,
+                pipe_name,
+                queue.get("log", 0),
+            )
+    unowned = sorted(set(queues) - set(owner))
+    if unowned:
+        raise ValueError(f"{source}: queue {unowned[0]} is not a port of any host or switch")
+    return topo
+
+
+def compile_topology(path: str) -> Topology:
+    """Read and validate a generic topology or fat tree spec file."""
+    with open(path, "r", encoding="utf-8") as topo_file:
+        lines = topo_file.readlines()
+    first = next((line.split()[0] for line in lines if line.split()), "")
+    if first == "Hosts":
+        return read_generic_topology(lines, path)
+    return fat_tree_topology(read_fat_tree_spec(lines, path))
+
+
+def add_commandline_options():
+    """
+    Create an argument parser and add command line options to the parser.
+
+    Returns:
+        argparse.ArgumentParser: The argument parser object with added command line options.
+    """
+    arg_parser = argparse.ArgumentParser(
+        description="Compile htsim topologies into memory-mappable binary files."
+    )
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser(
+        "compile", help="Compile a generic topology or fat tree .topo file."
+    )
+    compile_parser.add_argument("input", help="The text topology file.")
+    compile_parser.add_argument(
+        "-o", "--output", help="The compiled file, by default the input with .htop."
+    )
+    fat_tree_parser = commands.add_parser(
+        "fat_tree", help="Generate a compiled fat tree of radix k switches, the same in every tier."
+    )
+    fat_tree_parser.add_argument("-n", "--nodes", required=True, type=int, help="(Required) Hosts.")
+    fat_tree_parser.add_argument(
+        "-k", "--radix", required=True, type=int, help="(Required) Switch radix, half up and half down."
+    )
+    fat_tree_parser.add_argument("-t", "--tiers", default=3, type=int, help="2 or 3, by default 3.")
+    fat_tree_parser.add_argument(
+        "-s", "--speed_gbps", default=100, type=int, help="Link speed, by default 100."
+    )
+    fat_tree_parser.add_argument(
+        "-l",
+        "--latency_ns",
+        default=DEFAULT_LATENCY_NS,
+        type=int,
+        help=f"Link latency, by default {DEFAULT_LATENCY_NS}.",
+    )
+    fat_tree_parser.add_argument("-o", "--output", required=True, help="(Required) The compiled file.")
+    inspect_parser = commands.add_parser("inspect", help="Describe a compiled topology.")
+    inspect_parser.add_argument("input", help="The compiled topology file.")
+    return arg_parser
+
+
+def main():
+    """The main function of the topology compiler."""
+    args = add_commandline_options().parse_args()
+    try:
+        if args.command == "compile":
+            topo = compile_topology(args.input)
+            output = args.output or args.input.rsplit(".", 1)[0] + ".htop"
+            topo.write(output)
+            print(topo.summary())
+            print("Written to", output)
+        elif args.command == "fat_tree":
+            half = args.radix // 2
+            if args.tiers == 2:
+                podsize = args.nodes
+                tiers = (
+                    tier(args.speed_gbps, half, half, args.latency_ns),
+                    tier(args.speed_gbps, args.nodes // half, latency_ns=args.latency_ns),
+                )
+            else:
+                podsize = half * half
+                tiers = (
+                    tier(args.speed_gbps, half, half, args.latency_ns),
+                    tier(args.speed_gbps, half, half, args.latency_ns),
+                    tier(args.speed_gbps, args.nodes // podsize, latency_ns=args.latency_ns),
+                )
+            topo = fat_tree_topology(FatTreeSpec(args.nodes, podsize, tiers))
+            topo.write(args.output)
+            print(topo.summary())
+            print("Written to", args.output)
+        else:
+            print(Topology.read(args.input).summary())
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 # Sample Python script to read filenames from an input file and launch a process for each filename to count the number of lines in that file.
 
 import subprocess
+import shlex
 import sys
 import os
 
+from launch import launch
+
 def run_experiments(input_filename):
     # Read the filenames from the input file
     with open(input_filename, 'r') as file:
@@ -80,12 +83,12 @@ def run_experiments(input_filename):
 
         print ("Running",cmdline)
 
-        process = subprocess.Popen(cmdline,shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        # Get the output and errors from the process
-        output, errors = process.communicate()
+        # Run through the launch wrapper so the resources used are recorded
+        result = launch(shlex.split(cmdline))
+        output = result.stdout.encode('utf-8')
+        errors = result.stderr.encode('utf-8')
 
-        if process.returncode == 0:
+        if result.returncode == 0:
             # Extract the line count from the output
             #line_count = output.decode().split()[0]
             #print(f"File '{filename}' has {line_count} lines.")
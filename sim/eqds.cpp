@@ -60,7 +60,8 @@ bool EqdsNIC::requestSending(EqdsSrc& src) {
             eventlist().sourceIsPending(*this,_send_end_time);
         }
         _num_queued_srcs += 1;
-        _active_srcs.push_back(&src);
+        EqdsSrc* queued_src = &src;
+        _active_srcs.push(queued_src);
         return false;
     }
     assert (_num_queued_srcs == 0 && _control.empty());
@@ -73,8 +74,7 @@ void EqdsNIC::startSending(EqdsSrc& src, mem_b pkt_size) {
         cout << src.nodename() << " startSending at " << timeAsUs(EventList::getTheEventList().now()) << endl;
     }
     if (_num_queued_srcs > 0) {
-        EqdsSrc *queued_src = _active_srcs.front();
-        _active_srcs.pop_front();
+        EqdsSrc *queued_src = _active_srcs.pop();
         _num_queued_srcs--;
         assert(_num_queued_srcs >= 0);
         assert(queued_src == &src);
@@ -100,23 +100,21 @@ void EqdsNIC::cantSend(EqdsSrc& src) {
     if (_num_queued_srcs>0){
         _num_queued_srcs--;
 
-        EqdsSrc *queued_src = _active_srcs.front();
-        _active_srcs.pop_front();
+        EqdsSrc *queued_src = _active_srcs.pop();
 
         assert(queued_src == &src);
         assert(eventlist().now() >= _send_end_time);
 
         if (_num_queued_srcs > 0) {
             // give the next src a chance.
-            queued_src = _active_srcs.front();
+            queued_src = _active_srcs.next_to_pop();
             queued_src->timeToSend();
             return;
         }
     }
     if (!_control.empty()){
         //need to send a control packet, since we didn't manage to send a data packet.
-        Packet* p = _control.front();
-        _control.pop_front();
+        Packet* p = _control.pop();
         p->sendOn();
 
         simtime_picosec delta = ((simtime_picosec)p->size() * 8 * timeFromSec(1.0))/_linkspeed;
@@ -135,7 +133,7 @@ void EqdsNIC::cantSend(EqdsSrc& src) {
 bool EqdsNIC::sendControlPacket(EqdsBasePacket* pkt){
     //pkt->sendOn();
     _control_size += pkt->size();
-    _control.push_back(pkt);
+    _control.push(pkt);
 
     if (EqdsSrc::_debug) {
         cout << "NIC " << this << " request to send control packet of type " << pkt->str() << " control queue size " <<_control_size << " " << _control.size() << endl;
@@ -185,7 +183,7 @@ void EqdsNIC::doNextEvent() {
 
         if (_crt< _ratio_data){
             // it's time for the next source to send
-            EqdsSrc *queued_src = _active_srcs.front();
+            EqdsSrc *queued_src = _active_srcs.next_to_pop();
             queued_src->timeToSend();
 
             if (EqdsSrc::_debug) cout << " send data " << endl;
@@ -193,8 +191,7 @@ void EqdsNIC::doNextEvent() {
             return;
         } 
         else {
-            Packet* p = _control.front();
-            _control.pop_front();
+            Packet* p = _control.pop();
             p->sendOn();
 
             simtime_picosec delta = ((simtime_picosec)p->size() * 8 * timeFromSec(1.0))/_linkspeed;
@@ -214,15 +211,14 @@ void EqdsNIC::doNextEvent() {
     //either we have active sources or control packets, not both.
 
     if(_num_queued_srcs>0){
-            EqdsSrc *queued_src = _active_srcs.front();
+            EqdsSrc *queued_src = _active_srcs.next_to_pop();
             queued_src->timeToSend();
 
             if (EqdsSrc::_debug) cout << "NIC " << this << " send data ONLY " << endl;
     }
     else {
         assert(!_control.empty());
-        Packet* p = _control.front();
-        _control.pop_front();
+        Packet* p = _control.pop();
 
         if (EqdsSrc::_debug) cout << "NIC "<< this << " send control ONLY of size " << p->size() << " at " << timeAsUs(eventlist().now()) << endl;
         
@@ -270,6 +266,9 @@ EqdsSrc::EqdsSrc(TrafficLogger *trafficLogger, EventList &eventList, EqdsNIC &ni
     _credit_spec = _maxwnd;
     _in_flight = 0;
     _highest_sent = 0;
+    _tx_records.resize(64); // enough for the default window
+    _tx_low = 0;
+    _tx_high = 0;
     _send_blocked_on_nic = false;
     _no_of_paths = _path_entropy_size;
     _path_random = rand() % 0xffff; // random upper bits of EV
@@ -391,20 +390,18 @@ void EqdsSrc::receivePacket(Packet &pkt) {
 }
 
 void EqdsSrc::handleAckno(EqdsDataPacket::seq_t ackno) {
-    auto i = _tx_bitmap.find(ackno);
-    if (i == _tx_bitmap.end())
+    sendRecord* record = findSendRecord(ackno);
+    if (!record)
         return;
-    //mem_b pkt_size = i->second.pkt_size;
-    simtime_picosec send_time = i->second.send_time;
+    simtime_picosec send_time = record->send_time;
 
     //computeRTO(send_time);
 
-    mem_b pkt_size = i->second.pkt_size;
+    mem_b pkt_size = record->pkt_size;
     _in_flight -= pkt_size;
     assert(_in_flight >= 0);
     if (_debug_src) cout << _nodename << " handleAck " << ackno << " flow " << _flow.str() << endl;
-    _tx_bitmap.erase(i);
-    _send_times.erase(send_time);
+    record->pkt_size = 0;
 
     if (send_time == _rto_send_time) {
         recalculateRTO();
@@ -422,29 +419,29 @@ void EqdsSrc::handleCumulativeAck(EqdsDataPacket::seq_t cum_ack) {
         else break;
     }
 
-    auto i = _tx_bitmap.begin();
-    while (i != _tx_bitmap.end()) {
-        auto seqno = i->first;
-        // cumulative ack is next expected packet, not yet received
-        if (seqno >= cum_ack) {
-            // nothing else acked
-            break;
-        }
-        mem_b pkt_size = i->second.pkt_size;
-        simtime_picosec send_time = i->second.send_time;
+    // cumulative ack is next expected packet, not yet received
+    while (_tx_low < cum_ack && _tx_low < _tx_high) {
+        auto seqno = _tx_low++;
+        sendRecord& record = txRecord(seqno);
+        if (record.pkt_size == 0)
+            continue;
+        mem_b pkt_size = record.pkt_size;
+        simtime_picosec send_time = record.send_time;
 
         //computeRTO(send_time);
 
         _in_flight -= pkt_size;
         assert(_in_flight >= 0);
         if (_debug_src) cout << _nodename << " handleCumAck " << seqno << " flow " << _flow.str() << endl;
-        _tx_bitmap.erase(i);
-        i = _tx_bitmap.begin();
-        _send_times.erase(send_time);
+        record.pkt_size = 0;
         if (send_time == _rto_send_time) {
             recalculateRTO();
         }
     }
+    if (_tx_low < cum_ack) {
+        _tx_low = cum_ack;
+        _tx_high = cum_ack;
+    }
 }
 
 void EqdsSrc::handlePull(EqdsBasePacket::pull_quanta pullno) {
@@ -531,8 +528,8 @@ void EqdsSrc::processNack(const EqdsNackPacket& pkt) {
     //bool ecn_echo = pkt.ecn_echo();
 
     // move the packet to the RTX queue
-    auto i = _tx_bitmap.find(nacked_seqno);
-    if (i == _tx_bitmap.end()) {
+    sendRecord* record = findSendRecord(nacked_seqno);
+    if (!record) {
         if (_debug_src) 
             cout << "Didn't find NACKed packet in _active_packets flow " << _flow.str() << endl;
 
@@ -544,26 +541,24 @@ void EqdsSrc::processNack(const EqdsNackPacket& pkt) {
         // this can happen when the NACK arrives later than a cumulative ACK covering the NACKed packet.
         //return;
     }
-    mem_b pkt_size = i->second.pkt_size;
+    mem_b pkt_size = record->pkt_size;
     
     assert(pkt_size >= _hdr_size); // check we're not seeing NACKed RTS packets.
     if (pkt_size == _hdr_size){
         _stats.rts_nacks ++;
     } 
     
-    auto seqno = i->first;
-    simtime_picosec send_time = i->second.send_time;
+    auto seqno = nacked_seqno;
+    simtime_picosec send_time = record->send_time;
 
     //computeDynamicRTO(send_time);
 
     if (_debug_src) cout << _nodename << " erasing send record, seqno: " << seqno << " flow " << _flow.str() << endl;
-    _tx_bitmap.erase(i);
-    assert(_tx_bitmap.find(seqno) == _tx_bitmap.end()); // xxx remove when working
+    record->pkt_size = 0;
 
     _in_flight -= pkt_size;
     assert(_in_flight >= 0);
     
-    _send_times.erase(send_time);
     queueForRtx(seqno, pkt_size);
 
     if (send_time == _rto_send_time) {
@@ -622,7 +617,7 @@ void EqdsSrc::startFlow() {
     _state = SPECULATING; 
     _speculating = true;
     _send_blocked_on_nic = false;
-    while (_send_blocked_on_nic == false && credit() > 0 && _unsent > 0) {
+    while (_send_blocked_on_nic == false && credit() > 0 && _unsent > 0 && !txRingFull()) {
         if (_debug_src) cout << "requestSending 0 "<< " flow " << _flow.str() << endl;
 
         bool can_i_send = _nic.requestSending(*this);
@@ -712,6 +707,11 @@ void EqdsSrc::sendIfPermitted() {
         mem_b payload_size = _mss;
         if (_unsent == 0)
             return;
+        if (txRingFull()) {
+            // the sink can't track more packets until the oldest is
+            // acked; the ack will call us again
+            return;
+        }
 
         if (_unsent < payload_size) {
             payload_size = _unsent;
@@ -843,6 +843,7 @@ uint16_t EqdsSrc::nextEntropy() {
 mem_b EqdsSrc::sendNewPacket() {
     if (_debug_src) cout << _nodename << " sendNewPacket highest_sent " << _highest_sent << " h*m " << _highest_sent * _mss << " backlog " << _backlog << " unsent " << _unsent << " flow " << _flow.str() << endl;
     assert(_unsent > 0);
+    assert(!txRingFull());
     assert(((mem_b)_highest_sent - _rts_packets_sent) * _mss < _flow_size);
     mem_b payload_size = _mss;
     if (_unsent < payload_size) {
@@ -925,6 +926,11 @@ void EqdsSrc::sendRTS() {
         // a whole window.
         return;
     }
+    if (txRingFull(0)) {
+        // no sequence number free for the RTS.  The ones already sent
+        // ask for the retransmissions that will free them.
+        return;
+    }
     if (_debug_src) cout << _nodename << " sendRTS, route: " << _route << " flow " << _flow.str() << " at " << timeAsUs(eventlist().now()) << " last RTS " << timeAsUs(_last_rts) << endl;
     createSendRecord(_highest_sent, _hdr_size);
     auto *p = EqdsRtsPacket::newpkt(_flow, *_route, _highest_sent, _hdr_size,
@@ -945,9 +951,49 @@ void EqdsSrc::sendRTS() {
 void EqdsSrc::createSendRecord(EqdsBasePacket::seq_t seqno, mem_b full_pkt_size) {
     //assert(full_pkt_size > 64);
     if (_debug_src) cout << _nodename << " createSendRecord seqno: " << seqno << " size " << full_pkt_size << endl;
-    assert(_tx_bitmap.find(seqno) == _tx_bitmap.end());
-    _tx_bitmap.emplace(seqno, sendRecord(full_pkt_size, eventlist().now()));
-    _send_times.emplace(eventlist().now(), seqno);
+    assert(seqno >= _tx_low && !findSendRecord(seqno));
+    if (seqno >= _tx_high) {
+        growSendRecords(seqno + 1 - _tx_low);
+        _tx_high = seqno + 1;
+    }
+    sendRecord& record = txRecord(seqno);
+    record.pkt_size = full_pkt_size;
+    record.send_time = eventlist().now();
+    sendTime entry = {eventlist().now(), seqno};
+    _send_times.push(entry);
+}
+
+EqdsSrc::sendRecord* EqdsSrc::findSendRecord(EqdsBasePacket::seq_t seqno) {
+    if (seqno < _tx_low || seqno >= _tx_high)
+        return NULL;
+    sendRecord& record = txRecord(seqno);
+    return record.pkt_size ? &record : NULL;
+}
+
+void EqdsSrc::growSendRecords(EqdsBasePacket::seq_t span) {
+    size_t old_size = _tx_records.size();
+    size_t size = old_size;
+    while (size < span)
+        size *= 2;
+    if (size == old_size)
+        return;
+    assert(size <= eqdsMaxInFlightPkts);
+    vector<sendRecord> records(size);
+    for (auto seqno = _tx_low; seqno < _tx_high; seqno++)
+        records[seqno & (size - 1)] = _tx_records[seqno & (old_size - 1)];
+    _tx_records.swap(records);
+}
+
+void EqdsSrc::trimSendTimes() {
+    // drop the send times of packets since acked, nacked or timed out
+    // (or resent, if the send record has a later time)
+    while (!_send_times.empty()) {
+        sendTime& oldest = _send_times.next_to_pop();
+        sendRecord* record = findSendRecord(oldest.seqno);
+        if (record && record->send_time == oldest.send_time)
+            return;
+        _send_times.pop();
+    }
 }
 
 void EqdsSrc::queueForRtx(EqdsBasePacket::seq_t seqno, mem_b pkt_size) {
@@ -977,6 +1023,11 @@ void EqdsSrc::timeToSend() {
     // how much do we want to send?
     if (_rtx_queue.empty()) {
         // we want to send new data
+        if (txRingFull()) {
+            if (_debug_src) cout << "cantSend, send records full" << " flow " << _flow.str() << endl;
+            _nic.cantSend(*this);
+            return;
+        }
         mem_b payload_size = _mss;
         if (_unsent < payload_size) {
             payload_size = _unsent;
@@ -1033,6 +1084,10 @@ void EqdsSrc::timeToSend() {
         assert(_backlog == 0);
         return;
     }
+    if (_rtx_queue.empty() && txRingFull()) {
+        // wait for an ack to free a send record
+        return;
+    }
 
     // we're ready to send again.  Let the NIC know.
     assert(!_send_blocked_on_nic);
@@ -1047,11 +1102,12 @@ void EqdsSrc::recalculateRTO() {
     // we're no longer waiting for the packet we set the timer for -
     // figure out what the timer should be now.
     cancelRTO();
+    trimSendTimes();
     if (_send_times.empty()) {
         // nothing left that we're waiting for
         return;
     }
-    auto earliest_send_time = _send_times.begin()->first;
+    auto earliest_send_time = _send_times.next_to_pop().send_time;
     startRTO(earliest_send_time);
 }
 
@@ -1059,19 +1115,18 @@ void EqdsSrc::rtxTimerExpired() {
     assert(eventlist().now() == _rtx_timeout);
     clearRTO();
 
-    auto first_entry = _send_times.begin();
-    assert(first_entry != _send_times.end());
-    auto seqno = first_entry->second;
+    trimSendTimes();
+    assert(!_send_times.empty());
+    auto seqno = _send_times.pop().seqno;
 
-    auto send_record = _tx_bitmap.find(seqno);
-    assert(send_record != _tx_bitmap.end());
-    mem_b pkt_size = send_record->second.pkt_size;
+    sendRecord* send_record = findSendRecord(seqno);
+    assert(send_record);
+    mem_b pkt_size = send_record->pkt_size;
 
     //update flightsize?
 
-    _send_times.erase(first_entry);
     if (_debug_src) cout << _nodename << " rtx timer expired for " << seqno << " flow " << _flow.str() << endl;
-    _tx_bitmap.erase(send_record);
+    send_record->pkt_size = 0;
     recalculateRTO();
 
     if (!_rtx_queue.empty()) {
@@ -1151,6 +1206,8 @@ EqdsSink::EqdsSink(TrafficLogger *trafficLogger, EqdsPullPacer* pullPacer, EqdsN
     _received_bytes(0),
     _accepted_bytes(0),
     _end_trigger(NULL),
+    _rate_stats(NULL),
+    _rate_slot(0),
     _epsn_rx_bitmap(0),
     _out_of_order_count(0),
     _ack_request(false)
@@ -1159,6 +1216,7 @@ EqdsSink::EqdsSink(TrafficLogger *trafficLogger, EqdsPullPacer* pullPacer, EqdsN
     _stats = {0,0,0,0,0};
     _in_pull = false;
     _in_slow_pull = false;
+    _pull_slot = _pullPacer->addSink();
 }
 
 EqdsSink::EqdsSink(TrafficLogger* trafficLogger, linkspeed_bps linkSpeed, double rate_modifier, uint16_t mtu, EventList &eventList, EqdsNIC& nic) :
@@ -1173,6 +1231,8 @@ EqdsSink::EqdsSink(TrafficLogger* trafficLogger, linkspeed_bps linkSpeed, double
     _received_bytes(0),
     _accepted_bytes(0),
     _end_trigger(NULL),
+    _rate_stats(NULL),
+    _rate_slot(0),
     _epsn_rx_bitmap(0),
     _out_of_order_count(0),
     _ack_request(false)
@@ -1181,8 +1241,13 @@ EqdsSink::EqdsSink(TrafficLogger* trafficLogger, linkspeed_bps linkSpeed, double
     _stats = {0,0,0,0,0};
     _in_pull = false;
     _in_slow_pull = false;
+    _pull_slot = _pullPacer->addSink();
 } 
 
+void EqdsSink::setPullWeight(uint32_t weight) {
+    _pullPacer->setWeight(this, weight);
+}
+
 void EqdsSink::connect(EqdsSrc* src, Route* route){
     _src = src;
     _route = route;
@@ -1249,6 +1314,8 @@ void EqdsSink::processData(const EqdsDataPacket& pkt){
 
 
     assert(_received_bytes <= _src->flowsize());
+    if (_rate_stats && _received_bytes == _src->flowsize())
+        _rate_stats->finished(_rate_slot);
     if (_src->debug() && _received_bytes == _src->flowsize())
         cout << _nodename << " received " << _received_bytes << " at " << timeAsUs(EventList::getTheEventList().now())<< endl;
 
@@ -1410,6 +1477,8 @@ void EqdsSink::processRts(const EqdsRtsPacket& pkt){
 void EqdsSink::receivePacket(Packet &pkt) {
     _stats.received ++;
     _stats.bytes_received += pkt.size(); // should this include just the payload?
+    if (_rate_stats)
+        _rate_stats->received(_rate_slot, pkt.size());
 
     switch(pkt.type()){
         case EQDSDATA:
@@ -1551,7 +1620,7 @@ uint32_t EqdsSink::reorder_buffer_size() {
 
 // pull rate modifier should generally be something like 0.99 so we pull at just less than line rate
 EqdsPullPacer::EqdsPullPacer(linkspeed_bps linkSpeed, double pull_rate_modifier, uint16_t mtu, EventList &eventList) :
-    EventSource(eventList, "eqdsPull"), _pktTime(pull_rate_modifier * 8 * pktByteTimes(mtu) * 1e12 / linkSpeed) {
+    EventSource(eventList, "eqdsPull"), _sink_count(0), _pktTime(pull_rate_modifier * 8 * pktByteTimes(mtu) * 1e12 / linkSpeed) {
     _active = false;
 }
 
@@ -1566,35 +1635,30 @@ void EqdsPullPacer::doNextEvent() {
 
     if (!_rtx_senders.empty()){
         sink = _rtx_senders.front();
-        _rtx_senders.pop_front();
 
         pullPkt = sink->pull();
         if (EqdsSrc::_debug) cout << "PullPacer: RTX: " << sink->getSrc()->nodename() << " rtx_backlog " << sink->rtx_backlog() << " at " << timeAsUs(eventlist().now()) << endl;
         // TODO if more pulls are needed, enqueue again
-        if (sink->rtx_backlog()>0)
-            _rtx_senders.push_back(sink);
+        _rtx_senders.served(sink->rtx_backlog()>0);
     }
     else if (!_active_senders.empty()){
         sink = _active_senders.front();
 
         assert(sink->inPullQueue());
 
-        _active_senders.pop_front();
         pullPkt = sink->pull();
 
         // TODO if more pulls are needed, enqueue again
         if (EqdsSrc::_debug) cout << "PullPacer: Active: " << sink->getSrc()->nodename() << " backlog " << sink->backlog() << " at " << timeAsUs(eventlist().now()) << endl;
-        if (sink->backlog()>0)
-            _active_senders.push_back(sink);
-        else { //this sink has had its demand satisfied, move it to idle senders list.
-            _idle_senders.push_back(sink);
+        _active_senders.served(sink->backlog()>0);
+        if (sink->backlog()==0) { //this sink has had its demand satisfied, move it to idle senders list.
+            _idle_senders.push(sink);
             sink->removeFromPullQueue();
             sink->addToSlowPullQueue();
         }
     }
     else { //no active senders, we must have at least one idle sender
-        sink = _idle_senders.front();
-        _idle_senders.pop_front();
+        sink = _idle_senders.pop();
         if(!sink->inSlowPullQueue())
             sink->addToSlowPullQueue();
 
@@ -1605,7 +1669,7 @@ void EqdsPullPacer::doNextEvent() {
         if (sink->backlog() == 0 && sink->slowCredit() < EqdsBasePacket::quantize_floor(sink->getMaxCwnd())){
             //only send upto 1BDP worth of speculative credit.
             //backlog will be negative once this source starts receiving speculative credit. 
-            _idle_senders.push_back(sink);
+            _idle_senders.push(sink);
         }
         else
             sink->removeFromSlowPullQueue();
@@ -1620,38 +1684,21 @@ void EqdsPullPacer::doNextEvent() {
     eventlist().sourceIsPendingRel(*this, _pktTime);
 }
 
-bool EqdsPullPacer::isActive(EqdsSink* sink){
-    for (auto i = _active_senders.begin(); i != _active_senders.end(); i++) {
-        if(*i == sink)
-            return true;
-    }
-    return false;
-}
-
-bool EqdsPullPacer::isRetransmitting(EqdsSink* sink){
-    for (auto i = _rtx_senders.begin(); i != _rtx_senders.end(); i++) {
-        if(*i == sink)
-            return true;
-    }
-    return false;
-}
-
 bool EqdsPullPacer::isIdle(EqdsSink* sink){
-    for (auto i = _idle_senders.begin(); i != _idle_senders.end(); i++) {
-        if(*i == sink)
+    for (int i = 0; i < _idle_senders.size(); i++) {
+        if (_idle_senders.at(i) == sink)
             return true;
     }
     return false;
 }
 
-
 void EqdsPullPacer::requestPull(EqdsSink *sink) {
     if (isActive(sink)){
         abort(); 
     }
     assert (sink->inPullQueue());
 
-    _active_senders.push_back(sink);
+    _active_senders.push_back(sink->pullSlot(), sink);
     // TODO ack timer
 
     if (!_active) {
@@ -1663,7 +1710,7 @@ void EqdsPullPacer::requestPull(EqdsSink *sink) {
 void EqdsPullPacer::requestRetransmit(EqdsSink *sink) {
     assert (!isRetransmitting(sink));
     
-    _rtx_senders.push_back(sink);
+    _rtx_senders.push_back(sink->pullSlot(), sink);
     // TODO ack timer
 
     if (!_active) {
@@ -10,6 +10,8 @@
 #include "trigger.h"
 #include "eqdspacket.h"
 #include "circular_buffer.h"
+#include "active_set.h"
+#include "sink_stats.h"
 
 
 #define timeInf 0
@@ -33,6 +35,9 @@ class ModularVector {
 };
 
 static const unsigned eqdsMaxInFlightPkts = 1 << 12;
+// new data stops this many sequence numbers short of eqdsMaxInFlightPkts,
+// leaving room for the RTS packets sent while retransmissions are pending
+static const unsigned eqdsRtsReserve = 64;
 class EqdsPullPacer;
 class EqdsSink;
 class EqdsSrc;
@@ -56,8 +61,8 @@ public:
     bool sendControlPacket(EqdsBasePacket* pkt);
     void doNextEvent();
 private:
-    list <EqdsSrc*> _active_srcs;
-    list<EqdsBasePacket*> _control;
+    CircularBuffer<EqdsSrc*> _active_srcs;
+    CircularBuffer<EqdsBasePacket*> _control;
     mem_b _control_size;
 
     linkspeed_bps _linkspeed;
@@ -126,12 +131,14 @@ class EqdsSrc : public EventSource, public PacketSink, public TriggerTarget {
  private:
     EqdsNIC& _nic;
     struct sendRecord {
-        // need a constructor to be able to put this in a map
-        sendRecord(mem_b psize, simtime_picosec stime) :
-            pkt_size(psize), send_time(stime) {};
-        mem_b pkt_size;
+        sendRecord() : pkt_size(0), send_time(0) {};
+        mem_b pkt_size; // zero if the slot is empty
         simtime_picosec send_time;
     };
+    struct sendTime {
+        simtime_picosec send_time;
+        EqdsDataPacket::seq_t seqno;
+    };
     EqdsLogger* _logger;
     TrafficLogger* _pktlogger;
     FlowEventLogger* _flow_logger;
@@ -140,10 +147,29 @@ class EqdsSrc : public EventSource, public PacketSink, public TriggerTarget {
     // TODO in-flight packet storage - acks and sacks clear it
     //list<EqdsDataPacket*> _activePackets;
 
-    // we need to access the in_flight packet list quickly by sequence number, or by send time.
-    map <EqdsDataPacket::seq_t, sendRecord> _tx_bitmap;
-    map <simtime_picosec, EqdsDataPacket::seq_t> _send_times;
-    
+    // we need to access the in_flight packet list quickly by sequence
+    // number, or by send time.  The send records sit in a ring indexed
+    // by sequence number, covering [_tx_low, _tx_high); it doubles when
+    // it needs to, up to eqdsMaxInFlightPkts, the most the sink's
+    // bitmap can cover.  New data waits while the ring is full, as it
+    // does for an exhausted window.  Send times only ever increase, so
+    // they are queued in order; acks, nacks and timeouts empty the send
+    // record and leave its send time to be dropped when it reaches the
+    // front.
+    vector<sendRecord> _tx_records;
+    EqdsDataPacket::seq_t _tx_low;  // everything below has been cumulatively acked
+    EqdsDataPacket::seq_t _tx_high; // one past the highest seqno sent
+    CircularBuffer<sendTime> _send_times;
+    sendRecord& txRecord(EqdsDataPacket::seq_t seqno) {
+        return _tx_records[seqno & (_tx_records.size() - 1)];
+    }
+    bool txRingFull(unsigned reserve = eqdsRtsReserve) const {
+        return _highest_sent - _tx_low + reserve >= eqdsMaxInFlightPkts;
+    }
+    sendRecord* findSendRecord(EqdsDataPacket::seq_t seqno);
+    void growSendRecords(EqdsDataPacket::seq_t span);
+    void trimSendTimes();
+
     map <EqdsDataPacket::seq_t, mem_b> _rtx_queue;
     void startFlow();
     bool isSpeculative();
@@ -292,6 +318,11 @@ class EqdsSink : public PacketSink, public DataReceiver {
     inline void addToSlowPullQueue() { _in_pull = false; _in_slow_pull = true;}
     inline void removeFromSlowPullQueue() { _in_pull = false; _in_slow_pull = false;}
     inline EqdsNIC* getNIC() const {return &_nic;}  
+    inline uint32_t pullSlot() const {return _pull_slot;}
+    // pulls per round robin turn, when backlogged alongside other sinks
+    void setPullWeight(uint32_t weight);
+    // count received bytes in an aggregator instead of being sampled
+    void monitorWith(SinkStatsAggregator& stats) {_rate_stats = &stats; _rate_slot = stats.monitorSink(this);}
 
     uint16_t nextEntropy();
     
@@ -320,6 +351,7 @@ private:
 
     bool _in_pull;//this tunnel is in the pull queue.
     bool _in_slow_pull;//this tunnel is in the slow pull queue.
+    uint32_t _pull_slot; // in the pull pacer's round robins
 
     const Route* _route;
 
@@ -328,6 +360,8 @@ private:
     uint16_t _accepted_bytes;
 
     Trigger* _end_trigger;
+    SinkStatsAggregator* _rate_stats;
+    uint32_t _rate_slot;
     ModularVector<uint8_t, eqdsMaxInFlightPkts> _epsn_rx_bitmap; // list of packets above a hole, that we've received
     
     uint32_t _out_of_order_count;
@@ -339,10 +373,17 @@ private:
     string _nodename;
 };
 
+// The pacer round robins retransmitting and backlogged sinks by the
+// slot each was given by addSink(), so a pull costs the same however
+// many sinks are idle.  Backlogged sinks get pulled in proportion to
+// their pull weights.
 class EqdsPullPacer : public EventSource {
-    list<EqdsSink*> _rtx_senders; // TODO priorities?
-    list<EqdsSink*> _active_senders; // TODO priorities?
-    list<EqdsSink*> _idle_senders; // TODO priorities?
+    ActiveSet<EqdsSink*> _rtx_senders; // TODO priorities?
+    ActiveSet<EqdsSink*> _active_senders;
+    // a sink that goes active while idle can be queued here again when it
+    // goes idle; each time round it gets more speculative credit
+    CircularBuffer<EqdsSink*> _idle_senders; // TODO priorities?
+    uint32_t _sink_count;
 
     const simtime_picosec _pktTime;
     bool _active;
@@ -350,12 +391,19 @@ class EqdsPullPacer : public EventSource {
  public:
     EqdsPullPacer(linkspeed_bps linkSpeed, double pull_rate_modifier, uint16_t mtu, EventList &eventList);
     void doNextEvent() ;
+    uint32_t addSink() {return _sink_count++;}
     void requestPull(EqdsSink *sink);
     void requestRetransmit(EqdsSink *sink);
+    void setWeight(EqdsSink *sink, uint32_t weight) {_active_senders.set_weight(sink->pullSlot(), weight);}
 
-    bool isActive(EqdsSink *sink);
-    bool isRetransmitting(EqdsSink *sink);
+    bool isActive(EqdsSink *sink) {return _active_senders.contains(sink->pullSlot());}
+    bool isRetransmitting(EqdsSink *sink) {return _rtx_senders.contains(sink->pullSlot());}
     bool isIdle(EqdsSink *sink);
+
+    // how evenly backlogged sinks were pulled: Jain's index of the
+    // pulls each got, divided by its weight, and how many sinks that is
+    double fairness() const {return _active_senders.fairness();}
+    uint32_t sinksPulled() const {return _active_senders.served_slots();}
 };
 
 #endif // EQDS_H
@@ -0,0 +1,148 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include "event_profiler.h"
+#include <cxxabi.h>
+#include <stdlib.h>
+#include <string.h>
+#include <algorithm>
+#include <fstream>
+#include <iostream>
+#include <map>
+#include <vector>
+#include "eventlist.h"
+
+using namespace std;
+
+bool EventProfiler::_enabled = false;
+bool EventProfiler::_per_instance = false;
+string EventProfiler::_filename;
+uint64_t EventProfiler::_started = 0;
+unordered_map<const type_info*, EventProfiler::Counter> EventProfiler::_classes;
+unordered_map<EventSource*, EventProfiler::Instance> EventProfiler::_instances;
+
+static string class_name(const type_info& type) {
+    int status;
+    char* name = abi::__cxa_demangle(type.name(), NULL, NULL, &status);
+    string s = status == 0 ? name : type.name();
+    free(name);
+    return s;
+}
+
+static string json_string(const string& s) {
+    string out = "\"";
+    for (size_t i = 0; i < s.size(); i++) {
+        char c = s[i];
+        if (c == '"' || c == '\\') {
+            out += '\\';
+            out += c;
+        } else if ((unsigned char)c < 0x20) {
+            char buf[8];
+            snprintf(buf, sizeof(buf), "\\u%04x", c);
+            out += buf;
+        } else {
+            out += c;
+        }
+    }
+    return out + "\"";
+}
+
+bool
+EventProfiler::parseArg(int argc, char** argv, int& i) {
+    if (!strcmp(argv[i], "-profile") && i + 1 < argc) {
+        enable(argv[i+1], _per_instance);
+        i++;
+    } else if (!strcmp(argv[i], "-profile_instances")) {
+        _per_instance = true;
+    } else {
+        return false;
+    }
+    return true;
+}
+
+const char*
+EventProfiler::usage() {
+    return "\t[-profile file.json] count events and their wall time per event source class (needs make PROFILE=1)\n"
+        "\t[-profile_instances] with -profile, per event source as well";
+}
+
+void
+EventProfiler::enable(const string& filename, bool per_instance) {
+#ifndef HTSIM_PROFILE
+    cerr << "-profile needs the simulator built with make PROFILE=1" << endl;
+    exit(1);
+#endif
+    _enabled = true;
+    _per_instance = per_instance;
+    _filename = filename;
+    _started = clock();
+}
+
+void
+EventProfiler::eventDone(EventSource& src, uint64_t started) {
+    uint64_t elapsed = clock() - started;
+    Counter& c = _classes[&typeid(src)];
+    c.events++;
+    c.nanoseconds += elapsed;
+    if (_per_instance) {
+        auto i = _instances.find(&src);
+        if (i == _instances.end()) {
+            Instance inst = {&typeid(src), src.str(), {0, 0}};
+            i = _instances.insert(make_pair(&src, inst)).first;
+        }
+        i->second.counter.events++;
+        i->second.counter.nanoseconds += elapsed;
+    }
+}
+
+void
+EventProfiler::write() {
+    if (!_enabled)
+        return;
+    ofstream out(_filename.c_str());
+    if (!out) {
+        cerr << "Failed to write profile " << _filename << endl;
+        return;
+    }
+    out.precision(9);
+    map<string, Counter> classes;
+    uint64_t events = 0, nanoseconds = 0;
+    for (auto i = _classes.begin(); i != _classes.end(); i++) {
+        Counter& c = classes[class_name(*i->first)];
+        c.events += i->second.events;
+        c.nanoseconds += i->second.nanoseconds;
+        events += i->second.events;
+        nanoseconds += i->second.nanoseconds;
+    }
+    vector<pair<string, Counter>> sorted(classes.begin(), classes.end());
+    sort(sorted.begin(), sorted.end(), [](const pair<string, Counter>& a, const pair<string, Counter>& b) {
+            return a.second.nanoseconds > b.second.nanoseconds;
+        });
+
+    out << "{\n  \"run_seconds\": " << (clock() - _started) / 1e9
+        << ",\n  \"event_seconds\": " << nanoseconds / 1e9
+        << ",\n  \"events\": " << events
+        << ",\n  \"classes\": [";
+    for (size_t i = 0; i < sorted.size(); i++) {
+        out << (i ? ",\n" : "\n") << "    {\"class\": " << json_string(sorted[i].first)
+            << ", \"events\": " << sorted[i].second.events
+            << ", \"seconds\": " << sorted[i].second.nanoseconds / 1e9 << "}";
+    }
+    out << "\n  ]";
+    if (_per_instance) {
+        vector<const Instance*> instances;
+        for (auto i = _instances.begin(); i != _instances.end(); i++)
+            instances.push_back(&i->second);
+        sort(instances.begin(), instances.end(), [](const Instance* a, const Instance* b) {
+                return a->counter.nanoseconds > b->counter.nanoseconds;
+            });
+        out << ",\n  \"instances\": [";
+        for (size_t i = 0; i < instances.size(); i++) {
+            out << (i ? ",\n" : "\n") << "    {\"class\": " << json_string(class_name(*instances[i]->type))
+                << ", \"name\": " << json_string(instances[i]->name)
+                << ", \"events\": " << instances[i]->counter.events
+                << ", \"seconds\": " << instances[i]->counter.nanoseconds / 1e9 << "}";
+        }
+        out << "\n  ]";
+    }
+    out << "\n}" << endl;
+    cout << "Event profile written to " << _filename << endl;
+}
@@ -0,0 +1,70 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef EVENT_PROFILER_H
+#define EVENT_PROFILER_H
+
+/*
+ * EventProfiler counts the events EventList dispatches, and the wall
+ * time they take, for each class of EventSource (and, if asked, for each
+ * source), so a slow run shows whether its time goes on queues, pipes,
+ * retransmit timers, pacers or loggers.  The counts are written as JSON
+ * at the end of the run; datacenter/profile_report.py prints them.
+ * An event's time includes all it sets off: a Pipe's covers the queue or
+ * switch the packet arrives at.
+ *
+ * The hook in EventList::doNextEvent is only compiled in when the
+ * library is built with "make PROFILE=1" (which defines HTSIM_PROFILE),
+ * so a normal build pays nothing.  -profile on a normal build says so
+ * and exits.  Build from clean when switching between the two.
+ */
+
+#include <stdint.h>
+#include <chrono>
+#include <string>
+#include <typeinfo>
+#include <unordered_map>
+
+class EventSource;
+
+class EventProfiler {
+public:
+    // -profile file.json and -profile_instances; returns false for any
+    // other argument
+    static bool parseArg(int argc, char** argv, int& i);
+    static const char* usage();
+
+    static void enable(const std::string& filename, bool per_instance);
+    static bool enabled() {return _enabled;}
+
+    // called by EventList around each event
+    static uint64_t clock() {
+        return std::chrono::duration_cast<std::chrono::nanoseconds>(
+            std::chrono::steady_clock::now().time_since_epoch()).count();
+    }
+    static void eventDone(EventSource& src, uint64_t started);
+
+    // write the counts to the file given to enable(), if enabled
+    static void write();
+private:
+    struct Counter {
+        uint64_t events;
+        uint64_t nanoseconds;
+    };
+    struct Instance {
+        const std::type_info* type;
+        std::string name;
+        Counter counter;
+    };
+
+    static bool _enabled;
+    static bool _per_instance;
+    static std::string _filename;
+    static uint64_t _started;
+    // keyed by type_info address, which is cheap to hash; classes seen
+    // under two addresses are merged when written
+    static std::unordered_map<const std::type_info*, Counter> _classes;
+    // keyed by address: a source allocated where a deleted one was adds
+    // to its counts
+    static std::unordered_map<EventSource*, Instance> _instances;
+};
+
+#endif
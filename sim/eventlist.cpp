@@ -1,11 +1,21 @@
 // -*- c-basic-offset: 4; indent-tabs-mode: nil -*-        
 
+#include <string.h>
 #include "eventlist.h"
 #include "trigger.h"
+#ifdef HTSIM_PROFILE
+#include "event_profiler.h"
+#endif
+
+#define EVENT_NODE_CHUNK 4096
 
 simtime_picosec EventList::_endtime = 0;
 simtime_picosec EventList::_lasteventtime = 0;
-EventList::pendingsources_t EventList::_pendingsources;
+EventQueue* EventList::_pendingsources = NULL;
+EventQueue::queue_type EventList::_scheduler = EventQueue::CALENDAR;
+uint64_t EventList::_nextseq = 1;
+vector <EventNode*> EventList::_node_chunks;
+EventNode* EventList::_free_nodes = NULL;
 vector <TriggerTarget*> EventList::_pending_triggers;
 int EventList::_instanceCount = 0;
 EventList* EventList::_theEventList = nullptr;
@@ -38,6 +48,118 @@ EventList::setEndtime(simtime_picosec endtime)
     EventList::_endtime = endtime;
 }
 
+void
+EventList::initScheduler()
+{
+    const char* name = getenv("HTSIM_SCHEDULER");
+    if (name && *name && !EventQueue::parseType(name, _scheduler)) {
+        cerr << "Unknown HTSIM_SCHEDULER " << name << ", expected multimap, heap or calendar" << endl;
+        exit(1);
+    }
+    _pendingsources = EventQueue::create(_scheduler);
+}
+
+void
+EventList::setScheduler(EventQueue::queue_type type)
+{
+    EventQueue* queue = EventQueue::create(type);
+    if (_pendingsources) {
+        // events keep their sequence numbers, so the order is unchanged
+        while (EventNode* node = _pendingsources->popMin())
+            queue->insert(node);
+        delete _pendingsources;
+    }
+    _pendingsources = queue;
+    _scheduler = type;
+}
+
+EventQueue::queue_type
+EventList::scheduler()
+{
+    pending();
+    return _scheduler;
+}
+
+EventNode*
+EventList::allocNode(EventSource& src, simtime_picosec when)
+{
+    if (!_free_nodes) {
+        EventNode* chunk = new EventNode[EVENT_NODE_CHUNK];
+        _node_chunks.push_back(chunk);
+        for (int i = 0; i < EVENT_NODE_CHUNK; i++) {
+            chunk[i].seq = 0;
+            chunk[i].src = NULL;
+            chunk[i].next = _free_nodes;
+            _free_nodes = &chunk[i];
+        }
+    }
+    EventNode* node = _free_nodes;
+    _free_nodes = node->next;
+    node->when = when;
+    node->seq = _nextseq++;
+    node->src = &src;
+    node->src_prev = NULL;
+    node->src_next = src._pending_events;
+    if (src._pending_events)
+        src._pending_events->src_prev = node;
+    src._pending_events = node;
+    return node;
+}
+
+void
+EventList::releaseNode(EventNode* node)
+{
+    if (node->src) {
+        if (node->src_prev)
+            node->src_prev->src_next = node->src_next;
+        else
+            node->src->_pending_events = node->src_next;
+        if (node->src_next)
+            node->src_next->src_prev = node->src_prev;
+    }
+    node->seq = 0;
+    node->src = NULL;
+    node->next = _free_nodes;
+    _free_nodes = node;
+}
+
+void
+EventList::cancelNode(EventNode* node)
+{
+    pending().remove(node);
+    releaseNode(node);
+}
+
+void
+EventList::resetNodes()
+{
+    _free_nodes = NULL;
+    for (size_t c = 0; c < _node_chunks.size(); c++) {
+        for (int i = 0; i < EVENT_NODE_CHUNK; i++)
+            releaseNode(&_node_chunks[c][i]);
+    }
+}
+
+void
+EventList::reset()
+{
+    // objects that scheduled the dropped events are not freed here;
+    // the caller owns them.
+    pending().clear();
+    resetNodes();
+    _pending_triggers.clear();
+    _lasteventtime = 0;
+    _endtime = 0;
+}
+
+simtime_picosec
+EventList::nextEventTime()
+{
+    if (!_pending_triggers.empty())
+        return _lasteventtime;
+    return pending().minTime();
+}
+
 bool
 EventList::doNextEvent() 
 {
@@ -50,14 +172,24 @@ EventList::doNextEvent()
         return true;
     }
     
-    if (_pendingsources.empty())
+    EventNode* node = pending().popMin();
+    if (!node)
         return false;
     
-    simtime_picosec nexteventtime = _pendingsources.begin()->first;
-    EventSource* nextsource = _pendingsources.begin()->second;
-    _pendingsources.erase(_pendingsources.begin());
+    simtime_picosec nexteventtime = node->when;
+    EventSource* nextsource = node->src;
+    // free the node first: the source will usually schedule itself again
+    releaseNode(node);
     assert(nexteventtime >= _lasteventtime);
     _lasteventtime = nexteventtime; // set this before calling doNextEvent, so that this::now() is accurate
+#ifdef HTSIM_PROFILE
+    if (EventProfiler::enabled()) {
+        uint64_t started = EventProfiler::clock();
+        nextsource->doNextEvent();
+        EventProfiler::eventDone(*nextsource, started);
+        return true;
+    }
+#endif
     nextsource->doNextEvent();
     return true;
 }
@@ -68,7 +200,7 @@ EventList::sourceIsPending(EventSource &src, simtime_picosec when)
 {
     assert(when>=now());
     if (_endtime==0 || when<_endtime)
-        _pendingsources.insert(make_pair(when,&src));
+        pending().insert(allocNode(src, when));
 }
 
 EventList::Handle
@@ -76,10 +208,11 @@ EventList::sourceIsPendingGetHandle(EventSource &src, simtime_picosec when)
 {
     assert(when>=now());
     if (_endtime==0 || when<_endtime) {
-        EventList::Handle handle =_pendingsources.insert(make_pair(when,&src));
-        return handle;
+        EventNode* node = allocNode(src, when);
+        pending().insert(node);
+        return Handle(node);
     }
-    return _pendingsources.end();
+    return nullHandle();
 }
 
 void
@@ -89,42 +222,42 @@ EventList::triggerIsPending(TriggerTarget &target) {
 
 void 
 EventList::cancelPendingSource(EventSource &src) {
-    pendingsources_t::iterator i = _pendingsources.begin();
-    while (i != _pendingsources.end()) {
-        if (i->second == &src) {
-            _pendingsources.erase(i);
-            return;
-        }
-        i++;
+    // sources rarely have more than one or two events pending
+    EventNode* first = src._pending_events;
+    if (!first)
+        return;
+    for (EventNode* node = first->src_next; node; node = node->src_next) {
+        if (event_before(node, first))
+            first = node;
     }
+    cancelNode(first);
 }
 
 void 
 EventList::cancelPendingSourceByTime(EventSource &src, simtime_picosec when) {
-    // fast cancellation of a timer - the timer MUST exist
-    // this should normally be fast, except if we have a lot of events with exactly the same time value
-
-    auto range = _pendingsources.equal_range(when);
-
-    for (auto i = range.first; i != range.second; ++i) {
-        if (i->second == &src) {
-            _pendingsources.erase(i);
-            return;
-        }
+    // the timer MUST exist
+    EventNode* found = NULL;
+    for (EventNode* node = src._pending_events; node; node = node->src_next) {
+        if (node->when == when && (!found || node->seq < found->seq))
+            found = node;
     }
-    abort();
+    if (!found)
+        abort();
+    cancelNode(found);
 }
 
-
-void EventList::cancelPendingSourceByHandle(EventSource &src, EventList::Handle handle) {
-    // If we're cancelling timers often, cancel them by handle.  But
-    // be careful - cancelling a handle that has already been
-    // cancelled or has already expired is undefined behaviour
-    assert(handle->second == &src);
-    assert(handle != _pendingsources.end());
-    assert(handle->first >= now());
+bool
+EventList::cancelPendingSourceByHandle(EventSource &src, EventList::Handle handle) {
+    // the node is still ours only if its sequence number is unchanged;
+    // once the event runs or is cancelled the node is freed and reused
+    // with a new one, so stale and duplicate cancels are harmless
+    if (!isPending(handle))
+        return false;
+    assert(handle._node->src == &src);
+    assert(handle._node->when >= now());
     
-    _pendingsources.erase(handle);
+    cancelNode(handle._node);
+    return true;
 }
 
 void 
@@ -133,6 +266,18 @@ EventList::reschedulePendingSource(EventSource &src, simtime_picosec when) {
     sourceIsPending(src, when);
 }
 
+void
+EventList::cancelAllPendingSource(EventSource &src) {
+    while (src._pending_events)
+        cancelNode(src._pending_events);
+}
+
 EventSource::EventSource(const string& name) : EventSource(EventList::getTheEventList(), name) 
 {
 }
+
+EventSource::~EventSource()
+{
+    // don't leave the event list holding a dangling pointer
+    EventList::cancelAllPendingSource(*this);
+}
@@ -6,40 +6,74 @@
 #include <sys/time.h>
 #include "config.h"
 #include "loggertypes.h"
+#include "eventqueue.h"
 
 class EventList;
 class TriggerTarget;
 
 class EventSource : public Logged {
 public:
-    EventSource(EventList& eventlist, const string& name) : Logged(name), _eventlist(eventlist) {};
+    EventSource(EventList& eventlist, const string& name) : Logged(name), _eventlist(eventlist), _pending_events(NULL) {};
     EventSource(const string& name);
-    virtual ~EventSource() {};
+    virtual ~EventSource(); // cancels any events still pending
     virtual void doNextEvent() = 0;
     inline EventList& eventlist() const {return _eventlist;}
 protected:
     EventList& _eventlist;
+private:
+    friend class EventList;
+    EventNode* _pending_events; // this source's scheduled events, maintained by EventList
 };
 
 class EventList {
 public:
-    typedef multimap <simtime_picosec, EventSource*>::iterator Handle;
+    // refers to one scheduled event; a copy taken before the event fired
+    // or was cancelled no longer matches it
+    class Handle {
+    public:
+        Handle() : _node(NULL), _seq(0) {}
+        bool operator==(const Handle& h) const {return _node == h._node && _seq == h._seq;}
+        bool operator!=(const Handle& h) const {return !(*this == h);}
+    private:
+        friend class EventList;
+        explicit Handle(EventNode* node) : _node(node), _seq(node->seq) {}
+        EventNode* _node;
+        uint64_t _seq;
+    };
+
     EventList();
     static void setEndtime(simtime_picosec endtime); // end simulation at endtime (rather than forever)
+    static void reset(); // drop all pending events and rewind the clock, for running several simulations in one process
+    static simtime_picosec nextEventTime(); // time of the next pending event, or UINT64_MAX if there is none
+    static uint64_t eventsScheduled() {return _nextseq - 1;}
     static bool doNextEvent(); // returns true if it did anything, false if there's nothing to do
     static void sourceIsPending(EventSource &src, simtime_picosec when);
     static Handle sourceIsPendingGetHandle(EventSource &src, simtime_picosec when);
     static void sourceIsPendingRel(EventSource &src, simtime_picosec timefromnow)
     { sourceIsPending(src, EventList::now()+timefromnow); }
+    // cancel src's earliest pending event, if it has one.  Each source
+    // keeps a list of its own pending events, so none of the cancels
+    // search the whole event list.
     static void cancelPendingSource(EventSource &src);
-    // optimized cancel, if we know the expiry time
+    // cancel src's event at time when, which MUST exist
     static void cancelPendingSourceByTime(EventSource &src, simtime_picosec when);   
-    // optimized cancel by handle - be careful to ensure handle is still valid
-    static void cancelPendingSourceByHandle(EventSource &src, Handle handle);       
+    // cancel the event handle refers to; returns false, doing nothing, if
+    // it has already run or been cancelled
+    static bool cancelPendingSourceByHandle(EventSource &src, Handle handle);       
     static void reschedulePendingSource(EventSource &src, simtime_picosec when);
+    static void cancelAllPendingSource(EventSource &src);
+    static bool isPending(const Handle& handle) {
+        return handle._node && handle._node->seq == handle._seq;
+    }
     static void triggerIsPending(TriggerTarget &target);
     static inline simtime_picosec now() {return EventList::_lasteventtime;}
-    static Handle nullHandle() {return _pendingsources.end();}
+    static Handle nullHandle() {return Handle();}
+
+    // Choose the data structure that holds pending events.  All of them
+    // run events in the same order.  The default is calendar, or the
+    // HTSIM_SCHEDULER environment variable (multimap, heap or calendar).
+    static void setScheduler(EventQueue::queue_type type);
+    static EventQueue::queue_type scheduler();
 
 
     static EventList& getTheEventList();
@@ -49,8 +83,22 @@ public:
 private:
     static simtime_picosec _endtime;
     static simtime_picosec _lasteventtime;
-    typedef multimap <simtime_picosec, EventSource*> pendingsources_t;
-    static pendingsources_t _pendingsources;
+    static EventQueue& pending() {
+        if (!_pendingsources)
+            initScheduler();
+        return *_pendingsources;
+    }
+    static void initScheduler();
+    static EventNode* allocNode(EventSource& src, simtime_picosec when);
+    static void releaseNode(EventNode* node);
+    static void cancelNode(EventNode* node);
+    static void resetNodes();
+
+    static EventQueue* _pendingsources;
+    static EventQueue::queue_type _scheduler;
+    static uint64_t _nextseq;
+    static vector <EventNode*> _node_chunks;
+    static EventNode* _free_nodes;
     static vector <TriggerTarget*> _pending_triggers;
 
     static int _instanceCount;
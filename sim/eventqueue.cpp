@@ -0,0 +1,449 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include <string.h>
+#include <algorithm>
+#include "eventqueue.h"
+
+EventQueue*
+EventQueue::create(queue_type type) {
+    switch (type) {
+    case MULTIMAP:
+        return new MultimapEventQueue();
+    case HEAP:
+        return new HeapEventQueue();
+    case CALENDAR:
+        return new CalendarEventQueue();
+    }
+    abort();
+}
+
+bool
+EventQueue::parseType(const char* name, queue_type& type) {
+    if (!strcmp(name, "multimap")) {
+        type = MULTIMAP;
+    } else if (!strcmp(name, "heap")) {
+        type = HEAP;
+    } else if (!strcmp(name, "calendar")) {
+        type = CALENDAR;
+    } else {
+        return false;
+    }
+    return true;
+}
+
+const char*
+EventQueue::typeName(queue_type type) {
+    switch (type) {
+    case MULTIMAP:
+        return "multimap";
+    case HEAP:
+        return "heap";
+    case CALENDAR:
+        return "calendar";
+    }
+    abort();
+}
+
+/* same-time groups: a circular list through prev/next, in insertion
+   order, whose head is the one entry the index holds for that time.
+   Sequence numbers only grow, so a new event always goes at the end. */
+
+static inline void
+group_start(EventNode* head) {
+    head->prev = head;
+    head->next = head;
+}
+
+static inline void
+group_append(EventNode* head, EventNode* node) {
+    EventNode* tail = head->prev;
+    assert(tail->seq < node->seq);
+    node->pos = IN_GROUP;
+    node->prev = tail;
+    node->next = head;
+    tail->next = node;
+    head->prev = node;
+}
+
+// returns the node that followed, or NULL if the group is now empty
+static inline EventNode*
+group_unlink(EventNode* node) {
+    EventNode* next = node->next;
+    if (next == node)
+        return NULL;
+    node->prev->next = next;
+    next->prev = node->prev;
+    return next;
+}
+
+/* multimap: one entry per time, so the order among equal times is the
+   group's rather than whatever the tree does with equal keys */
+
+void
+MultimapEventQueue::insert(EventNode* node) {
+    pair<eventmap_t::iterator, bool> entry = _map.insert(make_pair(node->when, node));
+    if (entry.second) {
+        group_start(node);
+        node->pos = 0;
+        node->map_pos = entry.first;
+    } else {
+        group_append(entry.first->second, node);
+    }
+    _size++;
+}
+
+void
+MultimapEventQueue::removeHead(EventNode* head) {
+    EventNode* next = group_unlink(head);
+    if (next) {
+        next->pos = 0;
+        next->map_pos = head->map_pos;
+        next->map_pos->second = next;
+    } else {
+        _map.erase(head->map_pos);
+    }
+}
+
+EventNode*
+MultimapEventQueue::popMin() {
+    if (_map.empty())
+        return NULL;
+    EventNode* node = _map.begin()->second;
+    removeHead(node);
+    _size--;
+    return node;
+}
+
+simtime_picosec
+MultimapEventQueue::minTime() {
+    if (_map.empty())
+        return UINT64_MAX;
+    return _map.begin()->first;
+}
+
+void
+MultimapEventQueue::remove(EventNode* node) {
+    if (node->pos == IN_GROUP)
+        group_unlink(node);
+    else
+        removeHead(node);
+    _size--;
+}
+
+/* 4-ary heap: shallower than a binary heap, and the four children share
+   a cache line */
+
+void
+HeapEventQueue::siftUp(size_t pos) {
+    EventNode* node = _heap[pos];
+    while (pos > 0) {
+        size_t parent = (pos - 1) / ARITY;
+        if (!event_before(node, _heap[parent]))
+            break;
+        place(_heap[parent], pos);
+        pos = parent;
+    }
+    place(node, pos);
+}
+
+void
+HeapEventQueue::siftDown(size_t pos) {
+    EventNode* node = _heap[pos];
+    size_t n = _heap.size();
+    while (true) {
+        size_t first = pos * ARITY + 1;
+        if (first >= n)
+            break;
+        size_t best = first;
+        size_t last = std::min(first + ARITY, n);
+        for (size_t c = first + 1; c < last; c++) {
+            if (event_before(_heap[c], _heap[best]))
+                best = c;
+        }
+        if (!event_before(_heap[best], node))
+            break;
+        place(_heap[best], pos);
+        pos = best;
+    }
+    place(node, pos);
+}
+
+void
+HeapEventQueue::insert(EventNode* node) {
+    _size++;
+    // nodes are never freed, so a stale entry is safe to look at; it is
+    // only used if it is still at the top of a group of the same time
+    EventNode*& head = recent(node->when);
+    if (head && head->when == node->when && head->pos < _heap.size() && _heap[head->pos] == head) {
+        group_append(head, node);
+        return;
+    }
+    group_start(node);
+    _heap.push_back(node);
+    siftUp(_heap.size() - 1);
+    head = node;
+}
+
+void
+HeapEventQueue::removeHead(EventNode* head) {
+    size_t pos = head->pos;
+    assert(pos < _heap.size() && _heap[pos] == head);
+    EventNode* next = group_unlink(head);
+    if (next) {
+        // the rest of the group is due at the same time, so it takes the
+        // head's place; it only moves down if another group of that time
+        // has an earlier event
+        place(next, pos);
+        siftDown(pos);
+        EventNode*& slot = recent(head->when);
+        if (slot == head)
+            slot = next;
+        return;
+    }
+    EventNode* last = _heap.back();
+    _heap.pop_back();
+    if (pos == _heap.size())
+        return;
+    place(last, pos);
+    if (pos > 0 && event_before(last, _heap[(pos - 1) / ARITY]))
+        siftUp(pos);
+    else
+        siftDown(pos);
+}
+
+EventNode*
+HeapEventQueue::popMin() {
+    if (_heap.empty())
+        return NULL;
+    EventNode* top = _heap[0];
+    removeHead(top);
+    _size--;
+    return top;
+}
+
+simtime_picosec
+HeapEventQueue::minTime() {
+    if (_heap.empty())
+        return UINT64_MAX;
+    return _heap[0]->when;
+}
+
+void
+HeapEventQueue::remove(EventNode* node) {
+    if (node->pos == IN_GROUP)
+        group_unlink(node);
+    else
+        removeHead(node);
+    _size--;
+}
+
+/* calendar queue: a ring of buckets, each _width picoseconds of a
+   "year" wide, holding a list sorted by (time, seq).  Dequeue walks the
+   buckets from the last one used, taking the head of a bucket if it
+   falls in the current year.  The bucket count doubles or halves with
+   the number of events, and each resize sets the width to about three
+   times the gap between the earliest pending events, so most buckets
+   hold a few events whatever the link speeds. */
+
+CalendarEventQueue::CalendarEventQueue()
+    : _width(INITIAL_WIDTH), _size(0)
+{
+    _head.assign(MIN_BUCKETS, NULL);
+    _tail.assign(MIN_BUCKETS, NULL);
+    _mask = MIN_BUCKETS - 1;
+    _last_bucket = 0;
+    _bucket_top = _width;
+    _steps = 0;
+    _ops = 0;
+}
+
+void
+CalendarEventQueue::link(EventNode* node) {
+    size_t b = bucket(node->when);
+    node->pos = b;
+    // new events are mostly the latest in their bucket, so search from the tail
+    EventNode* after = _tail[b];
+    while (after && event_before(node, after)) {
+        after = after->prev;
+        _steps++;
+    }
+    node->prev = after;
+    if (after) {
+        node->next = after->next;
+        after->next = node;
+    } else {
+        node->next = _head[b];
+        _head[b] = node;
+    }
+    if (node->next)
+        node->next->prev = node;
+    else
+        _tail[b] = node;
+}
+
+void
+CalendarEventQueue::unlink(EventNode* node) {
+    size_t b = node->pos;
+    if (node->prev)
+        node->prev->next = node->next;
+    else
+        _head[b] = node->next;
+    if (node->next)
+        node->next->prev = node->prev;
+    else
+        _tail[b] = node->prev;
+}
+
+void
+CalendarEventQueue::insert(EventNode* node) {
+    link(node);
+    _size++;
+    // keep the search from starting after the new event
+    if (node->when < _bucket_top - _width) {
+        _last_bucket = node->pos;
+        _bucket_top = (node->when / _width + 1) * _width;
+    }
+    if (_size > 2 * (_mask + 1))
+        resize(2 * (_mask + 1));
+}
+
+EventNode*
+CalendarEventQueue::nextNode() {
+    if (_size == 0)
+        return NULL;
+    size_t b = _last_bucket;
+    simtime_picosec top = _bucket_top;
+    for (size_t n = 0; n <= _mask; n++) {
+        EventNode* head = _head[b];
+        _steps++;
+        if (head && head->when < top) {
+            _last_bucket = b;
+            _bucket_top = top;
+            return head;
+        }
+        b = (b + 1) & _mask;
+        top += _width;
+    }
+    // nothing in the coming year: jump straight to the earliest event
+    EventNode* best = NULL;
+    for (b = 0; b <= _mask; b++) {
+        if (_head[b] && (!best || event_before(_head[b], best)))
+            best = _head[b];
+    }
+    _steps += _mask + 1;
+    _last_bucket = best->pos;
+    _bucket_top = (best->when / _width + 1) * _width;
+    return best;
+}
+
+EventNode*
+CalendarEventQueue::popMin() {
+    EventNode* node = nextNode();
+    if (!node)
+        return NULL;
+    remove(node);
+    // the width suited the events when it was chosen; if the mix has
+    // changed enough to make operations slow, choose it again.  Checking
+    // no more often than every _size operations keeps this O(1) amortised.
+    if (++_ops >= std::max((size_t)4096, _size)) {
+        if (_steps > MAX_STEPS_PER_OP * _ops) {
+            resize(_mask + 1);
+        } else {
+            _steps = 0;
+            _ops = 0;
+        }
+    }
+    return node;
+}
+
+simtime_picosec
+CalendarEventQueue::minTime() {
+    EventNode* node = nextNode();
+    return node ? node->when : UINT64_MAX;
+}
+
+void
+CalendarEventQueue::remove(EventNode* node) {
+    unlink(node);
+    _size--;
+    if (_mask + 1 > MIN_BUCKETS && _size < (_mask + 1) / 2)
+        resize((_mask + 1) / 2);
+}
+
+void
+CalendarEventQueue::clear() {
+    _head.assign(MIN_BUCKETS, NULL);
+    _tail.assign(MIN_BUCKETS, NULL);
+    _mask = MIN_BUCKETS - 1;
+    _width = INITIAL_WIDTH;
+    _size = 0;
+    _last_bucket = 0;
+    _bucket_top = _width;
+    _steps = 0;
+    _ops = 0;
+}
+
+simtime_picosec
+CalendarEventQueue::estimateWidth(vector<EventNode*>& nodes) {
+    // sort the earliest events, taking more while they are nearly all
+    // at the same time
+    size_t k = 0;
+    size_t distinct = 0;
+    size_t want = WIDTH_SAMPLE;
+    while (k < nodes.size() && distinct < 3 && k < WIDTH_SAMPLE_MAX) {
+        k = std::min(want, nodes.size());
+        std::partial_sort(nodes.begin(), nodes.begin() + k, nodes.end(), event_before);
+        distinct = 1;
+        for (size_t i = 1; i < k; i++) {
+            if (nodes[i]->when != nodes[i - 1]->when)
+                distinct++;
+        }
+        want *= 4;
+    }
+    if (distinct < 2)
+        return _width; // all at the same time: nothing to learn
+
+    // Brown's estimate is three times the mean gap, leaving out gaps well
+    // above the mean.  Gaps of zero count as gaps, so that a bucket holds
+    // a few events however many share a timestamp, but only the nonzero
+    // gaps decide what is an outlier.
+    simtime_picosec span = nodes[k - 1]->when - nodes[0]->when;
+    simtime_picosec sum = 0;
+    size_t gaps = 0;
+    for (size_t i = 1; i < k; i++) {
+        simtime_picosec gap = nodes[i]->when - nodes[i - 1]->when;
+        if (gap * (distinct - 1) <= 2 * span) {
+            sum += gap;
+            gaps++;
+        }
+    }
+    if (sum == 0)
+        return _width;
+    return std::max((simtime_picosec)1, 3 * sum / gaps);
+}
+
+void
+CalendarEventQueue::resize(size_t buckets) {
+    vector<EventNode*> nodes;
+    nodes.reserve(_size);
+    for (size_t b = 0; b <= _mask; b++) {
+        for (EventNode* node = _head[b]; node; node = node->next)
+            nodes.push_back(node);
+    }
+    _width = estimateWidth(nodes);
+
+    _head.assign(buckets, NULL);
+    _tail.assign(buckets, NULL);
+    _mask = buckets - 1;
+    for (size_t i = 0; i < nodes.size(); i++)
+        link(nodes[i]);
+    // estimateWidth left the earliest event first
+    if (nodes.empty()) {
+        _last_bucket = 0;
+        _bucket_top = _width;
+    } else {
+        _last_bucket = nodes[0]->pos;
+        _bucket_top = (nodes[0]->when / _width + 1) * _width;
+    }
+    _steps = 0;
+    _ops = 0;
+}
@@ -0,0 +1,154 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef EVENTQUEUE_H
+#define EVENTQUEUE_H
+
+/*
+ * Scheduler backends for EventList.  All of them hand out events in
+ * (time, insertion order) order, so a simulation gives the same results
+ * whichever backend it runs on.
+ *
+ *   multimap   red-black tree keyed by time
+ *   heap       4-ary heap, O(log n) insert, pop and cancel
+ *   calendar   calendar queue (Brown 1988), O(1) expected insert and pop
+ *              when event times are spread over many buckets
+ *
+ * The tree holds one entry per distinct time, and the heap nearly always
+ * does.  Events due at the same time are kept in a ring in insertion order
+ * hanging off the first of them, so a burst of events at one timestamp (every flow
+ * starting at 0, say) costs the index a single entry, and dispatching or
+ * cancelling any one of them is O(1).  The calendar's sorted bucket lists
+ * already keep same-time events together in the same order.
+ */
+
+#include <map>
+#include <vector>
+#include "config.h"
+
+class EventSource;
+struct EventNode;
+
+typedef std::map<simtime_picosec, EventNode*> eventmap_t;
+
+// One pending event.  Nodes are pooled by EventList and never returned
+// to the system, so a stale pointer to one is still safe to read.
+struct EventNode {
+    simtime_picosec when;
+    uint64_t seq;        // insertion order, breaks ties in time; 0 while free
+    EventSource* src;
+    size_t pos;          // heap: index in the heap array; calendar: bucket;
+                         // multimap, heap: IN_GROUP if not first of its time
+    EventNode* prev;     // same-time ring or calendar bucket list; free list
+    EventNode* next;
+    EventNode* src_prev; // other pending events of the same source
+    EventNode* src_next;
+    eventmap_t::iterator map_pos; // multimap: this node's entry
+};
+
+static const size_t IN_GROUP = SIZE_MAX;
+
+inline bool event_before(const EventNode* a, const EventNode* b) {
+    return a->when < b->when || (a->when == b->when && a->seq < b->seq);
+}
+
+class EventQueue {
+public:
+    typedef enum {MULTIMAP, HEAP, CALENDAR} queue_type;
+
+    virtual ~EventQueue() {}
+    virtual void insert(EventNode* node) = 0;
+    virtual EventNode* popMin() = 0;            // NULL if empty
+    virtual simtime_picosec minTime() = 0;      // UINT64_MAX if empty
+    virtual void remove(EventNode* node) = 0;
+    virtual void clear() = 0;
+    virtual size_t size() const = 0;
+
+    static EventQueue* create(queue_type type);
+    // "multimap", "heap" or "calendar"; returns false for anything else
+    static bool parseType(const char* name, queue_type& type);
+    static const char* typeName(queue_type type);
+};
+
+class MultimapEventQueue : public EventQueue {
+public:
+    MultimapEventQueue() : _size(0) {}
+    virtual void insert(EventNode* node);
+    virtual EventNode* popMin();
+    virtual simtime_picosec minTime();
+    virtual void remove(EventNode* node);
+    virtual void clear() {_map.clear(); _size = 0;}
+    virtual size_t size() const {return _size;}
+private:
+    void removeHead(EventNode* head);
+    eventmap_t _map;
+    size_t _size;
+};
+
+class HeapEventQueue : public EventQueue {
+public:
+    HeapEventQueue() : _recent(RECENT_SLOTS, NULL), _size(0) {}
+    virtual void insert(EventNode* node);
+    virtual EventNode* popMin();
+    virtual simtime_picosec minTime();
+    virtual void remove(EventNode* node);
+    virtual void clear() {_heap.clear(); _recent.assign(RECENT_SLOTS, NULL); _size = 0;}
+    virtual size_t size() const {return _size;}
+private:
+    static const size_t ARITY = 4;
+    // same-time events find their group through a small table of recently
+    // started groups, indexed by a hash of the time.  Entries go stale
+    // rather than being removed, and a collision costs only coalescing:
+    // two groups at one time still come out in order.
+    static const size_t RECENT_SLOTS = 256;
+    void siftUp(size_t pos);
+    void siftDown(size_t pos);
+    void removeHead(EventNode* head);
+    inline void place(EventNode* node, size_t pos) {_heap[pos] = node; node->pos = pos;}
+    inline EventNode*& recent(simtime_picosec when) {
+        return _recent[(when * 0x9e3779b97f4a7c15ULL) >> 56];
+    }
+    std::vector<EventNode*> _heap;       // first event of each group
+    std::vector<EventNode*> _recent;
+    size_t _size;
+};
+
+class CalendarEventQueue : public EventQueue {
+public:
+    CalendarEventQueue();
+    virtual void insert(EventNode* node);
+    virtual EventNode* popMin();
+    virtual simtime_picosec minTime();
+    virtual void remove(EventNode* node);
+    virtual void clear();
+    virtual size_t size() const {return _size;}
+private:
+    // start with buckets about one 4KB packet at 100Gb/s wide; resizing
+    // re-estimates the width from the events actually pending.
+    static const simtime_picosec INITIAL_WIDTH = 320000;
+    static const size_t MIN_BUCKETS = 16;
+    // the width is estimated from at least this many of the earliest
+    // events, and more when they share timestamps, up to WIDTH_SAMPLE_MAX
+    static const size_t WIDTH_SAMPLE = 25;
+    static const size_t WIDTH_SAMPLE_MAX = 8192;
+    // re-estimate the width if an operation costs more than this many
+    // bucket or list steps on average
+    static const uint64_t MAX_STEPS_PER_OP = 8;
+
+    void link(EventNode* node);
+    void unlink(EventNode* node);
+    EventNode* nextNode();
+    void resize(size_t buckets);
+    simtime_picosec estimateWidth(vector<EventNode*>& nodes);
+    inline size_t bucket(simtime_picosec when) const {return (when / _width) & _mask;}
+
+    std::vector<EventNode*> _head;
+    std::vector<EventNode*> _tail;
+    size_t _mask;
+    simtime_picosec _width;
+    size_t _size;
+    size_t _last_bucket;       // where the search for the next event starts
+    simtime_picosec _bucket_top; // end of _last_bucket's current year
+    uint64_t _steps;           // work done since the last resize
+    uint64_t _ops;
+};
+
+#endif
@@ -90,6 +90,7 @@ FairCompositeQueue::completeService(){
     
   pkt->flow().logTraffic(*pkt,*this,TrafficLogger::PKT_DEPART);
   if (_logger) _logger->logQueue(*this, QueueLogger::PKT_SERVICE, *pkt);
+  _bytes_served += pkt->size();
   pkt->sendOn();
 
   _serv = QUEUE_INVALID;
@@ -68,22 +68,19 @@ FifoPullQueue<PullPkt>::flush_flow(flowid_t flow_id, int /*priority*/) {
 
 template<class PullPkt>
 FairPullQueue<PullPkt>::FairPullQueue() {
-    _current_queue = _queue_map.begin();
 }
 
 
 template<class PullPkt>
 void
 FairPullQueue<PullPkt>::enqueue(PullPkt& pkt, int /*priority*/) {
-    CircularBuffer<PullPkt*>* pull_queue;
-    if (queue_exists(pkt)) {
-            pull_queue = find_queue(pkt);
-    }  else {
-            pull_queue = create_queue(pkt);
-    }
+    uint32_t slot = find_slot(pkt.flow_id());
+    CircularBuffer<PullPkt*>* pull_queue = _queues[slot];
     //we add packets to the front,remove them from the back
     PullPkt* pkt_p = &pkt;
     pull_queue->push(pkt_p);
+    if (!_active.contains(slot))
+        _active.push_back(slot, pull_queue);
     this->_pull_count++;
 }
 
@@ -92,66 +89,56 @@ PullPkt*
 FairPullQueue<PullPkt>::dequeue() {
     if (this->_pull_count == 0)
         return 0;
-    while (1) {
-        if (_current_queue == _queue_map.end())
-            _current_queue = _queue_map.begin();
-        CircularBuffer <PullPkt*>* pull_queue = _current_queue->second;
-        _current_queue++;
-        if (!pull_queue->empty()) {
-            //we add packets to the front,remove them from the back
-            PullPkt* packet = pull_queue->pop();
-            this->_pull_count--;
-            return packet;
-        }
-        // there are packets queued, so we'll eventually find a queue
-        // that lets this terminate
-    }
+    CircularBuffer <PullPkt*>* pull_queue = _active.front();
+    //we add packets to the front,remove them from the back
+    PullPkt* packet = pull_queue->pop();
+    _active.served(!pull_queue->empty());
+    this->_pull_count--;
+    return packet;
 }
 
 template<class PullPkt>
 void
 FairPullQueue<PullPkt>::flush_flow(flowid_t flow_id, int /*priority*/) {
-    typename map <flowid_t, CircularBuffer<PullPkt*>*>::iterator i;
-    i = _queue_map.find(flow_id);
-    if (i == _queue_map.end())
+    auto i = _slots.find(flow_id);
+    if (i == _slots.end())
         return;
-    CircularBuffer<PullPkt*>* pull_queue = i->second;
+    uint32_t slot = i->second;
+    CircularBuffer<PullPkt*>* pull_queue = _queues[slot];
     while (!pull_queue->empty()) {
             PullPkt* packet = pull_queue->pop();
             packet->free();
             this->_pull_count--;
     }
-    if (_current_queue == i)
-        _current_queue++;
-    _queue_map.erase(i);
+    if (_active.contains(slot))
+        _active.remove(slot);
+    _active.reset(slot);
+    _slots.erase(i);
+    _free_slots.push_back(slot);
 }
 
 template<class PullPkt>
-bool 
-FairPullQueue<PullPkt>::queue_exists(const PullPkt& pkt) {
-    typename map <flowid_t, CircularBuffer<PullPkt*>*>::iterator i;
-    i = _queue_map.find(pkt.flow_id());
-    if (i == _queue_map.end())
-        return false;
-    return true;
-}
-
-template<class PullPkt>
-CircularBuffer<PullPkt*>* 
-FairPullQueue<PullPkt>::find_queue(const PullPkt& pkt) {
-    typename map <flowid_t, CircularBuffer<PullPkt*>*>::iterator i;
-    i = _queue_map.find(pkt.flow_id());
-    if (i == _queue_map.end())
-        return 0;
-    return i->second;
+void
+FairPullQueue<PullPkt>::set_flow_weight(flowid_t flow_id, uint32_t weight) {
+    _active.set_weight(find_slot(flow_id), weight);
 }
 
 template<class PullPkt>
-CircularBuffer<PullPkt*>* 
-FairPullQueue<PullPkt>::create_queue(const PullPkt& pkt) {
-    CircularBuffer<PullPkt*>* new_queue = new CircularBuffer<PullPkt*>;
-    _queue_map.insert(pair<flowid_t, CircularBuffer<PullPkt*>*>(pkt.flow_id(), new_queue));
-    return new_queue;
+uint32_t
+FairPullQueue<PullPkt>::find_slot(flowid_t flow_id) {
+    auto i = _slots.find(flow_id);
+    if (i != _slots.end())
+        return i->second;
+    uint32_t slot;
+    if (_free_slots.empty()) {
+        slot = _queues.size();
+        _queues.push_back(new CircularBuffer<PullPkt*>);
+    } else {
+        slot = _free_slots.back();
+        _free_slots.pop_back();
+    }
+    _slots[flow_id] = slot;
+    return slot;
 }
 
 template class BasePullQueue<NdpPull>;
@@ -7,10 +7,12 @@
  */
 
 #include <list>
+#include <unordered_map>
 #include "config.h"
 #include "eventlist.h"
 #include "network.h"
 #include "circular_buffer.h"
+#include "active_set.h"
 
 
 template<class PullPkt>
@@ -42,6 +44,11 @@ class FifoPullQueue : public BasePullQueue<PullPkt>{
     list <PullPkt*> _pull_queue; // needs insert middle, so can't use circular buffer
 };
 
+// Round robins between the flows with pulls queued, in the order they
+// got them.  Each flow's queue has a slot, reused once the flow is
+// flushed, and only flows with pulls queued are in the round robin, so
+// a dequeue costs the same however many flows are idle.  A flow given a
+// weight gets that many pulls per turn.
 template<class PullPkt>
 class FairPullQueue : public BasePullQueue<PullPkt>{
  public:
@@ -49,12 +56,15 @@ class FairPullQueue : public BasePullQueue<PullPkt>{
     virtual void enqueue(PullPkt& pkt, int priority = 0);
     virtual PullPkt* dequeue();
     virtual void flush_flow(flowid_t flow_id, int priority = 0);
+    void set_flow_weight(flowid_t flow_id, uint32_t weight);
+    // Jain's index of the pulls each flow got, divided by its weight
+    double fairness() const {return _active.fairness();}
  protected:
-    map<flowid_t, CircularBuffer<PullPkt*>*> _queue_map;  // map flow id to pull queue
-    bool queue_exists(const PullPkt& pkt);
-    CircularBuffer<PullPkt*>* find_queue(const PullPkt& pkt);
-    CircularBuffer<PullPkt*>* create_queue(const PullPkt& pkt);
-    typename map<flowid_t, CircularBuffer<PullPkt*>*>::iterator _current_queue;
+    unordered_map<flowid_t, uint32_t> _slots;  // map flow id to slot
+    vector<CircularBuffer<PullPkt*>*> _queues;  // pull queue by slot
+    vector<uint32_t> _free_slots;
+    ActiveSet<CircularBuffer<PullPkt*>*> _active; // slots with pulls queued
+    uint32_t find_slot(flowid_t flow_id);
 };
 
 #endif
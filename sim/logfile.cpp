@@ -1,6 +1,12 @@
 // -*- c-basic-offset: 4; indent-tabs-mode: nil -*-        
 #define _CRT_SECURE_NO_DEPRECATE  // For Visual Studio: this allows the unsafe operation fopen() without issuing a warning
 #include "logfile.h"
+#include "logsampler.h"
+#include <errno.h>
+#include <fcntl.h>
+#include <string.h>
+#include <unistd.h>
+#include <algorithm>
 #include <iostream>
 #include <sstream>
 #include <iomanip>
@@ -23,22 +29,35 @@ string RawLogEvent::str() {
 
 
 Logfile::Logfile(const string& filename, EventList& eventlist) 
-: _starttime(0), _eventlist(eventlist), 
+: _starttime(0), _eventlist(eventlist), _sampler(NULL),
   _preamble(ios_base::out | ios_base::in), 
-  _logfilename(filename), _numRecords(0)
+  _logfilename(filename), _numRecords(0), _written_records(0),
+  _offset(LOGFILE_HEADER_SIZE), _buf_used(0), _threaded(false), _stopping(false)
 {
-    _logfile = fopen(_logfilename.c_str(), "wbS");
-    if (_logfile==NULL) {
+    _fd = open(_logfilename.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0644);
+    if (_fd < 0) {
         cerr << "Failed to open logfile " << _logfilename << endl;
         exit(1);
     }
+    _buf = allocBuffer();
+    writeHeader(0, 0, 0);
 }
 
 Logfile::~Logfile() {
-    if (_logfile != NULL) {
-        fclose(_logfile);
-        transposeLog();
+    close();
+    for (size_t i = 0; i < _buffers.size(); i++)
+        free(_buffers[i]);
+}
+
+char*
+Logfile::allocBuffer() {
+    void* buf;
+    if (posix_memalign(&buf, 4096, LOGFILE_BUFFER_SIZE) != 0) {
+        cerr << "Failed to allocate logfile buffer" << endl;
+        exit(1);
     }
+    _buffers.push_back((char*)buf);
+    return (char*)buf;
 }
 
 void
@@ -63,88 +82,191 @@ Logfile::setStartTime(simtime_picosec starttime) {
     _starttime=starttime;
 }
 
+void
+Logfile::setFlushThread(bool enable) {
+    if (enable == _threaded || _fd < 0)
+        return;
+    if (enable) {
+        while (_free.size() < LOGFILE_FLUSH_BUFFERS - 1)
+            _free.push_back(allocBuffer());
+        _stopping = false;
+        _threaded = true;
+        _flush_thread = std::thread(&Logfile::flushThread, this);
+    } else {
+        {
+            std::lock_guard<std::mutex> lock(_flush_mutex);
+            _stopping = true;
+        }
+        _flush_cond.notify_all();
+        _flush_thread.join();
+        _threaded = false;
+    }
+}
+
+void
+Logfile::branch(const string& filename) {
+    assert(!_threaded);
+    int in = open(_logfilename.c_str(), O_RDONLY);
+    int out = open(filename.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0644);
+    if (in < 0 || out < 0) {
+        cerr << "Failed to branch logfile " << _logfilename << " to " << filename << endl;
+        exit(1);
+    }
+    ::close(_fd);
+    _fd = out;
+    _logfilename = filename;
+    // the header and the records on disk so far; the rest are in memory.
+    // Until the first records are written the file is just the header.
+    vector<char> buf(1 << 20);
+    uint64_t done = 0;
+    while (done < _offset) {
+        ssize_t n = pread(in, buf.data(), min((uint64_t)buf.size(), _offset - done), done);
+        if (n == 0)
+            break;
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            cerr << "Failed to read logfile while branching: " << strerror(errno) << endl;
+            exit(1);
+        }
+        writeAt(buf.data(), n, done);
+        done += n;
+    }
+    ::close(in);
+}
+
+void
+Logfile::setSampler(LogSampler* sampler) {
+    _sampler = sampler && sampler->enabled() ? sampler : NULL;
+}
+
 void
 Logfile::writeRecord(uint32_t type, uint32_t id, uint32_t ev, 
                      double val1, double val2, double val3) {
     uint64_t time = _eventlist.now();
     if (time<_starttime) return;
+    if (_sampler && !_sampler->keep(time, type, id, ev, val1, val2, val3))
+        return;
+    appendRecord(time, type, id, ev, val1, val2, val3);
+}
+
+void
+Logfile::writeFlowRecord(uint64_t flow_id, uint32_t type, uint32_t id, uint32_t ev,
+                         double val1, double val2, double val3) {
+    uint64_t time = _eventlist.now();
+    if (time<_starttime) return;
+    if (_sampler && !_sampler->keepFlow(flow_id, time, type, id, ev, val1, val2, val3))
+        return;
+    appendRecord(time, type, id, ev, val1, val2, val3);
+}
+
+void
+Logfile::appendRecord(simtime_picosec time, uint32_t type, uint32_t id, uint32_t ev,
+                      double val1, double val2, double val3) {
+    if (_buf_used + LOGFILE_RECORD_SIZE > LOGFILE_BUFFER_SIZE)
+        flushBuffer();
     double time_sec = timeAsSec(time);
-    fwrite(&time_sec, sizeof(double), 1, _logfile);
-    fwrite(&type, sizeof(uint32_t), 1, _logfile);
-    fwrite(&id, sizeof(uint32_t), 1, _logfile);
-    fwrite(&ev, sizeof(uint32_t), 1, _logfile);
-    fwrite(&val1, sizeof(double), 1, _logfile);
-    fwrite(&val2, sizeof(double), 1, _logfile);
-    fwrite(&val3, sizeof(double), 1, _logfile);
+    uint32_t ev_abs = ev + 100*type;
+    char* rec = _buf + _buf_used;
+    memcpy(rec, &time_sec, 8);
+    memcpy(rec + 8, &type, 4);
+    memcpy(rec + 12, &id, 4);
+    memcpy(rec + 16, &ev_abs, 4);
+    memcpy(rec + 20, &val1, 8);
+    memcpy(rec + 28, &val2, 8);
+    memcpy(rec + 36, &val3, 8);
+    _buf_used += LOGFILE_RECORD_SIZE;
     _numRecords++;
 }
 
 void
-Logfile::transposeLog() {
-    double* timeRec = new double[_numRecords];
-    uint32_t* typeRec = new uint32_t[_numRecords];
-    uint32_t* idRec = new uint32_t[_numRecords];
-    uint32_t* evRec = new uint32_t[_numRecords];
-    double* val1Rec = new double[_numRecords];
-    double* val2Rec = new double[_numRecords];
-    double *val3Rec = new double[_numRecords];
-    FILE* logfile;
-    logfile = fopen(_logfilename.c_str(),"rbS");
-    if (logfile==NULL) {
-        cerr << "Failed to open logfile " << _logfilename << endl;
-        exit(1);
-    }
-    size_t read;
-    double rd;
-    uint32_t ri;
-    int numread;
-    for (numread=0; numread<_numRecords; numread++) {
-        read = fread(&rd, sizeof(double), 1, logfile); if (read<1) break;
-        timeRec[numread] = rd;
-        read = fread(&ri, sizeof(uint32_t), 1, logfile); if (read<1) break;
-        typeRec[numread] = ri;
-        read = fread(&ri, sizeof(uint32_t), 1, logfile); if (read<1) break;
-        idRec[numread] = ri;
-        read = fread(&ri, sizeof(uint32_t), 1, logfile); if (read<1) break;
-        evRec[numread] = ri + 100*typeRec[numread];
-        read = fread(&rd, sizeof(double), 1, logfile); if (read<1) break;
-        val1Rec[numread] = rd;
-        read = fread(&rd, sizeof(double), 1, logfile); if (read<1) break;
-        val2Rec[numread] = rd;
-        read = fread(&rd, sizeof(double), 1, logfile); if (read<1) break;
-        val3Rec[numread] = rd;
-    }
-    fclose(logfile);
-    assert(numread==_numRecords);
-    _preamble << "# numrecords=" << numread << endl;
-    logfile = fopen(_logfilename.c_str(),"wbS");
-    if (logfile==0) {
-        cerr << "Failed to open logfile " << _logfilename << endl;
-        exit(1);
+Logfile::flushBuffer() {
+    if (_buf_used == 0)
+        return;
+    if (!_threaded) {
+        writeBuffer(_buf, _buf_used);
+        _buf_used = 0;
+        return;
     }
+    std::unique_lock<std::mutex> lock(_flush_mutex);
+    _full.push_back(std::make_pair(_buf, _buf_used));
+    _flush_cond.notify_all();
+    // only waits if the disk can't keep up
+    _flush_cond.wait(lock, [this] {return !_free.empty();});
+    _buf = _free.back();
+    _free.pop_back();
+    _buf_used = 0;
+}
+
+void
+Logfile::flushThread() {
+    std::unique_lock<std::mutex> lock(_flush_mutex);
     while (true) {
-        if (_preamble.peek()==-1) break;
-        char thisLine[1000];
-        _preamble.getline(&thisLine[0],1000);
-        fputs(thisLine, logfile);
-        fputs("\n", logfile);
+        _flush_cond.wait(lock, [this] {return _stopping || !_full.empty();});
+        if (_full.empty())
+            return; // stopping, and everything is written
+        std::pair<char*, size_t> buf = _full.front();
+        _full.pop_front();
+        lock.unlock();
+        writeBuffer(buf.first, buf.second);
+        lock.lock();
+        _free.push_back(buf.first);
+        _flush_cond.notify_all();
     }
-    fputs("# transpose=0\n",logfile);
-    fputs("# TRACE\n",logfile);
-    for (int i=0; i < numread; i++) {
-        fwrite(&timeRec[i], sizeof(double), 1, logfile);
-        fwrite(&typeRec[i], sizeof(uint32_t), 1, logfile);
-        fwrite(&idRec[i],   sizeof(uint32_t), 1, logfile);
-        fwrite(&evRec[i],   sizeof(uint32_t), 1, logfile);
-        fwrite(&val1Rec[i], sizeof(double), 1, logfile);
-        fwrite(&val2Rec[i], sizeof(double), 1, logfile);
-        fwrite(&val3Rec[i], sizeof(double), 1, logfile);
+}
+
+void
+Logfile::writeAt(const char* buf, size_t len, uint64_t offset) {
+    size_t done = 0;
+    while (done < len) {
+        ssize_t n = pwrite(_fd, buf + done, len - done, offset + done);
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            cerr << "Failed to write logfile " << _logfilename << ": " << strerror(errno) << endl;
+            exit(1);
+        }
+        done += n;
     }
-    fclose(logfile);
-    delete[] timeRec;
-    delete[] typeRec;
-    delete[] idRec;
-    delete[] evRec;
-    delete[] val1Rec;
-    delete[] val2Rec;
+}
+
+void
+Logfile::writeBuffer(char* buf, size_t len) {
+    writeAt(buf, len, _offset);
+    _offset += len;
+    _written_records += len / LOGFILE_RECORD_SIZE;
+    writeHeader(0, 0, 0);
+}
+
+void
+Logfile::writeHeader(uint32_t flags, uint64_t preamble_offset, uint64_t preamble_length) {
+    // the count is only ever of records already on disk
+    LogfileHeader header;
+    memset(&header, 0, sizeof(header));
+    memcpy(header.magic, LOGFILE_MAGIC, sizeof(header.magic));
+    header.version = LOGFILE_VERSION;
+    header.header_size = LOGFILE_HEADER_SIZE;
+    header.record_size = LOGFILE_RECORD_SIZE;
+    header.flags = flags;
+    header.num_records = _written_records;
+    header.preamble_offset = preamble_offset;
+    header.preamble_length = preamble_length;
+    writeAt((const char*)&header, sizeof(header), 0);
+}
+
+void
+Logfile::close() {
+    if (_fd < 0)
+        return;
+    setFlushThread(false);
+    if (_sampler)
+        _sampler->flush(*this);
+    flushBuffer();
+    assert(_written_records == (uint64_t)_numRecords);
+
+    string preamble = _preamble.str();
+    writeAt(preamble.data(), preamble.size(), _offset);
+    writeHeader(LOGFILE_COMPLETE, _offset, preamble.size());
+    ::close(_fd);
+    _fd = -1;
 }
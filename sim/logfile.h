@@ -7,10 +7,37 @@
  * The loggers (loggers.h) face both
  *  1. the log file, using the base class Logger (defined here)
  *  2. the simulator, using the base classes in loggertypes.h
+ *
+ * File format, all fields little-endian:
+ *
+ *   header (LOGFILE_HEADER_SIZE bytes)
+ *     0   magic "HTSIMLOG"
+ *     8   version (uint32), header size (uint32)
+ *     16  record size (uint32), flags (uint32): 1 once the file is complete
+ *     24  number of records (uint64)
+ *     32  offset of the preamble (uint64), 0 until the file is complete
+ *     40  length of the preamble (uint64)
+ *   records, packed, LOGFILE_RECORD_SIZE bytes each
+ *     time in seconds (double), type, id, ev + 100*type (uint32),
+ *     val1, val2, val3 (double)
+ *   preamble: the text given to write() and writeName()
+ *
+ * Records are streamed out in large buffers as they are logged, and the
+ * record count in the header is updated in place after every buffer, so
+ * a run that dies still leaves a readable trace.  Older versions wrote
+ * the preamble first, ending in "# TRACE", and rewrote the whole file at
+ * exit; parse_output reads both.
+ *
+ * With a LogSampler (logsampler.h) only some records are written; the
+ * ones its reservoir holds come last, when the file is closed.
  */
 
+#include <condition_variable>
+#include <deque>
 #include <fstream>
+#include <mutex>
 #include <sstream>
+#include <thread>
 #include <vector>
 #include <string>
 #include "config.h"
@@ -19,6 +46,28 @@
 
 class Logfile;
 class Logger;
+class LogSampler;
+
+#define LOGFILE_MAGIC "HTSIMLOG"
+#define LOGFILE_VERSION 2
+#define LOGFILE_HEADER_SIZE 4096
+#define LOGFILE_RECORD_SIZE 44
+// a whole number of both records and pages, about 4MB
+#define LOGFILE_BUFFER_SIZE (LOGFILE_RECORD_SIZE * 4096 * 24)
+#define LOGFILE_FLUSH_BUFFERS 4
+
+struct LogfileHeader {
+    char magic[8];
+    uint32_t version;
+    uint32_t header_size;
+    uint32_t record_size;
+    uint32_t flags;
+    uint64_t num_records;
+    uint64_t preamble_offset;
+    uint64_t preamble_length;
+};
+
+enum {LOGFILE_COMPLETE = 1};
 
 class RawLogEvent {
  public:
@@ -44,18 +93,58 @@ class Logfile {
     void writeName(Logged& logged);
     void writeRecord(uint32_t type, uint32_t id, uint32_t ev, 
                      double val1, double val2, double val3); // prepend uint64_t time
+    // a per-packet record of flow_id, which flow sampling may leave out
+    void writeFlowRecord(uint64_t flow_id, uint32_t type, uint32_t id, uint32_t ev,
+                         double val1, double val2, double val3);
+    // sample records rather than writing them all; NULL writes them all
+    void setSampler(LogSampler* sampler);
     void addLogger(Logger& logger);
+    // write full buffers from a background thread, so the simulation
+    // does not wait for the disk
+    void setFlushThread(bool enable);
+    bool hasFlushThread() const {return _threaded;}
+    // carry on in a copy of the file under a new name, for a process
+    // forked from this one (see checkpoint.h); the flush thread must be
+    // stopped
+    void branch(const string& filename);
+    // write out the remaining records and the preamble; the destructor
+    // does this if it has not been done
+    void close();
     simtime_picosec _starttime;
  private:
+    friend class LogSampler;
     EventList& _eventlist;
     vector<Logger*> _loggers;
+    LogSampler* _sampler;
+    void appendRecord(simtime_picosec time, uint32_t type, uint32_t id, uint32_t ev,
+                      double val1, double val2, double val3);
     // managing the files for writing
-    void transposeLog();
+    void flushBuffer();
+    void writeBuffer(char* buf, size_t len);
+    void writeAt(const char* buf, size_t len, uint64_t offset);
+    void writeHeader(uint32_t flags, uint64_t preamble_offset, uint64_t preamble_length);
+    void flushThread();
+    char* allocBuffer();
     stringstream _preamble;
     string _logfilename;
-    FILE* _logfile;
-    //bool _startedTrace;
+    int _fd;
     long int _numRecords;
+    uint64_t _written_records; // records on disk
+    uint64_t _offset;          // where the next buffer goes
+
+    char* _buf;
+    size_t _buf_used;
+
+    // background flushing: full buffers wait in _full for the thread,
+    // which returns them to _free once written
+    std::thread _flush_thread;
+    std::mutex _flush_mutex;
+    std::condition_variable _flush_cond;
+    std::deque<std::pair<char*, size_t>> _full;
+    vector<char*> _free;
+    vector<char*> _buffers;
+    bool _threaded;
+    bool _stopping;
 };
 
 #endif
@@ -29,11 +29,26 @@ string Logger::event_to_str(RawLogEvent& event) {
 }
 
 QueueLoggerFactory::QueueLoggerFactory(Logfile* lg, QueueLoggerType logtype, EventList& eventlist)
-    :_logfile(lg), _logger_type(logtype), _eventlist(eventlist)
+    :_logfile(lg), _logger_type(logtype), _eventlist(eventlist),
+     _deferred(false), _requested(0), _deferred_logger(*this)
 {
 };
 
 QueueLogger *QueueLoggerFactory::createQueueLogger() {
+    _requested++;
+    if (_deferred)
+        return &_deferred_logger;
+    return buildQueueLogger();
+}
+
+void QueueLoggerFactory::DeferredQueueLogger::logQueue(BaseQueue& queue, QueueEvent ev, Packet& pkt) {
+    // from now on the queue logs straight to its own logger
+    QueueLogger* logger = _factory.buildQueueLogger();
+    queue.setLogger(logger);
+    logger->logQueue(queue, ev, pkt);
+}
+
+QueueLogger *QueueLoggerFactory::buildQueueLogger() {
     QueueLogger* queue_logger = 0;
     switch(_logger_type) {
     case LOGGER_SIMPLE:
@@ -59,7 +74,7 @@ QueueLogger *QueueLoggerFactory::createQueueLogger() {
 
 void QueueLoggerSimple::logQueue(BaseQueue& queue, QueueLogger::QueueEvent ev, 
                                  Packet& pkt) {
-    _logfile->writeRecord(Logger::QUEUE_EVENT,
+    _logfile->writeFlowRecord(pkt.flow().get_id(), Logger::QUEUE_EVENT,
                           queue.get_id(), ev, 
                           (double)queue.queuesize(),
                           pkt.flow().get_id(),
@@ -436,7 +451,7 @@ string FlowEventLoggerSimple::event_to_str(RawLogEvent& event) {
 
 void TrafficLoggerSimple::logTraffic(Packet& pkt, Logged& location, 
                                      TrafficEvent ev) {
-    _logfile->writeRecord(Logger::TRAFFIC_EVENT,
+    _logfile->writeFlowRecord(pkt.flow().get_id(), Logger::TRAFFIC_EVENT,
                           location.get_id(),
                           ev,
                           pkt.flow().get_id(),
@@ -485,7 +500,7 @@ string TrafficLoggerSimple::event_to_str(RawLogEvent& event) {
 
 void TcpTrafficLogger::logTraffic(Packet& pkt, Logged& location, 
                                   TrafficEvent ev) {
-    _logfile->writeRecord(Logger::TCP_TRAFFIC,
+    _logfile->writeFlowRecord(pkt.flow().get_id(), Logger::TCP_TRAFFIC,
                           location.get_id(),
                           ev,
                           pkt.flow().get_id(),
@@ -535,7 +550,7 @@ string TcpTrafficLogger::event_to_str(RawLogEvent& event) {
 
 void SwiftTrafficLogger::logTraffic(Packet& pkt, Logged& location, 
                                     TrafficEvent ev) {
-    _logfile->writeRecord(Logger::SWIFT_TRAFFIC,
+    _logfile->writeFlowRecord(pkt.flow().get_id(), Logger::SWIFT_TRAFFIC,
                           location.get_id(),
                           ev,
                           pkt.flow().get_id(),
@@ -585,7 +600,7 @@ string SwiftTrafficLogger::event_to_str(RawLogEvent& event) {
 
 void STrackTrafficLogger::logTraffic(Packet& pkt, Logged& location, 
                                      TrafficEvent ev) {
-    _logfile->writeRecord(Logger::STRACK_TRAFFIC,
+    _logfile->writeFlowRecord(pkt.flow().get_id(), Logger::STRACK_TRAFFIC,
                           location.get_id(),
                           ev,
                           pkt.flow().get_id(),
@@ -659,7 +674,7 @@ void NdpTrafficLogger::logTraffic(Packet& pkt, Logged& location,
         }
     }
     
-    _logfile->writeRecord(Logger::NDP_TRAFFIC,
+    _logfile->writeFlowRecord(p.flow().get_id(), Logger::NDP_TRAFFIC,
                           location.get_id(),
                           ev,
                           p.flow().get_id(),
@@ -747,7 +762,7 @@ void RoceTrafficLogger::logTraffic(Packet& pkt, Logged& location, TrafficEvent e
     if (p.header_only())
         val3 |= ROCE_IS_HEADER;
     
-    _logfile->writeRecord(Logger::ROCE_TRAFFIC,
+    _logfile->writeFlowRecord(p.flow().get_id(), Logger::ROCE_TRAFFIC,
                           location.get_id(),
                           ev,
                           p.flow().get_id(),
@@ -830,7 +845,7 @@ void HPCCTrafficLogger::logTraffic(Packet& pkt, Logged& location, TrafficEvent e
     if (p.header_only())
         val3 |= HPCC_IS_HEADER;
     
-    _logfile->writeRecord(Logger::HPCC_TRAFFIC,
+    _logfile->writeFlowRecord(p.flow().get_id(), Logger::HPCC_TRAFFIC,
                           location.get_id(),
                           ev,
                           p.flow().get_id(),
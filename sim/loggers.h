@@ -103,12 +103,32 @@ public:
     void set_sample_period(simtime_picosec sample_period) {
         _sample_period = sample_period;
     }
+    // hand out a stand-in that builds a queue's logger when the queue
+    // first logs something, so ports that never see a packet cost nothing.
+    // Sampling then starts from the first packet rather than from time 0.
+    void set_deferred(bool deferred) {
+        _deferred = deferred;
+    }
+    uint64_t loggers_requested() const {return _requested;}
+    uint64_t loggers_built() const {return _loggers.size();}
 private:
+    class DeferredQueueLogger : public QueueLogger {
+    public:
+        DeferredQueueLogger(QueueLoggerFactory& factory) : _factory(factory) {}
+        virtual void logQueue(BaseQueue& queue, QueueEvent ev, Packet& pkt);
+    private:
+        QueueLoggerFactory& _factory;
+    };
+    QueueLogger* buildQueueLogger();
+
     Logfile* _logfile;
     QueueLoggerType _logger_type;
     simtime_picosec _sample_period;
     EventList& _eventlist;
     vector <QueueLogger*> _loggers;
+    bool _deferred;
+    uint64_t _requested;
+    DeferredQueueLogger _deferred_logger;
 };
 
 class QueueLoggerSimple : public QueueLogger {
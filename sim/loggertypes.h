@@ -68,7 +68,7 @@ class Logger {
                      STRACK_SINK=32, STRACK_MEMORY=33,
                      EQDS_EVENT=38, EQDS_STATE=39, EQDS_RECORD=40,
                      EQDS_SINK = 41, EQDS_MEMORY = 42, EQDS_TRAFFIC = 43,
-                     FLOW_EVENT = 44 };
+                     FLOW_EVENT = 44, SINK_STATS = 45 };
     static string event_to_str(RawLogEvent& event);
     Logger() {};
     virtual ~Logger(){};
@@ -0,0 +1,201 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include "logsampler.h"
+#include <stdlib.h>
+#include <string.h>
+#include <algorithm>
+#include <iostream>
+#include <sstream>
+#include "logfile.h"
+#include "loggertypes.h"
+
+LogSampler::LogSampler()
+    : _enabled(false), _flow_fraction(1.0), _flow_threshold(UINT64_MAX), _seed(0),
+      _reservoir_capacity(0), _reservoir_seen(0), _rng(0)
+{
+    Counter c = {1.0, 0.0, 0, 0};
+    _counters.assign(MAX_TYPES * MAX_EVS, c);
+}
+
+void
+LogSampler::setRate(int type, int ev, double rate) {
+    if (type < 0 || type >= (int)MAX_TYPES || ev >= (int)MAX_EVS || rate < 0 || rate > 1) {
+        cerr << "Bad log sampling rate " << rate << " for type " << type << " ev " << ev << endl;
+        exit(1);
+    }
+    for (uint32_t e = 0; e < MAX_EVS; e++) {
+        if (ev < 0 || (uint32_t)ev == e)
+            _counters[type * MAX_EVS + e].rate = rate;
+    }
+    _enabled = true;
+}
+
+void
+LogSampler::setFlowFraction(double fraction) {
+    if (fraction < 0 || fraction > 1) {
+        cerr << "Bad log flow fraction " << fraction << endl;
+        exit(1);
+    }
+    _flow_fraction = fraction;
+    // 2^64 doesn't fit, so a fraction of 1 keeps everything explicitly
+    _flow_threshold = fraction >= 1 ? UINT64_MAX : (uint64_t)(fraction * 18446744073709551616.0);
+    _enabled = true;
+}
+
+void
+LogSampler::setReservoir(size_t capacity) {
+    _reservoir_capacity = capacity;
+    _reservoir.reserve(capacity);
+    _enabled = true;
+}
+
+void
+LogSampler::setSeed(uint64_t seed) {
+    _seed = seed;
+    _rng.seed(seed);
+}
+
+bool
+LogSampler::parseArg(int argc, char** argv, int& i) {
+    if (!strcmp(argv[i], "-log_rate") && i + 2 < argc) {
+        // TYPE or TYPE:EV, then the fraction to keep
+        int type = atoi(argv[i+1]);
+        const char* colon = strchr(argv[i+1], ':');
+        int ev = colon ? atoi(colon + 1) : -1;
+        setRate(type, ev, atof(argv[i+2]));
+        i += 2;
+    } else if (!strcmp(argv[i], "-log_flows") && i + 1 < argc) {
+        setFlowFraction(atof(argv[i+1]));
+        i++;
+    } else if (!strcmp(argv[i], "-log_reservoir") && i + 1 < argc) {
+        setReservoir(atoll(argv[i+1]));
+        i++;
+    } else if (!strcmp(argv[i], "-log_sample_seed") && i + 1 < argc) {
+        setSeed(atoll(argv[i+1]));
+        i++;
+    } else {
+        return false;
+    }
+    return true;
+}
+
+const char*
+LogSampler::usage() {
+    return "\t[-log_rate type[:ev] fraction] keep this fraction of a record type\n"
+        "\t[-log_flows fraction] log packets of this fraction of flows\n"
+        "\t[-log_reservoir n] keep a uniform sample of n drop/trim/bounce records\n"
+        "\t[-log_sample_seed s] seed for flow and reservoir sampling";
+}
+
+bool
+LogSampler::isLossEvent(uint32_t type, uint32_t ev) {
+    switch (type) {
+    case Logger::QUEUE_EVENT:
+        return ev == QueueLogger::PKT_DROP || ev == QueueLogger::PKT_TRIM || ev == QueueLogger::PKT_BOUNCE;
+    case Logger::TRAFFIC_EVENT:
+    case Logger::TCP_TRAFFIC:
+    case Logger::NDP_TRAFFIC:
+    case Logger::SWIFT_TRAFFIC:
+    case Logger::STRACK_TRAFFIC:
+    case Logger::ROCE_TRAFFIC:
+    case Logger::HPCC_TRAFFIC:
+    case Logger::EQDS_TRAFFIC:
+        return ev == TrafficLogger::PKT_DROP || ev == TrafficLogger::PKT_TRIM || ev == TrafficLogger::PKT_BOUNCE;
+    default:
+        return false;
+    }
+}
+
+LogSampler::Counter*
+LogSampler::counter(uint32_t type, uint32_t ev) {
+    if (type >= MAX_TYPES || ev >= MAX_EVS)
+        return NULL;
+    return &_counters[type * MAX_EVS + ev];
+}
+
+bool
+LogSampler::sample(Counter& c) {
+    c.seen++;
+    if (c.rate >= 1)
+        return true;
+    c.credit += c.rate;
+    if (c.credit < 1)
+        return false;
+    c.credit -= 1;
+    return true;
+}
+
+bool
+LogSampler::hold(const HeldRecord& rec) {
+    _reservoir_seen++;
+    if (_reservoir.size() < _reservoir_capacity) {
+        _reservoir.push_back(rec);
+    } else {
+        uint64_t slot = std::uniform_int_distribution<uint64_t>(0, _reservoir_seen - 1)(_rng);
+        if (slot < _reservoir_capacity)
+            _reservoir[slot] = rec;
+    }
+    return false;
+}
+
+bool
+LogSampler::keep(simtime_picosec time, uint32_t type, uint32_t id, uint32_t ev,
+                 double val1, double val2, double val3) {
+    Counter* c = counter(type, ev);
+    if (c && !sample(*c))
+        return false;
+    if (_reservoir_capacity > 0 && isLossEvent(type, ev)) {
+        HeldRecord rec = {time, type, id, ev, val1, val2, val3};
+        return hold(rec);
+    }
+    if (c)
+        c->kept++;
+    return true;
+}
+
+bool
+LogSampler::keepFlow(uint64_t flow_id, simtime_picosec time, uint32_t type, uint32_t id, uint32_t ev,
+                     double val1, double val2, double val3) {
+    if (_flow_threshold != UINT64_MAX) {
+        // splitmix64 finaliser: consecutive flow IDs land far apart
+        uint64_t h = flow_id + _seed * 0x9e3779b97f4a7c15ULL;
+        h = (h ^ (h >> 30)) * 0xbf58476d1ce4e5b9ULL;
+        h = (h ^ (h >> 27)) * 0x94d049bb133111ebULL;
+        h ^= h >> 31;
+        if (h >= _flow_threshold) {
+            Counter* c = counter(type, ev);
+            if (c)
+                c->seen++;
+            return false;
+        }
+    }
+    return keep(time, type, id, ev, val1, val2, val3);
+}
+
+void
+LogSampler::flush(Logfile& logfile) {
+    if (!_enabled)
+        return;
+    std::stable_sort(_reservoir.begin(), _reservoir.end(),
+                     [](const HeldRecord& a, const HeldRecord& b) {return a.time < b.time;});
+    for (size_t i = 0; i < _reservoir.size(); i++) {
+        const HeldRecord& r = _reservoir[i];
+        logfile.appendRecord(r.time, r.type, r.id, r.ev, r.val1, r.val2, r.val3);
+        counter(r.type, r.ev)->kept++;
+    }
+    _reservoir.clear();
+
+    stringstream ss;
+    ss << "# sampling flows=" << _flow_fraction << " reservoir=" << _reservoir_capacity
+       << " reservoir_seen=" << _reservoir_seen << " seed=" << _seed;
+    logfile.write(ss.str());
+    for (uint32_t type = 0; type < MAX_TYPES; type++) {
+        for (uint32_t ev = 0; ev < MAX_EVS; ev++) {
+            const Counter& c = _counters[type * MAX_EVS + ev];
+            if (c.seen == 0)
+                continue;
+            ss.str("");
+            ss << "# sampled type=" << type << " ev=" << ev << " seen=" << c.seen << " kept=" << c.kept;
+            logfile.write(ss.str());
+        }
+    }
+}
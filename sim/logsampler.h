@@ -0,0 +1,94 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef LOGSAMPLER_H
+#define LOGSAMPLER_H
+
+/*
+ * LogSampler decides which records a Logfile keeps, so that packet level
+ * loggers stay usable on large fabrics.  Three policies, all optional:
+ *
+ *   rates      keep a fraction of the records of a given (type, ev), or of
+ *              every ev of a type.  Records are kept at evenly spaced
+ *              counts rather than at random, so a run is repeatable and
+ *              the simulation's random numbers are untouched.
+ *   flows      keep the per-packet records of a fixed fraction of flows,
+ *              chosen by hashing the flow ID, so a sampled flow is logged
+ *              at every hop.
+ *   reservoir  hold drop, trim and bounce records in a fixed size
+ *              reservoir (Vitter's algorithm R) and write them when the
+ *              file is closed, so a storm of losses can't fill the disk.
+ *
+ * The policies compose: a flow record must pass the flow test, then the
+ * rate.  For every (type, ev) seen, the number of records offered and kept
+ * is written to the preamble as
+ *     # sampled type=T ev=E seen=S kept=K
+ * so analysis can scale counts by S/K; parse_output -sampling lists them.
+ */
+
+#include <random>
+#include <string>
+#include <vector>
+#include "config.h"
+
+class Logfile;
+
+class LogSampler {
+public:
+    LogSampler();
+
+    // keep this fraction of the records of (type, ev); ev < 0 means all of them
+    void setRate(int type, int ev, double rate);
+    // keep the flow records of this fraction of flows
+    void setFlowFraction(double fraction);
+    // hold at most this many loss records, chosen uniformly; 0 turns it off
+    void setReservoir(size_t capacity);
+    void setSeed(uint64_t seed);
+
+    // handles -log_rate, -log_flows, -log_reservoir and -log_sample_seed,
+    // leaving i on the last argument used
+    bool parseArg(int argc, char** argv, int& i);
+    static const char* usage();
+
+    bool enabled() const {return _enabled;}
+    // whether to write a record straight away; loss records the reservoir
+    // takes are held for flush()
+    bool keep(simtime_picosec time, uint32_t type, uint32_t id, uint32_t ev,
+              double val1, double val2, double val3);
+    bool keepFlow(uint64_t flow_id, simtime_picosec time, uint32_t type, uint32_t id, uint32_t ev,
+                  double val1, double val2, double val3);
+    // write the reservoir, in time order, and the sampling details
+    void flush(Logfile& logfile);
+
+    static bool isLossEvent(uint32_t type, uint32_t ev);
+private:
+    static const uint32_t MAX_TYPES = 64;
+    static const uint32_t MAX_EVS = 32;
+
+    struct Counter {
+        double rate;
+        double credit;  // kept while credit reaches 1
+        uint64_t seen;
+        uint64_t kept;
+    };
+    struct HeldRecord {
+        simtime_picosec time;
+        uint32_t type, id, ev;
+        double val1, val2, val3;
+    };
+
+    Counter* counter(uint32_t type, uint32_t ev);
+    bool sample(Counter& c);
+    bool hold(const HeldRecord& rec);
+
+    bool _enabled;
+    vector<Counter> _counters; // MAX_TYPES * MAX_EVS
+    double _flow_fraction;
+    uint64_t _flow_threshold;
+    uint64_t _seed;
+
+    size_t _reservoir_capacity;
+    uint64_t _reservoir_seen;
+    vector<HeldRecord> _reservoir;
+    std::mt19937_64 _rng;
+};
+
+#endif
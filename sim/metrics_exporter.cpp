@@ -0,0 +1,152 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include <errno.h>
+#include <fcntl.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <time.h>
+#include <unistd.h>
+#include <algorithm>
+#include <iostream>
+#include "metrics_exporter.h"
+#include "compositequeue.h"
+
+static const char* tier_names[MetricsExporter::TIER_COUNT] = {"host", "tor", "agg", "core"};
+
+const vector<string>&
+MetricsExporter::counterNames() {
+    static vector<string> names;
+    if (names.empty()) {
+        names.push_back("time_ps");
+        names.push_back("wall_ns");
+        for (int tier = 0; tier < TIER_COUNT; tier++) {
+            names.push_back(string("qdepth_") + tier_names[tier]);
+            names.push_back(string("drops_") + tier_names[tier]);
+            names.push_back(string("trims_") + tier_names[tier]);
+        }
+        names.push_back("flows_started");
+        names.push_back("flows_finished");
+        names.push_back("bytes_finished");
+        names.push_back("bytes_delivered");
+    }
+    return names;
+}
+
+MetricsExporter::MetricsExporter(const string& shm_name, simtime_picosec period, EventList& eventlist,
+                                 uint32_t slots)
+    : EventSource(eventlist, "metrics_exporter"),
+      _shm_name(shm_name), _period(period), _slots(slots), _published(0), _closed(false),
+      _next(NULL), _flows_started(0), _flows_finished(0), _bytes_finished(0)
+{
+    if (_shm_name.empty() || _shm_name[0] != '/')
+        _shm_name = "/" + _shm_name;
+    const vector<string>& names = counterNames();
+    _ncounters = names.size();
+    _values.resize(_ncounters);
+    assert(_slots > 0);
+    assert(METRICS_HEADER_SIZE >= 64 + _ncounters * METRICS_NAME_LEN);
+    _size = METRICS_HEADER_SIZE + _slots * (1 + _ncounters) * sizeof(uint64_t);
+
+    int fd = shm_open(_shm_name.c_str(), O_CREAT | O_RDWR | O_TRUNC, 0644);
+    if (fd < 0 || ftruncate(fd, _size) != 0) {
+        cerr << "Failed to create shared memory segment " << _shm_name << ": " << strerror(errno) << endl;
+        exit(1);
+    }
+    _base = (uint8_t*)mmap(NULL, _size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    ::close(fd);
+    if (_base == MAP_FAILED) {
+        cerr << "Failed to map shared memory segment " << _shm_name << ": " << strerror(errno) << endl;
+        exit(1);
+    }
+
+    uint64_t* header = (uint64_t*)_base;
+    header[1] = ((uint64_t)_ncounters << 32) | METRICS_VERSION;
+    header[2] = _slots;
+    header[3] = _period;
+    header[4] = 0;
+    header[5] = 0;
+    for (uint32_t i = 0; i < _ncounters; i++) {
+        strncpy((char*)_base + 64 + i * METRICS_NAME_LEN, names[i].c_str(), METRICS_NAME_LEN - 1);
+    }
+    // magic last, so a reader never sees a half-written header
+    __atomic_store_n(&header[0], METRICS_MAGIC, __ATOMIC_RELEASE);
+
+    eventlist.sourceIsPendingRel(*this, _period);
+}
+
+MetricsExporter::~MetricsExporter() {
+    close();
+    munmap(_base, _size);
+}
+
+void
+MetricsExporter::monitorQueue(BaseQueue* queue, queue_tier tier) {
+    MonitoredQueue q;
+    q.queue = queue;
+    q.drops = dynamic_cast<Queue*>(queue);
+    q.trims = dynamic_cast<CompositeQueue*>(queue);
+    q.tier = tier;
+    _queues.push_back(q);
+}
+
+void
+MetricsExporter::logEvent(PacketFlow& flow, Logged& location, FlowEvent ev, mem_b bytes, uint64_t pkts) {
+    if (ev == START) {
+        _flows_started++;
+    } else if (ev == FINISH) {
+        _flows_finished++;
+        _bytes_finished += bytes;
+    }
+    if (_next)
+        _next->logEvent(flow, location, ev, bytes, pkts);
+}
+
+void
+MetricsExporter::doNextEvent() {
+    sample();
+    eventlist().sourceIsPendingRel(*this, _period);
+}
+
+void
+MetricsExporter::sample() {
+    struct timespec wall;
+    clock_gettime(CLOCK_MONOTONIC, &wall);
+
+    std::fill(_values.begin(), _values.end(), 0);
+    _values[0] = eventlist().now();
+    _values[1] = (uint64_t)wall.tv_sec * 1000000000 + wall.tv_nsec;
+    for (size_t i = 0; i < _queues.size(); i++) {
+        const MonitoredQueue& q = _queues[i];
+        uint64_t* tier = &_values[2 + 3 * q.tier];
+        tier[0] += q.queue->queuesize();
+        if (q.drops)
+            tier[1] += q.drops->num_drops();
+        if (q.trims)
+            tier[2] += q.trims->num_stripped();
+    }
+    size_t ix = 2 + 3 * TIER_COUNT;
+    _values[ix++] = _flows_started;
+    _values[ix++] = _flows_finished;
+    _values[ix++] = _bytes_finished;
+    uint64_t delivered = 0;
+    for (size_t i = 0; i < _delivered.size(); i++)
+        delivered += _delivered[i]();
+    _values[ix++] = delivered;
+
+    uint64_t* slot = (uint64_t*)(_base + METRICS_HEADER_SIZE)
+        + (_published % _slots) * (1 + _ncounters);
+    __atomic_store_n(&slot[0], 2 * _published + 1, __ATOMIC_RELAXED);
+    __atomic_thread_fence(__ATOMIC_RELEASE);
+    memcpy(slot + 1, &_values[0], _ncounters * sizeof(uint64_t));
+    __atomic_store_n(&slot[0], 2 * _published + 2, __ATOMIC_RELEASE);
+    _published++;
+    __atomic_store_n(&((uint64_t*)_base)[4], _published, __ATOMIC_RELEASE);
+}
+
+void
+MetricsExporter::close() {
+    if (_closed)
+        return;
+    sample();
+    __atomic_store_n(&((uint64_t*)_base)[5], (uint64_t)1, __ATOMIC_RELEASE);
+    _closed = true;
+}
@@ -0,0 +1,99 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef METRICS_EXPORTER_H
+#define METRICS_EXPORTER_H
+
+/*
+ * MetricsExporter: every period of simulated time, sample a fixed set
+ * of counters into a ring buffer in a POSIX shared memory segment, so a
+ * separate process (datacenter/metrics_reader.py) can watch a run live.
+ * Nothing is written to the logfile.
+ *
+ * Segment layout, all fields little-endian uint64 unless noted:
+ *
+ *   header (METRICS_HEADER_SIZE bytes)
+ *     0   magic "HTSIMMET"
+ *     8   version (uint32), counter count (uint32)
+ *     16  slot count
+ *     24  sample period in picoseconds
+ *     32  samples published so far
+ *     40  1 once the simulation has finished
+ *     64  counter names, METRICS_NAME_LEN bytes each, NUL padded
+ *   slots, each (1 + counter count) * 8 bytes
+ *     0   sequence: 2k+1 while sample k is written, 2k+2 once it is complete
+ *     8   counters
+ *
+ * There is one writer and no locks; a reader copies a slot and accepts
+ * it only if the sequence was 2k+2 both before and after the copy.
+ */
+
+#include <functional>
+#include <string>
+#include <vector>
+#include "config.h"
+#include "eventlist.h"
+#include "loggertypes.h"
+
+class BaseQueue;
+class Queue;
+class CompositeQueue;
+
+#define METRICS_MAGIC 0x54454d4d49535448ULL  // "HTSIMMET"
+#define METRICS_VERSION 1
+#define METRICS_HEADER_SIZE 4096
+#define METRICS_NAME_LEN 32
+#define METRICS_DEFAULT_SLOTS 4096
+
+class MetricsExporter : public EventSource, public FlowEventLogger {
+public:
+    enum queue_tier {TIER_HOST = 0, TIER_TOR = 1, TIER_AGG = 2, TIER_CORE = 3, TIER_COUNT = 4};
+
+    // shm_name is the POSIX shared memory name, e.g. "/htsim_metrics"
+    MetricsExporter(const string& shm_name, simtime_picosec period, EventList& eventlist,
+                    uint32_t slots = METRICS_DEFAULT_SLOTS);
+    virtual ~MetricsExporter();
+
+    void monitorQueue(BaseQueue* queue, queue_tier tier);
+    // bytes delivered are summed over sinks; anything with total_received() will do
+    template <class Sink> void monitorSink(Sink* sink) {
+        _delivered.push_back([sink]() -> uint64_t {return sink->total_received();});
+    }
+    // flow events are counted, then passed on to next if there is one
+    void setNextFlowLogger(FlowEventLogger* next) {_next = next;}
+
+    virtual void logEvent(PacketFlow& flow, Logged& location, FlowEvent ev, mem_b bytes, uint64_t pkts);
+    virtual void doNextEvent();
+
+    // write a last sample and mark the run as finished
+    void close();
+
+    static const vector<string>& counterNames();
+
+private:
+    struct MonitoredQueue {
+        BaseQueue* queue;
+        Queue* drops;           // NULL if the queue does not count drops
+        CompositeQueue* trims;  // NULL if the queue does not trim
+        queue_tier tier;
+    };
+
+    void sample();
+
+    string _shm_name;
+    simtime_picosec _period;
+    uint64_t _slots;
+    uint32_t _ncounters;
+    size_t _size;
+    uint8_t* _base;
+    uint64_t _published;
+    bool _closed;
+
+    vector<MonitoredQueue> _queues;
+    vector<std::function<uint64_t()>> _delivered;
+    FlowEventLogger* _next;
+    uint64_t _flows_started;
+    uint64_t _flows_finished;
+    uint64_t _bytes_finished;
+    vector<uint64_t> _values;
+};
+
+#endif
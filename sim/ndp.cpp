@@ -1225,6 +1225,8 @@ NdpSink::NdpSink(EventList& event, linkspeed_bps linkspeed, double pull_rate_mod
     _highest_seqno = 0;
     _log_me = false;
     _total_received = 0;
+    _rate_stats = NULL;
+    _rate_slot = 0;
     _path_hist_index = -1;
     _path_hist_first = -1;
 
@@ -1261,6 +1263,8 @@ NdpSink::NdpSink(NdpPullPacer* pacer) : DataReceiver("ndp_sink"),_cumulative_ack
     _last_packet_seqno = 0;
     _log_me = false;
     _total_received = 0;
+    _rate_stats = NULL;
+    _rate_slot = 0;
     _highest_seqno = 0;
     _path_hist_index = -1;
     _path_hist_first = -1;
@@ -1278,6 +1282,13 @@ NdpSink::NdpSink(NdpPullPacer* pacer) : DataReceiver("ndp_sink"),_cumulative_ack
 #endif
 }
 
+void NdpSink::monitorWith(SinkStatsAggregator& stats) {
+    assert(_src);
+    _rate_stats = &stats;
+    // _flow_size is huge when the flow has no set size
+    _rate_slot = stats.monitorSink(this, _src->_flow_size);
+}
+
 void NdpSink::set_end_trigger(Trigger& end_trigger) {
     _end_trigger = &end_trigger;
 }
@@ -1534,9 +1545,10 @@ void NdpSink::receivePacket(Packet& pkt) {
     }
 
     pkt.flow().logTraffic(pkt,*this,TrafficLogger::PKT_RCVDESTROY);
-    p->free();
   
     _total_received+=size;
+    if (_rate_stats)
+        _rate_stats->received(_rate_slot, size);
 
     if (p->seqno() > _highest_seqno)
             _highest_seqno = p->seqno();
@@ -1588,6 +1600,8 @@ void NdpSink::receivePacket(Packet& pkt) {
     if (NdpSink::_oversubscribed_congestion_control && _parked_cwnd > 0)
         receiver_increase(p);
 
+    p->free();
+
     // have we seen everything yet?
     if (_last_packet_seqno > 0 && _cumulative_ack == _last_packet_seqno) {
         _pacer->release_pulls(flow_id(), this);
@@ -15,6 +15,7 @@
 #include "priopullqueue.h"
 #include "trigger.h"
 #include "eventlist.h"
+#include "sink_stats.h"
 
 #define timeInf 0
 #define NDP_PACKET_SCATTER
@@ -252,6 +253,9 @@ class NdpSink : public PacketSink, public DataReceiver {
 
     void set_src(uint32_t s) {_srcaddr = s;}
     void set_end_trigger(Trigger& trigger);
+    // count received bytes in an aggregator instead of being sampled; call
+    // once connected, so the flow size is known
+    void monitorWith(SinkStatsAggregator& stats);
 
     list<NdpAck::seq_t> _received; // list of packets above a hole, that we've received
  
@@ -308,6 +312,8 @@ class NdpSink : public PacketSink, public DataReceiver {
     NdpPacket::seq_t _last_packet_seqno; //sequence number of the last
                                          //packet in the connection (or 0 if not known)
     uint64_t _total_received;
+    SinkStatsAggregator* _rate_stats;
+    uint32_t _rate_slot;
     NdpPacket::seq_t _highest_seqno;
     int _priority; // this receiver's priority relative to others on same pacer - low is best
 
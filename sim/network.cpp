@@ -1,9 +1,19 @@
 // -*- c-basic-offset: 4; indent-tabs-mode: nil -*- 
 #include "network.h"
+#include <cxxabi.h>
+#include <stdlib.h>
+#include <string.h>
+#include <iomanip>
 
 #define DEFAULTDATASIZE 1500
 int Packet::_data_packet_size = DEFAULTDATASIZE;
 bool Packet::_packet_size_fixed = false;
+
+void Packet::reset_packet_size() {
+    _packet_size_fixed = false;
+    _data_packet_size = DEFAULTDATASIZE;
+}
+
 PacketFlow Packet::_defaultFlow(nullptr);
 
 // use set_attrs only when we want to do a late binding of the route -
@@ -54,6 +64,22 @@ Packet::set_route(const Route *route){
 
 PacketSink *
 Packet::sendOn() {
+    PacketSink* nextsink = advanceHop();
+    //cout << "sendOn nextsink is: " << nextsink->nodename() << endl;
+    nextsink->receivePacket(*this);
+    return nextsink;
+}
+
+PacketSink *
+Packet::nextHop() const {
+    if (!_route)
+        return _next_routed_hop;
+    const Route* route = _bounced ? _route->reverse() : _route;
+    return _nexthop < route->size() ? route->at(_nexthop) : NULL;
+}
+
+PacketSink *
+Packet::advanceHop() {
     PacketSink* nextsink;
 
     /*if (_detour){
@@ -79,8 +105,6 @@ Packet::sendOn() {
     else {
         assert(0);
     }
-    //cout << "sendOn nextsink is: " << nextsink->nodename() << endl;
-    nextsink->receivePacket(*this);
     return nextsink;
 }
 
@@ -260,6 +284,10 @@ void PacketFlow::set_flowid(flowid_t id) {
     _flow_id = id;
 }
 
+void PacketFlow::reset_flow_ids() {
+    _max_flow_id = FLOW_ID_DYNAMIC_BASE;
+}
+
 void PacketFlow::set_logger(TrafficLogger *logger) {
     _logger = logger;
 }
@@ -281,3 +309,75 @@ void print_route(const Route& route) {
 }
 
 Logged::id_t Logged::LASTIDNUM = 1;
+
+uint32_t PacketDBBase::_prewarm = 0;
+uint32_t PacketDBBase::_max_pooled = 0;
+
+PacketDBBase::PacketDBBase(const std::type_info& type, size_t packet_bytes)
+    : _live(0), _peak(0), _recycled(0), _pooled(0), _overflow(0), _released(0),
+      _type(type), _packet_bytes(packet_bytes)
+{
+    all().push_back(this);
+}
+
+// a function static, so it exists before the first static PacketDB
+vector<PacketDBBase*>&
+PacketDBBase::all() {
+    static vector<PacketDBBase*> pools;
+    return pools;
+}
+
+uint32_t
+PacketDBBase::slabPackets() const {
+    uint32_t n = SLAB_PACKETS;
+    if (_pooled == 0 && _prewarm > n)
+        n = (_prewarm + SLAB_PACKETS - 1) / SLAB_PACKETS * SLAB_PACKETS;
+    if (_max_pooled) {
+        if (_pooled >= _max_pooled)
+            return 0;
+        if (n > _max_pooled - _pooled)
+            n = _max_pooled - _pooled;
+    }
+    return n;
+}
+
+bool
+PacketDBBase::parseArg(int argc, char** argv, int& i) {
+    if (!strcmp(argv[i], "-pkt_prewarm") && i + 1 < argc) {
+        setPrewarm(atoi(argv[i+1]));
+        i++;
+    } else if (!strcmp(argv[i], "-pkt_pool_max") && i + 1 < argc) {
+        setMaxPooled(atoi(argv[i+1]));
+        i++;
+    } else {
+        return false;
+    }
+    return true;
+}
+
+const char*
+PacketDBBase::usage() {
+    return "\t[-pkt_prewarm n] packets each packet pool makes when first used\n"
+        "\t[-pkt_pool_max n] packets each pool keeps; the rest are freed after use";
+}
+
+void
+PacketDBBase::printStats(ostream& out) {
+    vector<PacketDBBase*>& pools = all();
+    out << "Packet pools:" << endl;
+    for (size_t i = 0; i < pools.size(); i++) {
+        PacketDBBase* db = pools[i];
+        if (!db->_pooled && !db->_overflow)
+            continue;
+        int status;
+        char* name = abi::__cxa_demangle(db->_type.name(), NULL, NULL, &status);
+        out << "  " << left << setw(16) << (status == 0 ? name : db->_type.name()) << right
+            << " live " << db->_live << " peak " << db->_peak
+            << " recycled " << db->_recycled << " pooled " << db->_pooled
+            << " (" << fixed << setprecision(1) << db->_pooled * db->_packet_bytes / 1048576.0 << "MB)"
+            << " overflow " << db->_overflow << " released " << db->_released << endl;
+        free(name);
+    }
+    out.unsetf(ios_base::floatfield);
+    out << setprecision(6);
+}
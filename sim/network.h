@@ -3,7 +3,10 @@
 #define NETWORK_H
 
 #include <vector>
+#include <algorithm>
 #include <iostream>
+#include <new>
+#include <typeinfo>
 #include "config.h"
 #include "loggertypes.h"
 #include "route.h"
@@ -35,6 +38,7 @@ class PacketFlow : public Logged {
     void set_flowid(flowid_t id);
     inline flowid_t flow_id() const {return _flow_id;}
     bool log_me() const {return _logger != NULL;}
+    static void reset_flow_ids(); // start allocating dynamic flow ids from scratch
  protected:
     static packetid_t _max_flow_id;
     flowid_t _flow_id;
@@ -87,6 +91,11 @@ class Packet {
         _data_packet_size = packet_size;
     }
 
+    // back to the default, unfixed size.  Only for starting a new
+    // simulation in the same process, once everything that read the
+    // old size has gone.
+    static void reset_packet_size();
+
     static int data_packet_size() {
         _packet_size_fixed = true;
         return _data_packet_size;
@@ -94,6 +103,12 @@ class Packet {
 
     virtual PacketSink* sendOn(); // "go on to the next hop along your route"
                                   // returns what that hop is
+    // the hop sendOn() would deliver to, without going there; NULL if
+    // the route ends here
+    PacketSink* nextHop() const;
+    // move along the route as sendOn() does, but leave delivering the
+    // packet to the caller
+    PacketSink* advanceHop();
 
     virtual PacketSink* previousHop() {if (_nexthop>=2) return _route->at(_nexthop-2); else return NULL;}
     virtual PacketSink* currentHop() {if (_nexthop>=1) return _route->at(_nexthop-1); else return NULL;}
@@ -222,44 +237,127 @@ class PacketSink {
 // have been allocated -- that way we don't need a malloc for every
 // new packet, we can just reuse old packets. Care, though -- the set()
 // method will need to be invoked properly for each new/reused packet
+//
+// Packets are made in slabs, so a burst costs one allocation per slab
+// rather than one per packet, and packets of a type sit together in
+// memory.  Two limits, shared by every PacketDB, can be set from the
+// command line:
+//   prewarm     how many packets a pool makes the first time it is used,
+//               rounded up to whole slabs
+//   max pooled  the most packets a pool keeps in slabs.  Packets wanted
+//               beyond that are allocated on their own, and go back to
+//               the heap once freed, so the high water of a burst doesn't
+//               stay for the rest of the run.  A packet must not be read
+//               after its free().
+
+class PacketDBBase {
+ public:
+    PacketDBBase(const std::type_info& type, size_t packet_bytes);
+    virtual ~PacketDBBase() {}
+
+    static void setPrewarm(uint32_t packets) {_prewarm = packets;}
+    static void setMaxPooled(uint32_t packets) {_max_pooled = packets;} // 0 means no limit
+
+    // handles -pkt_prewarm and -pkt_pool_max, leaving i on the last argument used
+    static bool parseArg(int argc, char** argv, int& i);
+    static const char* usage();
+    // live, peak and recycled counts of every pool that has been used
+    static void printStats(ostream& out);
+
+    static const uint32_t SLAB_PACKETS = 256;
+ protected:
+    // packets the next slab should hold; 0 if the pool is full
+    uint32_t slabPackets() const;
+
+    static uint32_t _prewarm;
+    static uint32_t _max_pooled;
+
+    uint64_t _live;
+    uint64_t _peak;
+    uint64_t _recycled;  // allocations served by a packet freed earlier
+    uint64_t _pooled;    // packets made in slabs
+    uint64_t _overflow;  // packets made on their own because the pool was full
+    uint64_t _released;  // overflow packets given back to the heap
+ private:
+    static vector<PacketDBBase*>& all();
+
+    const std::type_info& _type;
+    size_t _packet_bytes;
+};
 
 template<class P>
-class PacketDB {
+class PacketDB : public PacketDBBase {
  public:
-    PacketDB() : _alloc_count(0) {}
+    PacketDB() : PacketDBBase(typeid(P), sizeof(P)), _fresh(NULL), _fresh_end(NULL), _overflow_live(0) {}
     ~PacketDB() {
-        //cout << "Pkt count: " << _alloc_count << endl;
-        //cout << "Pkt mem used: " << _alloc_count * sizeof(P) << endl;
+        // packets may still be referenced while the program exits, so
+        // the slabs are left for the OS
     }
     P* allocPacket() {
-        if (_freelist.empty()) {
-            P* p = new P();
-            p->inc_ref_count();
-            /*
-            if (_alloc_count == 0) {
-                cout << "Packet size: " << sizeof(P) << endl;
-            }
-            */
-            _alloc_count++;
-            return p;
-        } else {
-            P* p = _freelist.back();
+        P* p;
+        if (!_freelist.empty()) {
+            p = _freelist.back();
             _freelist.pop_back();
-            p->inc_ref_count();
-            return p;
+            _recycled++;
+        } else if (_fresh != _fresh_end || addSlab()) {
+            p = _fresh++;
+        } else {
+            p = new P();
+            _overflow++;
+            _overflow_live++;
         }
+        p->inc_ref_count();
+        if (++_live > _peak)
+            _peak = _live;
+        return p;
     };
     void freePacket(P* pkt) {
         assert(pkt->ref_count()>=1);
         pkt->dec_ref_count();
 
-        if (!pkt->ref_count())
+        if (pkt->ref_count())
+            return;
+        _live--;
+        if (_overflow_live && !inSlab(pkt)) {
+            _overflow_live--;
+            delete pkt;
+            _released++;
+        } else {
             _freelist.push_back(pkt);
+        }
     };
 
  protected:
+    bool addSlab() {
+        uint32_t n = slabPackets();
+        if (!n)
+            return false;
+        P* slab = static_cast<P*>(::operator new(n * sizeof(P)));
+        for (uint32_t i = 0; i < n; i++)
+            new (slab + i) P();
+        // kept in address order, for inSlab()
+        pair<P*, P*> range(slab, slab + n);
+        _slabs.insert(upper_bound(_slabs.begin(), _slabs.end(), range), range);
+        _pooled += n;
+        _freelist.reserve(_pooled);
+        _fresh = slab;
+        _fresh_end = slab + n;
+        return true;
+    }
+    static bool beforeSlab(P* pkt, const pair<P*, P*>& slab) {return pkt < slab.first;}
+    bool inSlab(P* pkt) const {
+        auto i = upper_bound(_slabs.begin(), _slabs.end(), pkt, beforeSlab);
+        if (i == _slabs.begin())
+            return false;
+        --i;
+        return pkt < i->second;
+    }
+
     vector<P*> _freelist; // Irek says it's faster with vector than with list
-    int _alloc_count;
+    P* _fresh;            // next never-used packet of the newest slab
+    P* _fresh_end;
+    vector<pair<P*, P*> > _slabs;
+    uint64_t _overflow_live;
 };
 
 
@@ -22,6 +22,8 @@ using namespace std;
 
 #include "loggers.h"
 #include "eqds_logger.h"
+#include "sink_stats.h"
+#include "logfile.h"
 
 struct eqint
 {
@@ -31,13 +33,43 @@ struct eqint
     }
 };
 
+// "# sampled" lines in the preamble say how many records of each type and
+// ev were offered to the LogSampler and how many it kept; counts taken from
+// the trace scale by seen/kept
+static void print_sampling(const char* line) {
+    unsigned type, ev;
+    unsigned long long seen, kept;
+    if (sscanf(line, "# sampled type=%u ev=%u seen=%llu kept=%llu", &type, &ev, &seen, &kept) == 4) {
+        printf("type %u ev %u seen %llu kept %llu weight %f\n", type, ev, seen, kept,
+               kept ? (double)seen / kept : 0.0);
+    } else if (!strncmp(line, "# sampling ", 11)) {
+        printf("%s\n", line + 2);
+    }
+}
+
+// ": name=id" lines in the preamble give the names of logged objects
+static void parse_name(char* line, hashmap<int, string>& object_names) {
+    if (!strstr(line, ": "))
+        return;
+    char* split = strstr(line,"=");
+
+    int id = -1;
+    if (split)
+        id = atoi(split+1);
+    
+    split[0]=0;
+    string * name = new string(line+2);
+    assert(id >= 0);
+    object_names[id] = *name;
+}
+
 int main(int argc, char** argv){
     if (argc < 2){
-        printf("Usage %s filename [-show|-verbose|-ascii]\n", argv[0]);
+        printf("Usage %s filename [-show|-verbose|-ascii|-sampling]\n", argv[0]);
         return 1;
     }
 
-    bool show = false, verbose = false, ascii = false;
+    bool show = false, verbose = false, ascii = false, sampling = false;
     stringstream filename;
     filename.str(std::string());
     filename << "";
@@ -56,6 +88,8 @@ int main(int argc, char** argv){
             verbose = true;
         } else if (!strcmp(argv[i],"-ascii") || !strcmp(argv[i],"--ascii")){
             ascii = true;
+        } else if (!strcmp(argv[i],"-sampling")){
+            sampling = true;
         } else if (!strcmp(argv[i],"-filter")){
             string* s = new string(argv[i+1]);
             filters.push_back(*s);
@@ -104,7 +138,46 @@ int main(int argc, char** argv){
     char* line = new char[10000];
     //cout << "reading preamble\n";
     int numRecords = 0, transpose = 1;
-    while (1){
+    bool text_preamble = true;
+    LogfileHeader header;
+    if (fread(&header, sizeof(header), 1, logfile) == 1
+        && !memcmp(header.magic, LOGFILE_MAGIC, sizeof(header.magic))) {
+        /* streamed log: fixed header, records, then the preamble */
+        if (header.version != LOGFILE_VERSION || header.record_size != LOGFILE_RECORD_SIZE) {
+            cerr << "Unsupported logfile version " << header.version << endl;
+            exit(1);
+        }
+        numRecords = header.num_records;
+        transpose = 0;
+        text_preamble = false;
+        if (header.flags & LOGFILE_COMPLETE) {
+            string preamble(header.preamble_length, '\0');
+            fseek(logfile, header.preamble_offset, SEEK_SET);
+            std::ignore = fread(&preamble[0], 1, header.preamble_length, logfile);
+            stringstream lines(preamble);
+            string l;
+            while (getline(lines, l)) {
+                strncpy(line, l.c_str(), 9999);
+                line[9999] = 0;
+                parse_name(line, object_names);
+                if (sampling)
+                    print_sampling(line);
+            }
+        } else {
+            cerr << "Logfile was not closed, object names are missing; reading the "
+                 << numRecords << " records written" << endl;
+        }
+        if (sampling)
+            exit(0);
+        if(numRecords<=0) {
+            printf("Numrecords is %d after preamble, bailing\n", numRecords);
+            exit(1);
+        }
+        fseek(logfile, header.header_size, SEEK_SET);
+    } else {
+        rewind(logfile);
+    }
+    while (text_preamble){
         if(!fgets(line, 10000, logfile)) {
             perror("File ended while reading preamble!\n");
             exit(1);
@@ -127,19 +200,7 @@ int main(int argc, char** argv){
         };
 
         //
-        if (strstr(line, ": ")){
-            //logged names and ids
-            char* split = strstr(line,"=");
-
-            int id = -1;
-            if (split)
-                id = atoi(split+1);
-            
-            split[0]=0;
-            string * name = new string(line+2);
-            assert(id >= 0);
-            object_names[id] = *name;
-        }
+        parse_name(line, object_names);
     }
     //cout << "done\n";
     FILE* idmapfile;
@@ -193,15 +254,17 @@ int main(int argc, char** argv){
         std::ignore = fread(val2Rec, sizeof(double), numread, logfile);
         std::ignore = fread(val3Rec, sizeof(double), numread, logfile);  
     } else {
-        /* new-style one record at a time */
+        /* new-style one packed record at a time */
+        char rec[LOGFILE_RECORD_SIZE];
         for (int i = 0; i < numRecords; i++) {
-            std::ignore = fread(&timeRec[i], sizeof(double), 1, logfile);
-            std::ignore = fread(&typeRec[i], sizeof(uint32_t), 1, logfile);
-            std::ignore = fread(&idRec[i],   sizeof(uint32_t), 1, logfile);
-            std::ignore = fread(&evRec[i],   sizeof(uint32_t), 1, logfile);
-            std::ignore = fread(&val1Rec[i], sizeof(double), 1, logfile);
-            std::ignore = fread(&val2Rec[i], sizeof(double), 1, logfile);
-            std::ignore = fread(&val3Rec[i], sizeof(double), 1, logfile);  
+            std::ignore = fread(rec, LOGFILE_RECORD_SIZE, 1, logfile);
+            memcpy(&timeRec[i], rec, 8);
+            memcpy(&typeRec[i], rec + 8, 4);
+            memcpy(&idRec[i],   rec + 12, 4);
+            memcpy(&evRec[i],   rec + 16, 4);
+            memcpy(&val1Rec[i], rec + 20, 8);
+            memcpy(&val2Rec[i], rec + 28, 8);
+            memcpy(&val3Rec[i], rec + 36, 8);
         }
     }
 
@@ -375,6 +438,9 @@ int main(int argc, char** argv){
             case Logger::FLOW_EVENT:
                 out = FlowEventLoggerSimple::event_to_str(event);
                 break;
+            case Logger::SINK_STATS:
+                out = SinkStatsAggregator::event_to_str(event);
+                break;
             }
             bool do_output = true;
             for (size_t f=0; f < filters.size(); f++) {
@@ -0,0 +1,60 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include "phase_timer.h"
+#include <sys/resource.h>
+#include <iomanip>
+
+using namespace std;
+
+PhaseTimer::PhaseTimer() : _current(-1), _rss_at_start(0) {
+}
+
+uint64_t
+PhaseTimer::peak_rss() {
+    struct rusage usage;
+    getrusage(RUSAGE_SELF, &usage);
+    return (uint64_t)usage.ru_maxrss * 1024; // kilobytes on Linux
+}
+
+void
+PhaseTimer::start(const string& phase) {
+    stop();
+    for (size_t i = 0; i < _phases.size(); i++) {
+        if (_phases[i].name == phase) {
+            _current = i;
+            break;
+        }
+    }
+    if (_current < 0) {
+        Phase p = {phase, 0.0, 0};
+        _phases.push_back(p);
+        _current = _phases.size() - 1;
+    }
+    _rss_at_start = peak_rss();
+    _started = chrono::steady_clock::now();
+}
+
+void
+PhaseTimer::stop() {
+    if (_current < 0)
+        return;
+    Phase& p = _phases[_current];
+    p.seconds += chrono::duration<double>(chrono::steady_clock::now() - _started).count();
+    p.rss_growth += peak_rss() - _rss_at_start;
+    _current = -1;
+}
+
+void
+PhaseTimer::print(ostream& out) const {
+    double total = 0;
+    out << "Startup phases:" << endl;
+    for (size_t i = 0; i < _phases.size(); i++) {
+        const Phase& p = _phases[i];
+        out << "  " << left << setw(20) << p.name << right << fixed << setprecision(3)
+            << setw(9) << p.seconds << "s  +" << setprecision(1) << p.rss_growth / 1048576.0 << "MB" << endl;
+        total += p.seconds;
+    }
+    out << "  " << left << setw(20) << "total" << right << setprecision(3)
+        << setw(9) << total << "s  peak " << setprecision(1) << peak_rss() / 1048576.0 << "MB" << endl;
+    out.unsetf(ios_base::floatfield);
+    out << setprecision(6);
+}
@@ -0,0 +1,39 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef PHASE_TIMER_H
+#define PHASE_TIMER_H
+
+/*
+ * PhaseTimer adds up the wall-clock time spent in each phase of setting
+ * up a run, and how much the peak resident memory grew meanwhile.
+ * Starting a phase ends the current one, so a loop that switches between
+ * two phases charges each its share; phases print in the order first
+ * started.
+ */
+
+#include <stdint.h>
+#include <chrono>
+#include <ostream>
+#include <string>
+#include <vector>
+
+class PhaseTimer {
+public:
+    PhaseTimer();
+    void start(const std::string& phase);
+    void stop();
+    void print(std::ostream& out) const;
+
+    static uint64_t peak_rss(); // bytes
+private:
+    struct Phase {
+        std::string name;
+        double seconds;
+        uint64_t rss_growth;
+    };
+    std::vector<Phase> _phases;
+    int _current; // index into _phases, or -1
+    std::chrono::steady_clock::time_point _started;
+    uint64_t _rss_at_start;
+};
+
+#endif
@@ -26,6 +26,24 @@ Pipe::receivePacket(Packet& pkt)
            we've an event pending */
             eventlist().sourceIsPendingRel(*this,_delay);
     }
+    push(pkt, eventlist().now() + _delay);
+}
+
+void
+Pipe::receivePacketAt(Packet& pkt, simtime_picosec arrival)
+{
+    assert(arrival >= eventlist().now());
+    if (_count == 0) {
+        eventlist().sourceIsPending(*this, arrival + _delay);
+    }
+    push(pkt, arrival + _delay);
+}
+
+void
+Pipe::push(Packet& pkt, simtime_picosec time)
+{
+    // packets leave in the order they came in
+    assert(_count == 0 || _inflight_v[(_next_insert + _size - 1) % _size].time <= time);
     _count++;
     if (_count == _size) {
         _inflight_v.resize(_size*2);
@@ -43,7 +61,7 @@ Pipe::receivePacket(Packet& pkt)
         }
         _size += _size;
     }
-    _inflight_v[_next_insert].time = eventlist().now() + _delay;
+    _inflight_v[_next_insert].time = time;
     _inflight_v[_next_insert].pkt = &pkt;
     _next_insert = (_next_insert +1) % _size;
     //_inflight.push_front(make_pair(eventlist().now() + _delay, &pkt));
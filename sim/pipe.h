@@ -23,6 +23,10 @@ class Pipe : public EventSource, public PacketSink, public Drawable {
  public:
     Pipe(simtime_picosec delay, EventList& eventlist=EventList::getTheEventList());
     virtual void receivePacket(Packet& pkt); // inherited from PacketSink
+    // take a packet that will arrive at a later time, as if
+    // receivePacket() were called then.  Arrivals must come in time order,
+    // so only the queue feeding the pipe may do this (see Queue).
+    void receivePacketAt(Packet& pkt, simtime_picosec arrival);
     virtual void doNextEvent(); // inherited from EventSource
     simtime_picosec delay() { return _delay; }
     const string& nodename() { return _nodename; }
@@ -41,6 +45,8 @@ protected:
     vector<pktrecord_t> _inflight_v;
     int _next_insert, _next_pop, _count, _size;
 private:
+    void push(Packet& pkt, simtime_picosec time);
+
     simtime_picosec _delay;
     PacketSink* _next_sink{nullptr}; // used in generic topology for linkage
 };
@@ -71,6 +71,7 @@ CtrlPrioQueue::completeService(){
     
   pkt->flow().logTraffic(*pkt,*this,TrafficLogger::PKT_DEPART);
   if (_logger) _logger->logQueue(*this, QueueLogger::PKT_SERVICE, *pkt);
+  _bytes_served += pkt->size();
   pkt->sendOn();
 
   //_virtual_time += drainTime(pkt);
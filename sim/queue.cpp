@@ -1,6 +1,7 @@
 // -*- c-basic-offset: 4; indent-tabs-mode: nil -*-        
 #include <sstream>
 #include <math.h>
+#include <typeinfo>
 #include "queue.h"
 #include "ndppacket.h"
 #include "queue_lossless.h"
@@ -11,6 +12,8 @@ simtime_picosec BaseQueue::_update_period = timeFromUs(0.1);
 BaseQueue::BaseQueue(linkspeed_bps bitrate, EventList& eventlist, QueueLogger* logger)
     : EventSource(eventlist, "Queue"), _logger(logger), _bitrate(bitrate), _switch(NULL) {
     _ps_per_byte = (simtime_picosec)((pow(10.0, 12.0) * 8) / _bitrate);
+    _background_rate = 0;
+    _bytes_served = 0;
     _window = timeFromUs(30.0);
     _busy = 0;
 
@@ -44,6 +47,13 @@ BaseQueue::log_packet_send(simtime_picosec duration){
     }
 }
 
+void
+BaseQueue::set_background_rate(linkspeed_bps rate){
+    assert(rate < _bitrate);
+    _background_rate = rate;
+    _ps_per_byte = (simtime_picosec)((pow(10.0, 12.0) * 8) / (_bitrate - rate));
+}
+
 uint16_t
 BaseQueue::average_utilization(){
     //how much time have we spent being busy in the current measurement window?
@@ -98,15 +108,7 @@ BaseQueue::quantized_queuesize(){
     if (eventlist().now()-_last_update_qs > _update_period){
         _last_update_qs = eventlist().now();
 
-        uint64_t qs = queuesize();
-        if (qs < maxsize() * 0.05)
-            _last_qs = 0;
-        else if (qs < maxsize() * 0.1)
-            _last_qs = 1;
-        else if (qs < maxsize() * 0.2)
-            _last_qs = 2;
-        else 
-            _last_qs = 3;
+        _last_qs = queuesize_band(queuesize(), maxsize());
         //_last_qs = queuesize();
 
         //cout << "QS " << (uint32_t)_last_qs << " queuesize " << queuesize() << " max " << maxsize() << endl;
@@ -114,11 +116,27 @@ BaseQueue::quantized_queuesize(){
     return _last_qs;
 }
 
+uint8_t
+BaseQueue::queuesize_band(mem_b qs, mem_b maxsize){
+    if (qs < maxsize * 0.05)
+        return 0;
+    else if (qs < maxsize * 0.1)
+        return 1;
+    else if (qs < maxsize * 0.2)
+        return 2;
+    else 
+        return 3;
+}
+
+
+bool Queue::_trains = true;
 
 Queue::Queue(linkspeed_bps bitrate, mem_b maxsize, EventList& eventlist, 
              QueueLogger* logger)
     : BaseQueue(bitrate, eventlist, logger), 
-      _maxsize(maxsize), _num_drops(0)
+      _maxsize(maxsize), _num_drops(0),
+      _train_mode(TRAINS_UNKNOWN), _train_next(NULL), _train_pipe(NULL),
+      _train_bytes(0), _train_end(0)
 {
     _queuesize = 0;
     stringstream ss;
@@ -132,7 +150,12 @@ Queue::beginService()
 {
     /* schedule the next dequeue event */
     assert(!_enqueued.empty());
-    eventlist().sourceIsPendingRel(*this, drainTime(_enqueued.back()));
+    if (_train_end > eventlist().now()) {
+        // wait for the last packet handed on in a train to leave
+        eventlist().sourceIsPending(*this, _train_end + drainTime(_enqueued.back()));
+    } else {
+        eventlist().sourceIsPendingRel(*this, drainTime(_enqueued.back()));
+    }
 }
 
 void
@@ -150,6 +173,7 @@ Queue::completeService()
     //used to compute queue utilization
     log_packet_send(drainTime(pkt));
 
+    _bytes_served += pkt->size();
     /* tell the packet to move on to the next pipe */
     pkt->sendOn();
 
@@ -166,10 +190,36 @@ Queue::doNextEvent()
 }
 
 
+Pipe*
+Queue::trainPipe(Packet& pkt)
+{
+    if (_train_mode == TRAINS_UNKNOWN)
+        _train_mode = typeid(*this) == typeid(Queue) ? TRAINS_ON : TRAINS_OFF;
+    if (!_trains || _train_mode == TRAINS_OFF || _logger || _switch || _background_rate
+        || pkt.flow().log_me())
+        return NULL;
+    PacketSink* next = pkt.nextHop();
+    if (next != _train_next) {
+        _train_next = next;
+        _train_pipe = next && typeid(*next) == typeid(Pipe) ? (Pipe*)next : NULL;
+    }
+    return _train_pipe;
+}
+
+void
+Queue::retireTrain() const
+{
+    simtime_picosec now = eventlist().now();
+    while (!_train.empty() && _train.back().depart <= now)
+        _train_bytes -= _train.pop().size;
+}
+
 void
 Queue::receivePacket(Packet& pkt) 
 {
-    if (_queuesize+pkt.size() > _maxsize) {
+    if (!_train.empty())
+        retireTrain();
+    if (_queuesize + _train_bytes + pkt.size() > _maxsize) {
         /* if the packet doesn't fit in the queue, drop it */
         if (_logger) 
             _logger->logQueue(*this, QueueLogger::PKT_DROP, pkt);
@@ -184,6 +234,20 @@ Queue::receivePacket(Packet& pkt)
 
     /* enqueue the packet */
     bool queueWasEmpty = _enqueued.empty();
+    Pipe* pipe;
+    if (queueWasEmpty && (pipe = trainPipe(pkt))) {
+        // nothing is waiting, so we know when it will leave
+        TrainPacket t;
+        t.depart = max(eventlist().now(), _train_end) + drainTime(&pkt);
+        t.size = pkt.size();
+        _train.push(t);
+        _train_bytes += t.size;
+        _train_end = t.depart;
+        _bytes_served += t.size;
+        pkt.advanceHop();
+        pipe->receivePacketAt(pkt, t.depart);
+        return;
+    }
     //_enqueued.push_front(&pkt);
     Packet* pkt_p = &pkt;
     _enqueued.push(pkt_p);
@@ -199,12 +263,14 @@ Queue::receivePacket(Packet& pkt)
 
 mem_b 
 Queue::queuesize() const {
-    return _queuesize;
+    if (!_train.empty())
+        retireTrain();
+    return _queuesize + _train_bytes;
 }
 
 simtime_picosec
 Queue::serviceTime() {
-    return _queuesize * _ps_per_byte;
+    return queuesize() * _ps_per_byte;
 }
 
 PriorityQueue::PriorityQueue(linkspeed_bps bitrate, mem_b maxsize, 
@@ -343,6 +409,7 @@ PriorityQueue::completeService()
         pkt->flow().logTraffic(*pkt, *this, TrafficLogger::PKT_DEPART);
         if (_logger) _logger->logQueue(*this, QueueLogger::PKT_SERVICE, *pkt);
 
+        _bytes_served += pkt->size();
         /* tell the packet to move on to the next pipe */
         pkt->sendOn();
     }
@@ -526,6 +593,7 @@ FairPriorityQueue::completeService()
         pkt->flow().logTraffic(*pkt, *this, TrafficLogger::PKT_DEPART);
         if (_logger) _logger->logQueue(*this, QueueLogger::PKT_SERVICE, *pkt);
 
+        _bytes_served += pkt->size();
         /* tell the packet to move on to the next pipe */
         pkt->sendOn();
     }
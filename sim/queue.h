@@ -16,6 +16,7 @@
 #include "drawable.h"
 #include "switch.h"
 #include "circular_buffer.h"
+#include "pipe.h"
 
 // BaseQueue is a generic queue, but doesn't actually implement any
 // queuing discipline.  Subclasses implement different queuing
@@ -58,11 +59,21 @@ class BaseQueue  : public EventSource, public PacketSink, public Drawable {
             return (mem_b)(timeAsSec(t) * (double)_bitrate); 
     }
 
+    // give this much of the link to traffic that is not simulated as
+    // packets (see FluidModel); packets are served at what is left
+    void set_background_rate(linkspeed_bps rate);
+    linkspeed_bps background_rate() const {return _background_rate;}
+    linkspeed_bps bitrate() const {return _bitrate;}
+    // bytes of all the packets sent on so far
+    uint64_t bytes_served() const {return _bytes_served;}
+
     virtual void log_packet_send(simtime_picosec duration);
     virtual uint16_t average_utilization();
 
     virtual uint64_t quantized_queuesize();
     virtual uint8_t quantized_utilization();
+    // the band, 0 to 3, quantized_queuesize() puts a queue of qs bytes in
+    static uint8_t queuesize_band(mem_b qs, mem_b maxsize);
 
     static simtime_picosec _update_period;
 
@@ -72,6 +83,8 @@ protected:
     QueueLogger* _logger;
     linkspeed_bps _bitrate; 
     simtime_picosec _ps_per_byte;  // service time, in picoseconds per byte
+    linkspeed_bps _background_rate;
+    uint64_t _bytes_served;
     string _nodename;
     
     CircularBuffer<simtime_picosec> _busystart;
@@ -90,6 +103,18 @@ protected:
 
 
 // A standard FIFO packet queue of fixed size
+//
+// The time a packet leaves a FIFO queue is fixed as soon as it arrives:
+// it is when the packets ahead of it are done plus its own drain time,
+// and nothing that arrives later can change that.  So when nothing is
+// waiting to be served per packet, the queue works out that time on
+// arrival and hands the packet straight to the pipe after it with
+// Pipe::receivePacketAt(), and a back-to-back train costs no events here,
+// only the pipe's.  The packet still counts towards queuesize() until the
+// time it leaves.  Packets are served one at a time as usual if anything
+// might look at them as they leave: a queue logger, a logged flow, a
+// switch (which reads the utilization), a background rate, a next hop
+// other than a plain Pipe, or a subclass.
 class Queue : public BaseQueue {
  public:
     Queue(linkspeed_bps bitrate, mem_b maxsize, EventList &eventlist, 
@@ -105,6 +130,10 @@ class Queue : public BaseQueue {
     int num_drops() const {return _num_drops;}
     void reset_drops() {_num_drops = 0;}
 
+    // hand packets on in trains where possible (see above); on by
+    // default, -no_trains in the tests mains turns it off
+    static bool _trains;
+
  protected:
     // Mechanism
     // start serving the item at the head of the queue
@@ -116,6 +145,24 @@ class Queue : public BaseQueue {
     mem_b _queuesize;
     CircularBuffer<Packet*> _enqueued;
     int _num_drops;
+
+ private:
+    struct TrainPacket {
+        simtime_picosec depart;
+        mem_b size;
+    };
+
+    // the pipe to hand pkt to in a train, or NULL to serve it as usual
+    Pipe* trainPipe(Packet& pkt);
+    // forget the packets in the train that have left by now
+    void retireTrain() const;
+
+    enum {TRAINS_UNKNOWN, TRAINS_ON, TRAINS_OFF} _train_mode;
+    PacketSink* _train_next;  // the last next hop looked at
+    Pipe* _train_pipe;        // and that as a plain Pipe, or NULL
+    mutable CircularBuffer<TrainPacket> _train; // handed on, not left yet
+    mutable mem_b _train_bytes;
+    simtime_picosec _train_end; // when the last of them leaves
 };
 
 class HostQueue : public Queue {
@@ -119,6 +119,7 @@ void LosslessQueue::completeService(){
     if (_logger) 
         _logger->logQueue(*this, QueueLogger::PKT_SERVICE, *pkt);
 
+    _bytes_served += pkt->size();
     /* tell the packet to move on to the next pipe */
     pkt->sendOn();
 
@@ -156,6 +156,7 @@ void LosslessOutputQueue::completeService(){
     //if (((uint64_t)timeAsUs(eventlist().now()))%5==0)
     //    cout << "Queue bandwidth utilization " << average_utilization() << "%" << endl;
 
+    _bytes_served += pkt->size();
     /* tell the packet to move on to the next pipe */
     pkt->sendOn();
 
@@ -5,17 +5,33 @@
 #include "queue.h"
 #include "pipe.h"
 
-void RouteTable::addRoute(int destination, Route* port, int cost, packet_direction direction){  
-    if (_fib.find(destination) == _fib.end())
+void RouteTable::addRoute(int destination, Route* port, int cost, packet_direction direction, int32_t port_id){  
+    assert(destination >= 0);
+    if ((uint32_t)destination >= _fib.size())
+        _fib.resize(destination+1, NULL);
+    if (!_fib[destination])
         _fib[destination] = new vector<FibEntry*>(); 
     
     assert(port!=NULL);
 
-    _fib[destination]->push_back(new FibEntry(port,cost,direction));
+    _fib[destination]->push_back(new FibEntry(port,cost,direction,port_id));
+}
+
+void RouteTable::addRoute(int destination, FibEntry* entry){  
+    assert(destination >= 0 && entry != NULL);
+    if ((uint32_t)destination >= _fib.size())
+        _fib.resize(destination+1, NULL);
+    if (!_fib[destination])
+        _fib[destination] = new vector<FibEntry*>(); 
+
+    _fib[destination]->push_back(entry);
 }
 
 void RouteTable::addHostRoute(int destination, Route* port, int flowid){  
-    if (_hostfib.find(destination) == _hostfib.end())
+    assert(destination >= 0);
+    if ((uint32_t)destination >= _hostfib.size())
+        _hostfib.resize(destination+1, NULL);
+    if (!_hostfib[destination])
         _hostfib[destination] = new unordered_map<int, HostFibEntry*>(); 
     
     assert(port!=NULL);
@@ -24,22 +40,24 @@ void RouteTable::addHostRoute(int destination, Route* port, int flowid){
 }
 
 
-vector<FibEntry*>* RouteTable::getRoutes(int destination){
-    if (_fib.find(destination) == _fib.end())
-        return NULL;
-    else        
-        return _fib[destination];
-}
-
 HostFibEntry* RouteTable::getHostRoute(int destination,int flowid){
-    if (_hostfib.find(destination) == _hostfib.end() ||
-        _hostfib[destination]->find(flowid) == _hostfib[destination]->end())
+    if ((uint32_t)destination >= _hostfib.size() || !_hostfib[destination])
+        return NULL;
+    auto i = _hostfib[destination]->find(flowid);
+    if (i == _hostfib[destination]->end())
         return NULL;
-    else {
-        return (*_hostfib[destination])[flowid];
-    }
+    return i->second;
 }
 
 void RouteTable::setRoutes(int destination, vector<FibEntry*>* routes){
+    assert(destination >= 0);
+    if ((uint32_t)destination >= _fib.size())
+        _fib.resize(destination+1, NULL);
     _fib[destination] = routes;
+}
+
+void RouteTable::clearRoutes(){
+    // packets on their way may still hold the old routes, so they are
+    // left allocated
+    _fib.clear();
 }
\ No newline at end of file
@@ -14,16 +14,19 @@
 
 class FibEntry{
 public:
-    FibEntry(Route* outport, uint32_t cost, packet_direction direction){ _out = outport; _cost = cost;_direction = direction;}
+    FibEntry(Route* outport, uint32_t cost, packet_direction direction, int32_t port_id = -1){ _out = outport; _cost = cost;_direction = direction; _port_id = port_id;}
 
     Route* getEgressPort(){return _out;}
     uint32_t getCost(){return _cost;}
     packet_direction getDirection(){return _direction;}
+    // the egress queue's port number on the switch, -1 if not known
+    int32_t getPortID(){return _port_id;}
     
 protected:
     Route* _out;
     uint32_t _cost;
     packet_direction _direction;
+    int32_t _port_id;
 };
 
 class HostFibEntry{
@@ -42,15 +45,24 @@ protected:
 class RouteTable {
 public:
     RouteTable() {};
-    void addRoute(int destination, Route* port, int cost, packet_direction direction);  
+    void addRoute(int destination, Route* port, int cost, packet_direction direction, int32_t port_id = -1);  
+    // as above, with an entry that may be shared with other destinations
+    void addRoute(int destination, FibEntry* entry);
     void addHostRoute(int destination, Route* port, int flowid);  
     void setRoutes(int destination, vector<FibEntry*>* routes);  
-    vector <FibEntry*>* getRoutes(int destination);
+    vector <FibEntry*>* getRoutes(int destination) {
+        return (uint32_t)destination < _fib.size() ? _fib[destination] : NULL;
+    }
+    // forget the routes to every destination but the directly attached
+    // hosts, so they are worked out again
+    void clearRoutes();
     HostFibEntry* getHostRoute(int destination, int flowid);
     
 private:
-    unordered_map<int,vector<FibEntry*>* > _fib;
-    unordered_map<int,unordered_map<int,HostFibEntry*>*> _hostfib;
+    // indexed by destination; host addresses are dense, so plain arrays
+    // beat hashing them, and grow to the highest destination seen
+    vector<vector<FibEntry*>* > _fib;
+    vector<unordered_map<int,HostFibEntry*>*> _hostfib;
 };
 
 #endif
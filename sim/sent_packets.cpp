@@ -2,68 +2,105 @@
 #include "sent_packets.h"
 #include <iostream>
 
-SentPackets::SentPackets(int max){
-    size = max;
-    crt_start = 0;
-    crt_end = 0;
-    crt_count = 0;
-  
-    sub_seq = new uint64_t[max];
-    data_seq = new uint64_t[max];
+SentPackets::SentPackets(int initial_size)
+    : _entries(initial_size), _initial_size(initial_size), _highest_seq(0),
+      _seq_base(0), _data_base(0), _stride(0), _even(true)
+{
+}
 
-    highest_seq = 0;
+void SentPackets::rebase(uint64_t seq, uint64_t data_seq){
+    uint64_t seq_base = _entries.empty() ? seq : seq_at(0);
+    uint64_t data_base = data_seq;
+    for (int i = 0; i < _entries.size(); i++)
+        data_base = min(data_base, data_seq_at(i));
+    assert(seq - seq_base <= UINT32_MAX);
+    for (int i = 0; i < _entries.size(); i++) {
+        Entry& e = _entries.at(i);
+        uint64_t d = _data_base + e.data_seq - data_base;
+        assert(d <= UINT32_MAX);
+        e.seq = _seq_base + e.seq - seq_base;
+        e.data_seq = d;
+    }
+    _seq_base = seq_base;
+    _data_base = data_base;
 }
 
 void SentPackets::add_packet(uint64_t seq, uint64_t data_s){
-    sub_seq[crt_end] = seq;
-    data_seq[crt_end] = data_s;
-
-    highest_seq = seq;
-
-    crt_end = (crt_end+1)%size;
-    crt_count ++;
+    int n = _entries.size();
+    if (n) {
+        uint64_t last = seq_at(n - 1);
+        assert(seq >= last); // added in sequence order
+        if (n == 1)
+            _stride = seq - last;
+        if (seq - last != _stride || _stride == 0)
+            _even = false;
+    }
+    if (!n || seq - _seq_base > UINT32_MAX || data_s < _data_base || data_s - _data_base > UINT32_MAX)
+        rebase(seq, data_s);
 
-    assert(crt_start!=crt_end);
+    Entry e = {(uint32_t)(seq - _seq_base), (uint32_t)(data_s - _data_base)};
+    _entries.push(e);
+    _highest_seq = seq;
 }
 
 int SentPackets::ack_packet(uint64_t ack_seq){
     int acked = 0;
-    while (crt_start!=crt_end && crt_count>0){
-        if (sub_seq[crt_start]<ack_seq){
-            crt_start = (crt_start+1)%size;
-            crt_count --;
-            acked++;
-        }
-        else break;
+    while (!_entries.empty() && seq_at(0) < ack_seq){
+        _entries.pop();
+        acked++;
+    }
+    if (_entries.empty()) {
+        _stride = 0;
+        _even = true;
     }
+    // give back what a burst needed once it has drained
+    int cap = _entries.capacity();
+    if (cap > _initial_size && _entries.size() * 8 < cap)
+        _entries.shrink(max(_initial_size, cap / 4));
     return acked;
 }
 
+int SentPackets::find(uint64_t seq){
+    int n = _entries.size();
+    if (!n || seq < seq_at(0) || seq > seq_at(n - 1))
+        return -1;
+    if (_even) {
+        uint64_t offset = seq - seq_at(0);
+        if (n == 1)
+            return offset == 0 ? 0 : -1;
+        return offset % _stride ? -1 : offset / _stride;
+    }
+    int lo = 0, hi = n - 1;
+    while (lo < hi) {
+        int mid = (lo + hi) / 2;
+        if (seq_at(mid) < seq)
+            lo = mid + 1;
+        else
+            hi = mid;
+    }
+    return seq_at(lo) == seq ? lo : -1;
+}
+
 int SentPackets::get_data_seq(uint64_t seq, uint64_t* dseq){
-    int t = crt_start;
-    while (t!=crt_end){
-        if (sub_seq[t]==seq){
-            *dseq = data_seq[t];
-            return 1;
-        }
-        t = (t+1)%size;
+    int i = find(seq);
+    if (i >= 0) {
+        *dseq = data_seq_at(i);
+        return 1;
     }
 
-    cout << "Didn't find packet in sent list! Seq No: " << seq << " First Sent " << sub_seq[crt_start] << "[" << data_seq[crt_start] <<"] Last Sent " << sub_seq[crt_end-1] << "["<< data_seq[crt_end-1] << "] start pos " << crt_start << " end pos " << crt_end << " count " << crt_count <<endl;
+    cout << "Didn't find packet in sent list! Seq No: " << seq;
+    if (!_entries.empty()) {
+        int n = _entries.size();
+        cout << " First Sent " << seq_at(0) << "[" << data_seq_at(0) << "] Last Sent " << seq_at(n - 1) << "[" << data_seq_at(n - 1) << "]";
+    }
+    cout << " count " << _entries.size() << endl;
     return 0;
 }
 
 int SentPackets::has_data_seq(uint64_t seq){
-    int t = crt_start;
-    while (t!=crt_end){
-        if (data_seq[t]==seq){
+    for (int i = 0; i < _entries.size(); i++) {
+        if (data_seq_at(i) == seq)
             return 1;
-        }
-        t = (t+1)%size;
     }
     return 0;
 }
-
-int SentPackets::have_mapping(int seq){
-    return highest_seq > seq;
-}
@@ -1,28 +1,50 @@
-// -*- c-basic-offset: 4; indent-tabs-mode: nil -*- 
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
 #ifndef SENT_PACKETS
 #define SENT_PACKETS
 #include "config.h"
+#include "circular_buffer.h"
 
+/*
+ * The subflow sequence numbers of the packets in flight, each with the
+ * data sequence number it carries.  Packets are added in sequence order
+ * and acked from the oldest, so they sit in a ring that grows with the
+ * data in flight and shrinks back once that drains.  Each entry holds
+ * the two numbers as 32-bit offsets from a base, which moves up when the
+ * ring empties, or on the rare occasion an offset doesn't fit.  While
+ * packets are evenly spaced, as a sender sending a packet at a time makes
+ * them, a lookup by sequence number goes straight to its entry; otherwise
+ * it is a binary search.
+ */
 class SentPackets {
 public:
-    int size;
-    int crt_count;
-    int crt_start;
-    int crt_end;
-    int highest_seq;
-
-    uint64_t* sub_seq;
-    uint64_t* data_seq;
- 
-    SentPackets(int max=20000);
-
-    int have_mapping(int seq);
-  
+    SentPackets(int initial_size=8);
+
+    int have_mapping(uint64_t seq) {return _highest_seq > seq;}
+
     void add_packet(uint64_t seq, uint64_t data_seq);
     int ack_packet(uint64_t ack_seq);
 
     int get_data_seq(uint64_t seq,uint64_t* dseq);
     int has_data_seq(uint64_t dseq);
+
+    int count() {return _entries.size();}
+private:
+    struct Entry {
+        uint32_t seq;      // from _seq_base
+        uint32_t data_seq; // from _data_base
+    };
+    uint64_t seq_at(int i) {return _seq_base + _entries.at(i).seq;}
+    uint64_t data_seq_at(int i) {return _data_base + _entries.at(i).data_seq;}
+    int find(uint64_t seq);
+    void rebase(uint64_t seq, uint64_t data_seq);
+
+    CircularBuffer<Entry> _entries;
+    int _initial_size;
+    uint64_t _highest_seq;
+    uint64_t _seq_base;
+    uint64_t _data_base;
+    uint64_t _stride;       // gap between packets, while it is the same
+    bool _even;
 };
 
 
@@ -0,0 +1,147 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#include <algorithm>
+#include <iomanip>
+#include <sstream>
+#include "sink_stats.h"
+#include "logfile.h"
+
+SinkStatsAggregator::SinkStatsAggregator(simtime_picosec period, EventList& eventlist,
+                                         Logger::EventType sink_type, int event_type,
+                                         double detail_fraction, uint32_t idle_periods)
+    : EventSource(eventlist, "SinkStats"), _period(period), _last_time(0),
+      _sink_type(sink_type), _event_type(event_type),
+      _detail_fraction(detail_fraction), _detail_credit(0), _idle_periods(idle_periods)
+{
+    eventlist.sourceIsPendingRel(*this, period);
+}
+
+uint32_t
+SinkStatsAggregator::monitorSink(DataReceiver* sink, uint64_t done_ack) {
+    uint32_t slot = _sinks.size();
+    _sinks.push_back(sink);
+    _bytes.push_back(0);
+    _last_bytes.push_back(0);
+    _state.push_back(IDLE);
+    _since.push_back(0);
+    _done_ack.push_back(done_ack);
+    _idle.push_back(0);
+
+    _detail_credit += _detail_fraction;
+    _detail.push_back(_detail_credit >= 1);
+    if (_detail_credit >= 1)
+        _detail_credit -= 1;
+    return slot;
+}
+
+void
+SinkStatsAggregator::activate(uint32_t slot) {
+    _state[slot] = ACTIVE;
+    _since[slot] = eventlist().now();
+    _idle[slot] = 0;
+    _active.push_back(slot);
+}
+
+void
+SinkStatsAggregator::retire(size_t i, flow_state state) {
+    _state[_active[i]] = state;
+    _active[i] = _active.back();
+    _active.pop_back();
+}
+
+void
+SinkStatsAggregator::finished(uint32_t slot) {
+    if (_state[slot] == ACTIVE)
+        _state[slot] = FINISHED;
+}
+
+void
+SinkStatsAggregator::doNextEvent() {
+    eventlist().sourceIsPendingRel(*this, _period);
+    simtime_picosec now = eventlist().now();
+
+    _rates.clear();
+    double sum = 0, sum_sq = 0;
+    double min_rate = 0, max_rate = 0;
+    uint32_t starved = 0;
+    for (size_t i = 0; i < _active.size();) {
+        uint32_t slot = _active[i];
+        simtime_picosec start = max(_since[slot], _last_time);
+        // a flow that started just now is left for the next sample
+        if (now <= start) {
+            i++;
+            continue;
+        }
+        uint64_t delta = _bytes[slot] - _last_bytes[slot];
+        _last_bytes[slot] = _bytes[slot];
+        double rate = delta * 1000000000000.0 / (now - start); // Bps
+        if (_rates.empty() || rate < min_rate)
+            min_rate = rate;
+        if (_rates.empty() || rate > max_rate)
+            max_rate = rate;
+        _rates.push_back(rate);
+        sum += rate;
+        sum_sq += rate * rate;
+        if (delta == 0 && _state[slot] == ACTIVE && _since[slot] <= _last_time)
+            starved++;
+        _idle[slot] = delta ? 0 : _idle[slot] + 1;
+        if (_detail[slot])
+            _logfile->writeRecord(_sink_type, _sinks[slot]->get_id(), _event_type,
+                                  _sinks[slot]->cumulative_ack(), 0, rate);
+
+        if (_state[slot] == ACTIVE && _done_ack[slot] && _sinks[slot]->cumulative_ack() >= _done_ack[slot])
+            _state[slot] = FINISHED;
+        if (_state[slot] == FINISHED)
+            retire(i, DONE);
+        else if (_idle_periods && _idle[slot] >= _idle_periods)
+            retire(i, IDLE);
+        else
+            i++;
+    }
+    _last_time = now;
+
+    size_t n = _rates.size();
+    if (n > 0) {
+        // percentiles in increasing order, each nth_element only looking
+        // at what lies above the last one
+        const double fractions[] = {0.1, 0.5, 0.9, 0.99};
+        double pct[4];
+        size_t from = 0;
+        for (int p = 0; p < 4; p++) {
+            size_t k = min(n - 1, (size_t)(n * fractions[p]));
+            if (k >= from) {
+                nth_element(_rates.begin() + from, _rates.begin() + k, _rates.end());
+                from = k + 1;
+            }
+            pct[p] = _rates[k];
+        }
+        _logfile->writeRecord(Logger::SINK_STATS, get_id(), RATE_LOW, min_rate, pct[0], pct[1]);
+        _logfile->writeRecord(Logger::SINK_STATS, get_id(), RATE_HIGH, pct[2], pct[3], max_rate);
+    }
+    double jain = sum_sq > 0 ? sum * sum / (n * sum_sq) : 0;
+    _logfile->writeRecord(Logger::SINK_STATS, get_id(), FAIRNESS, n, jain, starved);
+}
+
+string
+SinkStatsAggregator::event_to_str(RawLogEvent& event) {
+    stringstream ss;
+    ss << fixed << setprecision(9) << event._time;
+    assert(event._type == Logger::SINK_STATS);
+    ss << " Type SINK_STATS ID " << event._id;
+    switch((SinkStatsRecord)event._ev) {
+    case RATE_LOW:
+        ss << " Ev RATE_LOW Min " << (uint64_t)event._val1 << " P10 " << (uint64_t)event._val2
+           << " P50 " << (uint64_t)event._val3;
+        break;
+    case RATE_HIGH:
+        ss << " Ev RATE_HIGH P90 " << (uint64_t)event._val1 << " P99 " << (uint64_t)event._val2
+           << " Max " << (uint64_t)event._val3;
+        break;
+    case FAIRNESS:
+        ss << " Ev FAIRNESS Active " << (uint64_t)event._val1 << " Jain " << setprecision(4)
+           << event._val2 << " Starved " << (uint64_t)event._val3;
+        break;
+    default:
+        ss << " Unknown event " << event._ev;
+    }
+    return ss.str();
+}
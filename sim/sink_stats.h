@@ -0,0 +1,84 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+#ifndef SINK_STATS_H
+#define SINK_STATS_H
+
+/*
+ * SinkStatsAggregator: a cheaper alternative to SinkLoggerSampling for runs
+ * with many flows.  Rather than visiting every sink each period and writing
+ * a record for each, sinks add the bytes of every packet they receive to a
+ * counter here, indexed by the slot they were given when monitored.  A flow
+ * is active from its first packet until it has received everything: the
+ * sink says so with finished(), or its cumulative ack reaches the value
+ * given to monitorSink().  A flow that receives nothing for idle_periods
+ * samples in a row is dropped too, until its next packet.  Each period only
+ * the active flows are looked at, and three summary records are written:
+ *
+ *   SINK_STATS RATE_LOW   val1 min   val2 p10  val3 p50     rates in Bps
+ *   SINK_STATS RATE_HIGH  val1 p90   val2 p99  val3 max
+ *   SINK_STATS FAIRNESS   val1 active flows  val2 Jain's index  val3 starved flows
+ *
+ * A flow is starved if it was active for the whole period and received
+ * nothing.  A flow that finishes or goes idle is counted in that period
+ * and then dropped.  Per-flow records, in the protocol's usual sink RATE
+ * format, are kept only for a fraction of the sinks, chosen at evenly
+ * spaced counts as they are monitored.
+ */
+
+#include <vector>
+#include "config.h"
+#include "eventlist.h"
+#include "loggertypes.h"
+#include "network.h"
+
+class SinkStatsAggregator : public Logger, public EventSource {
+public:
+    enum SinkStatsRecord { RATE_LOW = 0, RATE_HIGH = 1, FAIRNESS = 2 };
+
+    // sink_type and event_type are those of the per-flow detail records
+    SinkStatsAggregator(simtime_picosec period, EventList& eventlist,
+                        Logger::EventType sink_type, int event_type,
+                        double detail_fraction = 0, uint32_t idle_periods = 10);
+
+    // returns the slot the sink reports with.  The flow is done once the
+    // sink's cumulative_ack() reaches done_ack; 0 if only finished() says so
+    uint32_t monitorSink(DataReceiver* sink, uint64_t done_ack = 0);
+
+    inline void received(uint32_t slot, uint64_t bytes) {
+        _bytes[slot] += bytes;
+        if (_state[slot] == IDLE)
+            activate(slot);
+    }
+    void finished(uint32_t slot);
+
+    virtual void doNextEvent();
+    static string event_to_str(RawLogEvent& event);
+
+private:
+    enum flow_state { IDLE, ACTIVE, FINISHED, DONE };
+    void retire(size_t i, flow_state state);
+
+    void activate(uint32_t slot);
+
+    simtime_picosec _period;
+    simtime_picosec _last_time;
+    Logger::EventType _sink_type;
+    int _event_type;
+    double _detail_fraction;
+    double _detail_credit;
+    uint32_t _idle_periods;
+
+    // per slot
+    vector<uint64_t> _bytes;       // cumulative, bumped on receipt
+    vector<uint64_t> _last_bytes;  // as of the last sample
+    vector<uint8_t> _state;
+    vector<simtime_picosec> _since;
+    vector<uint64_t> _done_ack;
+    vector<uint32_t> _idle;        // samples in a row with nothing received
+    vector<DataReceiver*> _sinks;
+    vector<bool> _detail;
+
+    vector<uint32_t> _active;      // slots that are ACTIVE or FINISHED
+    vector<double> _rates;         // scratch, one per active flow
+};
+
+#endif
@@ -990,7 +990,8 @@ SwiftSubflowSink::drops(){
 ////////////////////////////////////////////////////////////////
 
 SwiftSink::SwiftSink() 
-    : DataReceiver("SwiftSink"), _cumulative_data_ack(0), _buffer_logger(NULL)
+    : DataReceiver("SwiftSink"), _cumulative_data_ack(0), _buffer_logger(NULL),
+      _rate_stats(NULL), _rate_slot(0)
 {
     _src = 0;
     _nodename = "swiftsink";
@@ -1011,6 +1012,8 @@ SwiftSink::receivePacket(Packet& pkt) {
     SwiftPacket::seq_t dsn = p->dsn();
     int size = p->size(); // TODO: the following code assumes all packets are the same size
     //cout << "SwiftSink received dsn " << dsn << endl;
+    if (_rate_stats)
+        _rate_stats->received(_rate_slot, size);
     if (dsn == _cumulative_data_ack+1) {
         _cumulative_data_ack = dsn + size - 1;
         while (!_dsn_received.empty() && (*(_dsn_received.begin()) == _cumulative_data_ack+1) ) {
@@ -1030,6 +1033,15 @@ SwiftSink::receivePacket(Packet& pkt) {
     }
 }
  
+void
+SwiftSink::monitorWith(SinkStatsAggregator& stats) {
+    assert(_src);
+    _rate_stats = &stats;
+    // the source finishes once _cumulative_data_ack reaches its
+    // _flow_size, which is huge when the flow has no set size
+    _rate_slot = stats.monitorSink(this, _src->_flow_size + _src->_mss);
+}
+
 uint64_t
 SwiftSink::cumulative_ack() {
     // this is needed by some loggers.  If we ever need it, figure out what it should really return
@@ -14,6 +14,7 @@
 #include "swift_scheduler.h"
 #include "eventlist.h"
 #include "sent_packets.h"
+#include "sink_stats.h"
 
 //#define MODEL_RECEIVE_WINDOW 1
 
@@ -284,6 +285,9 @@ public:
     SwiftSrc* _src;
     uint64_t cumulative_ack();
     uint32_t drops();
+    // count received bytes in an aggregator instead of being sampled; call
+    // once connected, so the flow size is known
+    void monitorWith(SinkStatsAggregator& stats);
 
     vector <SwiftSubflowSink*> _subs; // public so the logger can see
 private:
@@ -291,6 +295,8 @@ private:
     SwiftSubflowSink* connect(SwiftSrc& src, SwiftSubflowSrc&, const Route& route);
     string _nodename;
     ReorderBufferLogger* _buffer_logger;
+    SinkStatsAggregator* _rate_stats;
+    uint32_t _rate_slot;
 };
 
 class SwiftRtxTimerScanner : public EventSource {
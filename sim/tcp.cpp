@@ -648,9 +648,8 @@ TcpSink::receivePacket(Packet& pkt) {
 
     int size = p->size(); // TODO: the following code assumes all packets are the same size
     pkt.flow().logTraffic(pkt,*this,TrafficLogger::PKT_RCVDESTROY);
-    p->free();
-
     _packets+= p->size();
+    p->free();
 
     //cout << "Sink recv seqno " << seqno << " size " << size << endl;
 
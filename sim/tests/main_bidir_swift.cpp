@@ -16,7 +16,8 @@
 #include "compositequeue.h"
 
 void exit_error(char* progr) {
-    cout << "Usage " << progr << " -hdiv <h_divisor> -cwnd <initial_window>" << endl;
+    cout << "Usage " << progr << " -hdiv <h_divisor> -cwnd <initial_window> [-no_trains]" << endl;
+    cout << "\t-no_trains: serve every packet at its plain Queue hops with its own event, rather than handing packets on in trains" << endl;
     exit(1);
 }
 
@@ -52,6 +53,8 @@ int main(int argc, char **argv) {
             psize = atoi(argv[i+1]);
             cout << "psize "<< psize << endl;
             i++;
+        } else if (!strcmp(argv[i],"-no_trains")){
+            Queue::_trains = false;
         } else {
             cout << argv[i] << endl;
             exit_error(argv[0]);
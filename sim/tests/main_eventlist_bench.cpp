@@ -0,0 +1,201 @@
+// -*- c-basic-offset: 4; indent-tabs-mode: nil -*-
+/*
+ * Microbenchmark for the EventList scheduler backends.
+ *
+ * The classic "hold" model: -pending sources each keep one event
+ * scheduled, and each time one fires it schedules itself again a random
+ * increment later.  With -timers, every source also keeps a timeout
+ * armed far in the future that it cancels and re-arms by handle on
+ * every event, the way transport retransmit timers behave; with
+ * -reschedule the timeout is a separate source moved with
+ * reschedulePendingSource instead.  -dist tick puts every event on a
+ * whole microsecond, for bursts of events at the same time.
+ *
+ * Each backend prints its event rate and a checksum of the order in
+ * which events ran; the checksums must all agree.
+ */
+#include "config.h"
+#include <string.h>
+#include <time.h>
+#include <iostream>
+#include <random>
+#include <vector>
+#include "eventlist.h"
+
+typedef enum {DIST_PACKET, DIST_EXP, DIST_UNIFORM, DIST_BIMODAL, DIST_TICK} dist_type;
+
+class Increments {
+public:
+    Increments(dist_type dist) : _dist(dist), _rng(1) {}
+    simtime_picosec next() {
+        switch (_dist) {
+        case DIST_PACKET: {
+            // mostly 4KB serialisation times at 100-400Gb/s, some RTT-scale
+            // gaps and the odd millisecond timeout
+            double u = _uniform(_rng);
+            if (u < 0.8)
+                return 81920 + (simtime_picosec)(_uniform(_rng) * 245760);
+            if (u < 0.98)
+                return timeFromUs(1.0 + _uniform(_rng) * 9.0);
+            return timeFromMs(1.0);
+        }
+        case DIST_EXP:
+            return (simtime_picosec)(_exp(_rng) * 1000000.0);
+        case DIST_UNIFORM:
+            return (simtime_picosec)(_uniform(_rng) * 2000000.0);
+        case DIST_BIMODAL:
+            return _uniform(_rng) < 0.9 ? timeFromNs(100) : timeFromUs(100.0);
+        case DIST_TICK:
+            // whole microseconds, so thousands of events share each time
+            return timeFromUs((double)(1 + (int)(_uniform(_rng) * 10)));
+        }
+        abort();
+    }
+private:
+    dist_type _dist;
+    std::mt19937_64 _rng;
+    std::uniform_real_distribution<double> _uniform;
+    std::exponential_distribution<double> _exp;
+};
+
+typedef enum {TIMER_NONE, TIMER_HANDLE, TIMER_RESCHEDULE} timer_type;
+
+// a timeout that never fires in practice
+class BenchTimeout : public EventSource {
+public:
+    BenchTimeout(EventList& eventlist) : EventSource(eventlist, "bench_timeout") {}
+    virtual void doNextEvent() {}
+};
+
+class BenchSource : public EventSource {
+public:
+    BenchSource(EventList& eventlist, uint64_t id, Increments& inc, timer_type timer, uint64_t& checksum)
+        : EventSource(eventlist, "bench"), _id(id), _inc(inc), _timer(timer), _checksum(checksum),
+          _timeout(eventlist) {}
+    void start() {
+        eventlist().sourceIsPendingRel(*this, _inc.next());
+        armTimer();
+    }
+    virtual void doNextEvent() {
+        _checksum = _checksum * 1000003 + eventlist().now() * 31 + _id;
+        armTimer();
+        eventlist().sourceIsPendingRel(*this, _inc.next());
+    }
+private:
+    void armTimer() {
+        simtime_picosec expiry = eventlist().now() + timeFromMs(10);
+        if (_timer == TIMER_HANDLE) {
+            eventlist().cancelPendingSourceByHandle(*this, _timer_handle);
+            _timer_handle = eventlist().sourceIsPendingGetHandle(*this, expiry);
+        } else if (_timer == TIMER_RESCHEDULE) {
+            eventlist().reschedulePendingSource(_timeout, expiry);
+        }
+    }
+
+    uint64_t _id;
+    Increments& _inc;
+    timer_type _timer;
+    uint64_t& _checksum;
+    EventList::Handle _timer_handle;
+    BenchTimeout _timeout;
+};
+
+static double wall_seconds() {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+static void usage(const char* prog) {
+    cout << "Usage " << prog << " [-scheduler multimap|heap|calendar|all] [-pending n] [-events n]"
+         << " [-dist packet|exp|uniform|bimodal|tick] [-timers|-reschedule]" << endl;
+    exit(1);
+}
+
+int main(int argc, char **argv) {
+    vector<EventQueue::queue_type> schedulers;
+    uint64_t pending = 100000;
+    uint64_t events = 10000000;
+    dist_type dist = DIST_PACKET;
+    const char* dist_name = "packet";
+    timer_type timers = TIMER_NONE;
+
+    int i = 1;
+    while (i < argc) {
+        if (!strcmp(argv[i], "-scheduler") && i + 1 < argc) {
+            EventQueue::queue_type type;
+            if (!strcmp(argv[i+1], "all")) {
+                schedulers.push_back(EventQueue::MULTIMAP);
+                schedulers.push_back(EventQueue::HEAP);
+                schedulers.push_back(EventQueue::CALENDAR);
+            } else if (EventQueue::parseType(argv[i+1], type)) {
+                schedulers.push_back(type);
+            } else {
+                usage(argv[0]);
+            }
+            i++;
+        } else if (!strcmp(argv[i], "-pending") && i + 1 < argc) {
+            pending = atoll(argv[i+1]);
+            i++;
+        } else if (!strcmp(argv[i], "-events") && i + 1 < argc) {
+            events = atoll(argv[i+1]);
+            i++;
+        } else if (!strcmp(argv[i], "-dist") && i + 1 < argc) {
+            dist_name = argv[i+1];
+            if (!strcmp(dist_name, "packet"))
+                dist = DIST_PACKET;
+            else if (!strcmp(dist_name, "exp"))
+                dist = DIST_EXP;
+            else if (!strcmp(dist_name, "uniform"))
+                dist = DIST_UNIFORM;
+            else if (!strcmp(dist_name, "bimodal"))
+                dist = DIST_BIMODAL;
+            else if (!strcmp(dist_name, "tick"))
+                dist = DIST_TICK;
+            else
+                usage(argv[0]);
+            i++;
+        } else if (!strcmp(argv[i], "-timers")) {
+            timers = TIMER_HANDLE;
+        } else if (!strcmp(argv[i], "-reschedule")) {
+            timers = TIMER_RESCHEDULE;
+        } else {
+            usage(argv[0]);
+        }
+        i++;
+    }
+    if (schedulers.empty()) {
+        schedulers.push_back(EventQueue::MULTIMAP);
+        schedulers.push_back(EventQueue::HEAP);
+        schedulers.push_back(EventQueue::CALENDAR);
+    }
+
+    EventList& eventlist = EventList::getTheEventList();
+    for (size_t s = 0; s < schedulers.size(); s++) {
+        EventList::reset();
+        EventList::setScheduler(schedulers[s]);
+        Increments inc(dist);
+        uint64_t checksum = 0;
+        vector<BenchSource*> sources;
+        for (uint64_t n = 0; n < pending; n++) {
+            sources.push_back(new BenchSource(eventlist, n, inc, timers, checksum));
+            sources.back()->start();
+        }
+
+        double start = wall_seconds();
+        uint64_t done = 0;
+        while (done < events && EventList::doNextEvent())
+            done++;
+        double elapsed = wall_seconds() - start;
+
+        cout << EventQueue::typeName(schedulers[s]) << " dist " << dist_name << " pending " << pending
+             << (timers == TIMER_HANDLE ? " timers" : timers == TIMER_RESCHEDULE ? " reschedule" : "")
+             << " events " << done
+             << " Mevents/s " << done / elapsed / 1e6 << " checksum " << hex << checksum << dec << endl;
+
+        EventList::reset();
+        for (size_t n = 0; n < sources.size(); n++)
+            delete sources[n];
+    }
+    return 0;
+}
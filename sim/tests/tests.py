@@ -6,8 +6,12 @@ import os
 import io
 import zlib
 import argparse
+import sys
 from glob import iglob
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'datacenter'))
+from launch import launch
+
 
 TEST_DIR = 'htsim-tests'
 
@@ -19,7 +23,8 @@ def check_ref(ref_file: io.BufferedRandom, executable: str, output: str, param_s
 		stdout = subprocess.DEVNULL
 
 	try:
-		rc = subprocess.call(['./' + executable] + param_str, stdout = stdout)
+		rc = launch(['./' + executable] + param_str, stdout = stdout, stderr = None,
+			    tags = {'test': executable}).returncode
 		if rc != 0:
 			print(f'Test failed: Exit status {rc}\n')
 			return
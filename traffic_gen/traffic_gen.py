@@ -21,6 +21,7 @@ DEFAULT_BASE_TIME_S = 0
 DEFAULT_DURATION_S = 1
 DEFAULT_OUTPUT_FILE_PATH = "cdf_traffic.txt"
 DEFAULT_SEED = None
+DEFAULT_FLUID_MIN_SIZE = None
 
 # Constants.
 NS_IN_S = 1e9
@@ -109,6 +110,17 @@ def add_commandline_options():
             " means using the system time."
         ),
     )
+    arg_parser.add_argument(
+        "-f",
+        "--fluid_min_size",
+        default=DEFAULT_FLUID_MIN_SIZE,
+        type=int,
+        help=(
+            "Tag flows of at least this many bytes as fluid background"
+            " traffic, simulated at the flow level (htsim_eqds). By default"
+            " no flow is tagged."
+        ),
+    )
     arg_parser.add_argument(
         "-o",
         "--output_file_path",
@@ -122,24 +134,31 @@ def add_commandline_options():
     return arg_parser
 
 
-def connection_matrix_line(flow: Flow, flow_id: int):
+def connection_matrix_line(flow: Flow, flow_id: int, fluid: bool = False):
     """
     Return a string representation of the flow. Format:
 
-    $src_idx->$dst_idx id $id start $start size $size
+    $src_idx->$dst_idx id $id start $start size $size [fluid]
     e.g. 14->9 id 3 start 0 size 1000000
 
     Args:
         flow (Flow): The flow to be represented.
         flow_id (int): The id of the flow. Flow id starts from 1.
+        fluid (bool): Tag the flow as background traffic for the fluid model.
     """
     return (
         f"{flow.src_idx}->{flow.dst_idx} id {flow_id} start"
         f" {flow.start_time_s} size {flow.size_bytes}"
+        + (" fluid" if fluid else "")
     )
 
 
-def export_flows(num_hosts: int, flow_list: list[Flow], output_file_path: str):
+def export_flows(
+    num_hosts: int,
+    flow_list: list[Flow],
+    output_file_path: str,
+    fluid_min_size: int = None,
+):
     """
     Export the flow list to the output_file_path with the desired format.
     Format (start time in seconds, flow size in bytes, flow id starts from 1)
@@ -154,11 +173,16 @@ def export_flows(num_hosts: int, flow_list: list[Flow], output_file_path: str):
         num_hosts (int): The number of hosts.
         flow_list (list[Flow]): A list of flows to be exported.
         output_file_path (str): The path of the output file.
+        fluid_min_size (int): Tag flows of at least this size as fluid; None
+            tags none.
     """
     with open(output_file_path, "w", encoding="utf-8") as ofile:
         ofile.write(f"Nodes {num_hosts}\nConnections {len(flow_list)}\n")
         for flow_id, flow in enumerate(flow_list):
-            ofile.write(connection_matrix_line(flow, flow_id + 1))
+            fluid = (
+                fluid_min_size is not None and flow.size_bytes >= fluid_min_size
+            )
+            ofile.write(connection_matrix_line(flow, flow_id + 1, fluid))
             ofile.write("\n")
 
 
@@ -223,7 +247,7 @@ def main():
     flow_list.sort(key=lambda flow: flow.start_time_s)
 
     # Export flow list to file with the desired format.
-    export_flows(nhost, flow_list, output_file_path)
+    export_flows(nhost, flow_list, output_file_path, args.fluid_min_size)
 
 
 if __name__ == "__main__":